@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import transaction
+from BTrees.OOBTree import OOBTree
+from DateTime import DateTime
+from ZODB.POSException import ConflictError
+from zope.annotation.interfaces import IAnnotations
+
+from bika.lims import api
+from bika.lims import logger
+from bika.lims.utils.arimport import get_lookups
+from bika.lims.utils.indexing import deferred_indexing
+
+"""Chunked import of AR Imports
+
+The Samples, Partitions and ARs of an AR Import used to be created for the
+whole grid within the request of the "import" transition, as one transaction:
+a conflict error on the last rows restarted the whole import.
+
+The import is now a job, stored in an annotation of the AR Import, which
+records the rows already imported. The rows are processed in chunks of
+`CHUNK_SIZE` rows, each chunk in its own transaction:
+
+- small imports (up to one chunk) are still processed by the transition
+- larger imports are processed by the `import_status` view of the AR Import,
+  one chunk per request. The `import_progress` page polls this view until the
+  job is done, so no request is held open for the whole import.
+- a row that fails is rolled back and the job stops as "failed". Starting
+  the job again resumes it from the first row not imported yet.
+
+`run` processes all the pending rows with a commit after each chunk, e.g. for
+scripts.
+"""
+
+ARIMPORT_JOB_STORAGE = "bika.lims.arimportjob"
+
+CHUNK_SIZE = 25
+
+# job keys
+STATUS = "status"
+TOTAL = "total"
+# row index -> AR UID
+ROWS = "rows"
+ERROR = "error"
+UPDATED = "updated"
+
+# job status
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def get_job(arimport):
+    """Returns the import job of the AR Import, None if not started
+    """
+    return IAnnotations(arimport).get(ARIMPORT_JOB_STORAGE)
+
+
+def get_rows(arimport):
+    return arimport.getSampleData() or []
+
+
+def start(arimport):
+    """Start the import job of the AR Import, or resume it if it failed
+    """
+    job = get_job(arimport)
+    if job is None:
+        job = OOBTree()
+        job[ROWS] = OOBTree()
+        IAnnotations(arimport)[ARIMPORT_JOB_STORAGE] = job
+    job[TOTAL] = len(get_rows(arimport))
+    if job.get(STATUS) != DONE:
+        job[STATUS] = QUEUED
+        job[ERROR] = ""
+    job[UPDATED] = DateTime()
+    return job
+
+
+def get_pending_rows(arimport):
+    """Returns a list of (row index, row) of the rows not imported yet
+    """
+    job = get_job(arimport)
+    done = job is not None and job[ROWS] or {}
+    return [(index, row) for index, row in enumerate(get_rows(arimport))
+            if index not in done]
+
+
+def get_pending_count(arimport):
+    return len(get_pending_rows(arimport))
+
+
+def import_row(arimport, index, row, lookups):
+    """Import a row. Returns the AR, or None if the import failed. The
+    changes of a failed row are rolled back.
+    """
+    savepoint = transaction.savepoint()
+    try:
+        with deferred_indexing():
+            return arimport.import_row(row, lookups)
+    except ConflictError:
+        raise
+    except Exception as e:
+        savepoint.rollback()
+        job = get_job(arimport)
+        job[STATUS] = FAILED
+        job[ERROR] = "Row {}: {}".format(index + 1, str(e))
+        logger.error("Failed to import row {} of {}: {}".format(
+            index + 1, api.get_path(arimport), str(e)))
+    return None
+
+
+def process(arimport, chunk_size=None):
+    """Import the next `chunk_size` pending rows of a started job, or all of
+    them if no chunk size is given. Returns the progress of the job.
+    """
+    job = get_job(arimport)
+    if job is None or job[STATUS] not in (QUEUED, RUNNING):
+        return get_progress(arimport)
+    pending = get_pending_rows(arimport)
+    if chunk_size:
+        pending = pending[:chunk_size]
+    job[STATUS] = RUNNING
+    lookups = get_lookups(arimport)
+    for index, row in pending:
+        ar = import_row(arimport, index, row, lookups)
+        if ar is None:
+            break
+        job[ROWS][index] = api.get_uid(ar)
+    if job[STATUS] == RUNNING and not get_pending_count(arimport):
+        job[STATUS] = DONE
+    # concurrent chunks of the same job always conflict on this key
+    job[UPDATED] = DateTime()
+    return get_progress(arimport)
+
+
+def run(arimport, chunk_size=CHUNK_SIZE):
+    """Import all the pending rows, with a commit after each chunk. Returns
+    the progress of the job.
+    """
+    start(arimport)
+    while True:
+        progress = process(arimport, chunk_size)
+        transaction.commit()
+        if progress["status"] != RUNNING:
+            return progress
+
+
+def get_progress(arimport):
+    """Returns the progress of the import job as a dict, which can be
+    serialized to JSON
+    """
+    job = get_job(arimport)
+    total = len(get_rows(arimport))
+    if job is None:
+        return {"status": "", "total": total, "done": 0, "percent": 0,
+                "error": "", "updated": ""}
+    done = len(job[ROWS])
+    percent = int(done * 100 / total) if total else 100
+    return {
+        "status": job[STATUS],
+        "total": total,
+        "done": done,
+        "percent": percent,
+        "error": job[ERROR],
+        "updated": job[UPDATED].ISO8601(),
+    }
@@ -7,8 +7,11 @@
 
 from Products.CMFCore.utils import getToolByName
 from Products.CMFCore.WorkflowCore import WorkflowException
+from zope.component import getUtility
 
+from bika.lims import api
 from bika.lims.browser import BrowserView
+from bika.lims.interfaces import IIdentifierRegistry
 from bika.lims.permissions import EditResults
 
 import json
@@ -57,6 +60,13 @@ class barcode_entry(BrowserView):
         return entry
 
     def resolve_item(self, entry):
+        # ids, barcodes, Client Sample IDs and external identifiers
+        uid = getUtility(IIdentifierRegistry).resolve(entry)
+        if uid:
+            instance = api.get_object_by_uid(uid, None)
+            if instance is not None:
+                return instance
+        # other items, e.g. setup items
         for catalog in [self.bika_catalog, self.bika_setup_catalog]:
             brains = catalog(title=entry)
             if brains:
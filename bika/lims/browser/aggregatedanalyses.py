@@ -7,6 +7,7 @@
 
 from AccessControl import getSecurityManager
 from Products.CMFPlone.utils import safe_unicode
+from bika.lims import api
 from bika.lims import bikaMessageFactory as _
 from bika.lims.utils import t, dicts_to_dict, format_supsub
 from bika.lims.utils.analysis import format_uncertainty
@@ -101,42 +102,40 @@ class AggregatedAnalysesView(AnalysesView):
         if not context.bika_setup.getShowPartitions():
             self.review_states[0]['columns'].remove('Partition')
 
+    def folderitems(self):
+        # The department filter is part of the catalog query, so only the
+        # analyses of the selected departments are woken up. The analyses of
+        # services without department are indexed with an empty UID.
+        departments = self.get_department_filter()
+        if departments is not None:
+            self.contentFilter['getDepartmentUID'] = {
+                "query": departments + [""], "operator": "or"}
+        return super(AggregatedAnalysesView, self).folderitems()
+
     def isItemAllowed(self, obj):
         """
-        It checks if the item can be added to the list depending on the
-        department filter. If the analysis service is not assigned to a
-        department, show it.
-        If department filtering is disabled in bika_setup, will return True.
-        @Obj: it is an analysis object.
-        @return: boolean
+        The department filter is applied by the catalog query, see
+        folderitems
         """
-        if not obj:
-            return None
-        if not self.context.bika_setup.getAllowDepartmentFiltering():
-            return True
-        # Gettin the department from analysis service
-        serv_dep = obj.getService().getDepartment()
-        result = True
-        if serv_dep:
-            # Getting the cookie value
-            cookie_dep_uid = self.request.get('filter_by_department_info', '')
-            # Comparing departments' UIDs
-            result = True if serv_dep.UID() in\
-                cookie_dep_uid.split(',') else False
-        return result
+        return True
 
     def folderitem(self, obj, item, index):
-        parent = obj.aq_parent
+        # The AR and the worksheet are read from the catalog metadata of the
+        # analysis, without waking them up
+        bac = getToolByName(self.context, self.catalog)
+        metadata = bac.getMetadataForUID(api.get_path(obj))
+        to_url = self.request.physicalPathToURL
         # Analysis Request
-        item['AnalysisRequest'] = parent.Title()
-        anchor = '<a href="%s">%s</a>' % (parent.absolute_url(), parent.Title())
+        item['AnalysisRequest'] = metadata['getRequestID']
+        anchor = '<a href="%s">%s</a>' % (
+            to_url(metadata['getRequestPath']), metadata['getRequestID'])
         item['replace']['AnalysisRequest'] = anchor
         # Worksheet
         item['Worksheet'] = ''
-        wss = obj.getBackReferences('WorksheetAnalysis')
-        if wss and len(wss) > 0:
-            ws = wss[0]
-            item['Worksheet'] = ws.Title()
-            anchor = '<a href="%s">%s</a>' % (ws.absolute_url(), ws.Title())
+        if metadata['getWorksheetPath']:
+            item['Worksheet'] = metadata['getWorksheetTitle']
+            anchor = '<a href="%s">%s</a>' % (
+                to_url(metadata['getWorksheetPath']),
+                metadata['getWorksheetTitle'])
             item['replace']['Worksheet'] = anchor
         return item
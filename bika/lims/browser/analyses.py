@@ -10,6 +10,7 @@ import json
 from AccessControl import getSecurityManager
 
 from zope.component import getAdapters
+from zope.component import getUtility
 
 from DateTime import DateTime
 from operator import itemgetter
@@ -19,15 +20,19 @@ from plone import api as ploneapi
 from Products.CMFPlone.utils import safe_unicode
 
 from bika.lims import api
+from bika.lims import instrumentvalidity
 from bika.lims import logger
+from bika.lims import resultsvocabulary
 from bika.lims import bikaMessageFactory as _
 from bika.lims.browser.bika_listing import BikaListingView
 from bika.lims.config import QCANALYSIS_TYPES
 from bika.lims.interfaces import IResultOutOfRange
+from bika.lims.interfaces import ISpecificationIndex
 from bika.lims.utils import isActive
 from bika.lims.utils import getUsers
 from bika.lims.utils import formatDecimalMark
 from bika.lims.utils.analysis import format_uncertainty
+from bika.lims.utils import outofrange
 from bika.lims.utils import t, dicts_to_dict, format_supsub
 from bika.lims.permissions import ManageBika
 from bika.lims.permissions import EditResults
@@ -148,6 +153,11 @@ class AnalysesView(BikaListingView):
         if not context.bika_setup.getShowPartitions():
             self.review_states[0]['columns'].remove('Partition')
 
+        # Results ranges and result flags of the listed analyses, see
+        # folderitems
+        self.results_ranges = {}
+        self.result_flags = {}
+
         super(AnalysesView, self).__init__(context,
                                            request,
                                            show_categories=context.bika_setup.getCategoriseAnalysisServices(),
@@ -155,6 +165,9 @@ class AnalysesView(BikaListingView):
 
     def get_analysis_spec(self, analysis):
         if hasattr(analysis, 'getResultsRange'):
+            uid = analysis.UID()
+            if uid in self.results_ranges:
+                return self.results_ranges[uid]
             return analysis.getResultsRange()
         if hasattr(analysis.aq_parent, 'getResultsRange'):
             rr = dicts_to_dict(analysis.aq_parent.getResultsRange(), 'keyword')
@@ -171,6 +184,9 @@ class AnalysesView(BikaListingView):
         We scan IResultOutOfRange adapters, and return True if any IAnalysis
         adapters trigger a result.
         """
+        flags = self.result_flags.get(analysis.UID())
+        if flags is not None:
+            return flags['out_of_range']
         adapters = getAdapters((analysis, ), IResultOutOfRange)
         spec = self.get_analysis_spec(analysis)
         for name, adapter in adapters:
@@ -195,14 +211,7 @@ class AnalysesView(BikaListingView):
         """
         ret = []
         if analysis:
-            service = analysis.getService()
-            methods = service.getAvailableMethods()
-            if methods and not service.getMethod():
-                ret.append({'ResultValue': '',
-                            'ResultText': _('None')})
-            for method in methods:
-                ret.append({'ResultValue': method.UID(),
-                            'ResultText': method.Title()})
+            ret = resultsvocabulary.get_methods_vocabulary(analysis)
         else:
             # All active methods
             bsc = getToolByName(self.context, 'bika_setup_catalog')
@@ -226,37 +235,20 @@ class AnalysesView(BikaListingView):
             If the analysis is a QC, the invalid instruments not
             out-of-date are also returned.
         """
-        ret = []
-        instruments = []
         if analysis:
-            service = analysis.getService()
-            if service.getInstrumentEntryOfResults() is False:
-                return []
+            return resultsvocabulary.get_instruments_vocabulary(analysis)
 
-            method = analysis.getMethod() \
-                if hasattr(analysis, 'getMethod') else None
-            instruments = method.getInstruments() \
-                if method else analysis.getService().getInstruments()
-
-        else:
-            # All active instruments
-            bsc = getToolByName(self.context, 'bika_setup_catalog')
-            brains = bsc(portal_type='Instrument', inactive_state='active')
-            instruments = [brain.getObject() for brain in brains]
-
-        for ins in instruments:
-            if analysis \
-                and analysis.portal_type in ['ReferenceAnalysis',
-                                             'DuplicateAnalysis'] \
-                    and not ins.isOutOfDate():
-                # Add the 'invalid', but in-date instrument
-                ret.append({'ResultValue': ins.UID(),
-                            'ResultText': ins.Title()})
-            if ins.isValid():
+        # All active instruments. The validity status is read from the
+        # catalog metadata
+        ret = []
+        bsc = getToolByName(self.context, 'bika_setup_catalog')
+        brains = bsc(portal_type='Instrument', inactive_state='active')
+        for brain in brains:
+            if instrumentvalidity.get_brain_status(brain)['valid']:
                 # Only add the 'valid' instruments: certificate
                 # on-date and valid internal calibration tests
-                ret.append({'ResultValue': ins.UID(),
-                            'ResultText': ins.Title()})
+                ret.append({'ResultValue': brain.UID,
+                            'ResultText': brain.Title})
 
         ret.insert(0, {'ResultValue': '',
                        'ResultText': _('None')})
@@ -271,6 +263,17 @@ class AnalysesView(BikaListingView):
                         'ResultText': analysts.getValue(a)})
         return ret
 
+    def get_department_filter(self):
+        """
+        Returns the UIDs of the departments selected in the department
+        filter, or None if department filtering is disabled in bika_setup.
+        """
+        if not self.context.bika_setup.getAllowDepartmentFiltering():
+            return None
+        # Getting the cookie value
+        cookie_dep_uid = self.request.get('filter_by_department_info', '')
+        return cookie_dep_uid.split(',')
+
     def isItemAllowed(self, obj):
         """
         It checks if the item can be added to the list depending on the
@@ -280,17 +283,15 @@ class AnalysesView(BikaListingView):
         @Obj: it is an analysis object.
         @return: boolean
         """
-        if not self.context.bika_setup.getAllowDepartmentFiltering():
+        departments = self.get_department_filter()
+        if departments is None:
             return True
         # Gettin the department from analysis service
         serv_dep = obj.getService().getDepartment()
         result = True
         if serv_dep:
-            # Getting the cookie value
-            cookie_dep_uid = self.request.get('filter_by_department_info', '')
             # Comparing departments' UIDs
-            result = True if serv_dep.UID() in\
-                cookie_dep_uid.split(',') else False
+            result = True if serv_dep.UID() in departments else False
         return result
 
     def folderitems(self):
@@ -319,6 +320,15 @@ class AnalysesView(BikaListingView):
         self.interim_fields = {}
         self.interim_columns = {}
         self.specs = {}
+        # Look up the results ranges of all analyses at once
+        analyses = [api.get_object(item['obj']) for item in items
+                    if 'obj' in item]
+        analyses = [an for an in analyses if hasattr(an, 'getResultsRange')]
+        self.results_ranges = getUtility(ISpecificationIndex).get_ranges(
+            analyses)
+        # Evaluate the out-of-range and detection limit flags at once
+        self.result_flags = outofrange.evaluate_analyses(
+            analyses, self.results_ranges)
         show_methodinstr_columns = False
         dmk = self.context.bika_setup.getResultsDecimalMark()
 
@@ -629,8 +639,9 @@ class AnalysesView(BikaListingView):
                     hasattr(obj, 'getDetectionLimitOperand') and \
                     hasattr(service, 'getDetectionLimitSelector') and \
                         service.getDetectionLimitSelector() is True:
-                    isldl = obj.isBelowLowerDetectionLimit()
-                    isudl = obj.isAboveUpperDetectionLimit()
+                    flags = self.result_flags[obj.UID()]
+                    isldl = flags['below_ldl']
+                    isudl = flags['above_udl']
                     dlval = ''
                     if isldl or isudl:
                         dlval = '<' if isldl else '>'
@@ -663,10 +674,11 @@ class AnalysesView(BikaListingView):
                            'manual_allowed': False,
                            'dlselect_allowed': False}
                     if hasattr(obj, 'getDetectionLimits'):
-                        dls['below_ldl'] = obj.isBelowLowerDetectionLimit()
-                        dls['above_udl'] = obj.isBelowLowerDetectionLimit()
-                        dls['is_ldl'] = obj.isLowerDetectionLimit()
-                        dls['is_udl'] = obj.isUpperDetectionLimit()
+                        flags = self.result_flags[obj.UID()]
+                        dls['below_ldl'] = flags['below_ldl']
+                        dls['above_udl'] = flags['above_udl']
+                        dls['is_ldl'] = flags['is_ldl']
+                        dls['is_udl'] = flags['is_udl']
                         dls['default_ldl'] = service.getLowerDetectionLimit()
                         dls['default_udl'] = service.getUpperDetectionLimit()
                         dls['manual_allowed'] = service.getAllowManualDetectionLimit()
@@ -11,6 +11,9 @@ from bika.lims import bikaMessageFactory as _
 from bika.lims.browser import BrowserView
 from bika.lims.utils import t, dicts_to_dict
 from bika.lims.utils.analysis import get_method_instrument_constraints
+from bika.lims.utils.outofrange import check_range
+from bika.lims.utils.outofrange import compile_range
+from bika.lims.utils.outofrange import to_float
 from bika.lims.interfaces import IAnalysis, IResultOutOfRange, IJSONReadExtender
 from bika.lims.interfaces import IFieldIcons
 from bika.lims.utils import to_utf8
@@ -136,47 +139,11 @@ class ResultOutOfRange(object):
 
 
     def isOutOfRange(self, result, Min, Max, error):
-        spec_min = None
-        spec_max = None
-        try:
-            result = float(result)
-        except:
+        result = to_float(result)
+        if result is None:
             return False, False
-        try:
-            spec_min = float(Min)
-        except:
-            spec_min = None
-        try:
-            error = float(error)
-        except:
-            error = 0
-        try:
-            spec_max = float(Max)
-        except:
-            spec_max = None
-        if (spec_min is None and spec_max is None):
-            if self.isOutOfShoulderRange(result, Min, Max, error):
-                return True, True
-            else:
-                return False, False  # No Min and Max values defined
-        elif spec_min is not None and spec_max is not None and spec_min <= result <= spec_max:
-            if self.isOutOfShoulderRange(result, Min, Max, error):
-                return True, True
-            else:
-                return False, False  # Min and Max values defined
-        elif spec_min is not None and spec_max is None and spec_min <= result:
-            if self.isOutOfShoulderRange(result, Min, Max, error):
-                return True, True
-            else:
-                return False, False  # Max value not defined
-        elif spec_min is None and spec_max is not None and spec_max >= result:
-            if self.isOutOfShoulderRange(result, Min, Max, error):
-                return True, True
-            else:
-                return False, False  # Min value not defined
-        if self.isOutOfShoulderRange(result, Min, Max, error):
-            return True, True
-        return True, False
+        spec = {'min': Min, 'max': Max, 'error': error}
+        return check_range(result, *compile_range(spec))
 
 class JSONReadExtender(object):
 
@@ -19,6 +19,7 @@ from plone.memoize.volatile import DontCache
 from plone.memoize.volatile import store_on_context
 
 from zope.annotation.interfaces import IAnnotations
+from zope.component import getUtility
 from zope.publisher.interfaces import IPublishTraverse
 from zope.interface import implements
 from zope.i18n.locales import locales
@@ -31,8 +32,10 @@ from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 from bika.lims import api
 from bika.lims import logger
 from bika.lims import bikaMessageFactory as _
+from bika.lims.interfaces import IServiceDependencyGraph
+from bika.lims.setupcache import get_setup_stamp
 from bika.lims.utils import tmpID
-from bika.lims.utils.analysisrequest import create_analysisrequest as crar
+from bika.lims.utils.analysisrequest import create_analysisrequests
 
 AR_CONFIGURATION_STORAGE = "bika.lims.browser.analysisrequest.manage.add"
 SKIP_FIELD_ON_COPY = ["Sample"]
@@ -64,6 +67,15 @@ def cache_key(method, self, obj):
     return gen_key(obj)
 
 
+def setup_cache_key(method, self, obj):
+    """Cache key for object infos which depend on other setup items, e.g. the
+    dependencies of a service. These are invalidated on bika_setup changes.
+    """
+    if obj is None:
+        raise DontCache
+    return "{}-{}".format(gen_key(obj), get_setup_stamp())
+
+
 def mg(value):
     """Copied from bika.lims.jsonapi.v1.calculate_partitions
     """
@@ -107,8 +119,9 @@ class AnalysisRequestAddView(BrowserView):
         logger.info("*** Prepared data for {} ARs ***".format(self.ar_count))
         return self.template()
 
+    @view.memoize
     def get_object_by_uid(self, uid):
-        """Get the object by UID
+        """Get the object by UID (memoized for the current request)
         """
         logger.debug("get_object_by_uid::UID={}".format(uid))
         obj = api.get_object_by_uid(uid, None)
@@ -509,125 +522,26 @@ class AnalysisRequestAddView(BrowserView):
         analysis = api.get_object(analysis)
         return api.get_uid(analysis.getService())
 
+    def get_objects_by_uids(self, uids):
+        """Returns a mapping of UID -> object
+        """
+        objs = map(self.get_object_by_uid, uids)
+        return dict(filter(lambda item: item[1] is not None, zip(uids, objs)))
+
     def get_calculation_dependencies_for(self, service):
         """Calculation dependencies of this service and the calculation of each
         dependent service (recursively).
-
-        TODO: This needs to go to bika.lims.api
         """
-
-        def calc_dependencies_gen(service, collector=None):
-            """Generator for recursive dependency resolution.
-            """
-
-            # The UID of the service
-            service_uid = api.get_uid(service)
-
-            # maintain an internal dependency mapping
-            if collector is None:
-                collector = {}
-
-            # Stop iteration if we processed this service already
-            if service_uid in collector:
-                raise StopIteration
-
-            # Get the calculation of the service.
-            # The calculation comes either from an assigned method or the user
-            # has set a calculation manually (see content/analysisservice.py).
-            calculation = service.getCalculation()
-
-            # Stop iteration if there is no calculation
-            if not calculation:
-                raise StopIteration
-
-            # The services used in this calculation.
-            # These are the actual dependencies of the used formula.
-            dep_services = calculation.getDependentServices()
-            for dep_service in dep_services:
-                # get the UID of the dependent service
-                dep_service_uid = api.get_uid(dep_service)
-
-                # remember the dependent service
-                collector[dep_service_uid] = dep_service
-
-                # yield the dependent service
-                yield dep_service
-
-                # check the dependencies of the dependent services
-                for ddep_service in calc_dependencies_gen(dep_service,
-                                                          collector=collector):
-                    yield ddep_service
-
-        dependencies = {}
-        for dep_service in calc_dependencies_gen(service):
-            # Skip the initial (requested) service
-            if dep_service == service:
-                continue
-            uid = api.get_uid(dep_service)
-            dependencies[uid] = dep_service
-
-        return dependencies
+        graph = getUtility(IServiceDependencyGraph)
+        uids = graph.get_dependencies(service)
+        return self.get_objects_by_uids(uids)
 
     def get_calculation_dependants_for(self, service):
-        """Calculation dependants of this service
-
-        TODO: This needs to go to bika.lims.api
+        """Calculation dependants of this service (recursively).
         """
-
-        def calc_dependants_gen(service, collector=None):
-            """Generator for recursive resolution of dependant sevices.
-            """
-
-            # The UID of the service
-            service_uid = api.get_uid(service)
-
-            # maintain an internal dependency mapping
-            if collector is None:
-                collector = {}
-
-            # Stop iteration if we processed this service already
-            if service_uid in collector:
-                raise StopIteration
-
-            # Get the dependant calculations of the service
-            # (calculations that use the service in their formula).
-            dep_calcs = service.getBackReferences('CalculationAnalysisService')
-            for dep_calc in dep_calcs:
-                # Get the methods linked to this calculation
-                dep_methods = dep_calc.getBackReferences('MethodCalculation')
-                for dep_method in dep_methods:
-                    # Get the services that have this method linked
-                    dep_services = dep_method.getBackReferences('AnalysisServiceMethod')
-                    for dep_service in dep_services:
-
-                        # get the UID of the dependent service
-                        dep_service_uid = api.get_uid(dep_service)
-
-                        # skip services with a different calculation, e.g. when
-                        # the user selected a calculation manually.
-                        if dep_service.getCalculation() != dep_calc:
-                            continue
-
-                        # remember the dependent service
-                        collector[dep_service_uid] = dep_service
-
-                        # yield the dependent service
-                        yield dep_service
-
-                        # check the dependants of the dependant services
-                        for ddep_service in calc_dependants_gen(dep_service,
-                                                                collector=collector):
-                            yield ddep_service
-
-        dependants = {}
-        for dep_service in calc_dependants_gen(service):
-            # Skip the initial (requested) service
-            if dep_service == service:
-                continue
-            uid = api.get_uid(dep_service)
-            dependants[uid] = dep_service
-
-        return dependants
+        graph = getUtility(IServiceDependencyGraph)
+        uids = graph.get_dependants(service)
+        return self.get_objects_by_uids(uids)
 
     def get_service_dependencies_for(self, service):
         """Calculate the dependencies for the given service.
@@ -957,7 +871,7 @@ class ajaxAnalysisRequestAddView(AnalysisRequestAddView):
 
         return info
 
-    @cache(cache_key, store_on_context)
+    @cache(setup_cache_key, store_on_context)
     def get_service_info(self, obj):
         """Returns the info for a Service
         """
@@ -1157,7 +1071,7 @@ class ajaxAnalysisRequestAddView(AnalysisRequestAddView):
         })
         return info
 
-    @cache(cache_key, store_on_context)
+    @cache(setup_cache_key, store_on_context)
     def get_specification_info(self, obj):
         """Returns the info for a Specification
         """
@@ -1387,8 +1301,6 @@ class ajaxAnalysisRequestAddView(AnalysisRequestAddView):
                 template_to_services[uid] = service_uids
                 # remember a mapping of service uid -> templates
                 for service_uid in service_uids:
-                    # append service to services mapping
-                    service = self.get_object_by_uid(service_uid)
                     # remember the template of all services
                     if service_uid in service_to_templates:
                         service_to_templates[service_uid].append(uid)
@@ -1719,8 +1631,8 @@ class ajaxAnalysisRequestAddView(AnalysisRequestAddView):
             return {'errors': errors}
 
         # Process Form
-        ARs = []
-        for n, record in enumerate(valid_records):
+        ar_records = []
+        for record in valid_records:
             client_uid = record.get("Client")
             client = self.get_object_by_uid(client_uid)
 
@@ -1730,13 +1642,15 @@ class ajaxAnalysisRequestAddView(AnalysisRequestAddView):
             # get the specifications and pass them directly to the AR create function.
             specifications = record.pop("Specifications", {})
 
-            # Create the Analysis Request
-            ar = crar(
-                client,
-                self.request,
-                record,
-                specifications=specifications,
-            )
+            ar_records.append({
+                "context": client,
+                "values": record,
+                "specifications": specifications,
+            })
+
+        # Create all Analysis Requests in one go
+        ARs = []
+        for n, ar in enumerate(create_analysisrequests(self.request, ar_records)):
             ARs.append(ar.Title())
 
             _attachments = []
@@ -16,6 +16,7 @@ from bika.lims.utils import isnumber
 from bika.lims.utils import to_utf8, encode_header, createPdf, attachPdf
 from bika.lims.utils import to_utf8, formatDecimalMark, format_supsub
 from bika.lims.utils.analysis import format_uncertainty
+from bika.lims.utils import outofrange
 from bika.lims.vocabularies import getARReportTemplates
 from DateTime import DateTime
 from email.mime.multipart import MIMEMultipart
@@ -60,7 +61,8 @@ class AnalysisRequestPublishView(BrowserView):
         self._cache = {
             '_analysis_data': {},
             '_qcanalyses_data': {},
-            '_ar_data': {}
+            '_ar_data': {},
+            '_result_flags': {}
         }
 
     @property
@@ -671,8 +673,12 @@ class AnalysisRequestPublishView(BrowserView):
         batch = ar.getBatch()
         workflow = getToolByName(self.context, 'portal_workflow')
         showhidden = self.isHiddenAnalysesVisible()
-        for an in ar.getAnalyses(full_objects=True,
-                                 review_state=analysis_states):
+        ar_analyses = ar.getAnalyses(full_objects=True,
+                                     review_state=analysis_states)
+        # Evaluate the out-of-range flags of all analyses at once
+        self._cache['_result_flags'].update(
+            outofrange.evaluate_analyses(ar_analyses))
+        for an in ar_analyses:
 
             # Omit hidden analyses?
             if not showhidden:
@@ -787,7 +793,10 @@ class AnalysisRequestPublishView(BrowserView):
         andict['formatted_uncertainty'] = format_uncertainty(analysis, analysis.getResult(), decimalmark=decimalmark, sciformat=int(scinot))
 
         # Out of range?
-        if specs:
+        flags = self._cache['_result_flags'].get(analysis.UID())
+        if specs and flags is not None:
+            andict['outofrange'] = flags['out_of_range']
+        elif specs:
             adapters = getAdapters((analysis, ), IResultOutOfRange)
             bsc = getToolByName(self.context, "bika_setup_catalog")
             for name, adapter in adapters:
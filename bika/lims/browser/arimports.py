@@ -6,7 +6,9 @@
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
 import csv
+import json
 from DateTime.DateTime import DateTime
+from bika.lims import arimportjob
 from bika.lims import bikaMessageFactory as _
 from bika.lims.browser import BrowserView, ulocalized_time
 from bika.lims.browser.bika_listing import BikaListingView
@@ -312,3 +314,34 @@ class ClientARImportAddView(BrowserView):
             if not existing:
                 return newname
             nr += 1
+
+
+class ARImportProgressView(BrowserView):
+    """Progress of the import of a large AR Import. The page polls the
+    `import_status` view, which imports the rows chunk by chunk.
+    """
+    template = ViewPageTemplateFile('templates/arimport_progress.pt')
+
+    def __call__(self):
+        self.progress = arimportjob.get_progress(self.context)
+        return self.template()
+
+
+class ARImportStatusView(BrowserView):
+    """Returns the progress of the AR Import job as JSON. A POST with
+    process=1 imports the next chunk of rows first, and a POST with resume=1
+    restarts a failed job.
+    """
+
+    def __call__(self):
+        form = self.request.form
+        if self.request.get('REQUEST_METHOD', 'GET') == 'POST':
+            CheckAuthenticator(form)
+            if form.get('resume'):
+                arimportjob.start(self.context)
+            if form.get('process') or form.get('resume'):
+                arimportjob.process(self.context, arimportjob.CHUNK_SIZE)
+        progress = arimportjob.get_progress(self.context)
+        progress['url'] = self.context.aq_parent.absolute_url()
+        self.request.RESPONSE.setHeader("Content-Type", "application/json")
+        return json.dumps(progress)
@@ -25,6 +25,7 @@ from bika.lims.utils import isActive, getHiddenAttributesForClass
 from bika.lims.utils import t
 from bika.lims.utils import to_utf8
 from bika.lims.utils import getFromString
+from bika.lims.utils.retest import retest_batch
 from plone.app.content.browser import tableview
 from plone import api as ploneapi
 from zope.component import getAdapters
@@ -157,6 +158,48 @@ class WorkflowAction:
         self.request.response.redirect(self.destination_url)
         return
 
+    def get_results_records(self, selected_items):
+        """Returns the values of the results entry form for the selected
+        analyses as a dict of analysis UID -> values, as expected by
+        `bika.lims.utils.submission.submit_results`
+        """
+        form = self.request.form
+        # calcs.js has kept item_data and form input interim values synced,
+        # so the json strings from item_data will be the same as the form
+        # values
+        item_data = {}
+        if 'item_data' in form:
+            if isinstance(form['item_data'], list):
+                for i_d in form['item_data']:
+                    for i, d in json.loads(i_d).items():
+                        item_data[i] = d
+            else:
+                item_data = json.loads(form['item_data'])
+        columns = {}
+        for name in ('Result', 'ResultDM', 'Method', 'Instrument', 'Analyst',
+                     'Uncertainty', 'DetectionLimit', 'Remarks'):
+            if name in form:
+                columns[name] = form[name][0]
+        retested = form.get('retested', {})
+        records = {}
+        for uid in selected_items:
+            values = dict([(name, column[uid])
+                           for name, column in columns.items()
+                           if uid in column])
+            if uid in item_data:
+                values['InterimFields'] = item_data[uid]
+            values['Retested'] = uid in retested
+            records[uid] = values
+        return records
+
+    def workflow_action_retract(self):
+        """Retract the selected items. The retests of the retracted analyses
+        are added to their worksheets with one update per worksheet.
+        """
+        action, came_from = self._get_form_workflow_action()
+        with retest_batch():
+            self.workflow_action_default("retract", came_from)
+
     def workflow_action_copy_to_new(self):
         """Invoke the ar_add form in the current context, passing the UIDs of
         the source ARs as request parameters.
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from plone.protect import CheckAuthenticator
+from Products.CMFCore.utils import getToolByName
+from Products.Five.browser import BrowserView
+from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
+
+from bika.lims import catalogprofiler
+
+CATALOGS = ("bika_catalog", "bika_analysis_catalog", "bika_setup_catalog")
+
+# number of query shapes shown per catalog
+MAX_QUERIES = 25
+
+
+class CatalogProfilerView(BrowserView):
+    """Statistics of the catalog query profiler: the slowest query shapes,
+    the index hits and the unused metadata columns of the bika catalogs.
+    A POST with enable, disable or reset controls the profiler.
+    """
+    template = ViewPageTemplateFile("templates/catalog_profiler.pt")
+
+    def __call__(self):
+        form = self.request.form
+        if self.request.get("REQUEST_METHOD", "GET") == "POST":
+            CheckAuthenticator(form)
+            if form.get("enable"):
+                catalogprofiler.enable()
+            elif form.get("disable"):
+                catalogprofiler.disable()
+            elif form.get("reset"):
+                catalogprofiler.reset()
+        self.sort_on = form.get("sort_on", "total")
+        if self.sort_on not in ("total", "max", "mean", "calls"):
+            self.sort_on = "total"
+        return self.template()
+
+    def is_enabled(self):
+        return catalogprofiler.is_enabled()
+
+    def get_catalogs(self):
+        """Returns a list of dicts with the statistics of each catalog
+        """
+        catalogs = []
+        for catalog_id in CATALOGS:
+            catalog = getToolByName(self.context, catalog_id)
+            catalogs.append({
+                "id": catalog_id,
+                "title": catalog.title,
+                "queries": catalogprofiler.get_query_stats(
+                    catalog_id, sort_on=self.sort_on, limit=MAX_QUERIES),
+                "index_hits": catalogprofiler.get_index_hits(catalog),
+                "unused_columns": catalogprofiler.get_unused_columns(catalog),
+                "slow_queries": catalogprofiler.get_slow_queries(catalog_id),
+            })
+        return catalogs
+
+    def format_callers(self, callers):
+        items = sorted(callers.items(), key=lambda item: -item[1])
+        return ", ".join(["{} ({})".format(name or "-", count)
+                          for name, count in items])
@@ -7,6 +7,8 @@
 
 from Products.CMFPlone.utils import safe_unicode
 from bika.lims import bikaMessageFactory as _, logger
+from bika.lims import instrumentlog
+from bika.lims import instrumentvalidity
 from bika.lims.utils import t
 from bika.lims.browser.bika_listing import BikaListingView
 from bika.lims.content.instrumentmaintenancetask import InstrumentMaintenanceTaskStatuses as mstatus
@@ -403,8 +405,8 @@ class InstrumentReferenceAnalysesView(AnalysesView):
                                             'Retractions']
 
 
-        analyses = self.context.getReferenceAnalyses()
-        asuids = [an.UID() for an in analyses]
+        asuids = instrumentlog.get_analysis_uids(
+            self.context, qctypes=instrumentlog.REFERENCE_QCTYPES)
         self.catalog = 'bika_analysis_catalog'
         self.contentFilter = {'UID': asuids}
         self.anjson = {}
@@ -655,6 +657,18 @@ class ajaxGetInstrumentMethods(BrowserView):
         return json.dumps(out)
 
 
+class InstrumentValiditySweepView(BrowserView):
+    """ Recomputes the validity status of all instruments, so that date
+        driven changes (expired certifications, validation and calibration
+        periods) are reflected in the catalog. Meant to be called
+        periodically, e.g. by a clock server or a cron job.
+    """
+
+    def __call__(self):
+        count = instrumentvalidity.sweep()
+        return "{} instruments changed".format(count)
+
+
 class InstrumentQCFailuresViewlet(ViewletBase):
     """ Print a viewlet showing failed instruments
     """
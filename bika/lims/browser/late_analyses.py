@@ -5,13 +5,17 @@
 # Copyright 2011-2017 by it's authors.
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
+import copy
+
 from AccessControl import getSecurityManager
 from DateTime import DateTime
 from Products.CMFCore.utils import getToolByName
 from bika.lims import bikaMessageFactory as _
+from bika.lims import lateness
 from bika.lims.utils import t
 from bika.lims.browser.bika_listing import BikaListingView
 from bika.lims.utils import isActive
+from Products.Five.browser import BrowserView
 from zope.component import getMultiAdapter
 import plone
 
@@ -71,7 +75,9 @@ class LateAnalysesView(BikaListingView):
         ]
 
     def folderitems(self):
-        items = super(LateAnalysesView, self).folderitems()
+        """Render the late analyses from the catalog metadata, without
+        waking up the analyses, their ARs, clients and contacts
+        """
         mtool = getToolByName(self.context, 'portal_membership')
         member = mtool.getAuthenticatedMember()
         roles = member.getRoles()
@@ -80,39 +86,76 @@ class LateAnalysesView(BikaListingView):
             and 'LabManager' not in roles \
             and 'LabClerk' not in roles
 
-        for x in range(len(items)):
-            if not items[x].has_key('obj'):
-                continue
-            obj = items[x]['obj']
-            ar = obj.aq_parent
-            sample = ar.getSample()
-            client = ar.aq_parent
-            contact = ar.getContact()
-            items[x]['Analysis'] = obj.Title()
-            items[x]['RequestID'] = ''
-            items[x]['replace']['RequestID'] = "<a href='%s'>%s</a>" % \
-                 (ar.absolute_url(), ar.Title())
-            items[x]['Client'] = ''
-            if hideclientlink == False:
-                items[x]['replace']['Client'] = "<a href='%s'>%s</a>" % \
-                     (client.absolute_url(), client.Title())
-            items[x]['Contact'] = ''
-            if contact:
-                items[x]['replace']['Contact'] = "<a href='mailto:%s'>%s</a>" % \
-                                                 (contact.getEmailAddress(),
-                                                  contact.getFullname())
-            items[x]['DateReceived'] = self.ulocalized_time(sample.getDateReceived())
-            items[x]['DueDate'] = self.ulocalized_time(obj.getDueDate())
-
-            late = DateTime() - obj.getDueDate()
-            days = int(late / 1)
-            hours = int((late % 1 ) * 24)
-            mins = int((((late % 1) * 24) % 1) * 60)
-            late_str = days and "%s day%s" % (days, days > 1 and 's' or '') or ""
-            if days < 2:
-                late_str += hours and " %s hour%s" % (hours, hours > 1 and 's' or '') or ""
-            if not days and not hours:
-                late_str = "%s min%s" % (mins, mins > 1 and 's' or '')
+        catalog = getToolByName(self.context, self.catalog)
+        query = copy.deepcopy(self.contentFilter)
+        query.update(self.get_filter_bar_queryaddition() or {})
+        brains = catalog(query)[self.limit_from:]
+        show_all = self.request.get('show_all', '').lower() == 'true' \
+            or self.show_all is True or self.pagesize == 0
+        self.show_more = False
+        to_url = self.request.physicalPathToURL
+        now = DateTime()
 
-            items[x]['Late'] = late_str
+        items = []
+        for brain in brains:
+            if not show_all and len(items) >= self.pagesize:
+                self.show_more = True
+                break
+            item = self.make_brain_item(brain)
+            item['Analysis'] = brain.Title
+            item['RequestID'] = ''
+            item['replace']['RequestID'] = "<a href='%s'>%s</a>" % \
+                (to_url(brain.getRequestPath), brain.getRequestID)
+            item['Client'] = ''
+            if not hideclientlink:
+                item['replace']['Client'] = "<a href='%s'>%s</a>" % \
+                    (to_url(brain.getClientPath), brain.getClientTitle)
+            item['Contact'] = ''
+            if brain.getContactEmail:
+                item['replace']['Contact'] = "<a href='mailto:%s'>%s</a>" % \
+                    (brain.getContactEmail, brain.getContactTitle)
+            item['DateReceived'] = self.ulocalized_time(brain.getDateReceived)
+            item['DueDate'] = self.ulocalized_time(brain.getDueDate)
+            item['Late'] = lateness.get_late_string(brain.getDueDate, now)
+            items.append(item)
         return items
+
+    def make_brain_item(self, brain):
+        """Returns a listing item with the basic data of the brain
+        """
+        return {
+            'id': brain.id,
+            'uid': brain.UID,
+            'url': brain.getURL(),
+            'relative_url': brain.getURL(relative=True),
+            'title': brain.Title,
+            'description': '',
+            'portal_type': brain.portal_type,
+            'path': brain.getPath(),
+            'review_state': brain.review_state,
+            'state_class': 'state-%s' % brain.review_state,
+            'class': {},
+            'item_data': '[]',
+            'table_row_class': '',
+            'category': 'None',
+            'type_class': 'contenttype-analysis',
+            'view_url': brain.getURL(),
+            'choices': {},
+            'field': {},
+            'allow_edit': [],
+            'required': [],
+            'before': {},
+            'after': {},
+            'replace': {},
+        }
+
+
+class SweepLatenessView(BrowserView):
+    """Flag the analyses which became late since the last sweep, see
+    bika.lims.lateness. Called every hour by the clock server of
+    buildout.cfg.
+    """
+
+    def __call__(self):
+        count = lateness.sweep()
+        return "{} analyses became late".format(count)
@@ -6,7 +6,9 @@
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
 from AccessControl import getSecurityManager
+from DateTime import DateTime
 from bika.lims.browser import BrowserView
+from bika.lims import qcstats
 from bika.lims import bikaMessageFactory as _
 from bika.lims.utils import t
 from bika.lims.browser.bika_listing import BikaListingView
@@ -88,6 +90,45 @@ class ReferenceAnalysesViewView(BrowserView):
     def get_analyses_json(self):
         return self.get_analyses_view().get_analyses_json()
 
+class QCChartDataView(BrowserView):
+    """ Levey-Jennings chart data of the Reference Sample as JSON.
+
+    The series of the Reference Definition of the sample are returned, one
+    per service (and instrument if instrument_uid is given). Use the request
+    parameters service_uid and instrument_uid to get a single series and
+    sample_only to restrict the points to the results of this sample.
+    """
+
+    def __call__(self):
+        form = self.request.form
+        service_uid = form.get("service_uid") or None
+        instrument_uid = form.get("instrument_uid") or None
+        sample_uid = form.get("sample_only") and self.context.UID() or None
+        window = int(form.get("window") or qcstats.ROLLING_WINDOW)
+        definition_uid = self.context.getField(
+            "ReferenceDefinition").getRaw(self.context) or ""
+
+        series = {}
+        for key in qcstats.get_series_keys(definition_uid, service_uid):
+            if instrument_uid and key[2] != instrument_uid:
+                continue
+            group = instrument_uid and key or key[:2]
+            series.setdefault(group, []).append(key)
+
+        out = []
+        for group, keys in sorted(series.items()):
+            data = qcstats.get_chart_data(keys, sample_uid, window)
+            if sample_uid and not data["points"]:
+                continue
+            data["service_uid"] = group[1]
+            data["instrument_uid"] = instrument_uid
+            out.append(data)
+
+        self.request.RESPONSE.setHeader("Content-Type", "application/json")
+        return json.dumps({"definition_uid": definition_uid,
+                           "series": out})
+
+
 class ReferenceAnalysesView(AnalysesView):
     """ Reference Analyses on this sample
     """
@@ -146,7 +187,6 @@ class ReferenceAnalysesView(AnalysesView):
                         'state_title'],
              },
         ]
-        self.anjson = {}
 
     def isItemAllowed(self, obj):
         allowed = super(ReferenceAnalysesView, self).isItemAllowed(obj)
@@ -162,55 +202,60 @@ class ReferenceAnalysesView(AnalysesView):
         item['Captured'] = self.ulocalized_time(obj.getResultCaptureDate())
         brefs = obj.getBackReferences("WorksheetAnalysis")
         item['Worksheet'] = brefs and brefs[0].Title() or ''
-        # The following item keywords are required for the
-        # JSON return value below, which is used to render graphs.
-        # they are not actually used in the table rendering.
-        item['Keyword'] = service.getKeyword()
-        item['Unit'] = service.getUnit()
-
-        self.addToJSON(obj, service, item)
         return item
 
-    def addToJSON(self, analysis, service, item):
-        """ Adds an analysis item to the self.anjson dict that will be used
-            after the page is rendered to generate a QC Chart
+    def get_analyses_json(self):
+        """ Returns the QC chart data of the verified results of the sample
+            as JSON: {"<service> (<keyword>)": {<sample id>: [rows]}}.
+            The results are read from the QC series of the reference
+            definition (see bika.lims.qcstats), so no reference analysis
+            is woken up.
         """
-        parent = analysis.aq_parent
-        qcid = parent.id
-        serviceref = "%s (%s)" % (item['Service'], item['Keyword'])
-        trows = self.anjson.get(serviceref, {})
-        anrows = trows.get(qcid, [])
-        anid = '%s.%s' % (item['getReferenceAnalysesGroupID'], item['id'])
-        rr = parent.getResultsRangeDict()
-        uid = service.UID()
-        if uid in rr:
-            specs = rr.get(uid, None)
+        anjson = {}
+        sample = self.context
+        definition_uid = sample.getField(
+            "ReferenceDefinition").getRaw(sample) or ""
+        series = {}
+        for key in qcstats.get_series_keys(definition_uid):
+            series.setdefault(key[1], []).append(key)
+        if not series:
+            return json.dumps(anjson)
+
+        bsc = getToolByName(sample, 'bika_setup_catalog')
+        services = dict([(brain.UID, brain) for brain in
+                         bsc(portal_type='AnalysisService',
+                             UID=series.keys())])
+        rr = sample.getResultsRangeDict()
+        for uid, keys in series.items():
+            if uid not in rr or uid not in services:
+                continue
+            data = qcstats.get_chart_data(keys, sample_uid=sample.UID())
+            if not data["points"]:
+                continue
+            service = services[uid]
+            specs = rr[uid]
             smin = float(specs.get('min', 0))
             smax = float(specs.get('max', 0))
             error = float(specs.get('error', 0))
             target = float(specs.get('result', 0))
-            result = float(item['Result'])
             error_amount = ((target / 100) * error) if target > 0 else 0
-            upper = smax + error_amount
-            lower = smin - error_amount
-
-            anrow = {'date': item['Captured'],
-                     'min': smin,
-                     'max': smax,
-                     'target': target,
-                     'error': error,
-                     'erroramount': error_amount,
-                     'upper': upper,
-                     'lower': lower,
-                     'result': result,
-                     'unit': item['Unit'],
-                     'id': item['uid']}
-            anrows.append(anrow)
-            trows[qcid] = anrows
-            self.anjson[serviceref] = trows
-
-    def get_analyses_json(self):
-        return json.dumps(self.anjson)
+            rows = []
+            for point in data["points"]:
+                rows.append({
+                    'date': self.ulocalized_time(DateTime(point["date"])),
+                    'min': smin,
+                    'max': smax,
+                    'target': target,
+                    'error': error,
+                    'erroramount': error_amount,
+                    'upper': smax + error_amount,
+                    'lower': smin - error_amount,
+                    'result': point["result"],
+                    'unit': service.getUnit or '',
+                    'id': point["uid"]})
+            serviceref = "%s (%s)" % (service.Title, service.getKeyword)
+            anjson[serviceref] = {sample.id: rows}
+        return json.dumps(anjson)
 
 
 class ReferenceResultsView(BikaListingView):
@@ -13,6 +13,7 @@ from DateTime import DateTime
 from Products.CMFCore.utils import getToolByName
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 from bika.lims import bikaMessageFactory as _
+from bika.lims import qcstats
 from bika.lims.utils import t, isAttributeHidden
 from bika.lims.browser import BrowserView
 from bika.lims.browser.reports.selection_macros import SelectionMacrosView
@@ -71,6 +72,7 @@ class Report(BrowserView):
 
         self.contentFilter = {'portal_type': 'ReferenceAnalysis',
                               'review_state': ['verified', 'published'],
+                              'getServiceUID': service_uid,
                               'path': {
                               "query": "/".join(sample.getPhysicalPath()),
                               "level": 0}}
@@ -92,64 +94,69 @@ class Report(BrowserView):
             message = _("No analyses matched your query")
             self.context.plone_utils.addPortalMessage(message, 'error')
             return self.default_template()
+        proxies = dict([(proxy.UID, proxy) for proxy in proxies])
+
+        # The results come from the QC series of the reference definition
+        # (see bika.lims.qcstats), the other columns from the catalog
+        # metadata, so no reference analysis is woken up
+        definition_uid = sample.getField("ReferenceDefinition").getRaw(sample)
+        keys = qcstats.get_series_keys(definition_uid or "", service_uid)
+        stats = qcstats.get_chart_data(keys, sample_uid=sample.UID())
+        points = [point for point in stats["points"]
+                  if point["uid"] in proxies]
+        if not points:
+            message = _("No analyses matched your query")
+            self.context.plone_utils.addPortalMessage(message, 'error')
+            return self.default_template()
 
-        # Compile a list with all relevant analysis data
-        analyses = []
+        resultsrange = [x for x in sample.getReferenceResults()
+                        if x['uid'] == service_uid][0]
+        range_min = float(resultsrange['min'])
+        range_max = float(resultsrange['max'])
+        precision = service.getPrecision() or 2
 
         out_of_range_count = 0
-        results = []
         capture_dates = []
-
         plotdata = ""
         tabledata = []
 
-        for analysis in proxies:
-            analysis = analysis.getObject()
-            service = analysis.getService()
-            resultsrange = \
-            [x for x in sample.getReferenceResults() if x['uid'] == service_uid][
-                0]
-            try:
-                result = float(analysis.getResult())
-                results.append(result)
-            except:
-                result = analysis.getResult()
-            capture_dates.append(analysis.getResultCaptureDate())
-
-            if result < float(resultsrange['min']) or result > float(
-                    resultsrange['max']):
-                out_of_range_count += 1
-
-            try:
-                precision = str(analysis.getPrecision())
-            except:
-                precision = "2"
+        for point in points:
+            proxy = proxies[point["uid"]]
+            result = point["result"]
+            captured = proxy.getResultCaptureDate or DateTime(point["date"])
+            capture_dates.append(captured)
 
-            try:
-                formatted_result = str("%." + precision + "f") % result
-            except:
-                formatted_result = result
+            if result < range_min or result > range_max:
+                out_of_range_count += 1
 
-            tabledata.append({_("Analysis"): analysis.getId(),
+            formatted_result = str("%." + str(precision) + "f") % result
+            tabledata.append({_("Analysis"): proxy.id,
                               _("Result"): formatted_result,
-                              _("Analyst"): analysis.getAnalyst(),
-                              _(
-                                  "Captured"): analysis.getResultCaptureDate().strftime(
+                              _("Analyst"): proxy.getAnalyst or "",
+                              _("Captured"): captured.strftime(
                                   self.date_format_long)})
 
             plotdata += "%s\t%s\t%s\t%s\n" % (
-                analysis.getResultCaptureDate().strftime(self.date_format_long),
+                captured.strftime(self.date_format_long),
                 result,
                 resultsrange['min'],
                 resultsrange['max']
             )
         plotdata.encode('utf-8')
 
-        result_values = [int(r) for r in results]
-        result_dates = [c for c in capture_dates]
+        result_dates = capture_dates
+
+        self.parms += [
+            {"title": _("Total analyses"), "value": len(points)},
+        ]
 
+        # Statistics of all verified results of the reference definition
         self.parms += [
-            {"title": _("Total analyses"), "value": len(proxies)},
+            {"title": _("Mean"), "value": "%.4g" % stats["mean"]},
+            {"title": _("Standard deviation"),
+             "value": "%.4g" % stats["sd"]},
+            {"title": _("Westgard rejections"),
+             "value": stats["rejected"]},
         ]
 
         # # This variable is output to the TAL
@@ -161,7 +168,7 @@ class Report(BrowserView):
             'footnotes': [],
         }
 
-        if MinimumResults <= len(proxies):
+        if MinimumResults <= len(points):
             plotscript = """
             set terminal png transparent truecolor enhanced size 700,350 font "Verdana, 8"
             set title "%(title)s"
@@ -9,13 +9,14 @@ import tempfile
 
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 from bika.lims import bikaMessageFactory as _
-from bika.lims.interfaces import IResultOutOfRange
-from bika.lims.utils import t, dicts_to_dict
+from bika.lims.interfaces import ISpecificationIndex
+from bika.lims.utils import t
+from bika.lims.utils import outofrange
 from bika.lims.browser import BrowserView
 from bika.lims.browser.reports.selection_macros import SelectionMacrosView
 from gpw import plot
 from plone.app.layout.globals.interfaces import IViewView
-from zope.component import getAdapters
+from zope.component import getUtility
 from zope.interface import implements
 import os
 
@@ -31,23 +32,6 @@ class Report(BrowserView):
         self.report = report
         self.selection_macros = SelectionMacrosView(self.context, self.request)
 
-    def get_analysis_spec(self, analysis):
-        rr = dicts_to_dict(analysis.aq_parent.getResultsRange(), 'keyword')
-        return rr.get(analysis.getKeyword(), None)
-
-    def ResultOutOfRange(self, analysis):
-        """ Template wants to know, is this analysis out of range?
-        We scan IResultOutOfRange adapters, and return True if any IAnalysis
-        adapters trigger a result.
-        """
-        adapters = getAdapters((analysis, ), IResultOutOfRange)
-        spec = self.get_analysis_spec(analysis)
-        for name, adapter in adapters:
-            if not spec:
-                return False
-            if adapter(specification=spec):
-                return True
-
     def __call__(self):
 
         MinimumResults = self.context.bika_setup.getMinimumResults()
@@ -126,16 +110,20 @@ class Report(BrowserView):
             self.context.plone_utils.addPortalMessage(message, 'error')
             return self.default_template()
 
+        # Evaluate the results ranges of all analyses at once
+        objects = [proxy.getObject() for proxy in proxies]
+        ranges = getUtility(ISpecificationIndex).get_ranges(objects)
+        result_flags = outofrange.evaluate_analyses(objects, ranges)
+
         # # Compile a list of dictionaries, with all relevant analysis data
-        for analysis in proxies:
-            analysis = analysis.getObject()
+        for analysis in objects:
             result = analysis.getResult()
             client = analysis.aq_parent.aq_parent
             uid = analysis.UID()
             service = analysis.getService()
             keyword = service.getKeyword()
             service_title = "%s (%s)" % (service.Title(), keyword)
-            result_in_range = self.ResultOutOfRange(analysis)
+            result_in_range = result_flags[uid]
 
             if service_title not in analyses.keys():
                 analyses[service_title] = []
@@ -154,6 +142,7 @@ class Report(BrowserView):
                 'Captured': analysis.getResultCaptureDate(),
                 'Uncertainty': analysis.getUncertainty(),
                 'result_in_range': result_in_range,
+                'spec': ranges.get(uid) or {},
                 'Unit': service.getUnit(),
                 'Keyword': keyword,
                 'icons': '',
@@ -229,18 +218,16 @@ class Report(BrowserView):
                 a['Result'] = a['obj'].getFormattedResult()
 
                 in_range = a['result_in_range']
-                # result out of range
-                if str(in_range[0]) == 'False':
-                    out_of_range_count += 1
-                    a['Result'] = "%s %s" % (a['Result'], error_icon)
                 # result almost out of range
-                if str(in_range[0]) == '1':
+                if in_range['acceptable']:
                     in_shoulder_range_count += 1
                     a['Result'] = "%s %s" % (a['Result'], warning_icon)
+                # result out of range
+                elif in_range['out_of_range']:
+                    out_of_range_count += 1
+                    a['Result'] = "%s %s" % (a['Result'], error_icon)
 
-                spec = {}
-                if hasattr(a["obj"], 'specification') and a["obj"].specification:
-                    spec = a["obj"].specification
+                spec = a['spec']
 
                 plotdata += "%s\t%s\t%s\t%s\t%s\n" % (
                     a['Sampled'],
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import json
+
+import plone.protect
+from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
+
+from bika.lims.browser import BrowserView
+from bika.lims.utils.receive import receive_samples
+
+# maximum number of identifiers received in one request
+BATCH_SIZE = 50
+
+
+class ReceiveStationView(BrowserView):
+    """Receive station: the scanned barcodes are queued by the browser and
+    sent in batches to the `receive_samples` view, which receives them at
+    once and returns the outcome of each scan.
+    """
+    template = ViewPageTemplateFile("templates/receive_station.pt")
+
+    def __call__(self):
+        self.batch_size = BATCH_SIZE
+        return self.template()
+
+
+class ReceiveSamplesView(BrowserView):
+    """Receive the Samples and ARs with the scanned identifiers.
+
+    The 'identifiers' request parameter is a JSON list of ids, barcodes or
+    Client Sample IDs. Returns the outcome of each identifier as JSON, see
+    `bika.lims.utils.receive`.
+    """
+
+    def __call__(self):
+        plone.protect.CheckAuthenticator(self.request)
+        plone.protect.PostOnly(self.request)
+        identifiers = json.loads(self.request.get("identifiers", "[]"))
+        outcomes = receive_samples(identifiers[:BATCH_SIZE])
+        result = {"outcomes": outcomes, "stickers_url": ""}
+        setup = self.context.bika_setup
+        received = [outcome["id"] for outcome in outcomes.values()
+                    if outcome["received"]]
+        if received and "receive" in setup.getAutoPrintStickers():
+            result["stickers_url"] = "{}/sticker?template={}&items={}".format(
+                self.context.absolute_url(), setup.getAutoStickerTemplate(),
+                ",".join(sorted(set(received))))
+        self.request.RESPONSE.setHeader("Content-Type", "application/json")
+        return json.dumps(result)
@@ -11,6 +11,7 @@ from bika.lims import PMF
 from bika.lims import bikaMessageFactory as _
 from bika.lims.utils import t
 from bika.lims.browser.bika_listing import BikaListingView
+from bika.lims.interfaces import ISamplesFolder
 from bika.lims.permissions import *
 from bika.lims.utils import getUsers
 from plone.app.layout.globals.interfaces import IViewView
@@ -56,6 +57,12 @@ class SamplesView(BikaListingView):
                     }
         else:
                 self.context_actions = {}
+        mtool = getToolByName(self.context, 'portal_membership')
+        if ISamplesFolder.providedBy(self.context) and \
+                mtool.checkPermission(ReceiveSample, self.context):
+            self.context_actions[_('Receive station')] = {
+                'url': 'receive_station',
+                'icon': '++resource++bika.lims.images/sample.png'}
         self.show_sort_column = False
         self.show_select_row = False
         self.show_select_column = True
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from Products.Five.browser import BrowserView
+
+from bika.lims import statehistogram
+
+
+class RebuildStateHistogramsView(BrowserView):
+    """Rebuild the review state histograms of all ARs and Worksheets, e.g.
+    to repair inconsistent histograms after a manual state change.
+    """
+
+    def __call__(self):
+        count = statehistogram.rebuild_all()
+        return "Rebuilt {} state histograms".format(count)
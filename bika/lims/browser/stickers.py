@@ -6,16 +6,127 @@
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
 from Products.CMFCore.utils import getToolByName
+from bika.lims import api
 from bika.lims import bikaMessageFactory as _, t
 from bika.lims import logger
 from bika.lims.browser import BrowserView
 from bika.lims.vocabularies import getStickerTemplates
+from plone.memoize import view
 from plone.resource.utils import iterDirectoriesOfType, queryResourceDirectory
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 import glob, os, os.path, sys, traceback
 
 import os
 
+# compiled sticker templates by path. A template is parsed once per process
+# and rendered for every sticker
+_templates = {}
+
+
+def get_template(path):
+    """Returns the compiled page template of the sticker template file
+    """
+    template = _templates.get(path)
+    if template is None:
+        template = _templates[path] = ViewPageTemplateFile(path)
+    return template
+
+
+def get_parent_id(brain_or_object):
+    """Returns the id of the parent of the brain or object
+    """
+    return api.get_parent_path(brain_or_object).rpartition("/")[2]
+
+
+class StickerItem(object):
+    """ One sticker: the analysis request, the sample and the sample
+        partition of the sticker, as catalog brains or objects.
+
+        Indexing the item returns the objects, e.g. item[1] is the sample, so
+        the sticker templates can use it as the [ar, sample, partition] array
+        they always got. The objects are only woken up when a template uses
+        them: `getData` returns the data of the sticker from the catalog
+        metadata.
+    """
+
+    # the sticker templates are restricted code
+    __allow_access_to_unprotected_subobjects__ = 1
+
+    def __init__(self, ar, sample, part):
+        self.brains = [ar, sample, part]
+        self.objects = {}
+
+    def __getitem__(self, index):
+        brain = self.brains[index]
+        if brain is None:
+            return None
+        if index not in self.objects:
+            self.objects[index] = api.get_object(brain)
+        return self.objects[index]
+
+    def __len__(self):
+        return len(self.brains)
+
+    def __iter__(self):
+        return iter([self[index] for index in range(len(self))])
+
+    def getId(self):
+        """ The id of the partition of the sticker, or of the sample if none
+        """
+        ar, sample, part = self.brains
+        return api.get_id(part or sample)
+
+    def getData(self, show_partitions=False):
+        """ Returns a dict with the data of the sticker, read from the
+            catalog metadata of the sample
+        """
+        ar, sample, part = self.brains
+        value = lambda name: api.safe_getattr(sample, name, None) or ""
+        date_sampled = value("getDateSampled")
+        data = {
+            "id": self.getId(),
+            "ar_id": ar and api.get_id(ar) or "",
+            "sample_id": api.get_id(sample),
+            "client_sample_id": value("getClientSampleID"),
+            "sample_type": value("getSampleTypeTitle"),
+            "sample_point": value("getSamplePointTitle"),
+            "date_sampled": date_sampled and date_sampled.Date() or "",
+        }
+        data["barcode"] = data["sample_id"]
+        if part and show_partitions:
+            data["barcode"] = data["id"]
+        return data
+
+
+def escape_zpl(value):
+    """ Returns the value as utf-8 field data of a ZPL label. The ^ and ~
+        characters are ZPL commands
+    """
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    return str(value).replace("^", " ").replace("~", " ")
+
+
+def render_zpl(data):
+    """ Returns the ZPL label of a sticker, for direct printing on Zebra
+        label printers: a Code 128 barcode, the sticker id, the sample type
+        and point and the sampling date
+    """
+    lines = [
+        "^XA",
+        "^CI28",
+        "^FO20,20^BCN,60,N,N,N^FD{}^FS".format(escape_zpl(data["barcode"])),
+        "^FO20,90^A0N,24,24^FD{}^FS".format(escape_zpl(data["id"])),
+        "^FO20,120^A0N,20,20^FD{} {}^FS".format(
+            escape_zpl(data["sample_type"]), escape_zpl(data["sample_point"])),
+        "^FO20,145^A0N,20,20^FD{} {}^FS".format(
+            escape_zpl(data["date_sampled"]),
+            escape_zpl(data["client_sample_id"])),
+        "^XZ",
+    ]
+    return "\n".join(lines)
+
+
 class Sticker(BrowserView):
     """ Invoked via URL on an object or list of objects from the types
         AnalysisRequest, Sample, SamplePartition or ReferenceSample.
@@ -29,33 +140,33 @@ class Sticker(BrowserView):
 
     def __call__(self):
         self.rendered_items = []
-        bc = getToolByName(self.context, 'bika_catalog')
+        self.item_index = 0
         items = self.request.get('items', '')
         if items:
-            self.items = [o.getObject() for o in bc(id=items.split(","))]
+            query = {"id": items.split(",")}
         else:
+            query = {"UID": api.get_uid(self.context)}
+        self.items = api.search(query, "bika_catalog")
+        if not self.items and not items:
             self.items = [self.context,]
-
-        new_items = []
-        for i in self.items:
-            outitems = self._populateItems(i)
-            new_items.extend(outitems)
-
-        self.items = new_items
+        self.items = self._populateItems(self.items)
         if not self.items:
             logger.warning("Cannot print stickers: no items specified in request")
             self.request.response.redirect(self.context.absolute_url())
             return
 
+        if self.request.get('format', '') == 'zpl':
+            return self.renderZPL()
         return self.template()
 
-    def _populateItems(self, item):
-        """ Creates an wel-defined array for this item to make the sticker
-            template easy to render. Each position of the array has a secondary
-            array, one per partition.
+    def _populateItems(self, items):
+        """ Returns a list of StickerItem, one per sticker, for the given
+            brains (or objects) of AnalysisRequest, Sample, SamplePartition or
+            ReferenceSample. The samples of the ARs and the partitions of the
+            samples are searched at once in bika_catalog, so no object is
+            woken up.
 
-            If the item is an object from an AnalysisRequest type, returns an
-            array with the following structure:
+            The stickers of an AnalysisRequest are:
                 [
                  [ar_object, ar_sample, ar_sample_partition-1],
                  [ar_object, ar_sample, ar_sample_partition-2],
@@ -63,39 +174,62 @@ class Sticker(BrowserView):
                  [ar_object, ar_sample, ara_sample_partition-n]
                 ]
 
-            If the item is an object from Sample type, returns an arary with the
-            following structure:
+            The stickers of a Sample are:
                 [
                  [None, sample, sample_partition-1],
                  [None, sample, sample_partition-2],
                  ...
                 ]
 
-            If the item is an object from ReferenceSample type, returns an
-            array with the following structure:
-                [[None, refsample, None]]
-            Note that in this case, the array always have a length=1
+            The sticker of a SamplePartition is:
+                [[None, sample, sample_partition]]
+
+            A ReferenceSample has no partitions, so no stickers.
         """
-        ar = None
-        sample = None
-        parts = []
-        if item.portal_type == 'AnalysisRequest':
-            ar = item
-            sample = item.getSample()
-            parts = sample.objectValues('SamplePartition')
-        elif item.portal_type == 'Sample':
-            sample = item
-            parts = sample.objectValues('SamplePartition')
-        elif item.portal_type == 'SamplePartition':
-            sample = item.aq_parent
-            parts = [item,]
-        elif item.portal_type == 'ReferenceSample':
-            sample = item
-
-        items = []
-        for p in parts:
-            items.append([ar, sample, p])
-        return items
+        # the samples of the ARs and of the partitions
+        sample_ids = []
+        for item in items:
+            portal_type = api.get_portal_type(item)
+            sample_id = None
+            if portal_type == 'AnalysisRequest':
+                sample_id = api.safe_getattr(item, "getSampleID", None)
+            elif portal_type == 'SamplePartition':
+                sample_id = get_parent_id(item)
+            elif portal_type == 'Sample':
+                sample_id = api.get_id(item)
+            sample_ids.append(sample_id)
+        samples = {}
+        if sample_ids:
+            query = {"portal_type": "Sample", "id": filter(None, sample_ids)}
+            for brain in api.search(query, "bika_catalog"):
+                samples[api.get_id(brain)] = brain
+
+        # the partitions of the samples
+        parts = {}
+        if samples:
+            query = {"portal_type": "SamplePartition",
+                     "path": {"query": [api.get_path(sample)
+                                        for sample in samples.values()],
+                              "depth": 1},
+                     "sort_on": "getObjPositionInParent"}
+            for brain in api.search(query, "bika_catalog"):
+                parts.setdefault(get_parent_id(brain), []).append(brain)
+
+        stickers = []
+        for item, sample_id in zip(items, sample_ids):
+            portal_type = api.get_portal_type(item)
+            sample = samples.get(sample_id)
+            if sample is None:
+                continue
+            if portal_type == 'AnalysisRequest':
+                stickers.extend([StickerItem(item, sample, part)
+                                 for part in parts.get(sample_id, [])])
+            elif portal_type == 'Sample':
+                stickers.extend([StickerItem(None, sample, part)
+                                 for part in parts.get(sample_id, [])])
+            elif portal_type == 'SamplePartition':
+                stickers.append(StickerItem(None, sample, item))
+        return stickers
 
     def getAvailableTemplates(self):
         """ Returns an array with the templates of stickers available. Each
@@ -112,6 +246,7 @@ class Sticker(BrowserView):
             templates.append(out)
         return templates
 
+    @view.memoize
     def getSelectedTemplate(self):
         """ Returns the id of the sticker template selected. If no specific
             template found in the request (parameter template), returns the
@@ -140,6 +275,7 @@ class Sticker(BrowserView):
             rq_template = 'Code_128_1x48mm.pt'
         return '%s:%s' % (prefix, rq_template) if prefix else rq_template
 
+    @view.memoize
     def getSelectedTemplateCSS(self):
         """ Looks for the CSS file from the selected template and return its
             contents. If the selected template is default.pt, looks for a
@@ -165,6 +301,18 @@ class Sticker(BrowserView):
                     content = content_file.read()
         return content
 
+    @view.memoize
+    def getSelectedTemplatePath(self):
+        """ Returns the full path of the selected sticker template file
+        """
+        templates_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     'templates/stickers')
+        embedt = self.getSelectedTemplate()
+        if embedt.find(':') >= 0:
+            prefix, embedt = embedt.split(':')
+            templates_dir = queryResourceDirectory('stickers', prefix).directory
+        return os.path.join(templates_dir, embedt)
+
     def nextItem(self):
         """ Iterates to the next item in the list and moves one position up the
             item index. If the end of the list of items is reached, returns the
@@ -174,7 +322,7 @@ class Sticker(BrowserView):
             self.item_index = 0
             self.rendered_items = []
         self.current_item = self.items[self.item_index]
-        self.rendered_items.append(self.current_item[2].getId())
+        self.rendered_items.append(self.current_item.getId())
         self.item_index += 1
         return self.current_item
 
@@ -187,20 +335,45 @@ class Sticker(BrowserView):
             bika.lims' Code_128_1x48mm.pt template (was sticker_small.pt).
         """
         curritem = self.nextItem()
-        templates_dir = 'templates/stickers'
-        embedt = self.getSelectedTemplate()
-        if embedt.find(':') >= 0:
-            prefix, embedt = embedt.split(':')
-            templates_dir = queryResourceDirectory('stickers', prefix).directory
-        fullpath = os.path.join(templates_dir, embedt)
+        fullpath = self.getSelectedTemplatePath()
         try:
-            embed = ViewPageTemplateFile(fullpath)
+            embed = get_template(fullpath)
             return embed(self)
         except:
             tbex = traceback.format_exc()
-            stickerid = curritem[2].id if curritem[2] else curritem[1].id
             return "<div class='error'>%s - %s '%s':<pre>%s</pre></div>" % \
-                    (stickerid, _("Unable to load the template"), embedt, tbex)
+                    (curritem.getId(), _("Unable to load the template"),
+                     os.path.basename(fullpath), tbex)
+
+    def renderStickers(self):
+        """ Renders all the stickers in one pass with the selected template,
+            compiled once. A template can render several items at once by
+            calling nextItem (e.g. two stickers per label): the items it
+            consumes are skipped.
+        """
+        self.item_index = 0
+        self.rendered_items = []
+        stickers = []
+        while self.item_index < len(self.items):
+            index = self.item_index
+            stickers.append(self.renderItem())
+            if self.item_index <= index:
+                # the template went past the last item and restarted
+                break
+        return stickers
+
+    def renderZPL(self):
+        """ Returns the ZPL labels of all the stickers, as a stream for direct
+            printing on label printers. The labels are built from the catalog
+            metadata, so the objects are not woken up.
+        """
+        show_partitions = self.context.bika_setup.getShowPartitions()
+        labels = [render_zpl(item.getData(show_partitions))
+                  for item in self.items]
+        self.request.response.setHeader("Content-Type", "application/zpl")
+        self.request.response.setHeader(
+            "Content-Disposition", "inline; filename=stickers.zpl")
+        return "\n".join(labels)
 
     def getItemsURL(self):
         req_items = self.request.get('items', '')
@@ -6,6 +6,7 @@
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
 from bika.lims.utils import t
+from bika.lims.utils.submission import submit_results
 from operator import itemgetter
 from Products.Archetypes.config import REFERENCE_CATALOG
 from Products.CMFCore.utils import getToolByName
@@ -145,3 +146,29 @@ class SetInstrument():
         if not instrument:
             raise Exception("Unable to lookup instrument")
         self.context.setInstrument(instrument)
+
+
+class SubmitResults():
+    """Save and submit the results of many analyses of the worksheet at once.
+
+    The 'results' request parameter is a JSON mapping of analysis UID ->
+    values (Result, InterimFields, Method, Instrument...), see
+    `bika.lims.utils.submission`. Returns the outcome of each analysis as
+    JSON. Analyses which are not assigned to the worksheet are ignored.
+    """
+
+    def __init__(self, context, request):
+        self.context = context
+        self.request = request
+
+    def __call__(self):
+        plone.protect.CheckAuthenticator(self.request)
+        plone.protect.PostOnly(self.request)
+        records = json.loads(self.request.get('results', '{}'))
+        submit = self.request.get('submit', 'true') != 'false'
+        uids = [slot['analysis_uid'] for slot in self.context.getLayout()]
+        records = dict([(uid, values) for uid, values in records.items()
+                        if uid in uids])
+        outcomes = submit_results(records, submit=submit)
+        self.request.RESPONSE.setHeader('Content-Type', 'application/json')
+        return json.dumps(outcomes)
@@ -14,6 +14,8 @@ from bika.lims.permissions import EditResults, EditWorksheet, ManageWorksheets
 from bika.lims.subscribers import doActionFor
 from bika.lims.subscribers import skip
 from bika.lims.utils import isActive
+from bika.lims.utils.retest import retest_batch
+from bika.lims.utils.submission import submit_results
 from Products.Archetypes.config import REFERENCE_CATALOG
 from Products.CMFCore.utils import getToolByName
 from Products.CMFCore.WorkflowCore import WorkflowException
@@ -156,112 +158,14 @@ class WorksheetWorkflowAction(WorkflowAction):
     def submit(self):
         """ Saves the form
         """
-
-        form = self.request.form
-        remarks = form.get('Remarks', [{}])[0]
-        results = form.get('Result',[{}])[0]
-        retested = form.get('retested', {})
-        methods = form.get('Method', [{}])[0]
-        instruments = form.get('Instrument', [{}])[0]
-        analysts = self.request.form.get('Analyst', [{}])[0]
-        uncertainties = self.request.form.get('Uncertainty', [{}])[0]
-        dlimits = self.request.form.get('DetectionLimit', [{}])[0]
         selected = WorkflowAction._get_selected_items(self)
-        workflow = getToolByName(self.context, 'portal_workflow')
-        rc = getToolByName(self.context, REFERENCE_CATALOG)
-        sm = getSecurityManager()
-
-        hasInterims = {}
-        # XXX combine data from multiple bika listing tables.
-        item_data = {}
-        if 'item_data' in form:
-            if type(form['item_data']) == list:
-                for i_d in form['item_data']:
-                    for i, d in json.loads(i_d).items():
-                        item_data[i] = d
-            else:
-                item_data = json.loads(form['item_data'])
-
-        # Iterate for each selected analysis and save its data as needed
-        for uid, analysis in selected.items():
-
-            allow_edit = sm.checkPermission(EditResults, analysis)
-            analysis_active = isActive(analysis)
-
-            # Need to save remarks?
-            if uid in remarks and allow_edit and analysis_active:
-                analysis.setRemarks(remarks[uid])
-
-            # Retested?
-            if uid in retested and allow_edit and analysis_active:
-                analysis.setRetested(retested[uid])
-
-            # Need to save the instrument?
-            if uid in instruments and analysis_active:
-                # TODO: Add SetAnalysisInstrument permission
-                # allow_setinstrument = sm.checkPermission(SetAnalysisInstrument)
-                allow_setinstrument = True
-                # ---8<-----
-                if allow_setinstrument == True:
-                    # The current analysis allows the instrument regards
-                    # to its analysis service and method?
-                    if (instruments[uid]==''):
-                        previnstr = analysis.getInstrument()
-                        if previnstr:
-                            previnstr.removeAnalysis(analysis)
-                        analysis.setInstrument(None);
-                    elif analysis.isInstrumentAllowed(instruments[uid]):
-                        previnstr = analysis.getInstrument()
-                        if previnstr:
-                            previnstr.removeAnalysis(analysis)
-                        analysis.setInstrument(instruments[uid])
-                        instrument = analysis.getInstrument()
-                        instrument.addAnalysis(analysis)
-                        if analysis.portal_type == 'ReferenceAnalysis':
-                            instrument.setDisposeUntilNextCalibrationTest(False)
-
-            # Need to save the method?
-            if uid in methods and analysis_active:
-                # TODO: Add SetAnalysisMethod permission
-                # allow_setmethod = sm.checkPermission(SetAnalysisMethod)
-                allow_setmethod = True
-                # ---8<-----
-                if allow_setmethod == True and analysis.isMethodAllowed(methods[uid]):
-                    analysis.setMethod(methods[uid])
-
-            # Need to save the analyst?
-            if uid in analysts and analysis_active:
-                analysis.setAnalyst(analysts[uid]);
-
-            # Need to save the uncertainty?
-            if uid in uncertainties and analysis_active:
-                analysis.setUncertainty(uncertainties[uid])
-
-            # Need to save the detection limit?
-            if analysis_active and uid in dlimits and dlimits[uid]:
-                analysis.setDetectionLimitOperand(dlimits[uid])
-
-            # Need to save results?
-            if uid in results and results[uid] and allow_edit \
-                and analysis_active:
-                interims = item_data.get(uid, [])
-                analysis.setInterimFields(interims)
-                analysis.setResult(results[uid])
-                analysis.reindexObject()
-
-                can_submit = True
-                deps = analysis.getDependencies() \
-                        if hasattr(analysis, 'getDependencies') else []
-                for dependency in deps:
-                    if workflow.getInfoFor(dependency, 'review_state') in \
-                       ('to_be_sampled', 'to_be_preserved',
-                        'sample_due', 'sample_received'):
-                        can_submit = False
-                        break
-                if can_submit:
-                    # doActionFor transitions the analysis to verif pending,
-                    # so must only be done when results are submitted.
-                    doActionFor(analysis, 'submit')
+        records = self.get_results_records(selected)
+        # The detection limit operand is only saved if set
+        for values in records.values():
+            if not values.get('DetectionLimit'):
+                values.pop('DetectionLimit', None)
+        # Save the results, recalculate and submit in one go
+        submit_results(records)
 
         # Maybe some analyses need to be retracted due to a QC failure
         # Done here because don't know if the last selected analysis is
@@ -303,19 +207,20 @@ class WorksheetWorkflowAction(WorkflowAction):
                     toretract[a.UID] = a
 
         retracted = []
-        for analysis in toretract.itervalues():
-            try:
-                # add a remark to this analysis
-                failedtxt = ulocalized_time(DateTime(), long_format=0)
-                failedtxt = '%s: %s' % (failedtxt, _("Instrument failed reference test"))
-                analysis.setRemarks(failedtxt)
-
-                # retract the analysis
-                doActionFor(analysis, 'retract')
-                retracted.append(analysis)
-            except:
-                # Already retracted as a dependant from a previous one?
-                pass
+        with retest_batch():
+            for analysis in toretract.itervalues():
+                try:
+                    # add a remark to this analysis
+                    failedtxt = ulocalized_time(DateTime(), long_format=0)
+                    failedtxt = '%s: %s' % (failedtxt, _("Instrument failed reference test"))
+                    analysis.setRemarks(failedtxt)
+
+                    # retract the analysis
+                    doActionFor(analysis, 'retract')
+                    retracted.append(analysis)
+                except:
+                    # Already retracted as a dependant from a previous one?
+                    pass
 
         if len(retracted) > 0:
             # Create the Retracted Analyses List
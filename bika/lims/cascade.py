@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from plone.api.exc import InvalidParameterError
+
+from bika.lims import api
+from bika.lims import logger
+from bika.lims.utils.indexing import deferred_indexing
+
+"""Cascade planner for Sample transitions
+
+A transition of a Sample is propagated to its Partitions, Analysis Requests
+and Analyses. Each of these transitions used to cascade again into the
+relatives of the transitioned object (Partition -> Analyses -> Sample -> ARs,
+AR -> Sample -> Analyses), which checked the same objects and reindexed them
+over and over.
+
+The planner computes the full set of (object, transition) pairs up front,
+from the workflow definitions and the current states of the objects, and
+executes them in one go:
+
+- the planned pairs are recorded in the request while the plan is executed.
+  `bika.lims.workflow.doActionFor` does not perform planned transitions, so
+  the workflow scripts of the transitioned objects don't cascade again
+- the workflow scripts of the objects still run, e.g. to set the date
+  received
+- the reindex operations are coalesced (see `bika.lims.utils.indexing`), so
+  each object is reindexed once with the union of the requested indexes
+"""
+
+CASCADE_KEY = "workflow_cascade"
+
+PARTITIONS = "partitions"
+ANALYSIS_REQUESTS = "analysisrequests"
+ANALYSES = "analyses"
+
+# Sample transition -> relatives the transition is propagated to
+SAMPLE_CASCADES = {
+    "receive": (PARTITIONS, ANALYSIS_REQUESTS, ANALYSES),
+    "sample": (PARTITIONS, ANALYSIS_REQUESTS, ANALYSES),
+    "preserve": (PARTITIONS, ANALYSIS_REQUESTS, ANALYSES),
+    "to_be_preserved": (PARTITIONS, ANALYSIS_REQUESTS, ANALYSES),
+    "sample_due": (ANALYSIS_REQUESTS, ),
+}
+
+
+def get_key(brain_or_object, action):
+    return "{}_{}".format(api.get_uid(brain_or_object), action)
+
+
+def is_planned(brain_or_object, action):
+    """Returns True if the transition of the object is part of the cascade
+    plan being executed
+    """
+    request = api.get_request()
+    planned = request is not None and request.get(CASCADE_KEY) or None
+    if not planned:
+        return False
+    return get_key(brain_or_object, action) in planned
+
+
+def get_source_states(portal_type, action):
+    """Returns a tuple of (state variable, states) of the workflow of the
+    portal type which has the transition. The transition can be performed
+    from the returned states.
+    """
+    wftool = api.get_tool("portal_workflow")
+    for workflow_id in wftool.getChainForPortalType(portal_type):
+        workflow = wftool.getWorkflowById(workflow_id)
+        if workflow is None or action not in workflow.transitions:
+            continue
+        states = [state.getId() for state in workflow.states.objectValues()
+                  if action in state.transitions]
+        return workflow.state_var, states
+    return None, []
+
+
+class CascadePlan(object):
+    """Ordered set of (object, transition) pairs
+    """
+
+    def __init__(self):
+        self.pairs = []
+        self.keys = set()
+        # keys of the failed transitions -> error message
+        self.errors = {}
+        # (portal type, transition) -> (state variable, source states)
+        self.source_states = {}
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __iter__(self):
+        return iter(self.pairs)
+
+    def get_source_states(self, portal_type, action):
+        key = (portal_type, action)
+        if key not in self.source_states:
+            self.source_states[key] = get_source_states(portal_type, action)
+        return self.source_states[key]
+
+    def add(self, brain_or_object, action):
+        """Add the transition of the object to the plan if the object is in
+        one of the source states of the transition. Returns True if added.
+        """
+        key = get_key(brain_or_object, action)
+        if key in self.keys:
+            return False
+        portal_type = api.get_portal_type(brain_or_object)
+        state_var, states = self.get_source_states(portal_type, action)
+        if not states:
+            return False
+        if api.is_brain(brain_or_object):
+            state = getattr(brain_or_object, state_var, None)
+        else:
+            state = api.get_workflow_status_of(brain_or_object, state_var)
+        if state not in states:
+            return False
+        self.keys.add(key)
+        self.pairs.append((api.get_object(brain_or_object), action))
+        return True
+
+    def execute(self):
+        """Perform all planned transitions. Returns the number of performed
+        transitions.
+        """
+        request = api.get_request()
+        planned = request.get(CASCADE_KEY)
+        if planned is None:
+            planned = set()
+            request[CASCADE_KEY] = planned
+        new_keys = self.keys.difference(planned)
+        planned.update(new_keys)
+        count = 0
+        try:
+            with deferred_indexing():
+                for obj, action in self.pairs:
+                    try:
+                        api.do_transition_for(obj, action)
+                        count += 1
+                    except InvalidParameterError as e:
+                        self.errors[get_key(obj, action)] = str(e)
+                        logger.warn("Failed to perform transition {} on {}: {}"
+                                    .format(action, obj, str(e)))
+        finally:
+            planned.difference_update(new_keys)
+        return count
+
+
+def plan_sample_transition(sample, action):
+    """Returns the cascade plan of the transition of the sample
+    """
+    plan = CascadePlan()
+    relatives = SAMPLE_CASCADES.get(action, ())
+    if PARTITIONS in relatives:
+        for partition in sample.objectValues("SamplePartition"):
+            plan.add(partition, action)
+    ars = sample.getAnalysisRequests()
+    if ANALYSIS_REQUESTS in relatives:
+        for ar in ars:
+            plan.add(ar, action)
+    if ANALYSES in relatives:
+        for ar in ars:
+            for brain in ar.getAnalyses():
+                plan.add(brain, action)
+    return plan
+
+
+def cascade_sample_transition(sample, action):
+    """Propagate the transition of the sample to its partitions, ARs and
+    analyses. Returns the number of performed transitions.
+    """
+    return plan_sample_transition(sample, action).execute()
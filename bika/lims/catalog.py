@@ -6,11 +6,14 @@
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
 from AccessControl import ClassSecurityInfo
+from AccessControl.Permissions import search_zcatalog as SearchZCatalog
 from App.class_init import InitializeClass
 from Products.CMFCore.permissions import ManagePortal
 from Products.CMFCore.utils import getToolByName
 from Products.CMFPlone.CatalogTool import CatalogTool
 from Products.ZCatalog.ZCatalog import ZCatalog
+from bika.lims import catalogprofiler
+from bika.lims import catalogrebuild
 from bika.lims.interfaces import IBikaCatalog
 from bika.lims.interfaces import IBikaAnalysisCatalog
 from bika.lims.interfaces import IBikaSetupCatalog
@@ -39,7 +42,46 @@ def getCatalog(instance, field='UID'):
         return catalog
 
 
-class BikaCatalog(CatalogTool):
+class BikaCatalogTool(CatalogTool):
+
+    """Base class of the bika catalogs"""
+
+    security = ClassSecurityInfo()
+
+    security.declareProtected(SearchZCatalog, 'searchResults')
+
+    def searchResults(self, REQUEST=None, **kw):
+        """Search the catalog, see `bika.lims.catalogprofiler`
+        """
+        return catalogprofiler.search(
+            self, CatalogTool.searchResults, REQUEST, **kw)
+
+    __call__ = searchResults
+
+    def catalog_object(self, object, uid=None, idxs=None,
+                       update_metadata=1, pghandler=None):
+        """Index the object. During a rebuild, the path of the object is
+        also recorded in the dirty objects of the rebuild job, and the object
+        is indexed into the shadow catalog when the rebuild finishes, see
+        `bika.lims.catalogrebuild`
+        """
+        CatalogTool.catalog_object(self, object, uid, idxs,
+                                   update_metadata, pghandler)
+        catalogrebuild.catalog_object(self, object, uid, idxs,
+                                      update_metadata)
+
+    def uncatalog_object(self, uid):
+        """Unindex the object. During a rebuild, the path is recorded in the
+        dirty objects of the rebuild job, and the object is removed from the
+        shadow catalog when the rebuild finishes
+        """
+        CatalogTool.uncatalog_object(self, uid)
+        catalogrebuild.uncatalog_object(self, uid)
+
+InitializeClass(BikaCatalogTool)
+
+
+class BikaCatalog(BikaCatalogTool):
 
     """Catalog for various transactional types"""
 
@@ -79,7 +121,7 @@ class BikaCatalog(CatalogTool):
 InitializeClass(BikaCatalog)
 
 
-class BikaAnalysisCatalog(CatalogTool):
+class BikaAnalysisCatalog(BikaCatalogTool):
 
     """Catalog for analysis types"""
 
@@ -119,7 +161,7 @@ class BikaAnalysisCatalog(CatalogTool):
 InitializeClass(BikaAnalysisCatalog)
 
 
-class BikaSetupCatalog(CatalogTool):
+class BikaSetupCatalog(BikaCatalogTool):
 
     """Catalog for all bika_setup objects"""
 
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import os
+import threading
+import time
+from collections import deque
+
+from bika.lims import logger
+
+"""Catalog query profiler
+
+Opt-in instrumentation of the searches of the bika catalogs (`bika_catalog`,
+`bika_analysis_catalog` and `bika_setup_catalog`, see `bika.lims.catalog`).
+While enabled, each search records:
+
+- the shape of the query: the queried indexes, the kind of their values and
+  the sort, e.g. `getServiceUID:list review_state:value sort_on=created`
+- the duration and the number of results
+- the calling view (the published object of the request)
+
+The statistics are aggregated by catalog and query shape, together with the
+number of queries using each index and the number of reads of each metadata
+column of the returned brains. Queries slower than `SLOW_QUERY_THRESHOLD`
+seconds are logged and kept in a short slow query log.
+
+The statistics are kept in memory, per Zope process, and are not persisted:
+profiling must not write to the database on every search. The profiler is
+enabled at startup with the `BIKA_CATALOG_PROFILER` environment variable, or
+at runtime from the `catalog_profiler` view of the site.
+"""
+
+SLOW_QUERY_THRESHOLD = float(
+    os.environ.get("BIKA_CATALOG_SLOW_QUERY_THRESHOLD", "0.5"))
+
+# number of entries of the slow query log
+SLOW_QUERY_LOG_SIZE = 100
+
+# number of distinct callers kept per query shape
+MAX_CALLERS = 10
+
+_lock = threading.Lock()
+_enabled = os.environ.get("BIKA_CATALOG_PROFILER", "") not in ("", "0")
+
+# (catalog id, query shape) -> statistics
+_queries = {}
+# (catalog id, index) -> number of queries
+_index_hits = {}
+# (catalog id, column) -> number of reads
+_column_reads = {}
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+# ids of the catalogs with profiled brains
+_profiled = set()
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    """Discard all the statistics
+    """
+    with _lock:
+        _queries.clear()
+        _index_hits.clear()
+        _column_reads.clear()
+        _slow_queries.clear()
+
+
+def get_value_kind(value):
+    if isinstance(value, dict):
+        # e.g. {"query": [...], "range": "min:max"}
+        return ",".join(sorted(value.keys()))
+    if isinstance(value, (list, tuple)):
+        return "list"
+    return "value"
+
+
+def get_query(REQUEST=None, **kw):
+    """Returns the query of the catalog search arguments as a dict
+    """
+    query = {}
+    if isinstance(REQUEST, dict):
+        query.update(REQUEST)
+    query.update(kw)
+    return query
+
+
+def get_query_shape(query):
+    """Returns the shape of the query: the queried indexes and the kind of
+    their values, without the values. The sort parameters are kept.
+    """
+    parts = []
+    for key in sorted(query.keys()):
+        value = query[key]
+        if key.startswith("sort_") or key == "b_size":
+            parts.append("{}={}".format(key, value))
+        else:
+            parts.append("{}:{}".format(key, get_value_kind(value)))
+    return " ".join(parts)
+
+
+def get_caller(request):
+    """Returns the name of the view (or object) published by the request
+    """
+    if request is None:
+        return ""
+    published = request.get("PUBLISHED", None)
+    if published is None:
+        return ""
+    name = getattr(published, "__name__", None)
+    if not isinstance(name, basestring):
+        name = published.__class__.__name__
+    return name
+
+
+def record(catalog, query, duration, count, caller=""):
+    """Record a search of the catalog
+    """
+    catalog_id = catalog.getId()
+    shape = get_query_shape(query)
+    indexes = catalog._catalog.indexes
+    used = [key for key in query.keys() if key in indexes]
+    sort_on = query.get("sort_on")
+    if isinstance(sort_on, basestring) and sort_on in indexes:
+        used.append(sort_on)
+    with _lock:
+        stats = _queries.get((catalog_id, shape))
+        if stats is None:
+            stats = _queries[(catalog_id, shape)] = {
+                "catalog": catalog_id,
+                "shape": shape,
+                "calls": 0,
+                "total": 0.0,
+                "max": 0.0,
+                "results": 0,
+                "callers": {},
+            }
+        stats["calls"] += 1
+        stats["total"] += duration
+        stats["max"] = max(stats["max"], duration)
+        stats["results"] += count
+        callers = stats["callers"]
+        if caller in callers or len(callers) < MAX_CALLERS:
+            callers[caller] = callers.get(caller, 0) + 1
+        for index in set(used):
+            key = (catalog_id, index)
+            _index_hits[key] = _index_hits.get(key, 0) + 1
+        if duration >= SLOW_QUERY_THRESHOLD:
+            _slow_queries.appendleft({
+                "catalog": catalog_id,
+                "query": repr(query),
+                "duration": duration,
+                "results": count,
+                "caller": caller,
+                "time": time.time(),
+            })
+    if duration >= SLOW_QUERY_THRESHOLD:
+        logger.warn("Slow query on {} ({:.3f}s, {} results, {}): {}".format(
+            catalog_id, duration, count, caller, repr(query)))
+
+
+def record_column(catalog_id, column):
+    key = (catalog_id, column)
+    # no lock: a lost increment does not matter, this is on every read
+    _column_reads[key] = _column_reads.get(key, 0) + 1
+
+
+def profile_brains(catalog):
+    """Make the brains of the catalog count the reads of their metadata
+    columns. The result class of a catalog is volatile, so this only affects
+    the current process until the catalog is reloaded.
+    """
+    internal = catalog._catalog
+    klass = getattr(internal, "_v_result_class", None)
+    if klass is None or getattr(klass, "_profiled", False):
+        return
+    catalog_id = catalog.getId()
+    columns = frozenset(klass.__record_schema__.keys())
+    _profiled.add(catalog_id)
+
+    def __getattribute__(self, name):
+        if name in columns:
+            record_column(catalog_id, name)
+        return klass.__getattribute__(self, name)
+
+    internal._v_result_class = klass.__class__(
+        klass.__name__, (klass,),
+        {"_profiled": True, "__getattribute__": __getattribute__})
+
+
+def unprofile_brains(catalog):
+    """Restore the brains of the catalog
+    """
+    internal = catalog._catalog
+    klass = getattr(internal, "_v_result_class", None)
+    if klass is not None and getattr(klass, "_profiled", False):
+        internal._v_result_class = klass.__bases__[0]
+    _profiled.discard(catalog.getId())
+
+
+def search(catalog, method, REQUEST=None, **kw):
+    """Perform the search with the catalog method, recording it if the
+    profiler is enabled
+    """
+    if not _enabled:
+        if _profiled:
+            unprofile_brains(catalog)
+        return method(catalog, REQUEST, **kw)
+    profile_brains(catalog)
+    start = time.time()
+    results = method(catalog, REQUEST, **kw)
+    duration = time.time() - start
+    try:
+        record(catalog, get_query(REQUEST, **kw), duration, len(results),
+               get_caller(getattr(catalog, "REQUEST", None)))
+    except Exception as e:
+        # never break a search because of the profiler
+        logger.warn("Failed to profile query on {}: {}".format(
+            catalog.getId(), str(e)))
+    return results
+
+
+def get_query_stats(catalog_id=None, sort_on="total", limit=None):
+    """Returns the statistics of the query shapes, slowest first. `sort_on`
+    is one of "total", "max", "mean" and "calls".
+    """
+    with _lock:
+        items = [dict(stats, callers=dict(stats["callers"]))
+                 for stats in _queries.values()
+                 if catalog_id in (None, stats["catalog"])]
+    for stats in items:
+        stats["mean"] = stats["total"] / stats["calls"]
+        stats["mean_results"] = stats["results"] / float(stats["calls"])
+    items.sort(key=lambda stats: stats[sort_on], reverse=True)
+    return limit and items[:limit] or items
+
+
+def get_index_hits(catalog):
+    """Returns a list of (index, number of queries) of all the indexes of
+    the catalog, least used first
+    """
+    catalog_id = catalog.getId()
+    hits = [(index, _index_hits.get((catalog_id, index), 0))
+            for index in catalog.indexes()]
+    return sorted(hits, key=lambda item: (item[1], item[0]))
+
+
+def get_column_reads(catalog):
+    """Returns a list of (column, number of reads) of all the metadata
+    columns of the catalog, least read first
+    """
+    catalog_id = catalog.getId()
+    reads = [(column, _column_reads.get((catalog_id, column), 0))
+             for column in catalog.schema()]
+    return sorted(reads, key=lambda item: (item[1], item[0]))
+
+
+def get_unused_columns(catalog):
+    """Returns the metadata columns of the catalog never read since the
+    profiler was enabled or reset
+    """
+    return [column for column, reads in get_column_reads(catalog)
+            if not reads]
+
+
+def get_slow_queries(catalog_id=None):
+    """Returns the slow query log, most recent first
+    """
+    with _lock:
+        return [dict(entry) for entry in _slow_queries
+                if catalog_id in (None, entry["catalog"])]
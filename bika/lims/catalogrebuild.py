@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import transaction
+from itertools import islice
+
+from Acquisition import aq_base
+from BTrees.OOBTree import OOBTree
+from DateTime import DateTime
+from persistent import Persistent
+from plone.indexer.interfaces import IIndexableObject
+from Products.CMFCore.utils import getToolByName
+from Products.ZCatalog.Catalog import Catalog
+from ZODB.POSException import ConflictError
+from zope.component import queryMultiAdapter
+
+from bika.lims import logger
+
+"""Resumable catalog rebuild
+
+`clearFindAndRebuild` of the bika catalogs clears the catalog and traverses
+the whole portal to reindex every object, in one transaction: the catalog is
+empty until the rebuild is committed, and a failure restarts it from scratch.
+
+The rebuild of a catalog is a job, stored on the catalog:
+
+- the objects are built into a shadow catalog, with the same indexes and
+  metadata columns as the catalog, which keeps serving the searches.
+- the objects are enumerated from the UID index of `uid_catalog`, walking
+  its BTree from the last indexed UID (the cursor), and indexed in chunks of
+  `CHUNK_SIZE` objects. Each chunk is committed together with its cursor, so
+  an interrupted rebuild resumes from the cursor, and the cost of a chunk
+  does not depend on the number of remaining objects.
+- the UIDs are split in contiguous ranges, one per worker, so that several
+  ZEO clients can build the shadow catalog concurrently (see
+  `bika/lims/scripts/rebuild_catalog.py`). The workers load the objects of a
+  chunk first and write them into the shadow catalog in a short transaction
+  of their own, retried on conflicts, so the concurrent writes of the
+  workers rarely overlap.
+- the objects (un)indexed in the catalog during the rebuild are not written
+  into the shadow catalog by the requests, which would conflict with the
+  workers: their paths are logged in a BTree of the job, whose concurrent
+  inserts are resolved by the ZODB, and replayed into the shadow catalog
+  when the workers are done.
+- when the last worker is done, the logged objects are replayed and the
+  shadow catalog replaces the catalog data in the same transaction.
+"""
+
+REBUILD_JOB_ATTR = "_bika_rebuild_job"
+
+CHUNK_SIZE = 500
+
+# job keys
+SHADOW = "shadow"
+WORKERS = "workers"
+# path -> True if (re)indexed, False if unindexed during the rebuild
+DIRTY = "dirty"
+STARTED = "started"
+UPDATED = "updated"
+
+# worker keys
+CURSOR = "cursor"
+COUNT = "count"
+DONE = "done"
+
+
+def get_job(catalog):
+    """Returns the rebuild job of the catalog, None if not rebuilding
+    """
+    return getattr(aq_base(catalog), REBUILD_JOB_ATTR, None)
+
+
+def get_shadow(catalog):
+    """Returns the shadow catalog of a rebuilding catalog, None otherwise
+    """
+    job = get_job(catalog)
+    if job is None:
+        return None
+    return job[SHADOW].__of__(catalog)
+
+
+def copy_index(catalog, index):
+    """Returns an empty index with the settings of the index
+    """
+    index = aq_base(index)
+    # the settings of an index are plain attributes, its data are persistent
+    # structures (BTrees, Length...) which are rebuilt by clear()
+    state = dict([(key, value) for key, value in index.__getstate__().items()
+                  if not isinstance(value, Persistent)])
+    empty = index.__class__.__new__(index.__class__)
+    empty.__setstate__(state)
+    # text indexes look up their lexicon in the catalog
+    empty.__of__(catalog).clear()
+    return empty
+
+
+def create_shadow(catalog):
+    """Returns an empty catalog with the indexes and metadata columns of the
+    catalog
+    """
+    internal = catalog._catalog
+    shadow = Catalog()
+    for name in internal.names:
+        shadow.addColumn(name)
+    for name, index in internal.indexes.items():
+        shadow.addIndex(name, copy_index(catalog, index))
+    return shadow
+
+
+def get_portal_types(catalog):
+    """Returns the portal types indexed by the catalog
+    """
+    at = getToolByName(catalog, "archetype_tool")
+    return [portal_type for portal_type, catalogs in at.catalog_map.items()
+            if catalog.getId() in catalogs]
+
+
+def get_uid_range(worker, workers):
+    """Returns the (lower, upper) bounds of the UIDs of the worker. The UID
+    space is split by the first two hex digits, the first and the last
+    workers are unbounded.
+    """
+    lower = worker * 256 // workers
+    upper = (worker + 1) * 256 // workers
+    lower = "%02x" % lower if worker else None
+    upper = "%02x" % upper if upper < 256 else None
+    return lower, upper
+
+
+def start(catalog, workers=1):
+    """Start the rebuild of the catalog with the given number of workers.
+    A rebuild in progress is resumed as is.
+    """
+    job = get_job(catalog)
+    if job is not None:
+        return job
+    job = OOBTree()
+    job[SHADOW] = create_shadow(catalog)
+    job[DIRTY] = OOBTree()
+    job[WORKERS] = OOBTree()
+    for worker in range(workers):
+        record = OOBTree()
+        record[CURSOR] = ""
+        record[COUNT] = 0
+        record[DONE] = False
+        job[WORKERS][worker] = record
+    job[STARTED] = DateTime()
+    job[UPDATED] = DateTime()
+    setattr(catalog, REBUILD_JOB_ATTR, job)
+    logger.info("Started the rebuild of {} with {} workers".format(
+        catalog.getId(), workers))
+    return job
+
+
+def cancel(catalog):
+    """Drop the rebuild job and the shadow catalog
+    """
+    if get_job(catalog) is not None:
+        delattr(catalog, REBUILD_JOB_ATTR)
+
+
+def index_object(catalog, shadow, obj, uid=None):
+    """Index the object in the shadow catalog of the catalog
+    """
+    if uid is None:
+        uid = "/".join(obj.getPhysicalPath())
+    wrapper = obj
+    if not IIndexableObject.providedBy(obj):
+        wrapper = queryMultiAdapter((obj, catalog), IIndexableObject) or obj
+    shadow.catalogObject(wrapper, uid, None, [])
+
+
+def catalog_object(catalog, obj, uid=None, idxs=None, update_metadata=1):
+    """Log the (re)indexed object, if the catalog is rebuilding
+    """
+    job = get_job(catalog)
+    if job is None:
+        return
+    if uid is None:
+        uid = "/".join(obj.getPhysicalPath())
+    job[DIRTY][uid] = True
+
+
+def uncatalog_object(catalog, uid):
+    """Log the unindexed object, if the catalog is rebuilding
+    """
+    job = get_job(catalog)
+    if job is not None:
+        job[DIRTY][uid] = False
+
+
+def get_chunk(catalog, worker=0, chunk_size=CHUNK_SIZE):
+    """Returns the next UIDs of the worker to index, at most chunk_size, and
+    the objects with these UIDs which are indexed by the catalog
+    """
+    job = get_job(catalog)
+    record = job[WORKERS][worker]
+    if record[DONE]:
+        return [], []
+    lower, upper = get_uid_range(worker, len(job[WORKERS]))
+    cursor = record[CURSOR]
+    uc = getToolByName(catalog, "uid_catalog")
+    index = uc._catalog.indexes["UID"]._index
+    bounds = {"excludemax": True}
+    if cursor:
+        bounds.update({"min": cursor, "excludemin": True})
+    elif lower:
+        bounds["min"] = lower
+    if upper:
+        bounds["max"] = upper
+    uids = list(islice(index.keys(**bounds), chunk_size))
+    if not uids:
+        return [], []
+    portal_types = get_portal_types(catalog)
+    objects = []
+    for brain in uc(UID=uids):
+        portal_type = getattr(aq_base(brain), "portal_type", None)
+        if portal_type and portal_type not in portal_types:
+            continue
+        obj = brain.getObject()
+        # stale entries of uid_catalog
+        if obj is None or obj.portal_type not in portal_types:
+            continue
+        objects.append(obj)
+    return uids, objects
+
+
+def index_chunk(catalog, worker, uids, objects, chunk_size=CHUNK_SIZE):
+    """Index the objects of a chunk in the shadow catalog and move the cursor
+    of the worker to the last UID of the chunk
+    """
+    job = get_job(catalog)
+    record = job[WORKERS][worker]
+    shadow = job[SHADOW].__of__(catalog)
+    for obj in objects:
+        index_object(catalog, shadow, obj)
+    if uids:
+        record[CURSOR] = uids[-1]
+    record[COUNT] += len(objects)
+    if len(uids) < chunk_size:
+        record[DONE] = True
+    return len(objects)
+
+
+def process(catalog, worker=0, chunk_size=CHUNK_SIZE):
+    """Index the next chunk of objects of the worker in the shadow catalog.
+    Returns the number of indexed objects.
+    """
+    if get_job(catalog)[WORKERS][worker][DONE]:
+        return 0
+    uids, objects = get_chunk(catalog, worker, chunk_size)
+    return index_chunk(catalog, worker, uids, objects, chunk_size)
+
+
+def replay(catalog):
+    """Index the objects (un)indexed in the catalog during the rebuild into
+    the shadow catalog
+    """
+    job = get_job(catalog)
+    shadow = job[SHADOW].__of__(catalog)
+    count = 0
+    for uid, indexed in job[DIRTY].items():
+        obj = indexed and catalog.unrestrictedTraverse(uid, None) or None
+        if obj is not None:
+            index_object(catalog, shadow, obj, uid)
+        elif uid in shadow.uids:
+            shadow.uncatalogObject(uid)
+        count += 1
+    job[DIRTY].clear()
+    return count
+
+
+def finish(catalog):
+    """Replace the data of the catalog by the shadow catalog, if all the
+    workers are done. Returns True if replaced.
+    """
+    job = get_job(catalog)
+    if job is None:
+        return False
+    if not all([record[DONE] for record in job[WORKERS].values()]):
+        return False
+    replay(catalog)
+    catalog._catalog = job[SHADOW]
+    delattr(catalog, REBUILD_JOB_ATTR)
+    if hasattr(aq_base(catalog), "_increment_counter"):
+        catalog._increment_counter()
+    logger.info("Rebuilt {}: {} objects".format(
+        catalog.getId(), len(catalog._catalog)))
+    return True
+
+
+def run(catalog, worker=0, workers=1, chunk_size=CHUNK_SIZE):
+    """Run the worker of the rebuild of the catalog until it is done, with a
+    commit after each chunk. The last worker done swaps the catalogs.
+    """
+    while True:
+        try:
+            # the workers of other ZEO clients may be starting the job too
+            start(catalog, workers)
+            transaction.commit()
+            break
+        except ConflictError:
+            transaction.abort()
+    while True:
+        if get_job(catalog)[WORKERS][worker][DONE]:
+            uids, objects = [], []
+        else:
+            # load the objects outside of the write transaction below
+            uids, objects = get_chunk(catalog, worker, chunk_size)
+        while True:
+            try:
+                # start from the latest committed state, so the shadow catalog
+                # is only written within this short transaction
+                transaction.begin()
+                record = get_job(catalog)[WORKERS][worker]
+                if not record[DONE]:
+                    index_chunk(catalog, worker, uids, objects, chunk_size)
+                done = record[DONE]
+                if done:
+                    # concurrent workers always conflict on this key, so the
+                    # last one done sees all the workers done
+                    get_job(catalog)[UPDATED] = DateTime()
+                    finish(catalog)
+                transaction.commit()
+                break
+            except ConflictError:
+                transaction.abort()
+        if done:
+            return get_progress(catalog)
+        logger.info("Rebuild of {}, worker {}: {} objects indexed".format(
+            catalog.getId(), worker, record[COUNT]))
+
+
+def get_progress(catalog):
+    """Returns the progress of the rebuild of the catalog as a dict
+    """
+    job = get_job(catalog)
+    if job is None:
+        return {"rebuilding": False, "workers": {}, "count": 0}
+    workers = dict([(worker, {"cursor": record[CURSOR],
+                              "count": record[COUNT],
+                              "done": record[DONE]})
+                    for worker, record in job[WORKERS].items()])
+    return {
+        "rebuilding": True,
+        "workers": workers,
+        "count": sum([record["count"] for record in workers.values()]),
+        "started": job[STARTED].ISO8601(),
+    }
@@ -17,6 +17,7 @@ from AccessControl import ClassSecurityInfo
 from plone.indexer import indexer
 from plone import api as ploneapi
 
+from zope.component import getUtility
 from zope.interface import implements
 
 from Products.ATExtensions.ateapi import DateTimeField
@@ -46,7 +47,10 @@ from Products.CMFPlone.utils import _createObjectByType
 from Products.CMFPlone.utils import safe_unicode
 
 from bika.lims import bikaMessageFactory as _
+from bika.lims import cascade
+from bika.lims import lateness
 from bika.lims import logger
+from bika.lims import statehistogram
 from bika.lims.browser.fields import DurationField
 from bika.lims.browser.fields import HistoryAwareReferenceField
 from bika.lims.browser.fields import InterimFieldsField
@@ -55,10 +59,16 @@ from bika.lims.browser.widgets import RecordsWidget as BikaRecordsWidget
 from bika.lims.config import PROJECTNAME
 from bika.lims.content.bikaschema import BikaSchema
 from bika.lims.interfaces import IAnalysis
+from bika.lims.interfaces import IAnalysisRequest
 from bika.lims.interfaces import IDuplicateAnalysis
 from bika.lims.interfaces import IReferenceAnalysis
 from bika.lims.interfaces import IReferenceSample
 from bika.lims.interfaces import ISamplePrepWorkflow
+from bika.lims.interfaces import IServiceDependencyGraph
+from bika.lims.interfaces import ISpecificationIndex
+from bika.lims.statehistogram import ATTACH_PENDING_STATES
+from bika.lims.statehistogram import SUBMIT_PENDING_STATES
+from bika.lims.statehistogram import VERIFY_PENDING_STATES
 from bika.lims.permissions import Unassign
 from bika.lims.permissions import Verify as VerifyPermission
 from bika.lims.utils import changeWorkflowState
@@ -66,12 +76,17 @@ from bika.lims.utils import drop_trailing_zeros_decimal
 from bika.lims.utils import formatDecimalMark
 from bika.lims.utils.analysis import format_numeric_result
 from bika.lims.utils.analysis import get_significant_digits
+from bika.lims.utils import retest
 from bika.lims.workflow import getTransitionActor
 from bika.lims.workflow import skip
 
 from bika.lims import api
 from plone.memoize.volatile import cache
 from plone.memoize.volatile import DontCache
+from zope.annotation.interfaces import IAnnotations
+
+# request cache of the worksheets of the analyses, see getWorksheet
+WORKSHEET_CACHE_KEY = "bika.lims.analysis.worksheet"
 
 
 def cache_key(method, self):
@@ -83,6 +98,27 @@ def cache_key(method, self):
     return "{}-{}".format(uid, modified)
 
 
+def get_worksheet_cache():
+    """Returns the worksheets of the analyses resolved in the current
+    request, by analysis UID
+    """
+    request = api.get_request()
+    if request is None:
+        return {}
+    annotations = IAnnotations(request)
+    resolved = annotations.get(WORKSHEET_CACHE_KEY)
+    if resolved is None:
+        resolved = annotations[WORKSHEET_CACHE_KEY] = {}
+    return resolved
+
+
+def clear_worksheet_cache():
+    """Discard the worksheets resolved in the current request. Called when
+    the analyses of a worksheet change
+    """
+    get_worksheet_cache().clear()
+
+
 @indexer(IAnalysis)
 def Priority(instance):
     priority = instance.getPriority()
@@ -102,7 +138,10 @@ def sortable_title_with_sort_key(instance):
 
 @indexer(IAnalysis)
 def getDepartmentUID(instance):
-    return instance.getService().getDepartment().UID()
+    # analyses of services without department are indexed with an empty
+    # UID, so the department filter can include them in the query
+    department = instance.getService().getDepartment()
+    return department and department.UID() or ""
 
 
 schema = BikaSchema.copy() + Schema((
@@ -244,11 +283,31 @@ schema = BikaSchema.copy() + Schema((
         expression='context.aq_parent.aq_parent.Title()',
     ),
 
+    ComputedField(
+        'ClientPath',
+        expression='context.aq_parent.getClientPath()',
+    ),
+
     ComputedField(
         'RequestID',
         expression='context.aq_parent.getRequestID()',
     ),
 
+    ComputedField(
+        'RequestPath',
+        expression="'/'.join(context.aq_parent.getPhysicalPath())",
+    ),
+
+    ComputedField(
+        'ContactTitle',
+        expression='context.aq_parent.getContactTitle()',
+    ),
+
+    ComputedField(
+        'ContactEmail',
+        expression="context.aq_parent.getContact().getEmailAddress() if context.aq_parent.getContact() else ''",
+    ),
+
     ComputedField(
         'ClientOrderNumber',
         expression='context.aq_parent.getClientOrderNumber()',
@@ -566,34 +625,34 @@ class Analysis(BaseContent):
         """ Return a list of analyses who depend on us
             to calculate their result
         """
-        rc = getToolByName(self, REFERENCE_CATALOG)
-        dependents = []
-        service = self.getService()
-        ar = self.aq_parent
-        for sibling in ar.getAnalyses(full_objects=True):
-            if sibling == self:
-                continue
-            service = rc.lookupObject(sibling.getServiceUID())
-            calculation = service.getCalculation()
-            if not calculation:
-                continue
-            depservices = calculation.getDependentServices()
-            dep_keywords = [x.getKeyword() for x in depservices]
-            if self.getService().getKeyword() in dep_keywords:
-                dependents.append(sibling)
-        return dependents
+        graph = getUtility(IServiceDependencyGraph)
+        service_uids = graph.get_dependants(self.getServiceUID(),
+                                            recursive=False)
+        return self._getSiblingsByServiceUID(service_uids)
 
     def getDependencies(self):
         """ Return a list of analyses who we depend on
             to calculate our result.
         """
-        siblings = self.aq_parent.getAnalyses(full_objects=True)
-        calculation = self.getService().getCalculation()
-        if not calculation:
+        graph = getUtility(IServiceDependencyGraph)
+        service_uids = graph.get_dependencies(self.getServiceUID(),
+                                              recursive=False)
+        return self._getSiblingsByServiceUID(service_uids)
+
+    def _getSiblingsByServiceUID(self, service_uids):
+        """ Return the analyses of the parent for the given services.
+            Only the matching analyses of an AR are woken up.
+        """
+        if not service_uids:
             return []
-        dep_services = [d.UID() for d in calculation.getDependentServices()]
-        dep_analyses = [a for a in siblings if a.getServiceUID() in dep_services]
-        return dep_analyses
+        parent = self.aq_parent
+        if IAnalysisRequest.providedBy(parent):
+            siblings = parent.getAnalyses(full_objects=True,
+                                          getServiceUID=service_uids)
+        else:
+            siblings = [a for a in parent.getAnalyses(full_objects=True)
+                        if a.getServiceUID() in service_uids]
+        return [a for a in siblings if a != self]
 
     def setResult(self, value, **kw):
         """ :value: must be a string
@@ -690,6 +749,35 @@ class Analysis(BaseContent):
     def getClientTitle(self):
         return self.aq_parent.aq_parent.Title()
 
+    def getLate(self):
+        """Return True if the analysis is late, see bika.lims.lateness
+        """
+        return lateness.is_late(self)
+
+    def getWorksheet(self):
+        """Return the worksheet the analysis is assigned to, if any. The
+        worksheet is resolved once per request, so the worksheet metadata
+        columns share a single back reference lookup
+        """
+        resolved = get_worksheet_cache()
+        uid = self.UID()
+        if uid not in resolved:
+            worksheets = self.getBackReferences('WorksheetAnalysis')
+            resolved[uid] = worksheets and worksheets[0] or None
+        return resolved[uid]
+
+    def getWorksheetUID(self):
+        worksheet = self.getWorksheet()
+        return worksheet and worksheet.UID() or ''
+
+    def getWorksheetTitle(self):
+        worksheet = self.getWorksheet()
+        return worksheet and worksheet.Title() or ''
+
+    def getWorksheetPath(self):
+        worksheet = self.getWorksheet()
+        return worksheet and '/'.join(worksheet.getPhysicalPath()) or ''
+
     def getResultsRange(self, specification=None):
         """ Returns the valid results range for this analysis, a
             dictionary with the following keys: 'keyword', 'uid', 'min',
@@ -698,28 +786,11 @@ class Analysis(BaseContent):
             If specification is None, the following is the priority to
             get the results range: AR > Client > Lab
             If no specification available for this analysis, returns {}
+            The client and lab ranges are looked up in the specification
+            index (see bika.lims.specindex)
         """
-        rr = {}
-        an = self
-        while an and an.portal_type in ('DuplicateAnalysis', 'RejectAnalysis'):
-            an = an.getAnalysis()
-
-        keyword = self.getKeyword()
-        if specification == 'ar' or specification is None:
-            if an.aq_parent and an.aq_parent.portal_type == 'AnalysisRequest':
-                rr = an.aq_parent.getResultsRange()
-                rr = [r for r in rr if r.get('keyword', '') == keyword]
-                rr = rr[0] if rr and len(rr) > 0 else {}
-                if rr:
-                    rr['uid'] = self.UID()
-        if not rr:
-            # Let's try to retrieve the specs from client and/or lab
-            specs = an.getAnalysisSpecs(specification)
-            rr = specs.getResultsRangeDict() if specs else {}
-            rr = rr.get(an.getKeyword(), {}) if rr else {}
-            if rr:
-                rr['uid'] = self.UID()
-        return rr
+        index = getUtility(ISpecificationIndex)
+        return index.get_ranges([self], specification).get(self.UID(), {})
 
     def getAnalysisSpecs(self, specification=None):
         """ Retrieves the analysis specs to be applied to this analysis.
@@ -737,32 +808,12 @@ class Analysis(BaseContent):
 
         sampletype = sample.getSampleType()
         sampletype_uid = sampletype and sampletype.UID() or ''
-        bsc = getToolByName(self, 'bika_setup_catalog')
-
-        # retrieves the desired specs if None specs defined
-        if not specification:
-            proxies = bsc(portal_type='AnalysisSpec',
-                          getClientUID=self.getClientUID(),
-                          getSampleTypeUID=sampletype_uid)
-
-            if len(proxies) == 0:
-                # No client specs available, retrieve lab specs
-                proxies = bsc(portal_type='AnalysisSpec',
-                              getSampleTypeUID=sampletype_uid)
-        else:
-            specuid = specification == "client" and self.getClientUID() or \
-                self.bika_setup.bika_analysisspecs.UID()
-            proxies = bsc(portal_type='AnalysisSpec',
-                          getSampleTypeUID=sampletype_uid,
-                          getClientUID=specuid)
-
-        outspecs = None
-        for spec in (p.getObject() for p in proxies):
-            if self.getKeyword() in spec.getResultsRangeDict():
-                outspecs = spec
-                break
-
-        return outspecs
+        index = getUtility(ISpecificationIndex)
+        spec_uid, rr = index.lookup(self.getClientUID(), sampletype_uid,
+                                    self.getKeyword(), specification)
+        if not spec_uid:
+            return None
+        return api.get_object_by_uid(spec_uid, None)
 
     def calculateResult(self, override=False, cascade=False):
         """ Calculates the result for the current analysis if it depends of
@@ -1333,7 +1384,8 @@ class Analysis(BaseContent):
         if skip(self, "receive"):
             return
         self.updateDueDate()
-        self.reindexObject()
+        self.reindexObject(idxs=["review_state", "getDueDate",
+                                 "getDateReceived"])
 
     def workflow_script_submit(self):
         # DuplicateAnalysis doesn't have analysis_workflow.
@@ -1352,6 +1404,9 @@ class Analysis(BaseContent):
         # Need to check for result and status of dependencies first
         dependents = self.getDependents()
         for dependent in dependents:
+            # submitted by the bulk submission
+            if cascade.is_planned(dependent, "submit"):
+                continue
             if not skip(dependent, "submit", peek=True):
                 can_submit = True
                 if not dependent.getResult():
@@ -1376,13 +1431,7 @@ class Analysis(BaseContent):
         # If all analyses in this AR have been submitted
         # escalate the action to the parent AR
         if not skip(ar, "submit", peek=True):
-            all_submitted = True
-            for a in ar.getAnalyses():
-                if a.review_state in \
-                   ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received"):
-                    all_submitted = False
-                    break
-            if all_submitted:
+            if not statehistogram.has_states(ar, SUBMIT_PENDING_STATES):
                 workflow.doActionFor(ar, "submit")
 
         # If assigned to a worksheet and all analyses on the worksheet have been submitted,
@@ -1392,14 +1441,10 @@ class Analysis(BaseContent):
             ws = ws[0]
             # if the worksheet analyst is not assigned, the worksheet can't  be transitioned.
             if ws.getAnalyst() and not skip(ws, "submit", peek=True):
-                all_submitted = True
-                for a in ws.getAnalyses():
-                    if workflow.getInfoFor(a, "review_state") in \
-                       ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received", "assigned"):
-                        # Note: referenceanalyses and duplicateanalyses can still have review_state = "assigned".
-                        all_submitted = False
-                        break
-                if all_submitted:
+                # Note: referenceanalyses and duplicateanalyses can still have
+                # review_state = "assigned".
+                if not statehistogram.has_states(
+                        ws, SUBMIT_PENDING_STATES + ("assigned", )):
                     workflow.doActionFor(ws, "submit")
 
         # If no problem with attachments, do 'attach' action for this instance.
@@ -1431,47 +1476,10 @@ class Analysis(BaseContent):
         if workflow.getInfoFor(self, 'cancellation_state', 'active') == "cancelled":
             return False
         # We'll assign the new analysis to this same worksheet, if any.
-        ws = self.getBackReferences("WorksheetAnalysis")
-        if ws:
-            ws = ws[0]
-        # Rename the analysis to make way for it's successor.
-        # Support multiple retractions by renaming to *-0, *-1, etc
-        parent = self.aq_parent
-        analyses = [x for x in parent.objectValues("Analysis")
-                    if x.getId().startswith(self.id)]
-        kw = self.getKeyword()
-        # LIMS-1290 - Analyst must be able to retract, which creates a new Analysis.
-        parent._verifyObjectPaste = str   # I cancel the permission check with this.
-        parent.manage_renameObject(kw, "{0}-{1}".format(kw, len(analyses)))
-        delattr(parent, '_verifyObjectPaste')
-        # Create new analysis and copy values from retracted
-        analysis = _createObjectByType("Analysis", parent, kw)
-        analysis.edit(
-            Service=self.getService(),
-            Calculation=self.getCalculation(),
-            InterimFields=self.getInterimFields(),
-            ResultDM=self.getResultDM(),
-            Retested=True,  # True
-            MaxTimeAllowed=self.getMaxTimeAllowed(),
-            DueDate=self.getDueDate(),
-            Duration=self.getDuration(),
-            ReportDryMatter=self.getReportDryMatter(),
-            Analyst=self.getAnalyst(),
-            Instrument=self.getInstrument(),
-            SamplePartition=self.getSamplePartition())
-        analysis.setDetectionLimitOperand(self.getDetectionLimitOperand())
-        analysis.setResult(self.getResult())
-        # Required number of verifications
-        reqvers = self.getNumberOfRequiredVerifications()
-        analysis.setNumberOfRequiredVerifications(reqvers)
-        analysis.unmarkCreationFlag()
-
-        # zope.event.notify(ObjectInitializedEvent(analysis))
-        changeWorkflowState(analysis,
-                            "bika_analysis_workflow", "sample_received")
-        if ws:
-            ws.addAnalysis(analysis)
-        analysis.reindexObject()
+        ws = retest.get_worksheet(self)
+        # Rename the analysis to make way for it's successor and create the
+        # retest
+        analysis = retest.create_retest(self)
         # retract our dependencies
         if "retract all dependencies" not in self.REQUEST["workflow_skiplist"]:
             for dependency in self.getDependencies():
@@ -1496,9 +1504,7 @@ class Analysis(BaseContent):
                     self.REQUEST["workflow_skiplist"].append("retract all analyses")
                 workflow.doActionFor(ar, "retract")
         # Escalate action to the Worksheet (if it's on one).
-        ws = self.getBackReferences("WorksheetAnalysis")
         if ws:
-            ws = ws[0]
             if not skip(ws, "retract", peek=True):
                 if workflow.getInfoFor(ws, "review_state") == "open":
                     skip(ws, "retract")
@@ -1509,20 +1515,8 @@ class Analysis(BaseContent):
                         workflow.doActionFor(ws, "retract")
                     except WorkflowException:
                         pass
-            # Add to worksheet Analyses
-            analyses = list(ws.getAnalyses())
-            analyses += [analysis, ]
-            ws.setAnalyses(analyses)
-            # Add to worksheet layout
-            layout = ws.getLayout()
-            pos = [x["position"] for x in layout
-                   if x["analysis_uid"] == self.UID()][0]
-            slot = {"position": pos,
-                    "analysis_uid": analysis.UID(),
-                    "container_uid": analysis.aq_parent.UID(),
-                    "type": "a"}
-            layout.append(slot)
-            ws.setLayout(layout)
+            # Add the retest to the slot of this analysis in the worksheet
+            retest.add_retest_to_worksheet(ws, self.UID(), analysis)
 
     def workflow_script_verify(self):
         # DuplicateAnalysis doesn't have analysis_workflow.
@@ -1538,13 +1532,7 @@ class Analysis(BaseContent):
         # escalate the action to the parent AR
         ar = self.aq_parent
         if not skip(ar, "verify", peek=True):
-            all_verified = True
-            for a in ar.getAnalyses():
-                if a.review_state in \
-                   ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received", "attachment_due", "to_be_verified"):
-                    all_verified = False
-                    break
-            if all_verified:
+            if not statehistogram.has_states(ar, VERIFY_PENDING_STATES):
                 if "verify all analyses" not in self.REQUEST['workflow_skiplist']:
                     self.REQUEST["workflow_skiplist"].append("verify all analyses")
                 workflow.doActionFor(ar, "verify")
@@ -1555,15 +1543,10 @@ class Analysis(BaseContent):
             ws = ws[0]
             ws_state = workflow.getInfoFor(ws, "review_state")
             if ws_state == "to_be_verified" and not skip(ws, "verify", peek=True):
-                all_verified = True
-                for a in ws.getAnalyses():
-                    if workflow.getInfoFor(a, "review_state") in \
-                       ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received", "attachment_due", "to_be_verified", "assigned"):
-                        # Note: referenceanalyses and duplicateanalyses can
-                        # still have review_state = "assigned".
-                        all_verified = False
-                        break
-                if all_verified:
+                # Note: referenceanalyses and duplicateanalyses can
+                # still have review_state = "assigned".
+                if not statehistogram.has_states(
+                        ws, VERIFY_PENDING_STATES + ("assigned", )):
                     if "verify all analyses" not in self.REQUEST['workflow_skiplist']:
                         self.REQUEST["workflow_skiplist"].append("verify all analyses")
                     workflow.doActionFor(ws, "verify")
@@ -1637,13 +1620,7 @@ class Analysis(BaseContent):
         ar = self.aq_parent
         ar_state = workflow.getInfoFor(ar, "review_state")
         if ar_state == "attachment_due" and not skip(ar, "attach", peek=True):
-            can_attach = True
-            for a in ar.getAnalyses():
-                if a.review_state in \
-                   ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received", "attachment_due"):
-                    can_attach = False
-                    break
-            if can_attach:
+            if not statehistogram.has_states(ar, ATTACH_PENDING_STATES):
                 workflow.doActionFor(ar, "attach")
         # If assigned to a worksheet and all analyses on the worksheet have been attached,
         # then attach the worksheet.
@@ -1652,14 +1629,10 @@ class Analysis(BaseContent):
             ws = ws[0]
             ws_state = workflow.getInfoFor(ws, "review_state")
             if ws_state == "attachment_due" and not skip(ws, "attach", peek=True):
-                can_attach = True
-                for a in ws.getAnalyses():
-                    if workflow.getInfoFor(a, "review_state") in \
-                       ("to_be_sampled", "to_be_preserved", "sample_due", "sample_received", "attachment_due", "assigned"):
-                        # Note: referenceanalyses and duplicateanalyses can still have review_state = "assigned".
-                        can_attach = False
-                        break
-                if can_attach:
+                # Note: referenceanalyses and duplicateanalyses can still have
+                # review_state = "assigned".
+                if not statehistogram.has_states(
+                        ws, ATTACH_PENDING_STATES + ("assigned", )):
                     workflow.doActionFor(ws, "attach")
 
     def workflow_script_assign(self):
@@ -1719,25 +1692,13 @@ class Analysis(BaseContent):
         #  if all other analyses are at a higher state than this one was.
         # (or maybe retract it if there are no analyses left)
         # Note: duplicates, controls and blanks have 'assigned' as a review_state.
-        can_submit = True
-        can_attach = True
-        can_verify = True
-        ws_empty = True
-        for a in ws.getAnalyses():
-            ws_empty = False
-            a_state = workflow.getInfoFor(a, "review_state")
-            if a_state in \
-               ("to_be_sampled", "to_be_preserved", "assigned", "sample_due", "sample_received"):
-                can_submit = False
-            else:
-                if not ws.getAnalyst():
-                    can_submit = False
-            if a_state in \
-               ("to_be_sampled", "to_be_preserved", "assigned", "sample_due", "sample_received", "attachment_due"):
-                can_attach = False
-            if a_state in \
-               ("to_be_sampled", "to_be_preserved", "assigned", "sample_due", "sample_received", "attachment_due", "to_be_verified",):
-                can_verify = False
+        ws_empty = statehistogram.is_empty(ws)
+        can_submit = ws.getAnalyst() and not statehistogram.has_states(
+            ws, SUBMIT_PENDING_STATES + ("assigned", ))
+        can_attach = not statehistogram.has_states(
+            ws, ATTACH_PENDING_STATES + ("assigned", ))
+        can_verify = not statehistogram.has_states(
+            ws, VERIFY_PENDING_STATES + ("assigned", ))
         if not ws_empty:
             # Note: WS adds itself to the skiplist so we have to take it off again
             #       to allow multiple promotions (maybe by more than one instance).
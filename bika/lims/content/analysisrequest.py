@@ -83,7 +83,9 @@ from bika.lims.interfaces import IAnalysisRequest
 from bika.lims.interfaces import ISamplePrepWorkflow
 
 from bika.lims import api
+from bika.lims import cascade
 from bika.lims import deprecated
+from bika.lims import lateness
 from bika.lims.config import PROJECTNAME
 from bika.lims import bikaMessageFactory as _
 from bika.lims.content.bikaschema import BikaSchema
@@ -1990,29 +1992,10 @@ class AnalysisRequest(BaseFolder):
     security.declareProtected(View, 'getLate')
 
     def getLate(self):
-        """Return True if any analyses are late
+        """Return True if any analyses are late. The late flags of the
+        analyses are read from the catalog, see bika.lims.lateness
         """
-        workflow = getToolByName(self, 'portal_workflow')
-        review_state = workflow.getInfoFor(self, 'review_state', '')
-        resultdate = 0
-        if review_state in ['to_be_sampled', 'to_be_preserved',
-                            'sample_due', 'published']:
-            return False
-
-        for analysis in self.objectValues('Analysis'):
-            review_state = workflow.getInfoFor(analysis, 'review_state', '')
-            if review_state == 'published':
-                continue
-            calculation = analysis.getService().getCalculation()
-            if not calculation or (calculation and not calculation.getDependentServices()):
-                resultdate = analysis.getResultCaptureDate()
-            duedate = analysis.getDueDate()
-            # noinspection PyCallingNonCallable
-            if (resultdate and resultdate > duedate) \
-                    or (not resultdate and DateTime() > duedate):
-                return True
-
-        return False
+        return lateness.is_ar_late(self)
 
     security.declareProtected(View, 'getBillableItems')
 
@@ -2807,6 +2790,9 @@ class AnalysisRequest(BaseFolder):
         # receive all analyses in this AR.
         analyses = self.getAnalyses(review_state='sample_due')
         for analysis in analyses:
+            # received by the cascade of the sample
+            if cascade.is_planned(analysis, 'receive'):
+                continue
             if not skip(analysis, 'receive'):
                 workflow.doActionFor(analysis.getObject(), 'receive')
 
@@ -16,15 +16,13 @@ from bika.lims.config import PROJECTNAME
 from bika.lims.content.bikaschema import BikaSchema
 from bika.lims.content.analysisrequest import schema as ar_schema
 from bika.lims.content.sample import schema as sample_schema
+from bika.lims import arimportjob
 from bika.lims.idserver import renameAfterCreation
 from bika.lims.interfaces import IARImport, IClient
-from bika.lims.utils import tmpID, getUsers
+from bika.lims.utils import tmpID
+from bika.lims.utils.arimport import get_lookups
 from bika.lims.vocabularies import CatalogVocabulary
 from bika.lims.workflow import getTransitionDate
-from collective.progressbar.events import InitialiseProgressBar
-from collective.progressbar.events import ProgressBar
-from collective.progressbar.events import ProgressState
-from collective.progressbar.events import UpdateProgressEvent
 from Products.Archetypes import atapi
 from Products.Archetypes.public import *
 from Products.Archetypes.references import HoldingReference
@@ -43,7 +41,6 @@ from Products.DataGridField import TimeColumn
 from plone import api
 from plone.indexer import indexer
 from zope import event
-from zope.event import notify
 from zope.i18nmessageid import MessageFactory
 from zope.interface import implements
 
@@ -310,131 +307,107 @@ class ARImport(BaseFolder):
             workflow.doActionFor(self, 'validate')
 
     def workflow_script_import(self):
-        """Create objects from valid ARImport
+        """Create objects from valid ARImport. Large imports are processed in
+        chunks, see `bika.lims.arimportjob`.
+        """
+        arimportjob.start(self)
+        status = arimportjob.QUEUED
+        if arimportjob.get_pending_count(self) <= arimportjob.CHUNK_SIZE:
+            status = arimportjob.process(self)["status"]
+        if status == arimportjob.DONE:
+            url = self.aq_parent.absolute_url()
+        else:
+            url = "%s/import_progress" % self.absolute_url()
+        # document has been written to, and redirect() fails here
+        self.REQUEST.response.write(
+            '<script>document.location.href="%s"</script>' % url)
+
+    def import_row(self, therow, lookups=None):
+        """Create the Sample, SamplePartition and AR of a SampleData row.
+        Returns the AR.
         """
 
         def convert_date_string(datestr):
             return datestr.replace('-', '/')
 
-        def lookup_sampler_uid(import_user):
-            #Lookup sampler's uid
-            found = False
-            userid = None
-            user_ids = []
-            users = getUsers(self, ['LabManager', 'Sampler']).items()
-            for (samplerid, samplername) in users:
-                if import_user == samplerid:
-                    found = True
-                    userid = samplerid
-                    break
-                if import_user == samplername:
-                    user_ids.append(samplerid)
-            if found:
-                return userid
-            if len(user_ids) == 1:
-                return user_ids[0]
-            if len(user_ids) > 1:
-                #raise ValueError('Sampler %s is ambiguous' % import_user)
-                return ''
-            #Otherwise
-            #raise ValueError('Sampler %s not found' % import_user)
-            return ''
-
-        bsc = getToolByName(self, 'bika_setup_catalog')
+        if lookups is None:
+            lookups = get_lookups(self)
         workflow = getToolByName(self, 'portal_workflow')
         client = self.aq_parent
-
-        title = _('Submitting AR Import')
-        description = _('Creating and initialising objects')
-        bar = ProgressBar(self, self.REQUEST, title, description)
-        notify(InitialiseProgressBar(bar))
-
-        profiles = [x.getObject() for x in bsc(portal_type='AnalysisProfile')]
-
-        gridrows = self.schema['SampleData'].get(self)
-        row_cnt = 0
-        for therow in gridrows:
-            row = therow.copy()
-            row_cnt += 1
-            # Create Sample
-            sample = _createObjectByType('Sample', client, tmpID())
-            sample.unmarkCreationFlag()
-            # First convert all row values into something the field can take
-            sample.edit(**row)
-            sample._renameAfterCreation()
-            event.notify(ObjectInitializedEvent(sample))
-            sample.at_post_create_script()
-            swe = self.bika_setup.getSamplingWorkflowEnabled()
-            if swe:
-                workflow.doActionFor(sample, 'sampling_workflow')
-            else:
-                workflow.doActionFor(sample, 'no_sampling_workflow')
-            part = _createObjectByType('SamplePartition', sample, 'part-1')
-            part.unmarkCreationFlag()
-            renameAfterCreation(part)
-            if swe:
-                workflow.doActionFor(part, 'sampling_workflow')
-            else:
-                workflow.doActionFor(part, 'no_sampling_workflow')
-            # Container is special... it could be a containertype.
-            container = self.get_row_container(row)
-            if container:
-                if container.portal_type == 'ContainerType':
-                    containers = container.getContainers()
-                # XXX And so we must calculate the best container for this partition
-                part.edit(Container=containers[0])
-
-            # Profiles are titles, profile keys, or UIDS: convert them to UIDs.
-            newprofiles = []
-            for title in row['Profiles']:
-                objects = [x for x in profiles
-                           if title in (x.getProfileKey(), x.UID(), x.Title())]
-                for obj in objects:
-                    newprofiles.append(obj.UID())
-            row['Profiles'] = newprofiles
-
-            # BBB in bika.lims < 3.1.9, only one profile is permitted
-            # on an AR.  The services are all added, but only first selected
-            # profile name is stored.
-            row['Profile'] = newprofiles[0] if newprofiles else None
-
-            # Same for analyses
-            newanalyses = set(self.get_row_services(row) +
-                              self.get_row_profile_services(row))
-            row['Analyses'] = []
-            # get batch
-            batch = self.schema['Batch'].get(self)
-            if batch:
-                row['Batch'] = batch
-            # Add AR fields from schema into this row's data
-            row['ClientReference'] = self.getClientReference()
-            row['ClientOrderNumber'] = self.getClientOrderNumber()
-            row['Contact'] = self.getContact()
-            row['DateSampled'] = convert_date_string(row['DateSampled'])
-            if row['Sampler']:
-                row['Sampler'] = lookup_sampler_uid(row['Sampler'])
-
-            # Create AR
-            ar = _createObjectByType("AnalysisRequest", client, tmpID())
-            ar.setSample(sample)
-            ar.unmarkCreationFlag()
-            ar.edit(**row)
-            ar._renameAfterCreation()
-            ar.setAnalyses(list(newanalyses))
-            for analysis in ar.getAnalyses(full_objects=True):
-                analysis.setSamplePartition(part)
-            ar.at_post_create_script()
-            if swe:
-                workflow.doActionFor(ar, 'sampling_workflow')
-            else:
-                workflow.doActionFor(ar, 'no_sampling_workflow')
-            progress_index = float(row_cnt) / len(gridrows) * 100
-            progress = ProgressState(self.REQUEST, progress_index)
-            notify(UpdateProgressEvent(progress))
-        # document has been written to, and redirect() fails here
-        self.REQUEST.response.write(
-            '<script>document.location.href="%s"</script>' % (
-                self.aq_parent.absolute_url()))
+        row = therow.copy()
+        # Create Sample
+        sample = _createObjectByType('Sample', client, tmpID())
+        sample.unmarkCreationFlag()
+        # First convert all row values into something the field can take
+        sample.edit(**row)
+        sample._renameAfterCreation()
+        event.notify(ObjectInitializedEvent(sample))
+        sample.at_post_create_script()
+        swe = self.bika_setup.getSamplingWorkflowEnabled()
+        if swe:
+            workflow.doActionFor(sample, 'sampling_workflow')
+        else:
+            workflow.doActionFor(sample, 'no_sampling_workflow')
+        part = _createObjectByType('SamplePartition', sample, 'part-1')
+        part.unmarkCreationFlag()
+        renameAfterCreation(part)
+        if swe:
+            workflow.doActionFor(part, 'sampling_workflow')
+        else:
+            workflow.doActionFor(part, 'no_sampling_workflow')
+        # Container is special... it could be a containertype.
+        container = self.get_row_container(row)
+        if container:
+            containers = [container]
+            if container.portal_type == 'ContainerType':
+                containers = container.getContainers()
+            # XXX And so we must calculate the best container for this partition
+            part.edit(Container=containers[0])
+
+        # Profiles are titles, profile keys, or UIDS: convert them to UIDs.
+        newprofiles = []
+        for title in row['Profiles']:
+            uid = lookups.get_profile_uid(title)
+            if uid:
+                newprofiles.append(uid)
+        row['Profiles'] = newprofiles
+
+        # BBB in bika.lims < 3.1.9, only one profile is permitted
+        # on an AR.  The services are all added, but only first selected
+        # profile name is stored.
+        row['Profile'] = newprofiles[0] if newprofiles else None
+
+        # Same for analyses
+        newanalyses = set(self.get_row_services(row) +
+                          self.get_row_profile_services(row))
+        row['Analyses'] = []
+        # get batch
+        batch = self.schema['Batch'].get(self)
+        if batch:
+            row['Batch'] = batch
+        # Add AR fields from schema into this row's data
+        row['ClientReference'] = self.getClientReference()
+        row['ClientOrderNumber'] = self.getClientOrderNumber()
+        row['Contact'] = self.getContact()
+        row['DateSampled'] = convert_date_string(row['DateSampled'])
+        if row['Sampler']:
+            row['Sampler'] = lookups.get_sampler_id(row['Sampler'])
+
+        # Create AR
+        ar = _createObjectByType("AnalysisRequest", client, tmpID())
+        ar.setSample(sample)
+        ar.unmarkCreationFlag()
+        ar.edit(**row)
+        ar._renameAfterCreation()
+        ar.setAnalyses(list(newanalyses))
+        for analysis in ar.objectValues('Analysis'):
+            analysis.setSamplePartition(part)
+        ar.at_post_create_script()
+        if swe:
+            workflow.doActionFor(ar, 'sampling_workflow')
+        else:
+            workflow.doActionFor(ar, 'no_sampling_workflow')
+        return ar
 
     def get_header_values(self):
         """Scrape the "Header" values from the original input file
@@ -567,13 +540,7 @@ class ARImport(BaseFolder):
         """Save values from the file's header row into the DataGrid columns
         after doing some very basic validation
         """
-        bsc = getToolByName(self, 'bika_setup_catalog')
-        keywords = self.bika_setup_catalog.uniqueValuesFor('getKeyword')
-        profiles = []
-        for p in bsc(portal_type='AnalysisProfile'):
-            p = p.getObject()
-            profiles.append(p.Title())
-            profiles.append(p.getProfileKey())
+        lookups = get_lookups(self)
 
         sample_data = self.get_sample_values()
         if not sample_data:
@@ -675,13 +642,13 @@ class ARImport(BaseFolder):
             # Count and remove Keywords and Profiles from the list
             gridrow['Analyses'] = []
             for k, v in row.items():
-                if k in keywords:
+                if lookups.is_keyword(k):
                     del (row[k])
                     if str(v).strip().lower() not in ('', '0', 'false'):
                         gridrow['Analyses'].append(k)
             gridrow['Profiles'] = []
             for k, v in row.items():
-                if k in profiles:
+                if lookups.is_profile(k):
                     del (row[k])
                     if str(v).strip().lower() not in ('', '0', 'false'):
                         gridrow['Profiles'].append(k)
@@ -869,14 +836,7 @@ class ARImport(BaseFolder):
         """Scan through the SampleData values and make sure
         that each one is correct
         """
-
-        bsc = getToolByName(self, 'bika_setup_catalog')
-        keywords = bsc.uniqueValuesFor('getKeyword')
-        profiles = []
-        for p in bsc(portal_type='AnalysisProfile'):
-            p = p.getObject()
-            profiles.append(p.Title())
-            profiles.append(p.getProfileKey())
+        lookups = get_lookups(self)
 
         row_nr = 0
         for gridrow in self.getSampleData():
@@ -903,13 +863,13 @@ class ARImport(BaseFolder):
 
             an_cnt = 0
             for v in gridrow['Analyses']:
-                if v and v not in keywords:
+                if v and not lookups.is_keyword(v):
                     self.error("Row %s: value is invalid (%s=%s)" %
                                ('Analysis keyword', row_nr, v))
                 else:
                     an_cnt += 1
             for v in gridrow['Profiles']:
-                if v and v not in profiles:
+                if v and not lookups.is_profile(v):
                     self.error("Row %s: value is invalid (%s=%s)" %
                                ('Profile Title', row_nr, v))
                 else:
@@ -965,16 +925,12 @@ class ARImport(BaseFolder):
         """Return a list of services which are referenced in Analyses.
         values may be UID, Title or Keyword.
         """
-        bsc = getToolByName(self, 'bika_setup_catalog')
+        lookups = get_lookups(self)
         services = set()
         for val in row.get('Analyses', []):
-            brains = bsc(portal_type='AnalysisService', getKeyword=val)
-            if not brains:
-                brains = bsc(portal_type='AnalysisService', title=val)
-            if not brains:
-                brains = bsc(portal_type='AnalysisService', UID=val)
-            if brains:
-                services.add(brains[0].UID)
+            uid = lookups.get_service_uid(val)
+            if uid:
+                services.add(uid)
             else:
                 self.error("Invalid analysis specified: %s" % val)
         return list(services)
@@ -983,15 +939,12 @@ class ARImport(BaseFolder):
         """Return a list of services which are referenced in profiles
         values may be UID, Title or ProfileKey.
         """
-        bsc = getToolByName(self, 'bika_setup_catalog')
+        lookups = get_lookups(self)
         services = set()
-        profiles = [x.getObject() for x in bsc(portal_type='AnalysisProfile')]
         for val in row.get('Profiles', []):
-            objects = [x for x in profiles
-                       if val in (x.getProfileKey(), x.UID(), x.Title())]
-            if objects:
-                for service in objects[0].getService():
-                    services.add(service.UID())
+            service_uids = lookups.get_profile_services(val)
+            if service_uids is not None:
+                services.update(service_uids)
             else:
                 self.error("Invalid profile specified: %s" % val)
         return list(services)
@@ -999,16 +952,10 @@ class ARImport(BaseFolder):
     def get_row_container(self, row):
         """Return a sample container
         """
-        bsc = getToolByName(self, 'bika_setup_catalog')
         val = row.get('Container', False)
         if val:
-            brains = bsc(portal_type='Container', UID=row['Container'])
-            if brains:
-                brains[0].getObject()
-            brains = bsc(portal_type='ContainerType', UID=row['Container'])
-            if brains:
-                # XXX Cheating.  The calculation of capacity vs. volume  is not done.
-                return brains[0].getObject()
+            # XXX Cheating.  The calculation of capacity vs. volume  is not done.
+            return get_lookups(self).get_container(val)
         return None
 
     def get_row_profiles(self, row):
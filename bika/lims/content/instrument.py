@@ -45,11 +45,12 @@ from bika.lims.browser.widgets import RecordsWidget
 
 # bika.lims imports
 from bika.lims import api
+from bika.lims import instrumentlog
+from bika.lims import instrumentvalidity
 from bika.lims.utils import t
 from bika.lims.utils import to_utf8
 from bika.lims.config import PROJECTNAME
 from bika.lims.interfaces import IInstrument
-from bika.lims.config import QCANALYSIS_TYPES
 from bika.lims.content.bikaschema import BikaSchema
 from bika.lims.content.bikaschema import BikaFolderSchema
 from bika.lims import bikaMessageFactory as _
@@ -202,8 +203,10 @@ schema = BikaFolderSchema.copy() + BikaSchema.copy() + Schema((
         ),
     ),
 
-    # References to all analyses performed with this instrument.
-    # Includes regular analyses, QC analyes and Calibration tests.
+    # BBB: The analyses performed with this instrument (regular analyses, QC
+    # analyses and Calibration tests) are stored in the analysis log of the
+    # instrument (see bika.lims.instrumentlog). This field is only read to
+    # build the log of instruments created before.
     ReferenceField(
         'Analyses',
         required=0,
@@ -216,8 +219,7 @@ schema = BikaFolderSchema.copy() + BikaSchema.copy() + Schema((
         ),
     ),
 
-    # Private method. Use getLatestReferenceAnalyses() instead.
-    # See getLatestReferenceAnalyses() method for further info.
+    # BBB: Not used anymore. Use getLatestReferenceAnalyses() instead.
     ReferenceField(
         '_LatestReferenceAnalyses',
         required=0,
@@ -481,15 +483,26 @@ class Instrument(ATFolder):
                 certs.append(c)
         return certs
 
+    security.declareProtected("Modify portal content",
+                              "setDisposeUntilNextCalibrationTest")
+    def setDisposeUntilNextCalibrationTest(self, value):
+        """ Sets the dispose flag and updates the validity status
+        """
+        self.getField("DisposeUntilNextCalibrationTest").set(self, value)
+        if not self.checkCreationFlag():
+            instrumentvalidity.update(self)
+
     def isValid(self):
         """ Returns if the current instrument is not out for verification, calibration,
         out-of-date regards to its certificates and if the latest QC succeed
         """
-        return self.isOutOfDate() is False \
-            and self.isQCValid() is True \
-            and self.getDisposeUntilNextCalibrationTest() is False \
-            and self.isValidationInProgress() is False \
-            and self.isCalibrationInProgress() is False
+        return self.getValidityStatus()["valid"]
+
+    def getValidityStatus(self):
+        """ Returns the cached validity status of the instrument.
+            See bika.lims.instrumentvalidity for further info.
+        """
+        return instrumentvalidity.get_status(self)
 
     def getLatestReferenceAnalyses(self):
         """ Returns a list with the latest Reference analyses performed
@@ -500,34 +513,20 @@ class Instrument(ATFolder):
             instrument, Analysis Service and Reference type (blank or control).
             The list is created 'on-fly' if the method hasn't been already
             called or a new ReferenceAnalysis has been added by using
-            addReferences() since its last call. Otherwise, uses the
-            private accessor _LatestReferenceAnalyses as a cache
-            (prevents overload).
+            addReferences() since its last call. The latest analyses are
+            kept up to date by the analysis log of the instrument
+            (see bika.lims.instrumentlog).
             As an example:
             [0]: RefAnalysis for Ethanol, QC-001 (Blank)
             [1]: RefAnalysis for Ethanol, QC-002 (Control)
             [2]: RefAnalysis for Methanol, QC-001 (Blank)
         """
-        field = self.getField('_LatestReferenceAnalyses')
-        refs = field and field.get(self) or []
-        if len(refs) == 0:
-            latest = {}
-            # Since the results file importer uses Date from the results
-            # file as Analysis 'Capture Date', we cannot assume the last
-            # item from the list is the latest analysis done, so we must
-            # pick up the latest analyses using the Results Capture Date
-            for ref in self.getReferenceAnalyses():
-                antype = QCANALYSIS_TYPES.getValue(ref.getReferenceType())
-                key = '%s.%s' % (ref.getServiceUID(), antype)
-                last = latest.get(key, ref)
-                if ref.getResultCaptureDate() > last.getResultCaptureDate():
-                    latest[key] = ref
-                else:
-                    latest[key] = last
-            refs = [r for r in latest.itervalues()]
-            # Add to the cache
-            self.getField('_LatestReferenceAnalyses').set(self, refs)
-        return refs
+        # Since the results file importer uses Date from the results
+        # file as Analysis 'Capture Date', we cannot assume the last
+        # item from the list is the latest analysis done. The analysis log
+        # keeps the latest analyses by their Results Capture Date.
+        uids = instrumentlog.get_latest_reference_uids(self)
+        return filter(None, [api.get_object_by_uid(uid, None) for uid in uids])
 
     def isQCValid(self):
         """ Returns True if the instrument succeed for all the latest
@@ -689,8 +688,25 @@ class Instrument(ATFolder):
             The rest of the analyses (regular and duplicates) will not
             be returned.
         """
-        return [analysis for analysis in self.getAnalyses()
-                if analysis.portal_type == 'ReferenceAnalysis']
+        uids = instrumentlog.get_analysis_uids(
+            self, qctypes=instrumentlog.REFERENCE_QCTYPES)
+        return filter(None, [api.get_object_by_uid(uid, None) for uid in uids])
+
+    def getRawAnalyses(self):
+        """ Returns the UIDs of all analyses performed with this instrument
+        """
+        return instrumentlog.get_analysis_uids(self)
+
+    def getAnalyses(self):
+        """ Returns all analyses performed with this instrument
+        """
+        uids = self.getRawAnalyses()
+        return filter(None, [api.get_object_by_uid(uid, None) for uid in uids])
+
+    def setAnalyses(self, analyses):
+        """ Set the analyses (objects or UIDs) performed with this instrument
+        """
+        instrumentlog.set_analyses(self, analyses)
 
     def addAnalysis(self, analysis):
         """ Add regular analysis (included WS QCs) to this instrument
@@ -701,10 +717,9 @@ class Instrument(ATFolder):
             return
         if targetuid != self.UID():
             raise Exception("Invalid instrument")
-        ans = self.getRawAnalyses() if self.getRawAnalyses() else []
-        ans.append(analysis.UID())
-        self.setAnalyses(ans)
-        self.cleanReferenceAnalysesCache()
+        instrumentlog.add_analysis(self, analysis)
+        if analysis.portal_type == 'ReferenceAnalysis':
+            instrumentvalidity.update(self)
 
     def removeAnalysis(self, analysis):
         """ Remove a regular analysis assigned to this instrument
@@ -714,13 +729,12 @@ class Instrument(ATFolder):
             return
         if targetuid != self.UID():
             raise Exception("Invalid instrument")
-        uid = analysis.UID()
-        ans = [a for a in self.getRawAnalyses() if a != uid]
-        self.setAnalyses(ans)
-        self.cleanReferenceAnalysesCache()
+        instrumentlog.remove_analysis(self, analysis)
+        if analysis.portal_type == 'ReferenceAnalysis':
+            instrumentvalidity.update(self)
 
     def cleanReferenceAnalysesCache(self):
-        self.getField('_LatestReferenceAnalyses').set(self, [])
+        instrumentlog.refresh_latest(self)
 
     def addReferences(self, reference, service_uids):
         """ Add reference analyses to reference
@@ -755,6 +769,7 @@ class Instrument(ATFolder):
             # the same Reference Sample and same Worksheet)
             # https://github.com/bikalabs/Bika-LIMS/issues/931
             ref_analysis.setReferenceAnalysesGroupID(refgid)
+            ref_analysis.setInstrument(self)
             ref_analysis.reindexObject()
 
             # copy the interimfields
@@ -769,14 +784,13 @@ class Instrument(ATFolder):
                 wf.doActionFor(ref_analysis, 'assign')
             addedanalyses.append(ref_analysis)
 
-        self.setAnalyses(self.getAnalyses() + addedanalyses)
-
-        # Initialize LatestReferenceAnalyses cache
-        self.cleanReferenceAnalysesCache()
+        for ref_analysis in addedanalyses:
+            instrumentlog.add_analysis(self, ref_analysis)
 
         # Set DisposeUntilNextCalibrationTest to False
         if (len(addedanalyses) > 0):
             self.getField('DisposeUntilNextCalibrationTest').set(self, False)
+            instrumentvalidity.update(self)
 
         return addedanalyses
 
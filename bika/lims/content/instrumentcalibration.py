@@ -33,6 +33,7 @@ from Products.Archetypes.atapi import TextAreaWidget
 # bika.lims imports
 from bika.lims.config import PROJECTNAME
 from bika.lims import bikaMessageFactory as _
+from bika.lims import instrumentvalidity
 from bika.lims.content.bikaschema import BikaSchema
 from bika.lims.browser.widgets import DateTimeWidget
 from bika.lims.browser.widgets import ReferenceWidget
@@ -173,6 +174,20 @@ class InstrumentCalibration(BaseFolder):
         from bika.lims.idserver import renameAfterCreation
         renameAfterCreation(self)
 
+    security.declareProtected("Modify portal content", "setDownFrom")
+    def setDownFrom(self, value):
+        """Sets the date and updates the validity status of the instrument
+        """
+        self.getField("DownFrom").set(self, value)
+        instrumentvalidity.update_parent(self)
+
+    security.declareProtected("Modify portal content", "setDownTo")
+    def setDownTo(self, value):
+        """Sets the date and updates the validity status of the instrument
+        """
+        self.getField("DownTo").set(self, value)
+        instrumentvalidity.update_parent(self)
+
     def getLabContacts(self):
         bsc = ploneapi.portal.get_tool('bika_setup_catalog')
         # fallback - all Lab Contacts
@@ -38,6 +38,7 @@ from bika.lims.browser.widgets import ReferenceWidget
 from bika.lims.browser.widgets import ComboBoxWidget
 
 # bika.lims imports
+from bika.lims import instrumentvalidity
 from bika.lims import logger
 from bika.lims.config import PROJECTNAME
 from bika.lims import bikaMessageFactory as _
@@ -217,6 +218,13 @@ class InstrumentCertification(BaseFolder):
         from bika.lims.idserver import renameAfterCreation
         renameAfterCreation(self)
 
+    security.declareProtected("Modify portal content", "setValidFrom")
+    def setValidFrom(self, value):
+        """Sets the date and updates the validity status of the instrument
+        """
+        self.getField("ValidFrom").set(self, value)
+        instrumentvalidity.update_parent(self)
+
     security.declareProtected("Modify portal content", "setValidTo")
     def setValidTo(self, value):
         """Custom setter method to calculate a `ValidTo` date based on
@@ -234,6 +242,7 @@ class InstrumentCertification(BaseFolder):
         else:
             # just set the value
             self.getField("ValidTo").set(self, valid_to)
+        instrumentvalidity.update_parent(self)
 
     def getLabContacts(self):
         bsc = ploneapi.portal.get_tool('bika_setup_catalog')
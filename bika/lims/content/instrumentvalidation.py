@@ -33,6 +33,7 @@ from bika.lims.browser.widgets import ReferenceWidget
 
 from bika.lims.config import PROJECTNAME
 from bika.lims import bikaMessageFactory as _
+from bika.lims import instrumentvalidity
 from bika.lims.interfaces import IInstrumentValidation
 
 
@@ -153,6 +154,20 @@ class InstrumentValidation(BaseFolder):
         from bika.lims.idserver import renameAfterCreation
         renameAfterCreation(self)
 
+    security.declareProtected("Modify portal content", "setDownFrom")
+    def setDownFrom(self, value):
+        """Sets the date and updates the validity status of the instrument
+        """
+        self.getField("DownFrom").set(self, value)
+        instrumentvalidity.update_parent(self)
+
+    security.declareProtected("Modify portal content", "setDownTo")
+    def setDownTo(self, value):
+        """Sets the date and updates the validity status of the instrument
+        """
+        self.getField("DownTo").set(self, value)
+        instrumentvalidity.update_parent(self)
+
     def getLabContacts(self):
         bsc = ploneapi.portal.get_tool('bika_setup_catalog')
         # fallback - all Lab Contacts
@@ -12,6 +12,9 @@ from bika.lims.workflow import getTransitionActor
 from plone import api
 from AccessControl import ClassSecurityInfo
 from bika.lims import bikaMessageFactory as _
+from bika.lims import instrumentlog
+from bika.lims import instrumentvalidity
+from bika.lims import qcstats
 from bika.lims.utils import t, formatDecimalMark
 from bika.lims.utils.analysis import format_numeric_result
 from bika.lims.browser.fields import HistoryAwareReferenceField
@@ -21,6 +24,7 @@ from bika.lims.config import STD_TYPES, PROJECTNAME
 from bika.lims.content.bikaschema import BikaSchema
 from bika.lims.interfaces import IReferenceAnalysis
 from bika.lims.permissions import Verify as VerifyPermission
+from Products.CMFCore.permissions import ModifyPortalContent
 from bika.lims.subscribers import skip
 from bika.lims.utils.analysis import get_significant_digits
 from DateTime import DateTime
@@ -228,6 +232,19 @@ class ReferenceAnalysis(BaseContent):
         # Always update ResultCapture date when this field is modified
         self.setResultCaptureDate(DateTime())
         self.getField('Result').set(self, value, **kw)
+        # The QC validity of the instrument depends on the latest results
+        instrument = self.getInstrument()
+        if instrument:
+            instrumentvalidity.update(instrument)
+
+    security.declareProtected(ModifyPortalContent, 'setResultCaptureDate')
+
+    def setResultCaptureDate(self, value, **kw):
+        self.getField('ResultCaptureDate').set(self, value, **kw)
+        # Keep the latest reference analyses of the instrument up to date
+        instrument = self.getInstrument()
+        if instrument:
+            instrumentlog.update_result_capture(instrument, self)
 
     security.declarePublic('current_date')
 
@@ -591,6 +608,9 @@ class ReferenceAnalysis(BaseContent):
         workflow = getToolByName(self, 'portal_workflow')
         self.reindexObject(idxs=["review_state", ])
 
+        # Add the verified result to the QC statistics
+        qcstats.add_analysis(self)
+
         # If all other analyses on the worksheet are verified,
         # then verify the worksheet.
         ws = self.getBackReferences('WorksheetAnalysis')
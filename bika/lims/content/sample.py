@@ -56,6 +56,7 @@ from bika.lims.permissions import SampleSample
 from bika.lims.permissions import ScheduleSampling
 from bika.lims.workflow import doActionFor, isBasicTransitionAllowed
 from bika.lims.workflow import skip
+from bika.lims import cascade
 from bika.lims import bikaMessageFactory as _
 from bika.lims import bikaMessageFactory as logger
 
@@ -936,34 +937,18 @@ class Sample(BaseFolder, HistoryAwareMixin):
         return DisplayList(prep_workflows)
 
     def workflow_script_receive(self):
-        workflow = getToolByName(self, 'portal_workflow')
         self.setDateReceived(DateTime())
         self.reindexObject(idxs=["review_state", "getDateReceived"])
-        # Receive all self partitions that are still 'sample_due'
-        parts = self.objectValues('SamplePartition')
-        sample_due = [sp for sp in parts
-                      if workflow.getInfoFor(sp, 'review_state') == 'sample_due']
-        for sp in sample_due:
-            workflow.doActionFor(sp, 'receive')
-        # when a self is received, all associated
-        # AnalysisRequests are also transitioned
-        for ar in self.getAnalysisRequests():
-            doActionFor(ar, "receive")
+        # Receive all partitions that are still 'sample_due', the associated
+        # AnalysisRequests and their analyses
+        cascade.cascade_sample_transition(self, "receive")
 
     def workflow_script_preserve(self):
         """This action can happen in the Sample UI, so we transition all
         self partitions that are still 'to_be_preserved'
         """
-        workflow = getToolByName(self, 'portal_workflow')
-        parts = self.objectValues("SamplePartition")
-        tbs = [sp for sp in parts
-               if workflow.getInfoFor(sp, 'review_state') == 'to_be_preserved']
-        for sp in tbs:
-            doActionFor(sp, "preserve")
         # All associated AnalysisRequests are also transitioned
-        for ar in self.getAnalysisRequests():
-            doActionFor(ar, "preserve")
-            ar.reindexObject()
+        cascade.cascade_sample_transition(self, "preserve")
 
     def workflow_script_expire(self):
         self.setDateExpired(DateTime())
@@ -976,41 +961,23 @@ class Sample(BaseFolder, HistoryAwareMixin):
     def workflow_script_sample(self):
         if skip(self, "sample"):
             return
-        workflow = getToolByName(self, 'portal_workflow')
-        parts = self.objectValues('SamplePartition')
         # This action can happen in the Sample UI.  So we transition all
-        # partitions that are still 'to_be_sampled'
-        tbs = [sp for sp in parts
-               if workflow.getInfoFor(sp, 'review_state') == 'to_be_sampled']
-        for sp in tbs:
-            doActionFor(sp, "sample")
-        # All associated AnalysisRequests are also transitioned
-        for ar in self.getAnalysisRequests():
-            doActionFor(ar, "sample")
-            ar.reindexObject()
+        # partitions that are still 'to_be_sampled'. All associated
+        # AnalysisRequests are also transitioned
+        cascade.cascade_sample_transition(self, "sample")
 
     def workflow_script_to_be_preserved(self):
         if skip(self, "to_be_preserved"):
             return
-        workflow = getToolByName(self, 'portal_workflow')
-        parts = self.objectValues('SamplePartition')
-        # Transition our children
-        tbs = [sp for sp in parts
-               if workflow.getInfoFor(sp, 'review_state') == 'to_be_preserved']
-        for sp in tbs:
-            doActionFor(sp, "to_be_preserved")
-        # All associated AnalysisRequests are also transitioned
-        for ar in self.getAnalysisRequests():
-            doActionFor(ar, "to_be_preserved")
-            ar.reindexObject()
+        # Transition our children. All associated AnalysisRequests are also
+        # transitioned
+        cascade.cascade_sample_transition(self, "to_be_preserved")
 
     def workflow_script_sample_due(self):
         if skip(self, "sample_due"):
             return
         # All associated AnalysisRequests are also transitioned
-        for ar in self.getAnalysisRequests():
-            doActionFor(ar, "sample_due")
-            ar.reindexObject()
+        cascade.cascade_sample_transition(self, "sample_due")
 
     def workflow_script_reinstate(self):
         if skip(self, "reinstate"):
@@ -9,7 +9,9 @@ from Products.CMFCore.WorkflowCore import WorkflowException
 from plone import api
 from AccessControl import ClassSecurityInfo
 from bika.lims import bikaMessageFactory as _, logger
+from bika.lims import statehistogram
 from bika.lims.config import *
+from bika.lims.content.analysis import clear_worksheet_cache
 from bika.lims.idserver import renameAfterCreation
 from bika.lims.utils import t, tmpID, changeWorkflowState
 from bika.lims.utils import to_utf8 as _c
@@ -29,6 +31,7 @@ from Products.Archetypes.public import *
 from Products.Archetypes.references import HoldingReference
 from Products.ATContentTypes.lib.historyaware import HistoryAwareMixin
 from Products.ATExtensions.ateapi import RecordsField
+from Products.CMFCore.permissions import ModifyPortalContent
 from Products.CMFCore.utils import getToolByName
 from Products.CMFPlone.utils import safe_unicode, _createObjectByType
 from zope.interface import implements
@@ -133,6 +136,16 @@ class Worksheet(BaseFolder, HistoryAwareMixin):
         # contentsMethod methods.  We ignore it.
         return list(self.getAnalyses())
 
+    security.declareProtected(ModifyPortalContent, 'setAnalyses')
+
+    def setAnalyses(self, analyses):
+        """Set the analyses of the worksheet, update the state histogram and
+        discard the worksheets of the analyses resolved in this request
+        """
+        self.getField('Analyses').set(self, analyses)
+        statehistogram.set_members(self, self.getRawAnalyses())
+        clear_worksheet_cache()
+
     security.declareProtected(EditWorksheet, 'addAnalysis')
 
     def addAnalysis(self, analysis, position=None):
@@ -225,6 +238,9 @@ class Worksheet(BaseFolder, HistoryAwareMixin):
         if analysis in Analyses:
             Analyses.remove(analysis)
             self.setAnalyses(Analyses)
+            # refresh the worksheet metadata of the analysis, now that the
+            # reference is gone
+            analysis.reindexObject(idxs=['worksheetanalysis_review_state'])
         layout = [slot for slot in self.getLayout() if slot['analysis_uid'] != analysis.UID()]
         self.setLayout(layout)
 
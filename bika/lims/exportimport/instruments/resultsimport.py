@@ -8,6 +8,8 @@
 from Products.CMFCore.utils import getToolByName
 from Products.CMFPlone.utils import _createObjectByType, safe_unicode
 from bika.lims import bikaMessageFactory as _
+from bika.lims import identifierregistry
+from bika.lims.interfaces import IIdentifierRegistry
 from bika.lims.utils import t
 from bika.lims.exportimport.instruments.logger import Logger
 from bika.lims.idserver import renameAfterCreation
@@ -15,8 +17,25 @@ from bika.lims.utils import tmpID
 from Products.Archetypes.config import REFERENCE_CATALOG
 from datetime import datetime
 from DateTime import DateTime
+from zope.component import getUtility
 import os
 
+# search criteria -> kinds of identifiers of the Analysis Requests
+AR_IDENTIFIER_KINDS = {
+    'arid': [identifierregistry.ID],
+    'sid': [identifierregistry.SAMPLE_ID],
+    'csid': [identifierregistry.CLIENT_SAMPLE_ID],
+}
+
+# search criteria -> bika_catalog index of the Analysis Requests, used when
+# the identifier is not in the registry
+AR_IDENTIFIER_INDEXES = {
+    'arid': 'getRequestID',
+    'sid': 'getSampleID',
+    'csid': 'getClientSampleID',
+}
+
+
 class InstrumentResultsFileParser(Logger):
 
     def __init__(self, infile, mimetype):
@@ -575,18 +594,25 @@ class AnalysisResultsImporter(Logger):
     def _getObjects(self, objid, criteria, states):
         #self.log("Criteria: %s %s") % (criteria, obji))
         obj = []
-        if (criteria == 'arid'):
-            obj = self.bc(portal_type='AnalysisRequest',
-                           getRequestID=objid,
-                           review_state=states)
-        elif (criteria == 'sid'):
-            obj = self.bc(portal_type='AnalysisRequest',
-                           getSampleID=objid,
-                           review_state=states)
-        elif (criteria == 'csid'):
-            obj = self.bc(portal_type='AnalysisRequest',
-                           getClientSampleID=objid,
-                           review_state=states)
+        if criteria in AR_IDENTIFIER_KINDS:
+            # Resolve the AR, Sample or Client Sample ID in the identifier
+            # registry, then filter the ARs by state
+            registry = getUtility(IIdentifierRegistry)
+            kinds = AR_IDENTIFIER_KINDS[criteria]
+            uids = registry.resolve_all(objid, kinds)
+            if uids:
+                obj = self.bc(portal_type='AnalysisRequest',
+                               UID=uids,
+                               review_state=states)
+            if not obj:
+                # Not registered (yet), search the catalog and register the
+                # ARs found, so the next lookup hits the registry
+                query = {AR_IDENTIFIER_INDEXES[criteria]: objid}
+                obj = self.bc(portal_type='AnalysisRequest',
+                               review_state=states,
+                               **query)
+                for brain in obj:
+                    registry.update(brain.getObject())
         elif (criteria == 'aruid'):
             obj = self.bc(portal_type='AnalysisRequest',
                            UID=objid,
@@ -6,16 +6,23 @@
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
 from Products.CMFCore.utils import getToolByName
+from Products.CMFPlone.utils import safe_unicode
 from bika.lims.browser import BrowserView
 from bika.lims import PMF
+from bika.lims import api
 from bika.lims import logger
+from bika.lims.interfaces import IServiceDependencyGraph
+from bika.lims.interfaces import ISpecificationIndex
 from bika.lims.interfaces import ISetupDataImporter
+from bika.lims.utils.indexing import deferred_indexing
 from openpyxl import load_workbook
 from pkg_resources import resource_filename
 from zope.component import getAdapters
+from zope.component import getUtility
 import traceback
 
 import tempfile
+import time
 import transaction
 
 try:
@@ -25,6 +32,84 @@ except:
     from zope.app.component.hooks import getSite
 
 
+# catalogs which are rebuilt after the setup data is loaded
+REBUILT_CATALOGS = ('bika_setup_catalog', 'bika_catalog',
+                    'bika_analysis_catalog')
+
+
+def open_workbook(filename):
+    """Open the workbook in read-only mode: the rows of the sheets are
+    streamed instead of being loaded in memory
+    """
+    try:
+        return load_workbook(filename=filename, read_only=True)
+    except TypeError:
+        # openpyxl < 2.0
+        return load_workbook(filename=filename, use_iterators=True)
+
+
+class SetupDataRegistry(object):
+    """In-memory registry of the setup objects by portal type and title.
+
+    The importers register the objects when they create them, and the objects
+    they find in the catalog, so that the cross-references between the sheets
+    are resolved without a catalog query (and a getObject) each. Catalog
+    queries also index the deferred objects of the queried catalog, which are
+    indexed again when the catalogs are rebuilt.
+
+    The objects are created before their title is set, so they are only
+    keyed by title when they are looked up.
+    """
+
+    def __init__(self):
+        # (portal_type, title) -> list of objects
+        self.objects = {}
+        # keyword -> analysis service
+        self.keywords = {}
+        self.uids = set()
+        # registered objects which are not keyed by title yet
+        self.unkeyed = []
+        # lookups resolved by the registry and by a catalog query
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, portal_type, title):
+        return portal_type, safe_unicode(title)
+
+    def add(self, obj):
+        uid = api.get_uid(obj)
+        if uid in self.uids:
+            return
+        self.uids.add(uid)
+        self.unkeyed.append(obj)
+
+    def update_keys(self):
+        """Key the registered objects by title, once the title is set
+        """
+        unkeyed = []
+        for obj in self.unkeyed:
+            title = obj.Title()
+            if not title:
+                unkeyed.append(obj)
+                continue
+            portal_type = api.get_portal_type(obj)
+            key = self.get_key(portal_type, title)
+            self.objects.setdefault(key, []).append(obj)
+            if portal_type == 'AnalysisService':
+                self.keywords[obj.getKeyword()] = obj
+        self.unkeyed = unkeyed
+
+    def get(self, portal_type, title):
+        """Returns the list of registered objects with the title
+        """
+        self.update_keys()
+        return self.objects.get(self.get_key(portal_type, title), [])
+
+    def get_service(self, keyword):
+        self.update_keys()
+        return self.keywords.get(keyword)
+
+
 class LoadSetupData(BrowserView):
 
     def __init__(self, context, request):
@@ -35,6 +120,10 @@ class LoadSetupData(BrowserView):
         # dependencies to resolve
         self.deferred = []
 
+        self.registry = SetupDataRegistry()
+        # sheet name -> import time in seconds
+        self.timings = []
+
         self.request.set('disable_border', 1)
 
     def solve_deferred(self, deferred=None):
@@ -66,6 +155,16 @@ class LoadSetupData(BrowserView):
         self.deferred = unsolved
         return len(unsolved)
 
+    def import_sheet(self, name, adapter, workbook):
+        """Run the importer of a sheet
+        """
+        transaction.savepoint()
+        start = time.time()
+        adapter(self, workbook, self.dataset_project, self.dataset_name)
+        seconds = time.time() - start
+        self.timings.append((name, seconds))
+        logger.info("Loaded %s in %.2fs" % (name, seconds))
+
     def __call__(self):
         form = self.request.form
         portal = getSite()
@@ -79,7 +178,7 @@ class LoadSetupData(BrowserView):
                     (self.dataset_name, self.dataset_name)
                 filename = resource_filename(self.dataset_project, path)
                 try:
-                    workbook = load_workbook(filename=filename)  # , use_iterators=True)
+                    workbook = open_workbook(filename)
                 except AttributeError:
                     print ""
                     print traceback.format_exc()
@@ -90,7 +189,7 @@ class LoadSetupData(BrowserView):
                 tmp = "{}.xlsx".format(tempfile.mktemp())
                 file_content = form['import_file'].read()
                 open(tmp, 'wb').write(file_content)
-                workbook = load_workbook(filename=tmp)  # , use_iterators=True)
+                workbook = open_workbook(tmp)
                 self.dataset_name = 'uploaded'
 
         assert(workbook is not None)
@@ -98,36 +197,51 @@ class LoadSetupData(BrowserView):
         adapters = [[name, adapter]
                     for name, adapter
                     in list(getAdapters((self.context, ), ISetupDataImporter))]
-        for sheetname in workbook.get_sheet_names():
-            transaction.savepoint()
-            ad_name = sheetname.replace(" ", "_")
-            if ad_name in [a[0] for a in adapters]:
-                adapter = [a[1] for a in adapters if a[0] == ad_name][0]
-                adapter(self, workbook, self.dataset_project, self.dataset_name)
-                adapters = [a for a in adapters if a[0] != ad_name]
-        for name, adapter in adapters:
-            transaction.savepoint()
-            adapter(self, workbook, self.dataset_project, self.dataset_name)
-
-        check = len(self.deferred)
-        while len(self.deferred) > 0:
-            new = self.solve_deferred()
-            logger.info("solved %s of %s deferred references" % (
-                check - new, check))
-            if new == check:
-                raise Exception("%s unsolved deferred references: %s" % (
-                    len(self.deferred), self.deferred))
-            check = new
-
-        logger.info("Rebuilding bika_setup_catalog")
-        bsc = getToolByName(self.context, 'bika_setup_catalog')
-        bsc.clearFindAndRebuild()
-        logger.info("Rebuilding bika_catalog")
-        bc = getToolByName(self.context, 'bika_catalog')
-        bc.clearFindAndRebuild()
-        logger.info("Rebuilding bika_analysis_catalog")
-        bac = getToolByName(self.context, 'bika_analysis_catalog')
-        bac.clearFindAndRebuild()
+        # The objects are indexed once, when the catalogs are rebuilt below.
+        # Catalog queries of the importers still index the pending objects
+        # of the queried catalog first.
+        with deferred_indexing() as queue:
+            for sheetname in workbook.get_sheet_names():
+                ad_name = sheetname.replace(" ", "_")
+                if ad_name in [a[0] for a in adapters]:
+                    adapter = [a[1] for a in adapters if a[0] == ad_name][0]
+                    self.import_sheet(ad_name, adapter, workbook)
+                    adapters = [a for a in adapters if a[0] != ad_name]
+            for name, adapter in adapters:
+                self.import_sheet(name, adapter, workbook)
+
+            check = len(self.deferred)
+            while len(self.deferred) > 0:
+                new = self.solve_deferred()
+                logger.info("solved %s of %s deferred references" % (
+                    check - new, check))
+                if new == check:
+                    raise Exception("%s unsolved deferred references: %s" % (
+                        len(self.deferred), self.deferred))
+                check = new
+
+            # Only index the objects of the catalogs which are not rebuilt
+            for obj, idxs, catalogs in list(queue.pending.values()):
+                if not set(catalogs).difference(REBUILT_CATALOGS):
+                    queue.remove(obj)
+
+        if hasattr(workbook, 'close'):
+            workbook.close()
+
+        for catalog_id in REBUILT_CATALOGS:
+            logger.info("Rebuilding %s" % catalog_id)
+            start = time.time()
+            getToolByName(self.context, catalog_id).clearFindAndRebuild()
+            self.timings.append((catalog_id, time.time() - start))
+        logger.info("Rebuilding service dependency graph")
+        getUtility(IServiceDependencyGraph).rebuild()
+        logger.info("Rebuilding specification index")
+        getUtility(ISpecificationIndex).rebuild()
+
+        for name, seconds in self.timings:
+            logger.info("Setup data timing: %s %.2fs" % (name, seconds))
+        logger.info("Setup data lookups: %s from the registry, %s queried" % (
+            self.registry.hits, self.registry.misses))
 
         message = PMF("Changes saved.")
         self.context.plone_utils.addPortalMessage(message)
@@ -117,7 +117,8 @@ class WorksheetImporter:
         headers = []
         row_nr = 0
         worksheet = worksheet if worksheet else self.worksheet
-        for row in worksheet.rows:  # .iter_rows():
+        # read-only worksheets stream the rows
+        for row in worksheet.iter_rows():
             row_nr += 1
             if row_nr == 1:
                 # headers = [cell.internal_value for cell in row]
@@ -140,6 +141,8 @@ class WorksheetImporter:
                 if isinstance(value, str):
                     value = value.strip(' \t\n\r')
                 new_row.append(value)
+            # read-only worksheets don't pad the rows with empty cells
+            new_row.extend([''] * (len(headers) - len(new_row)))
             row = dict(zip(headers, new_row))
 
             # parse out addresses
@@ -211,6 +214,14 @@ class WorksheetImporter:
     def defer(self, **kwargs):
         self.lsd.deferred.append(kwargs)
 
+    def create_object(self, portal_type, container, id=None):
+        """Create the object and register it, so that the next sheets can
+        find it by title without querying the catalog
+        """
+        obj = _createObjectByType(portal_type, container, id or tmpID())
+        self.lsd.registry.add(obj)
+        return obj
+
     def Import(self):
         """ Override this.
         XXX Simple generic sheet importer
@@ -265,16 +276,34 @@ class WorksheetImporter:
             value = row.get(fieldname, '')
             field.set(obj, value)
 
-    def get_object(self, catalog, portal_type, title=None, **kwargs):
+    def get_object(self, catalog, portal_type, title=None,
+                   title_index='title', **kwargs):
         """This will return an object from the catalog.
         Logs a message and returns None if no object or multiple objects found.
-        All keyword arguments are passed verbatim to the contentFilter
+        The title is searched in the title_index of the catalog, and all other
+        keyword arguments are passed verbatim to the contentFilter
         """
         if not title and not kwargs:
             return None
+        # Objects created by the previous sheets, or already found
+        registry = self.lsd.registry
+        if title and not kwargs:
+            objects = registry.get(portal_type, title)
+            if len(objects) > 1:
+                logger.info("More than one object found for %s '%s'" % (
+                    portal_type, title))
+                return None
+            elif objects:
+                registry.hits += 1
+                return objects[0]
+            elif portal_type == 'AnalysisService' and \
+                    registry.get_service(title):
+                registry.hits += 1
+                return registry.get_service(title)
+        registry.misses += 1
         contentFilter = {"portal_type": portal_type}
         if title:
-            contentFilter['title'] = to_unicode(title)
+            contentFilter[title_index] = to_unicode(title)
         contentFilter.update(kwargs)
         brains = catalog(contentFilter)
         if len(brains) > 1:
@@ -284,11 +313,16 @@ class WorksheetImporter:
             if portal_type == 'AnalysisService':
                 brains = catalog(portal_type=portal_type, getKeyword=title)
                 if brains:
-                    return brains[0].getObject()
+                    obj = brains[0].getObject()
+                    registry.add(obj)
+                    return obj
             logger.info("No objects found for %s" % contentFilter)
             return None
         else:
-            return brains[0].getObject()
+            obj = brains[0].getObject()
+            if title and not kwargs:
+                registry.add(obj)
+            return obj
 
 
 class Sub_Groups(WorksheetImporter):
@@ -297,7 +331,7 @@ class Sub_Groups(WorksheetImporter):
         folder = self.context.bika_setup.bika_subgroups
         for row in self.get_rows(3):
             if 'title' in row and row['title']:
-                obj = _createObjectByType("SubGroup", folder, tmpID())
+                obj = self.create_object("SubGroup", folder)
                 obj.edit(title=row['title'],
                          description=row['description'],
                          SortKey=row['SortKey'])
@@ -376,7 +410,7 @@ class Lab_Contacts(WorksheetImporter):
                     warning = "Lab Contact: Cannot load the signature file '{0}' for user '{1}'. The contact will be created, but without a signature image".format(row['Signature'], username)
                     logger.warning(warning)
 
-            obj = _createObjectByType("LabContact", folder, tmpID())
+            obj = self.create_object("LabContact", folder)
             obj.edit(
                 title=fullname,
                 Salutation=row.get('Salutation', ''),
@@ -474,7 +508,7 @@ class Lab_Departments(WorksheetImporter):
         lab_contacts = [o.getObject() for o in bsc(portal_type="LabContact")]
         for row in self.get_rows(3):
             if row['title']:
-                obj = _createObjectByType("Department", folder, tmpID())
+                obj = self.create_object("Department", folder)
                 obj.edit(title=row['title'],
                          description=row.get('description', ''))
                 manager = None
@@ -500,7 +534,7 @@ class Lab_Products(WorksheetImporter):
         # Iterate through the rows
         for row in self.get_rows(3):
             # Create the SRTemplate object
-            obj = _createObjectByType('LabProduct', folder, tmpID())
+            obj = self.create_object('LabProduct', folder)
             # Apply the row values
             obj.edit(
                 title=row.get('title', 'Unknown'),
@@ -518,7 +552,7 @@ class Clients(WorksheetImporter):
     def Import(self):
         folder = self.context.clients
         for row in self.get_rows(3):
-            obj = _createObjectByType("Client", folder, tmpID())
+            obj = self.create_object("Client", folder)
             if not row['Name']:
                 message = "Client %s has no Name"
                 raise Exception(message)
@@ -545,15 +579,14 @@ class Client_Contacts(WorksheetImporter):
         portal_groups = getToolByName(self.context, 'portal_groups')
         pc = getToolByName(self.context, 'portal_catalog')
         for row in self.get_rows(3):
-            client = pc(portal_type="Client",
-                        getName=row['Client_title'])
-            if len(client) == 0:
+            client = self.get_object(pc, "Client", row['Client_title'],
+                                     title_index='getName')
+            if not client:
                 client_contact = "%(Firstname)s %(Surname)s" % row
                 error = "Client invalid: '%s'. The Client Contact %s will not be uploaded."
                 logger.error(error, row['Client_title'], client_contact)
                 continue
-            client = client[0].getObject()
-            contact = _createObjectByType("Contact", client, tmpID())
+            contact = self.create_object("Contact", client)
             fullname = "%(Firstname)s %(Surname)s" % row
             pub_pref = [x.strip() for x in
                         row.get('PublicationPreference', '').split(",")]
@@ -610,7 +643,7 @@ class Container_Types(WorksheetImporter):
         for row in self.get_rows(3):
             if not row['title']:
                 continue
-            obj = _createObjectByType("ContainerType", folder, tmpID())
+            obj = self.create_object("ContainerType", folder)
             obj.edit(title=row['title'],
                      description=row.get('description', ''))
             obj.unmarkCreationFlag()
@@ -624,7 +657,7 @@ class Preservations(WorksheetImporter):
         for row in self.get_rows(3):
             if not row['title']:
                 continue
-            obj = _createObjectByType("Preservation", folder, tmpID())
+            obj = self.create_object("Preservation", folder)
             RP = {
                 'days': int(row['RetentionPeriod_days'] and row['RetentionPeriod_days'] or 0),
                 'hours': int(row['RetentionPeriod_hours'] and row['RetentionPeriod_hours'] or 0),
@@ -646,7 +679,7 @@ class Containers(WorksheetImporter):
         for row in self.get_rows(3):
             if not row['title']:
                 continue
-            obj = _createObjectByType("Container", folder, tmpID())
+            obj = self.create_object("Container", folder)
             obj.edit(
                 title=row['title'],
                 description=row.get('description', ''),
@@ -670,7 +703,7 @@ class Suppliers(WorksheetImporter):
     def Import(self):
         folder = self.context.bika_setup.bika_suppliers
         for row in self.get_rows(3):
-            obj = _createObjectByType("Supplier", folder, tmpID())
+            obj = self.create_object("Supplier", folder)
             if row['Name']:
                 obj.edit(
                     Name=row.get('Name', ''),
@@ -700,12 +733,11 @@ class Supplier_Contacts(WorksheetImporter):
                 continue
             if not row['Firstname']:
                 continue
-            folder = bsc(portal_type="Supplier",
-                         Title=row['Supplier_Name'])
+            folder = self.get_object(bsc, "Supplier", row['Supplier_Name'],
+                                     title_index='Title')
             if not folder:
                 continue
-            folder = folder[0].getObject()
-            obj = _createObjectByType("SupplierContact", folder, tmpID())
+            obj = self.create_object("SupplierContact", folder)
             obj.edit(
                 Firstname=row['Firstname'],
                 Surname=row.get('Surname', ''),
@@ -722,7 +754,7 @@ class Manufacturers(WorksheetImporter):
     def Import(self):
         folder = self.context.bika_setup.bika_manufacturers
         for row in self.get_rows(3):
-            obj = _createObjectByType("Manufacturer", folder, tmpID())
+            obj = self.create_object("Manufacturer", folder)
             if row['title']:
                 obj.edit(
                     title=row['title'],
@@ -738,7 +770,7 @@ class Instrument_Types(WorksheetImporter):
     def Import(self):
         folder = self.context.bika_setup.bika_instrumenttypes
         for row in self.get_rows(3):
-                obj = _createObjectByType("InstrumentType", folder, tmpID())
+                obj = self.create_object("InstrumentType", folder)
                 obj.edit(
                     title=row['title'],
                     description=row.get('description', ''))
@@ -757,7 +789,7 @@ class Instruments(WorksheetImporter):
                 logger.info("Unable to import '%s'. Missing supplier, manufacturer or type" % row.get('title', ''))
                 continue
 
-            obj = _createObjectByType("Instrument", folder, tmpID())
+            obj = self.create_object("Instrument", folder)
 
             obj.edit(
                 title=row.get('title', ''),
@@ -831,7 +863,7 @@ class Instrument_Validations(WorksheetImporter):
 
             folder = self.get_object(bsc, 'Instrument', row.get('instrument'))
             if folder:
-                obj = _createObjectByType("InstrumentValidation", folder, tmpID())
+                obj = self.create_object("InstrumentValidation", folder)
                 obj.edit(
                     title=row['title'],
                     DownFrom=row.get('downfrom', ''),
@@ -863,7 +895,7 @@ class Instrument_Calibrations(WorksheetImporter):
 
             folder = self.get_object(bsc, 'Instrument', row.get('instrument'))
             if folder:
-                obj = _createObjectByType("InstrumentCalibration", folder, tmpID())
+                obj = self.create_object("InstrumentCalibration", folder)
                 obj.edit(
                     title=row['title'],
                     DownFrom=row.get('downfrom', ''),
@@ -895,7 +927,7 @@ class Instrument_Certifications(WorksheetImporter):
 
             folder = self.get_object(bsc, 'Instrument', row.get('instrument', ''))
             if folder:
-                obj = _createObjectByType("InstrumentCertification", folder, tmpID())
+                obj = self.create_object("InstrumentCertification", folder)
                 today = datetime.date.today()
                 certificate_expire_date = today.strftime('%d/%m') + '/' + str(today.year + 1) \
                     if row.get('validto', '') == '' else row.get('validto')
@@ -979,7 +1011,7 @@ def addDocument(self, row_dict, folder):
                     self.context.plone_utils.addPortalMessage(warning)
                     idAlreadyInUse = True
             if not idAlreadyInUse:
-                obj = _createObjectByType("Multifile", folder, tmpID())
+                obj = self.create_object("Multifile", folder)
                 obj.edit(
                     DocumentID=row_dict.get('DocumentID', ''),
                     DocumentVersion=row_dict.get('DocumentVersion', ''),
@@ -1001,7 +1033,7 @@ class Instrument_Maintenance_Tasks(WorksheetImporter):
 
             folder = self.get_object(bsc, 'Instrument', row.get('instrument'))
             if folder:
-                obj = _createObjectByType("InstrumentMaintenanceTask", folder, tmpID())
+                obj = self.create_object("InstrumentMaintenanceTask", folder)
                 try:
                     cost = "%.2f" % (row.get('cost', 0))
                 except:
@@ -1033,7 +1065,7 @@ class Instrument_Schedule(WorksheetImporter):
                 continue
             folder = self.get_object(bsc, 'Instrument', row.get('instrument'))
             if folder:
-                obj = _createObjectByType("InstrumentScheduledTask", folder, tmpID())
+                obj = self.create_object("InstrumentScheduledTask", folder)
                 criteria = [
                     {'fromenabled': row.get('date', None) is not None,
                      'fromdate': row.get('date', ''),
@@ -1064,7 +1096,7 @@ class Sample_Matrices(WorksheetImporter):
         for row in self.get_rows(3):
             if not row['title']:
                 continue
-            obj = _createObjectByType("SampleMatrix", folder, tmpID())
+            obj = self.create_object("SampleMatrix", folder)
             obj.edit(
                 title=row['title'],
                 description=row.get('description', '')
@@ -1079,7 +1111,7 @@ class Batch_Labels(WorksheetImporter):
         folder = self.context.bika_setup.bika_batchlabels
         for row in self.get_rows(3):
             if row['title']:
-                obj = _createObjectByType("BatchLabel", folder, tmpID())
+                obj = self.create_object("BatchLabel", folder)
                 obj.edit(title=row['title'])
                 obj.unmarkCreationFlag()
                 renameAfterCreation(obj)
@@ -1093,7 +1125,7 @@ class Sample_Types(WorksheetImporter):
         for row in self.get_rows(3):
             if not row['title']:
                 continue
-            obj = _createObjectByType("SampleType", folder, tmpID())
+            obj = self.create_object("SampleType", folder)
             samplematrix = self.get_object(bsc, 'SampleMatrix',
                                            row.get('SampleMatrix_title'))
             containertype = self.get_object(bsc, 'ContainerType',
@@ -1131,12 +1163,12 @@ class Sample_Points(WorksheetImporter):
                 continue
             if row['Client_title']:
                 client_title = row['Client_title']
-                client = pc(portal_type="Client", getName=client_title)
-                if len(client) == 0:
+                folder = self.get_object(pc, "Client", client_title,
+                                         title_index='getName')
+                if not folder:
                     error = "Sample Point %s: Client invalid: '%s'. The Sample point will not be uploaded."
                     logger.error(error, row['title'], client_title)
                     continue
-                folder = client[0].getObject()
             else:
                 folder = setup_folder
 
@@ -1145,7 +1177,7 @@ class Sample_Points(WorksheetImporter):
             if row['Longitude']:
                 logger.log("Ignored SamplePoint Longitude", 'error')
 
-            obj = _createObjectByType("SamplePoint", folder, tmpID())
+            obj = self.create_object("SamplePoint", folder)
             obj.edit(
                 title=row['title'],
                 description=row.get('description', ''),
@@ -1191,7 +1223,7 @@ class Storage_Locations(WorksheetImporter):
             if not row['Address']:
                 continue
 
-            obj = _createObjectByType("StorageLocation", setup_folder, tmpID())
+            obj = self.create_object("StorageLocation", setup_folder)
             obj.edit(
                 title=row['Address'],
                 SiteTitle=row['SiteTitle'],
@@ -1215,7 +1247,7 @@ class Sample_Conditions(WorksheetImporter):
         folder = self.context.bika_setup.bika_sampleconditions
         for row in self.get_rows(3):
             if row['Title']:
-                obj = _createObjectByType("SampleCondition", folder, tmpID())
+                obj = self.create_object("SampleCondition", folder)
                 obj.edit(
                     title=row['Title'],
                     description=row.get('Description', '')
@@ -1235,7 +1267,7 @@ class Analysis_Categories(WorksheetImporter):
                 department = self.get_object(bsc, 'Department',
                                              row.get('Department_title'))
             if row.get('title', None) and department:
-                obj = _createObjectByType("AnalysisCategory", folder, tmpID())
+                obj = self.create_object("AnalysisCategory", folder)
                 obj.edit(
                     title=row['title'],
                     description=row.get('description', ''))
@@ -1258,7 +1290,7 @@ class Methods(WorksheetImporter):
         for row in self.get_rows(3):
             if row['title']:
                 calculation = self.get_object(bsc, 'Calculation', row.get('Calculation_title'))
-                obj = _createObjectByType("Method", folder, tmpID())
+                obj = self.create_object("Method", folder)
                 obj.edit(
                     title=row['title'],
                     description=row.get('description', ''),
@@ -1298,7 +1330,7 @@ class Sampling_Deviations(WorksheetImporter):
         folder = self.context.bika_setup.bika_samplingdeviations
         for row in self.get_rows(3):
             if row['title']:
-                obj = _createObjectByType("SamplingDeviation", folder, tmpID())
+                obj = self.create_object("SamplingDeviation", folder)
                 obj.edit(
                     title=row['title'],
                     description=row.get('description', '')
@@ -1344,7 +1376,7 @@ class Calculations(WorksheetImporter):
             interim_keys = [k['keyword'] for k in calc_interims]
             dep_keywords = [k for k in keywords if k not in interim_keys]
 
-            obj = _createObjectByType("Calculation", folder, tmpID())
+            obj = self.create_object("Calculation", folder)
             obj.edit(
                 title=calc_title,
                 description=row.get('description', ''),
@@ -1512,7 +1544,7 @@ class Analysis_Services(WorksheetImporter):
             if not row['title']:
                 continue
 
-            obj = _createObjectByType("AnalysisService", folder, tmpID())
+            obj = self.create_object("AnalysisService", folder)
             MTA = {
                 'days': self.to_int(row.get('MaxTimeAllowed_days', 0), 0),
                 'hours': self.to_int(row.get('MaxTimeAllowed_hours', 0), 0),
@@ -1634,17 +1666,9 @@ class Analysis_Specifications(WorksheetImporter):
 
     def resolve_service(self, row):
         bsc = getToolByName(self.context, "bika_setup_catalog")
-        service = bsc(
-            portal_type="AnalysisService",
-            title=safe_unicode(row["service"])
-        )
-        if not service:
-            service = bsc(
-                portal_type="AnalysisService",
-                getKeyword=safe_unicode(row["service"])
-            )
-        service = service[0].getObject()
-        return service
+        # get_object falls back to the keyword of the service
+        return self.get_object(bsc, "AnalysisService",
+                               safe_unicode(row["service"]))
 
     def Import(self):
         bucket = {}
@@ -1677,13 +1701,15 @@ class Analysis_Specifications(WorksheetImporter):
                 if parent == "lab":
                     folder = self.context.bika_setup.bika_analysisspecs
                 else:
-                    proxy = pc(portal_type="Client", getName=safe_unicode(parent))[0]
-                    folder = proxy.getObject()
+                    folder = self.get_object(pc, "Client",
+                                             safe_unicode(parent),
+                                             title_index='getName')
                 st = bucket[parent][title]["sampletype"]
                 resultsrange = bucket[parent][title]["resultsrange"]
                 if st:
-                    st_uid = bsc(portal_type="SampleType", title=safe_unicode(st))[0].UID
-                obj = _createObjectByType("AnalysisSpec", folder, tmpID())
+                    st_uid = self.get_object(
+                        bsc, "SampleType", safe_unicode(st)).UID()
+                obj = self.create_object("AnalysisSpec", folder)
                 obj.edit(title=title)
                 obj.setResultsRange(resultsrange)
                 if st:
@@ -1719,7 +1745,7 @@ class Analysis_Profiles(WorksheetImporter):
         folder = self.context.bika_setup.bika_analysisprofiles
         for row in self.get_rows(3):
             if row['title']:
-                obj = _createObjectByType("AnalysisProfile", folder, tmpID())
+                obj = self.create_object("AnalysisProfile", folder)
                 obj.edit(title=row['title'],
                          description=row.get('description', ''),
                          ProfileKey=row['ProfileKey'],
@@ -1796,15 +1822,15 @@ class AR_Templates(WorksheetImporter):
             if client_title == 'lab':
                 folder = self.context.bika_setup.bika_artemplates
             else:
-                folder = pc(portal_type='Client',
-                            getName=client_title)[0].getObject()
+                folder = self.get_object(pc, 'Client', client_title,
+                                         title_index='getName')
 
             sampletype = self.get_object(bsc, 'SampleType',
                                          row.get('SampleType_title'))
             samplepoint = self.get_object(bsc, 'SamplePoint',
                                           row.get('SamplePoint_title'))
 
-            obj = _createObjectByType("ARTemplate", folder, tmpID())
+            obj = self.create_object("ARTemplate", folder)
             obj.edit(
                 title=str(row['title']),
                 description=row.get('description', ''),
@@ -1850,7 +1876,7 @@ class Reference_Definitions(WorksheetImporter):
         for row in self.get_rows(3):
             if not row['title']:
                 continue
-            obj = _createObjectByType("ReferenceDefinition", folder, tmpID())
+            obj = self.create_object("ReferenceDefinition", folder)
             obj.edit(
                 title=row['title'],
                 description=row.get('description', ''),
@@ -1903,7 +1929,7 @@ class Worksheet_Templates(WorksheetImporter):
         folder = self.context.bika_setup.bika_worksheettemplates
         for row in self.get_rows(3):
             if row['title']:
-                obj = _createObjectByType("WorksheetTemplate", folder, tmpID())
+                obj = self.create_object("WorksheetTemplate", folder)
                 obj.edit(
                     title=row['title'],
                     description=row.get('description', ''),
@@ -1992,7 +2018,7 @@ class Attachment_Types(WorksheetImporter):
     def Import(self):
         folder = self.context.bika_setup.bika_attachmenttypes
         for row in self.get_rows(3):
-            obj = _createObjectByType("AttachmentType", folder, tmpID())
+            obj = self.create_object("AttachmentType", folder)
             obj.edit(
                 title=row['title'],
                 description=row.get('description', ''))
@@ -2042,7 +2068,7 @@ class Reference_Samples(WorksheetImporter):
             service = self.get_object(bsc, 'AnalysisService',
                                       row.get('AnalysisService_title'))
             # Analyses are keyed/named by service keyword
-            obj = _createObjectByType("ReferenceAnalysis", sample, row['id'])
+            obj = self.create_object("ReferenceAnalysis", sample, row['id'])
             obj.edit(title=row['id'],
                      ReferenceType=row['ReferenceType'],
                      Result=row['Result'],
@@ -2084,9 +2110,10 @@ class Reference_Samples(WorksheetImporter):
         for row in self.get_rows(3):
             if not row['id']:
                 continue
-            supplier = bsc(portal_type='Supplier',
-                           getName=row.get('Supplier_title', ''))[0].getObject()
-            obj = _createObjectByType("ReferenceSample", supplier, row['id'])
+            supplier = self.get_object(bsc, 'Supplier',
+                                       row.get('Supplier_title', ''),
+                                       title_index='getName')
+            obj = self.create_object("ReferenceSample", supplier, row['id'])
             ref_def = self.get_object(bsc, 'ReferenceDefinition',
                                       row.get('ReferenceDefinition_title'))
             ref_man = self.get_object(bsc, 'Manufacturer',
@@ -2121,9 +2148,9 @@ class Samples(WorksheetImporter):
         for row in self.get_rows(3):
             if not row['id']:
                 continue
-            client = pc(portal_type="Client",
-                        getName=row['Client_title'])[0].getObject()
-            obj = _createObjectByType("Sample", client, row['id'])
+            client = self.get_object(pc, "Client", row['Client_title'],
+                                     title_index='getName')
+            obj = self.create_object("Sample", client, row['id'])
             obj.setSampleID(row['id'])
             obj.setClientSampleID(row['ClientSampleID'])
             obj.setSamplingWorkflowEnabled(False)
@@ -2144,7 +2171,7 @@ class Samples(WorksheetImporter):
                 obj.setSamplePoint(sp)
             obj.unmarkCreationFlag()
             # XXX hard-wired, Creating a single partition without proper init, no decent review_state ideas
-            part = _createObjectByType("SamplePartition", obj, "part-1")
+            part = self.create_object("SamplePartition", obj, "part-1")
             container = bsc(portal_type='Container', title='None Specified')[0].UID
             part.setContainer(container)
             part.unmarkCreationFlag()
@@ -2163,12 +2190,12 @@ class Analysis_Requests(WorksheetImporter):
         bsc = getToolByName(self.context, 'bika_setup_catalog')
         bc = getToolByName(self.context, 'bika_catalog')
         for row in self.get_rows(3, worksheet=self.analyses_worksheet):
-            service = bsc(portal_type='AnalysisService',
-                          title=row['AnalysisService_title'])[0].getObject()
+            service = self.get_object(bsc, 'AnalysisService',
+                                      row['AnalysisService_title'])
             # analyses are keyed/named by keyword
             keyword = service.getKeyword()
             ar = bc(portal_type='AnalysisRequest', id=row['AnalysisRequest_id'])[0].getObject()
-            obj = _createObjectByType("Analysis", ar, keyword)
+            obj = self.create_object("Analysis", ar, keyword)
             MTA = {
                 'days': int(row['MaxTimeAllowed_days'] and row['MaxTimeAllowed_days'] or 0),
                 'hours': int(row['MaxTimeAllowed_hours'] and row['MaxTimeAllowed_hours'] or 0),
@@ -2223,11 +2250,11 @@ class Analysis_Requests(WorksheetImporter):
         for row in self.get_rows(3):
             if not row['id']:
                 continue
-            client = pc(portal_type="Client",
-                        getName=row['Client_title'])[0].getObject()
-            obj = _createObjectByType("AnalysisRequest", client, row['id'])
-            contact = pc(portal_type="Contact",
-                         getFullname=row['Contact_Fullname'])[0].getObject()
+            client = self.get_object(pc, "Client", row['Client_title'],
+                                     title_index='getName')
+            obj = self.create_object("AnalysisRequest", client, row['id'])
+            contact = self.get_object(pc, "Contact", row['Contact_Fullname'],
+                                      title_index='getFullname')
             obj.edit(
                 RequestID=row['id'],
                 Contact=contact,
@@ -2240,8 +2267,9 @@ class Analysis_Requests(WorksheetImporter):
                 Remarks=row['Remarks']
             )
             if row['CCContact_Fullname']:
-                contact = pc(portal_type="Contact",
-                             getFullname=row['CCContact_Fullname'])[0].getObject()
+                contact = self.get_object(pc, "Contact",
+                                          row['CCContact_Fullname'],
+                                          title_index='getFullname')
                 obj.setCCContact(contact)
             if row['AnalysisProfile_title']:
                 profile = pc(portal_type="AnalysisProfile",
@@ -2262,7 +2290,7 @@ class Invoice_Batches(WorksheetImporter):
     def Import(self):
         folder = self.context.invoices
         for row in self.get_rows(3):
-            obj = _createObjectByType("InvoiceBatch", folder, tmpID())
+            obj = self.create_object("InvoiceBatch", folder)
             if not row['title']:
                 message = _("InvoiceBatch has no Title")
                 raise Exception(t(message))
@@ -2286,7 +2314,7 @@ class AR_Priorities(WorksheetImporter):
         folder = self.context.bika_setup.bika_arpriorities
         for row in self.get_rows(3):
             if row['title']:
-                obj = _createObjectByType("ARPriority", folder, tmpID())
+                obj = self.create_object("ARPriority", folder)
                 obj.edit(title=row['title'],
                          description=row.get('description', ''),
                          pricePremium=row.get('pricePremium', 0),
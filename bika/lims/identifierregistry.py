@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from BTrees.OOBTree import OOBTree
+from Products.CMFPlone.utils import safe_unicode
+from zope.interface import implements
+
+from bika.lims import api
+from bika.lims import logger
+from bika.lims.interfaces import IHaveIdentifiers
+from bika.lims.interfaces import IIdentifierRegistry
+from bika.lims.setupcache import get_setup_annotation
+
+"""Identifier Registry
+
+Persistent registry of the identifiers of the objects which are scanned or
+referenced by external systems (barcode entry, instrument results import),
+mapped to their UIDs:
+
+- the id of Analysis Requests, Samples, Batches, Reference Samples and
+  Worksheets (which is also their barcode), and their title if it differs
+- the Sample id of Analysis Requests
+- the Client Sample ID of Analysis Requests and Samples
+- the external identifiers of the objects with identifiers (see
+  `bika.lims.adapters.identifiers`)
+
+An identifier can be shared by several objects, e.g. the Client Sample ID of
+a Sample and its Analysis Requests. The entries of an identifier are sorted by
+kind, so an id always wins over a Client Sample ID. Ids and external
+identifiers must be unique per kind: duplicates are logged, and external
+identifiers are validated against the registry.
+
+The registry is updated when the objects are created, modified, renamed or
+removed (see `bika.lims.subscribers.identifierregistry`).
+"""
+
+IDENTIFIER_REGISTRY_STORAGE = "bika.lims.identifierregistry"
+
+# identifier -> ((kind, UID), ...)
+IDENTIFIERS = "identifiers"
+# UID -> ((kind, identifier), ...)
+OBJECTS = "objects"
+
+TREES = (IDENTIFIERS, OBJECTS)
+
+# kinds of identifiers, by priority
+ID = 0
+TITLE = 1
+SAMPLE_ID = 2
+CLIENT_SAMPLE_ID = 3
+IDENTIFIER = 4
+
+# kinds which must be unique
+UNIQUE_KINDS = (ID, IDENTIFIER)
+
+REGISTERED_TYPES = ("AnalysisRequest", "Sample", "Batch", "ReferenceSample",
+                    "Worksheet")
+
+
+def is_registered_type(obj):
+    """Checks if the identifiers of the object are registered
+    """
+    portal_type = getattr(obj, "portal_type", None)
+    return portal_type in REGISTERED_TYPES or IHaveIdentifiers.providedBy(obj)
+
+
+def get_identifiers(obj):
+    """Returns a list of (kind, identifier) of the object
+    """
+    identifiers = []
+    obj_id = api.get_id(obj)
+    identifiers.append((ID, obj_id))
+    if api.get_portal_type(obj) in REGISTERED_TYPES:
+        title = api.get_title(obj)
+        if title and title != obj_id:
+            identifiers.append((TITLE, title))
+    sample = None
+    if api.get_portal_type(obj) == "AnalysisRequest":
+        sample = obj.getSample()
+        if sample is not None:
+            identifiers.append((SAMPLE_ID, api.get_id(sample)))
+    elif api.get_portal_type(obj) == "Sample":
+        sample = obj
+    if sample is not None and sample.getClientSampleID():
+        identifiers.append((CLIENT_SAMPLE_ID, sample.getClientSampleID()))
+    if IHaveIdentifiers.providedBy(obj):
+        for record in obj.Schema()["Identifiers"].get(obj) or []:
+            identifier = record.get("Identifier")
+            if identifier:
+                identifiers.append((IDENTIFIER, identifier))
+    return [(kind, safe_unicode(identifier).strip())
+            for kind, identifier in identifiers]
+
+
+def normalize(identifier):
+    return safe_unicode(identifier or "").strip()
+
+
+class IdentifierRegistry(object):
+    """Persistent identifier registry
+    """
+    implements(IIdentifierRegistry)
+
+    @property
+    def storage(self):
+        """The registry storage, built on first access
+        """
+        annotation = get_setup_annotation()
+        storage = annotation.get(IDENTIFIER_REGISTRY_STORAGE)
+        if storage is None:
+            storage = self.init_storage()
+            self.build(storage)
+        return storage
+
+    def init_storage(self):
+        """Create a new, empty registry storage
+        """
+        storage = OOBTree()
+        for name in TREES:
+            storage[name] = OOBTree()
+        get_setup_annotation()[IDENTIFIER_REGISTRY_STORAGE] = storage
+        return storage
+
+    def flush(self):
+        """Delete the registry storage
+        """
+        annotation = get_setup_annotation()
+        if annotation.get(IDENTIFIER_REGISTRY_STORAGE) is not None:
+            del annotation[IDENTIFIER_REGISTRY_STORAGE]
+
+    def rebuild(self):
+        """Rebuild the registry from scratch
+        """
+        self.flush()
+        storage = self.init_storage()
+        self.build(storage)
+
+    def build(self, storage):
+        """Populate the given storage with the identifiers of all objects
+        """
+        portal_types = list(REGISTERED_TYPES) + ["AnalysisService"]
+        count = 0
+        for portal_type in portal_types:
+            for brain in api.search({"portal_type": portal_type}):
+                obj = api.get_object(brain)
+                if is_registered_type(obj):
+                    self._update(storage, obj)
+                    count += 1
+        logger.info("Built identifier registry for {} objects".format(count))
+
+    def _add(self, storage, uid, kind, identifier):
+        identifiers = storage[IDENTIFIERS]
+        entries = list(identifiers.get(identifier, ()))
+        if kind in UNIQUE_KINDS:
+            for other_kind, other_uid in entries:
+                if other_kind == kind and other_uid != uid:
+                    logger.warn("Duplicate identifier '{}' of {} and {}"
+                                .format(identifier, uid, other_uid))
+        if (kind, uid) in entries:
+            return
+        entries.append((kind, uid))
+        # stable sort: the first registered object wins within a kind
+        entries.sort(key=lambda entry: entry[0])
+        identifiers[identifier] = tuple(entries)
+
+    def _remove(self, storage, uid):
+        record = storage[OBJECTS].get(uid)
+        if record is None:
+            return
+        del storage[OBJECTS][uid]
+        identifiers = storage[IDENTIFIERS]
+        for kind, identifier in record:
+            entries = [entry for entry in identifiers.get(identifier, ())
+                       if entry != (kind, uid)]
+            if entries:
+                identifiers[identifier] = tuple(entries)
+            elif identifier in identifiers:
+                del identifiers[identifier]
+
+    def _update(self, storage, obj):
+        uid = api.get_uid(obj)
+        record = tuple([(kind, identifier)
+                        for kind, identifier in get_identifiers(obj)
+                        if identifier])
+        if storage[OBJECTS].get(uid) == record:
+            return
+        self._remove(storage, uid)
+        for kind, identifier in record:
+            self._add(storage, uid, kind, identifier)
+        storage[OBJECTS][uid] = record
+
+    def update(self, obj):
+        """Register the current identifiers of the object
+        """
+        self._update(self.storage, obj)
+
+    def remove(self, obj_or_uid):
+        """Remove the identifiers of the object
+        """
+        uid = obj_or_uid
+        if not isinstance(uid, basestring):
+            uid = api.get_uid(obj_or_uid)
+        self._remove(self.storage, uid)
+
+    def get_entries(self, identifier, kinds=None):
+        """Returns the (kind, UID) entries of the identifier
+        """
+        entries = self.storage[IDENTIFIERS].get(normalize(identifier), ())
+        if kinds is None:
+            return list(entries)
+        return [entry for entry in entries if entry[0] in kinds]
+
+    def resolve(self, identifier, kinds=None):
+        """Returns the UID of the object with the identifier, None if not
+        found. `kinds` restricts the kinds of identifiers to look up.
+        """
+        entries = self.get_entries(identifier, kinds)
+        return entries and entries[0][1] or None
+
+    def resolve_all(self, identifier, kinds=None):
+        """Returns the UIDs of all the objects with the identifier
+        """
+        uids = []
+        for kind, uid in self.get_entries(identifier, kinds):
+            if uid not in uids:
+                uids.append(uid)
+        return uids
+
+    def resolve_many(self, identifiers, kinds=None):
+        """Returns a dict of identifier -> UID (None if not found)
+        """
+        return dict([(identifier, self.resolve(identifier, kinds))
+                     for identifier in identifiers])
+
+    def is_unique(self, identifier, uid, kind=IDENTIFIER):
+        """Checks if the identifier is not used by another object with the
+        same kind of identifier
+        """
+        for other_kind, other_uid in self.get_entries(identifier, [kind]):
+            if other_uid != uid:
+                return False
+        return True
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from BTrees.OOBTree import OOBTree
+from BTrees.OOBTree import OOTreeSet
+from zope.annotation.interfaces import IAnnotations
+
+from bika.lims import api
+from bika.lims import logger
+
+"""Analysis log of an Instrument
+
+The analyses performed with an instrument (regular, duplicate and reference
+analyses) are stored in BTrees inside an annotation of the instrument,
+indexed by Analysis Service and QC type:
+
+- "b" for blank and "c" for control reference analyses
+- "d" for duplicate analyses
+- "" for regular analyses
+
+The latest reference analysis per (service, blank/control) is kept up to
+date when analyses are added or removed and when the result of a reference
+analysis is captured, so that the QC validity of an instrument is computed
+from a constant number of analyses.
+
+Instruments created before the log existed stored the analyses in the
+"Analyses" reference field. Their log is built from that field on first
+access (see `rebuild`).
+"""
+
+INSTRUMENT_LOG_STORAGE = "bika.lims.instrumentlog"
+
+# uid -> (portal_type, service uid, qc type, capture time)
+ANALYSES = "analyses"
+# service uid -> set of uids
+BY_SERVICE = "by_service"
+# qc type -> set of uids
+BY_QCTYPE = "by_qctype"
+# (service uid, qc type) -> (capture time, uid) for blanks and controls
+LATEST = "latest"
+
+TREES = (ANALYSES, BY_SERVICE, BY_QCTYPE, LATEST)
+
+REFERENCE_QCTYPES = ("b", "c")
+
+
+def get_qctype(analysis):
+    """Returns the QC type of the analysis
+    """
+    portal_type = api.get_portal_type(analysis)
+    if portal_type == "ReferenceAnalysis":
+        return analysis.getReferenceType()
+    if portal_type == "DuplicateAnalysis":
+        return "d"
+    return ""
+
+
+def get_capture_time(analysis):
+    """Returns the result capture date of the analysis as a float, 0 if the
+    result has not been captured yet
+    """
+    date = analysis.getResultCaptureDate()
+    return date and date.timeTime() or 0
+
+
+def get_storage(instrument):
+    """Returns the log of the instrument. The log is built on first access.
+    """
+    annotation = IAnnotations(instrument)
+    storage = annotation.get(INSTRUMENT_LOG_STORAGE)
+    if storage is None:
+        storage = rebuild(instrument)
+    return storage
+
+
+def init_storage(instrument):
+    storage = OOBTree()
+    for name in TREES:
+        storage[name] = OOBTree()
+    IAnnotations(instrument)[INSTRUMENT_LOG_STORAGE] = storage
+    return storage
+
+
+def rebuild(instrument):
+    """Build the log from the legacy "Analyses" reference field and the
+    current log, if any
+    """
+    annotation = IAnnotations(instrument)
+    old_storage = annotation.get(INSTRUMENT_LOG_STORAGE)
+    uids = list(instrument.getField("Analyses").getRaw(instrument) or [])
+    if old_storage is not None:
+        uids.extend(old_storage[ANALYSES].keys())
+
+    storage = init_storage(instrument)
+    for uid in uids:
+        analysis = api.get_object_by_uid(uid, None)
+        if analysis is not None:
+            _add(storage, analysis)
+    logger.info("Built analysis log of instrument {}: {} analyses".format(
+        api.get_id(instrument), len(storage[ANALYSES])))
+    return storage
+
+
+def _add_to_set(tree, key, uid):
+    values = tree.get(key)
+    if values is None:
+        values = tree[key] = OOTreeSet()
+    values.insert(uid)
+
+
+def _remove_from_set(tree, key, uid):
+    values = tree.get(key)
+    if values is None:
+        return
+    if uid in values:
+        values.remove(uid)
+    if not values:
+        del tree[key]
+
+
+def _update_latest(storage, service_uid, qctype, uid, capture_time):
+    if qctype not in REFERENCE_QCTYPES:
+        return
+    key = (service_uid, qctype)
+    latest = storage[LATEST].get(key)
+    if latest is None or latest[1] == uid or capture_time > latest[0]:
+        storage[LATEST][key] = (capture_time, uid)
+
+
+def _recompute_latest(storage, service_uid, qctype):
+    key = (service_uid, qctype)
+    if key in storage[LATEST]:
+        del storage[LATEST][key]
+    analyses = storage[ANALYSES]
+    for uid in storage[BY_SERVICE].get(service_uid, ()):
+        a_qctype, capture_time = analyses[uid][2:]
+        if a_qctype == qctype:
+            _update_latest(storage, service_uid, qctype, uid, capture_time)
+
+
+def _add(storage, analysis):
+    uid = api.get_uid(analysis)
+    if uid in storage[ANALYSES]:
+        return
+    service_uid = analysis.getServiceUID()
+    qctype = get_qctype(analysis)
+    capture_time = get_capture_time(analysis)
+    storage[ANALYSES][uid] = (api.get_portal_type(analysis), service_uid,
+                              qctype, capture_time)
+    _add_to_set(storage[BY_SERVICE], service_uid, uid)
+    _add_to_set(storage[BY_QCTYPE], qctype, uid)
+    _update_latest(storage, service_uid, qctype, uid, capture_time)
+
+
+def _remove(storage, uid):
+    record = storage[ANALYSES].get(uid)
+    if record is None:
+        return
+    portal_type, service_uid, qctype, capture_time = record
+    del storage[ANALYSES][uid]
+    _remove_from_set(storage[BY_SERVICE], service_uid, uid)
+    _remove_from_set(storage[BY_QCTYPE], qctype, uid)
+    latest = storage[LATEST].get((service_uid, qctype))
+    if latest is not None and latest[1] == uid:
+        _recompute_latest(storage, service_uid, qctype)
+
+
+def refresh_latest(instrument):
+    """Recompute the latest reference analyses of the instrument
+    """
+    storage = get_storage(instrument)
+    storage[LATEST].clear()
+    for uid, record in storage[ANALYSES].items():
+        portal_type, service_uid, qctype, capture_time = record
+        _update_latest(storage, service_uid, qctype, uid, capture_time)
+
+
+def add_analysis(instrument, analysis):
+    """Add the analysis to the log of the instrument
+    """
+    _add(get_storage(instrument), analysis)
+
+
+def remove_analysis(instrument, analysis_or_uid):
+    """Remove the analysis from the log of the instrument
+    """
+    uid = analysis_or_uid
+    if not isinstance(uid, basestring):
+        uid = api.get_uid(analysis_or_uid)
+    _remove(get_storage(instrument), uid)
+
+
+def set_analyses(instrument, analyses):
+    """Set the analyses of the log to the given analyses or UIDs
+    """
+    storage = get_storage(instrument)
+    analyses = dict([(isinstance(a, basestring) and a or api.get_uid(a), a)
+                     for a in analyses])
+    for uid in list(storage[ANALYSES].keys()):
+        if uid not in analyses:
+            _remove(storage, uid)
+    for uid, analysis in analyses.items():
+        if uid in storage[ANALYSES]:
+            continue
+        if isinstance(analysis, basestring):
+            analysis = api.get_object_by_uid(analysis, None)
+        if analysis is not None:
+            _add(storage, analysis)
+
+
+def update_result_capture(instrument, analysis):
+    """Update the capture time of the analysis after its result was set
+    """
+    storage = get_storage(instrument)
+    uid = api.get_uid(analysis)
+    record = storage[ANALYSES].get(uid)
+    if record is None:
+        return
+    portal_type, service_uid, qctype, old_capture_time = record
+    capture_time = get_capture_time(analysis)
+    storage[ANALYSES][uid] = (portal_type, service_uid, qctype, capture_time)
+    latest = storage[LATEST].get((service_uid, qctype))
+    if latest is not None and latest[1] == uid and \
+            capture_time < old_capture_time:
+        # might not be the latest anymore
+        _recompute_latest(storage, service_uid, qctype)
+    else:
+        _update_latest(storage, service_uid, qctype, uid, capture_time)
+
+
+def get_analysis_uids(instrument, service_uid=None, qctypes=None):
+    """Returns the UIDs of the analyses of the instrument, optionally filtered
+    by service and QC types
+    """
+    storage = get_storage(instrument)
+    uids = None
+    if service_uid is not None:
+        uids = set(storage[BY_SERVICE].get(service_uid, ()))
+    if qctypes is not None:
+        by_type = set()
+        for qctype in qctypes:
+            by_type.update(storage[BY_QCTYPE].get(qctype, ()))
+        uids = by_type if uids is None else uids.intersection(by_type)
+    if uids is None:
+        return list(storage[ANALYSES].keys())
+    return list(uids)
+
+
+def get_latest_reference_uids(instrument):
+    """Returns the UIDs of the latest reference analysis for each service and
+    reference type (blank or control)
+    """
+    return [uid for capture_time, uid in get_storage(instrument)[LATEST].values()]
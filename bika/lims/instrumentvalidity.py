@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from DateTime import DateTime
+from Missing import Value as MissingValue
+from zope.annotation.interfaces import IAnnotations
+
+from bika.lims import api
+from bika.lims import logger
+
+"""Cached validity status of an Instrument
+
+Checking if an instrument is valid requires to check its certifications,
+validations, calibrations and the latest QC results. The status is therefore
+computed when one of these changes and stored in an annotation of the
+instrument, together with the date when the status expires, i.e. the next
+date when a certification, validation or calibration period begins or ends.
+
+The status is exposed as catalog metadata (getValidityStatus), so listings
+can check the validity of instruments without waking them up.
+
+A status expires at the latest `STATUS_MAX_AGE` days after it was computed.
+Expired status records are computed on the fly (without storing them). The
+`@@instrument_validity_sweep` view recomputes and reindexes the status of all
+instruments. It is called every hour by the clock server of the instance
+(see buildout.cfg).
+
+The "Dispose until next calibration test" flag is a plain field of the
+instrument, so `get_status` always reads it from the instrument. The setters
+of the flag and of the certification, validation and calibration periods
+update the stored status as well, so the catalog metadata stays current.
+"""
+
+INSTRUMENT_VALIDITY_STORAGE = "bika.lims.instrumentvalidity"
+
+# days after which a stored status expires, if no certification, validation
+# or calibration period begins or ends earlier
+STATUS_MAX_AGE = 1
+
+
+def get_expiry_date(instrument, now):
+    """Returns the next date when a certification, validation or calibration
+    period of the instrument begins or ends, None if there is no such date
+    """
+    dates = []
+    for certification in instrument.getCertifications():
+        dates.extend([certification.getValidFrom(),
+                      certification.getValidTo()])
+    for period in instrument.getValidations() + instrument.getCalibrations():
+        dates.extend([period.getDownFrom(), period.getDownTo()])
+    dates = filter(lambda date: date and date >= now, dates)
+    dates.append(now + STATUS_MAX_AGE)
+    return min(dates)
+
+
+def is_valid(status):
+    """Checks if the instrument of the validity status is valid
+    """
+    return status.get("out_of_date") is False \
+        and status.get("qc_valid") is True \
+        and not status.get("disposed") \
+        and status.get("in_validation") is False \
+        and status.get("in_calibration") is False
+
+
+def compute(instrument):
+    """Compute the validity status of the instrument
+    """
+    now = DateTime()
+    status = {
+        "out_of_date": instrument.isOutOfDate(),
+        "qc_valid": instrument.isQCValid(),
+        "disposed": instrument.getDisposeUntilNextCalibrationTest(),
+        "in_validation": instrument.isValidationInProgress(),
+        "in_calibration": instrument.isCalibrationInProgress(),
+        "expires": get_expiry_date(instrument, now),
+    }
+    status["valid"] = is_valid(status)
+    return status
+
+
+def is_expired(status, now=None):
+    if not status:
+        return True
+    expires = status.get("expires")
+    if expires is None:
+        # stored by a previous version, without a maximum age
+        return True
+    now = now or DateTime()
+    return now >= expires
+
+
+def get_status(instrument):
+    """Returns the validity status of the instrument. The stored status is
+    used unless it is expired. The dispose flag is always read from the
+    instrument.
+    """
+    status = IAnnotations(instrument).get(INSTRUMENT_VALIDITY_STORAGE)
+    if is_expired(status):
+        return compute(instrument)
+    disposed = instrument.getDisposeUntilNextCalibrationTest()
+    if disposed != status.get("disposed"):
+        status = dict(status, disposed=disposed)
+        status["valid"] = is_valid(status)
+    return status
+
+
+def get_brain_status(brain):
+    """Returns the validity status from the catalog metadata of the
+    instrument, or from the instrument if the metadata is expired
+    """
+    status = getattr(brain, "getValidityStatus", MissingValue)
+    if status is MissingValue or is_expired(status):
+        return get_status(api.get_object(brain))
+    return status
+
+
+def update(instrument, reindex=True):
+    """Recompute and store the validity status of the instrument. Returns
+    True if the status changed. A status which did not change is only
+    stored again (with a new expiry date) once the stored one expired.
+    """
+    annotation = IAnnotations(instrument)
+    old_status = annotation.get(INSTRUMENT_VALIDITY_STORAGE)
+    status = compute(instrument)
+    changed = dict(status, expires=None) != dict(old_status or {},
+                                                 expires=None)
+    if not changed and not is_expired(old_status):
+        return False
+    annotation[INSTRUMENT_VALIDITY_STORAGE] = status
+    if reindex:
+        instrument.reindexObject()
+    return changed
+
+
+def update_parent(obj):
+    """Recompute the validity status of the instrument of a certification,
+    validation or calibration, unless the object is being created
+    """
+    if obj.checkCreationFlag():
+        return
+    instrument = api.get_parent(obj)
+    if getattr(instrument, "portal_type", None) != "Instrument":
+        return
+    update(instrument)
+
+
+def sweep():
+    """Recompute the validity status of all instruments. Returns the number
+    of instruments with a changed status.
+    """
+    count = 0
+    for brain in api.search({"portal_type": "Instrument"},
+                            "bika_setup_catalog"):
+        if update(api.get_object(brain)):
+            count += 1
+    logger.info("Instrument validity sweep: {} instruments changed"
+                .format(count))
+    return count
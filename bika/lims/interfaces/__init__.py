@@ -754,6 +754,18 @@ class INumberGenerator(Interface):
     """A utility to generates unique numbers by key
     """
 
+class IServiceDependencyGraph(Interface):
+    """A utility to look up the calculation dependencies between services
+    """
+
+class ISpecificationIndex(Interface):
+    """A utility to look up the results ranges of the analysis specifications
+    """
+
+class IIdentifierRegistry(Interface):
+    """A utility to resolve ids, barcodes and external identifiers to UIDs
+    """
+
 class IClientType(Interface):
     """ A Client Type.
     """
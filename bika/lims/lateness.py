@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from DateTime import DateTime
+
+from bika.lims import api
+from bika.lims import logger
+from bika.lims.interfaces import IRoutineAnalysis
+from bika.lims.utils.indexing import deferred_indexing
+from bika.lims.utils.indexing import update_catalog
+
+"""Lateness of analyses and Analysis Requests
+
+An analysis is late if its result was captured after its due date, or if it
+has no result yet and its due date is passed. An AR is late if any of its
+analyses, not published yet, is late.
+
+The late flag (`getLate`) of the analyses is indexed and stored as metadata
+in the analysis catalog, with the due date and the titles and paths of the
+AR, client and contact, so the late analyses and the late status of ARs are
+rendered from the catalog, without waking up the objects:
+
+- the late flag of an analysis and of its AR are reindexed after each
+  transition of the analysis (see `bika.lims.workflow`), which covers the
+  changes of the due date (receive) and of the result (submit, retract)
+- an analysis without result becomes late when the time passes its due date,
+  without any change. `is_ar_late` compares the due date of these analyses
+  with the current time, and `sweep` reindexes them and their ARs. The sweep
+  is run every hour by the `sweep_lateness` view of the site, with the clock
+  server of buildout.cfg
+"""
+
+# states of the analyses and ARs which are not received yet
+NOT_RECEIVED_STATES = ("sample_registered", "to_be_sampled", "sampled",
+                       "to_be_preserved", "sample_due")
+
+# states of the analyses which are waiting for a result
+PENDING_STATES = ("sample_received", "assigned")
+
+
+def is_late(analysis, now=None):
+    """Returns True if the analysis is late
+    """
+    if api.get_workflow_status_of(analysis) in NOT_RECEIVED_STATES:
+        return False
+    due_date = analysis.getDueDate()
+    if not due_date:
+        return False
+    result_date = analysis.getResultCaptureDate()
+    if result_date:
+        return result_date > due_date
+    return (now or DateTime()) > due_date
+
+
+def is_ar_late(ar, now=None):
+    """Returns True if any analysis of the AR, not published yet, is late.
+    The lateness of the analyses is read from the catalog: the analyses
+    waiting for a result are late once their due date is passed, even if
+    they were not swept yet.
+    """
+    state = api.get_workflow_status_of(ar)
+    if state in NOT_RECEIVED_STATES or state == "published":
+        return False
+    now = now or DateTime()
+    for brain in ar.getAnalyses():
+        if brain.review_state == "published":
+            continue
+        if brain.getLate is True:
+            return True
+        if brain.review_state in PENDING_STATES and \
+                brain.cancellation_state == "active" and \
+                brain.getDueDate and brain.getDueDate < now:
+            return True
+    return False
+
+
+def update(analysis):
+    """Reindex the late flag of the analysis and of its AR
+    """
+    if not IRoutineAnalysis.providedBy(analysis):
+        return
+    analysis.reindexObject(idxs=["getLate"])
+    # the AR reads the late flag of its analyses from the catalog: it is
+    # updated after them, and only in bika_catalog (not in portal_catalog,
+    # which has no getLate index and would reindex the AR completely)
+    update_catalog(api.get_parent(analysis), "bika_catalog", ["getLate"])
+
+
+def sweep(now=None):
+    """Reindex the analyses waiting for a result which became late since the
+    last sweep, and their ARs. Returns the number of late analyses.
+    """
+    now = now or DateTime()
+    query = {"portal_type": "Analysis",
+             "getLate": False,
+             "review_state": PENDING_STATES,
+             "cancellation_state": "active",
+             "getDueDate": {"query": now, "range": "max"}}
+    brains = api.search(query, "bika_analysis_catalog")
+    count = 0
+    with deferred_indexing():
+        for brain in brains:
+            update(api.get_object(brain))
+            count += 1
+    logger.info("Lateness sweep: {} analyses became late".format(count))
+    return count
+
+
+def get_late_string(due_date, now=None):
+    """Returns how late the due date is, e.g. "2 days" or "3 hours"
+    """
+    late = (now or DateTime()) - due_date
+    days = int(late / 1)
+    hours = int((late % 1) * 24)
+    mins = int((((late % 1) * 24) % 1) * 60)
+    late_str = days and "%s day%s" % (days, days > 1 and 's' or '') or ""
+    if days < 2:
+        late_str += hours and " %s hour%s" % (
+            hours, hours > 1 and 's' or '') or ""
+    if not days and not hours:
+        late_str = "%s min%s" % (mins, mins > 1 and 's' or '')
+    return late_str.strip()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from bika.lims.utils.indexing import get_queue
+from bika.lims.utils.indexing import process_queue
+
+
+def indexObject(self):
+    """Queue the indexing of the object inside `deferred_indexing`
+    """
+    queue = get_queue()
+    if queue.active:
+        return queue.add(self)
+    return self._old_indexObject()
+
+
+def reindexObject(self, idxs=[]):
+    """Queue the reindexing of the object inside `deferred_indexing`
+    """
+    queue = get_queue()
+    if queue.active:
+        return queue.add(self, idxs)
+    return self._old_reindexObject(idxs=idxs)
+
+
+def unindexObject(self):
+    """Discard pending reindex operations of the object and unindex it
+    """
+    get_queue().remove(self)
+    return self._old_unindexObject()
+
+
+def searchResults(self, REQUEST=None, **kw):
+    """Process the pending reindex operations of this catalog first
+    """
+    process_queue(self.getId())
+    return self._old_searchResults(REQUEST, **kw)
+
+
+def unrestrictedSearchResults(self, REQUEST=None, **kw):
+    """Process the pending reindex operations of this catalog first
+    """
+    process_queue(self.getId())
+    return self._old_unrestrictedSearchResults(REQUEST, **kw)
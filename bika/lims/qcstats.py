@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import math
+from array import array
+
+from BTrees.OOBTree import OOBTree
+from DateTime import DateTime
+
+from bika.lims import api
+from bika.lims import logger
+from bika.lims.setupcache import get_setup_annotation
+
+"""QC statistics of reference analyses
+
+The verified results of the reference analyses are stored as QC series, one
+per (reference definition, service, instrument), inside an annotation of
+`bika_setup`. Each series keeps its points ordered by capture time and the
+running aggregates (count, mean and sum of squared deviations, see Welford's
+algorithm), which are updated when a reference analysis is verified or
+removed. Levey-Jennings charts and QC reports therefore never wake up the
+reference analyses.
+
+The chart data of a series is computed in one pass over the numeric arrays of
+the series:
+
+- mean and standard deviation
+- Westgard rule violations (1-2s warning, 1-3s, 2-2s, R-4s, 4-1s, 10x)
+- rolling control limits (mean +/- 3 SD of the last `window` points)
+
+The series are built on first access and can be rebuilt with `rebuild`.
+"""
+
+QC_STATS_STORAGE = "bika.lims.qcstats"
+
+# series key -> series
+SERIES = "series"
+# reference analysis UID -> series key
+ANALYSES = "analyses"
+
+TREES = (SERIES, ANALYSES)
+
+# series: (capture time, analysis UID) -> (result, reference sample UID)
+POINTS = "points"
+# series: (count, mean, sum of squared deviations)
+AGGREGATES = "aggregates"
+
+QC_STATES = ("verified", "published")
+
+ROLLING_WINDOW = 20
+
+# Westgard rules
+RULE_1_2S = "1-2s"
+RULE_1_3S = "1-3s"
+RULE_2_2S = "2-2s"
+RULE_R_4S = "R-4s"
+RULE_4_1S = "4-1s"
+RULE_10X = "10x"
+
+# rules which reject the run (1-2s is a warning rule)
+REJECTION_RULES = (RULE_1_3S, RULE_2_2S, RULE_R_4S, RULE_4_1S, RULE_10X)
+
+
+def get_storage(create=True):
+    """Returns the QC statistics storage. The storage is built if it does not
+    exist yet, unless create is False.
+    """
+    annotation = get_setup_annotation()
+    storage = annotation.get(QC_STATS_STORAGE)
+    if storage is None and create:
+        storage = rebuild()
+    return storage
+
+
+def init_storage():
+    storage = OOBTree()
+    for name in TREES:
+        storage[name] = OOBTree()
+    get_setup_annotation()[QC_STATS_STORAGE] = storage
+    return storage
+
+
+def rebuild():
+    """Build the QC series from all verified reference analyses
+    """
+    storage = init_storage()
+    query = {"portal_type": "ReferenceAnalysis", "review_state": QC_STATES}
+    brains = api.search(query, "bika_analysis_catalog")
+    for brain in brains:
+        _add(storage, api.get_object(brain))
+    logger.info("Built QC statistics: {} series, {} reference analyses"
+                .format(len(storage[SERIES]), len(storage[ANALYSES])))
+    return storage
+
+
+def get_series_key(analysis):
+    """Returns the (reference definition UID, service UID, instrument UID)
+    series key of the reference analysis
+    """
+    sample = api.get_parent(analysis)
+    definition = sample.getField("ReferenceDefinition").getRaw(sample)
+    instrument = analysis.getField("Instrument").getRaw(analysis)
+    return (definition or "", analysis.getServiceUID(), instrument or "")
+
+
+def get_result(analysis):
+    """Returns the result of the analysis as a float, None if the result is
+    not floatable
+    """
+    try:
+        return float(analysis.getResult())
+    except (TypeError, ValueError):
+        return None
+
+
+def get_capture_time(analysis):
+    date = analysis.getResultCaptureDate()
+    return date and date.timeTime() or 0
+
+
+def _add_aggregate(aggregates, value):
+    count, mean, m2 = aggregates
+    count += 1
+    delta = value - mean
+    mean += delta / count
+    m2 += delta * (value - mean)
+    return count, mean, m2
+
+
+def _remove_aggregate(aggregates, value):
+    count, mean, m2 = aggregates
+    if count <= 1:
+        return 0, 0.0, 0.0
+    old_mean = (count * mean - value) / (count - 1)
+    m2 -= (value - mean) * (value - old_mean)
+    return count - 1, old_mean, max(m2, 0.0)
+
+
+def _get_series(storage, key):
+    series = storage[SERIES].get(key)
+    if series is None:
+        series = storage[SERIES][key] = OOBTree()
+        series[POINTS] = OOBTree()
+        series[AGGREGATES] = (0, 0.0, 0.0)
+    return series
+
+
+def _add(storage, analysis):
+    uid = api.get_uid(analysis)
+    _remove(storage, uid)
+    value = get_result(analysis)
+    if value is None:
+        return
+    key = get_series_key(analysis)
+    series = _get_series(storage, key)
+    sample_uid = api.get_uid(api.get_parent(analysis))
+    series[POINTS][(get_capture_time(analysis), uid)] = (value, sample_uid)
+    series[AGGREGATES] = _add_aggregate(series[AGGREGATES], value)
+    storage[ANALYSES][uid] = (key, get_capture_time(analysis))
+
+
+def _remove(storage, uid):
+    record = storage[ANALYSES].get(uid)
+    if record is None:
+        return
+    key, capture_time = record
+    del storage[ANALYSES][uid]
+    series = storage[SERIES].get(key)
+    if series is None:
+        return
+    point = series[POINTS].get((capture_time, uid))
+    if point is None:
+        return
+    del series[POINTS][(capture_time, uid)]
+    if not series[POINTS]:
+        del storage[SERIES][key]
+        return
+    series[AGGREGATES] = _remove_aggregate(series[AGGREGATES], point[0])
+
+
+def add_analysis(analysis):
+    """Add the verified reference analysis to its QC series
+    """
+    _add(get_storage(), analysis)
+
+
+def remove_analysis(analysis_or_uid):
+    """Remove the reference analysis from its QC series
+    """
+    storage = get_storage(create=False)
+    if storage is None:
+        return
+    uid = analysis_or_uid
+    if not isinstance(uid, basestring):
+        uid = api.get_uid(analysis_or_uid)
+    _remove(storage, uid)
+
+
+def get_series_keys(definition_uid=None, service_uid=None):
+    """Returns the keys of the series for the given reference definition
+    and service
+    """
+    keys = get_storage()[SERIES].keys()
+    return [key for key in keys
+            if (definition_uid is None or key[0] == definition_uid) and
+            (service_uid is None or key[1] == service_uid)]
+
+
+def get_points(keys, sample_uid=None):
+    """Returns the points of the given series, ordered by capture time, as a
+    tuple of (capture times, results, analysis UIDs, sample UIDs). The
+    capture times and results are numeric arrays.
+    """
+    series = get_storage()[SERIES]
+    points = []
+    for key in keys:
+        if key in series:
+            points.extend(series[key][POINTS].items())
+    if len(keys) > 1:
+        points.sort()
+    times = array("d")
+    values = array("d")
+    uids = []
+    samples = []
+    for (capture_time, uid), (value, point_sample_uid) in points:
+        if sample_uid and point_sample_uid != sample_uid:
+            continue
+        times.append(capture_time)
+        values.append(value)
+        uids.append(uid)
+        samples.append(point_sample_uid)
+    return times, values, uids, samples
+
+
+def get_aggregates(keys):
+    """Returns the (count, mean, SD) of the given series, combined from the
+    stored aggregates
+    """
+    series = get_storage()[SERIES]
+    count, mean, m2 = 0, 0.0, 0.0
+    for key in keys:
+        if key not in series:
+            continue
+        n, s_mean, s_m2 = series[key][AGGREGATES]
+        if n == 0:
+            continue
+        # parallel variant of Welford's algorithm
+        delta = s_mean - mean
+        total = count + n
+        mean += delta * n / total
+        m2 += s_m2 + delta * delta * count * n / total
+        count = total
+    sd = math.sqrt(m2 / (count - 1)) if count > 1 else 0.0
+    return count, mean, sd
+
+
+def compute_stats(values):
+    """Returns the (count, mean, SD) of the values
+    """
+    count = len(values)
+    if count == 0:
+        return 0, 0.0, 0.0
+    mean = math.fsum(values) / count
+    if count == 1:
+        return count, mean, 0.0
+    m2 = math.fsum([(value - mean) ** 2 for value in values])
+    return count, mean, math.sqrt(m2 / (count - 1))
+
+
+def westgard(values, mean, sd):
+    """Returns a list with the violated Westgard rules of each value
+    """
+    violations = [[] for value in values]
+    if sd <= 0:
+        return violations
+    # length of the current run of values on the same side of the mean
+    # beyond 1 SD, beyond 2 SD and at all
+    run_1s = run_2s = run_side = 0
+    side_1s = side_2s = side = 0
+    previous_z = None
+    for i, value in enumerate(values):
+        z = (value - mean) / sd
+        sign = z > 0 and 1 or (z < 0 and -1 or 0)
+        rules = violations[i]
+        if abs(z) > 3:
+            rules.append(RULE_1_3S)
+        elif abs(z) > 2:
+            rules.append(RULE_1_2S)
+
+        # 2-2s: two consecutive values beyond 2 SD on the same side
+        if abs(z) > 2:
+            run_2s = run_2s + 1 if sign == side_2s else 1
+            side_2s = sign
+        else:
+            run_2s = side_2s = 0
+        if run_2s >= 2:
+            rules.append(RULE_2_2S)
+
+        # R-4s: two consecutive values 4 SD apart (beyond 2 SD on opposite
+        # sides)
+        if previous_z is not None and abs(z) > 2 and abs(previous_z) > 2 \
+                and z * previous_z < 0:
+            rules.append(RULE_R_4S)
+
+        # 4-1s: four consecutive values beyond 1 SD on the same side
+        if abs(z) > 1:
+            run_1s = run_1s + 1 if sign == side_1s else 1
+            side_1s = sign
+        else:
+            run_1s = side_1s = 0
+        if run_1s >= 4:
+            rules.append(RULE_4_1S)
+
+        # 10x: ten consecutive values on the same side of the mean
+        if sign != 0:
+            run_side = run_side + 1 if sign == side else 1
+            side = sign
+        else:
+            run_side = side = 0
+        if run_side >= 10:
+            rules.append(RULE_10X)
+
+        previous_z = z
+    return violations
+
+
+def rolling_limits(values, window=ROLLING_WINDOW):
+    """Returns a list of (mean, SD) of the last `window` values at each
+    value. The SD is 0 until there are at least two values.
+    """
+    limits = []
+    total = total_sq = 0.0
+    for i, value in enumerate(values):
+        total += value
+        total_sq += value * value
+        if i >= window:
+            old = values[i - window]
+            total -= old
+            total_sq -= old * old
+        count = min(i + 1, window)
+        mean = total / count
+        variance = 0.0
+        if count > 1:
+            variance = max((total_sq - count * mean * mean) / (count - 1), 0)
+        limits.append((mean, math.sqrt(variance)))
+    return limits
+
+
+def get_chart_data(keys, sample_uid=None, window=ROLLING_WINDOW):
+    """Returns the Levey-Jennings chart data of the given series as a dict,
+    which can be serialized to JSON. The mean and SD are the stored
+    aggregates of the series. If a sample UID is given, only the points of
+    that reference sample are returned, checked against the limits of the
+    whole series.
+    """
+    times, values, uids, samples = get_points(keys, sample_uid)
+    count, mean, sd = get_aggregates(keys)
+    violations = westgard(values, mean, sd)
+    limits = rolling_limits(values, window)
+
+    points = []
+    rejected = 0
+    for i, value in enumerate(values):
+        rolling_mean, rolling_sd = limits[i]
+        rules = violations[i]
+        if set(rules).intersection(REJECTION_RULES):
+            rejected += 1
+        points.append({
+            "uid": uids[i],
+            "sample_uid": samples[i],
+            "date": DateTime(times[i]).ISO8601(),
+            "result": value,
+            "z": (value - mean) / sd if sd else 0.0,
+            "rules": rules,
+            "rolling_mean": rolling_mean,
+            "rolling_lower": rolling_mean - 3 * rolling_sd,
+            "rolling_upper": rolling_mean + 3 * rolling_sd,
+        })
+
+    return {
+        "count": count,
+        "mean": mean,
+        "sd": sd,
+        "limits": {
+            "lower_3s": mean - 3 * sd,
+            "lower_2s": mean - 2 * sd,
+            "upper_2s": mean + 2 * sd,
+            "upper_3s": mean + 3 * sd,
+        },
+        "rejected": rejected,
+        "window": window,
+        "points": points,
+    }
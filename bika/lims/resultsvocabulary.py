@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from plone.memoize import ram
+from zope.annotation.interfaces import IAnnotations
+
+from bika.lims import api
+from bika.lims import bikaMessageFactory as _
+from bika.lims import instrumentvalidity
+from bika.lims.setupcache import get_setup_stamp
+
+"""Method and Instrument vocabularies for results entry
+
+The results entry listings (AR manage_results, Worksheet, QC analyses) offer
+a Method and an Instrument selector for every analysis. Both vocabularies only
+depend on the Analysis Service, the Method of the analysis and whether the
+analysis is a QC (reference or duplicate) analysis, so they are computed once
+per (service UID, method UID, QC flag) and request.
+
+The candidate methods and instruments (UIDs and titles) of a service are kept
+in a RAM cache shared across requests. The cache key contains the setup stamp
+(see `bika.lims.setupcache`), so the cached data is discarded when a setup
+item (service, method, instrument...) is modified.
+
+The validity of the instruments changes with the results of the reference
+analyses and over time, so it is not cached across requests. It is read from
+the catalog metadata of the instruments instead (see
+`bika.lims.instrumentvalidity`).
+"""
+
+REQUEST_CACHE_KEY = "bika.lims.resultsvocabulary"
+
+QC_PORTAL_TYPES = ("ReferenceAnalysis", "DuplicateAnalysis")
+
+
+def _setup_cache_key(method, *args):
+    return (api.get_path(api.get_portal()), ) + args + (get_setup_stamp(), )
+
+
+@ram.cache(_setup_cache_key)
+def get_service_methods(service_uid):
+    """Returns a tuple of (has default method, ((uid, title), ...)) with the
+    methods available for the service
+    """
+    service = api.get_object_by_uid(service_uid)
+    methods = service.getAvailableMethods()
+    return (bool(service.getMethod()),
+            tuple([(api.get_uid(m), api.get_title(m)) for m in methods]))
+
+
+@ram.cache(_setup_cache_key)
+def get_service_instruments(service_uid, method_uid):
+    """Returns a tuple of (uid, title) with the instruments capable to perform
+    the method, or the instruments of the service if no method is given.
+    Returns None if the service does not allow instrument entry of results.
+    """
+    service = api.get_object_by_uid(service_uid)
+    if service.getInstrumentEntryOfResults() is False:
+        return None
+    if method_uid:
+        instruments = api.get_object_by_uid(method_uid).getInstruments()
+    else:
+        instruments = service.getInstruments()
+    return tuple([(api.get_uid(i), api.get_title(i)) for i in instruments])
+
+
+def get_request_cache():
+    """Returns the vocabularies cache of the current request
+    """
+    request = api.get_request()
+    if request is None:
+        return {}
+    annotations = IAnnotations(request)
+    cache = annotations.get(REQUEST_CACHE_KEY)
+    if cache is None:
+        cache = annotations[REQUEST_CACHE_KEY] = {}
+    return cache
+
+
+def get_validity_status(uids):
+    """Returns a dict of instrument UID -> validity status. The status of
+    each instrument is looked up once per request.
+    """
+    cache = get_request_cache().setdefault("validity", {})
+    missing = [uid for uid in uids if uid not in cache]
+    if missing:
+        query = {"portal_type": "Instrument", "UID": missing}
+        for brain in api.search(query, "bika_setup_catalog"):
+            cache[brain.UID] = instrumentvalidity.get_brain_status(brain)
+    return dict([(uid, cache.get(uid)) for uid in uids])
+
+
+def is_qc(analysis):
+    return api.get_portal_type(analysis) in QC_PORTAL_TYPES
+
+
+def get_methods_vocabulary(analysis):
+    """Returns the methods vocabulary for the analysis. A 'None' option is
+    added if the service has methods available, but no default method.
+    """
+    service_uid = analysis.getServiceUID()
+    key = ("methods", service_uid)
+    cache = get_request_cache()
+    if key not in cache:
+        has_default, methods = get_service_methods(service_uid)
+        vocabulary = []
+        if methods and not has_default:
+            vocabulary.append({'ResultValue': '',
+                               'ResultText': _('None')})
+        for uid, title in methods:
+            vocabulary.append({'ResultValue': uid,
+                               'ResultText': title})
+        cache[key] = vocabulary
+    return list(cache[key])
+
+
+def get_instruments_vocabulary(analysis):
+    """Returns the instruments vocabulary for the analysis. Only valid
+    instruments are included, except for QC analyses, which also get the
+    invalid instruments that are not out of date.
+    """
+    service_uid = analysis.getServiceUID()
+    method = analysis.getMethod() if hasattr(analysis, 'getMethod') else None
+    method_uid = method and api.get_uid(method) or None
+    qc = is_qc(analysis)
+    key = ("instruments", service_uid, method_uid, qc)
+    cache = get_request_cache()
+    if key not in cache:
+        instruments = get_service_instruments(service_uid, method_uid)
+        if instruments is None:
+            cache[key] = []
+        else:
+            status = get_validity_status([uid for uid, t in instruments])
+            vocabulary = [{'ResultValue': '', 'ResultText': _('None')}]
+            for uid, title in instruments:
+                valid = status.get(uid)
+                if valid is None:
+                    continue
+                if valid['valid'] or (qc and not valid['out_of_date']):
+                    vocabulary.append({'ResultValue': uid,
+                                       'ResultText': title})
+            cache[key] = vocabulary
+    return list(cache[key])
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""
+Benchmark of the batch evaluation of results against results ranges, see
+bika.lims.utils.outofrange.
+
+Usage:
+bin/zopectl run benchmark_outofrange.py [<results>] [<repeat>] [<ploneSiteId>]
+
+Evaluates the given number of synthetic results (10000 by default) with the
+batch evaluator and with the per-result arithmetic of the default
+IResultOutOfRange adapter, checks that both give the same flags and prints
+the best time of each over <repeat> runs (5 by default).
+
+If a site is given, the flags of the given number of analyses of the site are
+also computed the way the analyses listings and the publication reports do
+(`evaluate_analyses`, with the lookup of the results ranges in the
+specification index) and the way they used to (the IResultOutOfRange
+adapters and the detection limit methods of each analysis). If the site has
+fewer analyses, they are repeated.
+"""
+
+import random
+import time
+from sys import argv
+
+from zope.component import getAdapters
+
+from bika.lims.browser.analysis import ResultOutOfRange
+from bika.lims.interfaces import IResultOutOfRange
+from bika.lims.utils.outofrange import evaluate
+from bika.lims.utils.outofrange import evaluate_analyses
+
+count = len(argv) > 1 and int(argv[1]) or 10000
+repeat = len(argv) > 2 and int(argv[2]) or 5
+site_id = len(argv) > 3 and argv[3] or None
+
+random.seed(0)
+# a few ranges shared by many results, like the services of a lab
+specs = [{"min": str(low), "max": str(low + 10), "error": "5"}
+         for low in range(0, 100, 10)]
+records = []
+for i in range(count):
+    spec = random.choice(specs)
+    result = "%.2f" % random.uniform(-10, 120)
+    records.append((result, spec, "", 0.0, 1000.0))
+
+
+def run_batch():
+    return [(flags["out_of_range"], flags["acceptable"])
+            for flags in evaluate(records)]
+
+
+def run_per_result():
+    adapter = ResultOutOfRange(None)
+    return [adapter.isOutOfRange(result, spec["min"], spec["max"],
+                                 spec["error"])
+            for result, spec, operand, ldl, udl in records]
+
+
+def best_time(func):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+assert run_batch() == run_per_result(), "Different flags"
+print "{} results, best of {} runs".format(count, repeat)
+print "batch evaluation: {:.1f} ms".format(best_time(run_batch) * 1000)
+print "per result:       {:.1f} ms".format(best_time(run_per_result) * 1000)
+
+if site_id:
+    from AccessControl.SecurityManagement import newSecurityManager
+    from Testing.makerequest import makerequest
+    from zope.component.hooks import setSite
+
+    app = makerequest(app)
+    portal = app[site_id]
+    setSite(portal)
+    admin = app.acl_users.getUserById("admin")
+    newSecurityManager(None, admin.__of__(app.acl_users))
+
+    bac = portal.bika_analysis_catalog
+    brains = bac(portal_type="Analysis")[:count]
+    assert brains, "No analyses in {}".format(site_id)
+    analyses = [brain.getObject() for brain in brains]
+    analyses = (analyses * (count / len(analyses) + 1))[:count]
+
+    def run_analyses_batch():
+        flags = evaluate_analyses(analyses)
+        return [(bool(flags[an.UID()]["out_of_range"]),
+                 flags[an.UID()]["below_ldl"],
+                 flags[an.UID()]["above_udl"]) for an in analyses]
+
+    def run_analyses_per_analysis():
+        ret = []
+        for analysis in analyses:
+            spec = analysis.getResultsRange()
+            out_of_range = False
+            for name, adapter in getAdapters((analysis, ), IResultOutOfRange):
+                flags = spec and adapter(specification=spec)
+                if flags and flags.get("out_of_range"):
+                    out_of_range = True
+                    break
+            ret.append((out_of_range,
+                        analysis.isBelowLowerDetectionLimit(),
+                        analysis.isAboveUpperDetectionLimit()))
+        return ret
+
+    assert run_analyses_batch() == run_analyses_per_analysis(), \
+        "Different flags"
+    print "{} analyses of {} ({} distinct), best of {} runs".format(
+        count, site_id, len(brains), repeat)
+    print "evaluate_analyses: {:.1f} ms".format(
+        best_time(run_analyses_batch) * 1000)
+    print "per analysis:      {:.1f} ms".format(
+        best_time(run_analyses_per_analysis) * 1000)
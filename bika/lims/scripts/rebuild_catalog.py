@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+"""
+Resumable rebuild of a bika catalog, see bika.lims.catalogrebuild.
+
+Usage:
+bin/zopectl run rebuild_catalog.py <ploneSiteId> <catalogId> [<worker> <workers>]
+
+To rebuild with several ZEO clients, run the script on each client with the
+same number of workers and a different worker number, e.g. on 4 clients:
+
+bin/client1 run rebuild_catalog.py bika bika_analysis_catalog 0 4
+bin/client2 run rebuild_catalog.py bika bika_analysis_catalog 1 4
+...
+
+An interrupted worker resumes from its last committed chunk when it is run
+again. The catalog is replaced when the last worker is done.
+"""
+
+from sys import argv
+
+from AccessControl.SecurityManagement import newSecurityManager
+from Testing.makerequest import makerequest
+from zope.component.hooks import setSite
+
+from bika.lims import catalogrebuild
+
+app = makerequest(app)
+portal = app[argv[1]]
+setSite(portal)
+admin = app.acl_users.getUserById("admin")
+newSecurityManager(None, admin.__of__(app.acl_users))
+
+catalog = portal[argv[2]]
+worker = len(argv) > 3 and int(argv[3]) or 0
+workers = len(argv) > 4 and int(argv[4]) or 1
+
+progress = catalogrebuild.run(catalog, worker, workers)
+print progress
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from BTrees.OOBTree import OOBTree
+from zope.interface import implements
+
+from bika.lims import api
+from bika.lims import logger
+from bika.lims.interfaces import IServiceDependencyGraph
+from bika.lims.setupcache import get_setup_annotation
+
+"""Service Dependency Graph
+
+Persistent graph of the calculation dependencies between Analysis Services.
+
+A service depends on another service if the calculation of the service uses
+the other service in its formula. The graph stores the direct edges in both
+directions and the transitive closure of each service, so that dependency
+and dependant queries are simple lookups.
+
+The calculation of a service is derived from the service itself, its default
+method or its default instrument. These objects are remembered as the
+"sources" of a service, so that a change on a Calculation, Method or
+Instrument updates only the services which were derived from it.
+"""
+
+SERVICE_GRAPH_STORAGE = "bika.lims.servicegraph"
+
+# direct edges: service UID -> tuple of service UIDs
+DEPENDENCIES = "dependencies"
+DEPENDANTS = "dependants"
+# transitive closures: service UID -> tuple of service UIDs
+ALL_DEPENDENCIES = "all_dependencies"
+ALL_DEPENDANTS = "all_dependants"
+# service UID -> tuple of calculation/method/instrument UIDs
+SOURCES = "sources"
+# calculation/method/instrument UID -> tuple of service UIDs
+SERVICES_BY_SOURCE = "services_by_source"
+
+TREES = (DEPENDENCIES, DEPENDANTS, ALL_DEPENDENCIES, ALL_DEPENDANTS,
+         SOURCES, SERVICES_BY_SOURCE)
+
+
+def get_service_edges(service):
+    """Returns a tuple of (dependency UIDs, source UIDs) of the service
+    """
+    uid = api.get_uid(service)
+    calculation = service.getCalculation()
+    method = service.getMethod()
+    instrument = service.getInstrument()
+
+    dependencies = []
+    if calculation:
+        for dep in calculation.getDependentServices():
+            dep_uid = api.get_uid(dep)
+            if dep_uid != uid and dep_uid not in dependencies:
+                dependencies.append(dep_uid)
+
+    sources = [api.get_uid(obj) for obj in (calculation, method, instrument)
+               if obj]
+    return tuple(dependencies), tuple(sources)
+
+
+def closure(edges, uid):
+    """Returns the transitive closure of the given UID in the edges tree
+    """
+    seen = set()
+    stack = list(edges.get(uid, ()))
+    while stack:
+        node = stack.pop()
+        if node in seen or node == uid:
+            continue
+        seen.add(node)
+        stack.extend(edges.get(node, ()))
+    return seen
+
+
+def add_to(tree, key, value):
+    values = tree.get(key, ())
+    if value not in values:
+        tree[key] = values + (value, )
+
+
+def remove_from(tree, key, value):
+    values = tree.get(key, ())
+    if value not in values:
+        return
+    values = tuple(filter(lambda v: v != value, values))
+    if values:
+        tree[key] = values
+    else:
+        del tree[key]
+
+
+class ServiceDependencyGraph(object):
+    """Persistent service dependency graph
+    """
+    implements(IServiceDependencyGraph)
+
+    @property
+    def storage(self):
+        """The graph storage, built on first access
+        """
+        annotation = get_setup_annotation()
+        storage = annotation.get(SERVICE_GRAPH_STORAGE)
+        if storage is None:
+            storage = self.init_storage()
+            self.build(storage)
+        return storage
+
+    def init_storage(self):
+        """Create a new, empty graph storage
+        """
+        storage = OOBTree()
+        for name in TREES:
+            storage[name] = OOBTree()
+        get_setup_annotation()[SERVICE_GRAPH_STORAGE] = storage
+        return storage
+
+    def flush(self):
+        """Delete the graph storage
+        """
+        annotation = get_setup_annotation()
+        if annotation.get(SERVICE_GRAPH_STORAGE) is not None:
+            del annotation[SERVICE_GRAPH_STORAGE]
+
+    def rebuild(self):
+        """Rebuild the graph from scratch
+        """
+        self.flush()
+        storage = self.init_storage()
+        self.build(storage)
+
+    def build(self, storage):
+        """Populate the given storage with all services
+        """
+        bsc = api.get_tool("bika_setup_catalog")
+        services = bsc(portal_type="AnalysisService")
+        logger.info("Building service dependency graph for {} services"
+                    .format(len(services)))
+
+        deps = storage[DEPENDENCIES]
+        for brain in services:
+            service = api.get_object(brain)
+            uid = api.get_uid(service)
+            dependencies, sources = get_service_edges(service)
+            if dependencies:
+                deps[uid] = dependencies
+            for dep_uid in dependencies:
+                add_to(storage[DEPENDANTS], dep_uid, uid)
+            self._set_sources(storage, uid, sources)
+
+        for uid in deps.keys():
+            storage[ALL_DEPENDENCIES][uid] = tuple(closure(deps, uid))
+        dependants = storage[DEPENDANTS]
+        for uid in dependants.keys():
+            storage[ALL_DEPENDANTS][uid] = tuple(closure(dependants, uid))
+
+    def _set_sources(self, storage, uid, sources):
+        old_sources = storage[SOURCES].get(uid, ())
+        for source_uid in set(old_sources).difference(sources):
+            remove_from(storage[SERVICES_BY_SOURCE], source_uid, uid)
+        for source_uid in sources:
+            add_to(storage[SERVICES_BY_SOURCE], source_uid, uid)
+        if sources:
+            storage[SOURCES][uid] = sources
+        elif uid in storage[SOURCES]:
+            del storage[SOURCES][uid]
+
+    def _set_closure(self, tree, uid, values):
+        if values:
+            tree[uid] = tuple(values)
+        elif uid in tree:
+            del tree[uid]
+
+    def _set_dependencies(self, storage, uid, dependencies):
+        """Set the direct dependencies of a service and update the closures
+        of all affected services
+        """
+        deps = storage[DEPENDENCIES]
+        dependants = storage[DEPENDANTS]
+        old_dependencies = deps.get(uid, ())
+        if set(old_dependencies) == set(dependencies):
+            return
+
+        # remember the old descendants for the reverse closures
+        old_descendants = set(storage[ALL_DEPENDENCIES].get(uid, ()))
+
+        # update the direct edges
+        for dep_uid in set(old_dependencies).difference(dependencies):
+            remove_from(dependants, dep_uid, uid)
+        for dep_uid in dependencies:
+            add_to(dependants, dep_uid, uid)
+        self._set_closure(deps, uid, dependencies)
+
+        # the dependencies of the service and all its (transitive) dependants
+        # changed
+        for node in closure(dependants, uid).union([uid]):
+            self._set_closure(storage[ALL_DEPENDENCIES], node,
+                              closure(deps, node))
+
+        # the dependants of the service and all its old and new
+        # dependencies changed
+        new_descendants = set(storage[ALL_DEPENDENCIES].get(uid, ()))
+        for node in old_descendants.union(new_descendants).union([uid]):
+            self._set_closure(storage[ALL_DEPENDANTS], node,
+                              closure(dependants, node))
+
+    def update_service(self, service):
+        """Update the edges of the given service
+        """
+        storage = self.storage
+        uid = api.get_uid(service)
+        dependencies, sources = get_service_edges(service)
+        self._set_dependencies(storage, uid, dependencies)
+        self._set_sources(storage, uid, sources)
+
+    def remove_service(self, service_or_uid):
+        """Remove the given service from the graph
+        """
+        storage = self.storage
+        uid = self._get_uid(service_or_uid)
+        self._set_dependencies(storage, uid, ())
+        self._set_sources(storage, uid, ())
+
+    def update_source(self, obj):
+        """Update all services derived from the given Calculation, Method or
+        Instrument
+        """
+        uid = api.get_uid(obj)
+        for service_uid in self.storage[SERVICES_BY_SOURCE].get(uid, ()):
+            service = api.get_object_by_uid(service_uid, None)
+            if service is None:
+                self.remove_service(service_uid)
+            else:
+                self.update_service(service)
+
+    def _get_uid(self, service_or_uid):
+        if isinstance(service_or_uid, basestring):
+            return service_or_uid
+        return api.get_uid(service_or_uid)
+
+    def get_dependencies(self, service_or_uid, recursive=True):
+        """Returns the UIDs of the services the given service depends on
+        """
+        tree = recursive and ALL_DEPENDENCIES or DEPENDENCIES
+        uid = self._get_uid(service_or_uid)
+        return list(self.storage[tree].get(uid, ()))
+
+    def get_dependants(self, service_or_uid, recursive=True):
+        """Returns the UIDs of the services which depend on the given service
+        """
+        tree = recursive and ALL_DEPENDANTS or DEPENDANTS
+        uid = self._get_uid(service_or_uid)
+        return list(self.storage[tree].get(uid, ()))
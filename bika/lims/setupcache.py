@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from zope.annotation.interfaces import IAnnotations
+
+from bika.lims import api
+from bika.lims import logger
+
+"""Setup data cache invalidation
+
+Data derived from the setup items (services, calculations, methods, sample
+types, specifications etc.) can be cached safely as long as the cache key
+contains the current setup stamp. The stamp is a persistent counter stored
+on `bika_setup`, which is incremented whenever an object inside `bika_setup`
+or the methods folder is modified, added, moved or removed. Because the
+counter is persistent, all ZEO clients see the new stamp after the
+invalidating transaction commits.
+"""
+
+SETUP_STAMP_STORAGE = "bika.lims.setupcache.stamp"
+
+
+def get_setup_annotation():
+    """Annotation storage bound to `bika_setup`
+    """
+    bika_setup = api.get_bika_setup()
+    if bika_setup is None:
+        return None
+    return IAnnotations(bika_setup)
+
+
+def get_setup_stamp():
+    """Returns the current setup modification stamp
+    """
+    annotation = get_setup_annotation()
+    if annotation is None:
+        return 0
+    return annotation.get(SETUP_STAMP_STORAGE, 0)
+
+
+def invalidate_setup_cache():
+    """Increments the setup stamp, which invalidates all cached setup data
+    """
+    annotation = get_setup_annotation()
+    if annotation is None:
+        return
+    stamp = annotation.get(SETUP_STAMP_STORAGE, 0) + 1
+    annotation[SETUP_STAMP_STORAGE] = stamp
+    logger.debug("Setup cache invalidated (stamp={})".format(stamp))
+
+
+def get_setup_paths():
+    """Returns the physical paths of the folders containing setup items
+    """
+    paths = []
+    bika_setup = api.get_bika_setup()
+    if bika_setup is not None:
+        paths.append(bika_setup.getPhysicalPath())
+        methods = getattr(api.get_portal(), "methods", None)
+        if methods is not None:
+            paths.append(methods.getPhysicalPath())
+    return paths
+
+
+def is_setup_item(obj):
+    """Checks if the object is located inside `bika_setup` or the methods
+    folder
+    """
+    if obj is None or not hasattr(obj, "getPhysicalPath"):
+        return False
+    path = obj.getPhysicalPath()
+    for setup_path in get_setup_paths():
+        if path[:len(setup_path)] == setup_path:
+            return True
+    return False
+
@@ -516,6 +516,7 @@ class BikaGenerator:
         addIndex(bac, 'getRawSampleTypes', 'KeywordIndex')
         addIndex(bac, 'getRetested', 'FieldIndex')
         addIndex(bac, 'getReferenceAnalysesGroupID', 'FieldIndex')
+        addIndex(bac, 'getLate', 'FieldIndex')
 
         addColumn(bac, 'path')
         addColumn(bac, 'UID')
@@ -533,7 +534,21 @@ class BikaGenerator:
         addColumn(bac, 'getRequestID')
         addColumn(bac, 'getReferenceAnalysesGroupID')
         addColumn(bac, 'getResultCaptureDate')
+        addColumn(bac, 'getAnalyst')
         addColumn(bac, 'Priority')
+        addColumn(bac, 'getDueDate')
+        addColumn(bac, 'getDateReceived')
+        addColumn(bac, 'getLate')
+        addColumn(bac, 'getClientTitle')
+        addColumn(bac, 'getClientPath')
+        addColumn(bac, 'getRequestPath')
+        addColumn(bac, 'getContactTitle')
+        addColumn(bac, 'getContactEmail')
+        addColumn(bac, 'getDepartmentUID')
+        addColumn(bac, 'getServiceTitle')
+        addColumn(bac, 'getWorksheetUID')
+        addColumn(bac, 'getWorksheetTitle')
+        addColumn(bac, 'getWorksheetPath')
 
         # bika_catalog
 
@@ -618,6 +633,7 @@ class BikaGenerator:
         addIndex(bc, 'getWorksheetTemplateTitle', 'FieldIndex')
         addIndex(bc, 'Priority', 'FieldIndex')
         addIndex(bc, 'BatchUID', 'FieldIndex')
+        addIndex(bc, 'getLate', 'FieldIndex')
         addColumn(bc, 'path')
         addColumn(bc, 'UID')
         addColumn(bc, 'id')
@@ -648,6 +664,7 @@ class BikaGenerator:
         addColumn(bc, 'getDateReceived')
         addColumn(bc, 'getDateSampled')
         addColumn(bc, 'review_state')
+        addColumn(bc, 'getLate')
 
         # bika_setup_catalog
 
@@ -816,6 +833,7 @@ class BikaGenerator:
         addColumn(bsc, 'getTotalPrice')
         addColumn(bsc, 'getUnit')
         addColumn(bsc, 'getVATAmount')
+        addColumn(bsc, 'getValidityStatus')
         addColumn(bsc, 'getVolume')
 
     def setupTopLevelFolders(self, context):
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from BTrees.OOBTree import OOBTree
+from zope.interface import implements
+
+from bika.lims import api
+from bika.lims import logger
+from bika.lims.interfaces import IAnalysisRequest
+from bika.lims.interfaces import IReferenceSample
+from bika.lims.interfaces import ISpecificationIndex
+from bika.lims.setupcache import get_setup_annotation
+from bika.lims.utils import dicts_to_dict
+
+"""Specification Index
+
+Persistent index of the results ranges of the Analysis Specifications, keyed
+by (owner UID, sample type UID, service keyword). The owner is the Client for
+client specifications and the `bika_analysisspecs` folder for lab
+specifications, i.e. the same UID as the `getClientUID` index of the specs.
+
+The results range of an analysis is resolved with a few lookups instead of
+catalog queries and waking up the specifications:
+
+- the results range of the Analysis Request (specification="ar" or None)
+- the client specification (specification="client" or None)
+- the lab specification (specification="lab" or None)
+
+The index is updated when a specification is modified, added, moved or
+removed (see `bika.lims.subscribers.specindex`).
+"""
+
+SPEC_INDEX_STORAGE = "bika.lims.specindex"
+
+# spec UID -> (owner UID, sample type UID, tuple of keywords)
+SPECS = "specs"
+# (owner UID, sample type UID, keyword) -> ((spec UID, range dict), ...)
+RANGES = "ranges"
+
+TREES = (SPECS, RANGES)
+
+# the results range subfields which are not part of the range dict
+SKIP_SUBFIELDS = ("uid", "keyword")
+
+# containers of specifications
+OWNER_TYPES = ("Client", "AnalysisSpecs")
+
+
+def get_spec_ranges(spec):
+    """Returns a tuple of (owner UID, sample type UID, {keyword: range}) of
+    the specification, None if the specification is not located in a client
+    or the lab specifications folder (e.g. in the portal factory)
+    """
+    parent = api.get_parent(spec)
+    if api.get_portal_type(parent) not in OWNER_TYPES:
+        return None
+    sampletype = spec.getSampleType()
+    sampletype_uid = sampletype and api.get_uid(sampletype) or ""
+    subfields = spec.Schema()["ResultsRange"].subfields
+    ranges = {}
+    for record in spec.getResultsRange() or []:
+        keyword = record.get("keyword")
+        if not keyword:
+            continue
+        ranges[keyword] = dict([(key, record.get(key, ""))
+                                for key in subfields
+                                if key not in SKIP_SUBFIELDS])
+    return api.get_uid(parent), sampletype_uid, ranges
+
+
+class SpecificationIndex(object):
+    """Persistent specification index
+    """
+    implements(ISpecificationIndex)
+
+    @property
+    def storage(self):
+        """The index storage, built on first access
+        """
+        annotation = get_setup_annotation()
+        storage = annotation.get(SPEC_INDEX_STORAGE)
+        if storage is None:
+            storage = self.init_storage()
+            self.build(storage)
+        return storage
+
+    def init_storage(self):
+        """Create a new, empty index storage
+        """
+        storage = OOBTree()
+        for name in TREES:
+            storage[name] = OOBTree()
+        get_setup_annotation()[SPEC_INDEX_STORAGE] = storage
+        return storage
+
+    def flush(self):
+        """Delete the index storage
+        """
+        annotation = get_setup_annotation()
+        if annotation.get(SPEC_INDEX_STORAGE) is not None:
+            del annotation[SPEC_INDEX_STORAGE]
+
+    def rebuild(self):
+        """Rebuild the index from scratch
+        """
+        self.flush()
+        storage = self.init_storage()
+        self.build(storage)
+
+    def build(self, storage):
+        """Populate the given storage with all specifications
+        """
+        bsc = api.get_tool("bika_setup_catalog")
+        specs = bsc(portal_type="AnalysisSpec")
+        logger.info("Building specification index for {} specifications"
+                    .format(len(specs)))
+        for brain in specs:
+            self._update(storage, api.get_object(brain))
+
+    def _add_range(self, storage, key, spec_uid, rr):
+        ranges = storage[RANGES]
+        values = filter(lambda v: v[0] != spec_uid, ranges.get(key, ()))
+        ranges[key] = tuple(sorted(values + [(spec_uid, rr)]))
+
+    def _remove_range(self, storage, key, spec_uid):
+        ranges = storage[RANGES]
+        values = filter(lambda v: v[0] != spec_uid, ranges.get(key, ()))
+        if values:
+            ranges[key] = tuple(values)
+        elif key in ranges:
+            del ranges[key]
+
+    def _remove(self, storage, spec_uid):
+        record = storage[SPECS].get(spec_uid)
+        if record is None:
+            return
+        owner_uid, sampletype_uid, keywords = record
+        for keyword in keywords:
+            self._remove_range(storage, (owner_uid, sampletype_uid, keyword),
+                               spec_uid)
+        del storage[SPECS][spec_uid]
+
+    def _update(self, storage, spec):
+        spec_uid = api.get_uid(spec)
+        self._remove(storage, spec_uid)
+        record = get_spec_ranges(spec)
+        if record is None:
+            return
+        owner_uid, sampletype_uid, ranges = record
+        storage[SPECS][spec_uid] = (owner_uid, sampletype_uid,
+                                    tuple(ranges.keys()))
+        for keyword, rr in ranges.items():
+            self._add_range(storage, (owner_uid, sampletype_uid, keyword),
+                            spec_uid, rr)
+
+    def update_spec(self, spec):
+        """Update the results ranges of the given specification
+        """
+        self._update(self.storage, spec)
+
+    def remove_spec(self, spec_or_uid):
+        """Remove the given specification from the index
+        """
+        uid = spec_or_uid
+        if not isinstance(uid, basestring):
+            uid = api.get_uid(spec_or_uid)
+        self._remove(self.storage, uid)
+
+    def get_lab_uid(self):
+        return api.get_uid(api.get_bika_setup().bika_analysisspecs)
+
+    def get_owner_uids(self, client_uid, specification=None):
+        """Returns the owner UIDs to look up in order of priority
+        """
+        if specification == "client":
+            return [client_uid]
+        if specification is None:
+            return [client_uid, self.get_lab_uid()]
+        return [self.get_lab_uid()]
+
+    def lookup(self, client_uid, sampletype_uid, keyword,
+               specification=None):
+        """Returns a tuple of (spec UID, range dict) of the specification to
+        apply, (None, {}) if no specification is available
+        """
+        ranges = self.storage[RANGES]
+        for owner_uid in self.get_owner_uids(client_uid, specification):
+            values = ranges.get((owner_uid, sampletype_uid, keyword))
+            if values:
+                spec_uid, rr = values[0]
+                return spec_uid, dict(rr)
+        return None, {}
+
+    def get_ranges(self, analyses, specification=None):
+        """Returns a dict of analysis UID -> results range for the given
+        analyses. The results range of the Analysis Request has priority over
+        the client and lab specifications (see `lookup`).
+        """
+        out = {}
+        # AR infos, computed once for all its analyses
+        ars = {}
+        for analysis in analyses:
+            uid = api.get_uid(analysis)
+            an = analysis
+            while an and api.get_portal_type(an) in ("DuplicateAnalysis",
+                                                     "RejectAnalysis"):
+                an = an.getAnalysis()
+            ar = an and api.get_parent(an) or None
+            if not IAnalysisRequest.providedBy(ar):
+                out[uid] = {}
+                continue
+
+            ar_uid = api.get_uid(ar)
+            if ar_uid not in ars:
+                ar_ranges = {}
+                if specification in ("ar", None):
+                    ar_ranges = dicts_to_dict(ar.getResultsRange(), "keyword")
+                # No specifications available for ReferenceSamples
+                sample = ar.getSample()
+                has_specs = sample is not None and \
+                    not IReferenceSample.providedBy(sample)
+                sampletype = has_specs and sample.getSampleType() or None
+                sampletype_uid = sampletype and api.get_uid(sampletype) or ""
+                ars[ar_uid] = (ar_ranges, api.get_uid(api.get_parent(ar)),
+                               sampletype_uid, has_specs)
+            ar_ranges, client_uid, sampletype_uid, has_specs = ars[ar_uid]
+
+            keyword = analysis.getKeyword()
+            rr = dict(ar_ranges.get(keyword, {}))
+            if not rr and has_specs:
+                rr = self.lookup(client_uid, sampletype_uid, an.getKeyword(),
+                                 specification)[1]
+            if rr:
+                rr["uid"] = uid
+            out[uid] = rr
+        return out
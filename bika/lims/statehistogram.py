@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from BTrees.OOBTree import OOBTree
+from zope.annotation.interfaces import IAnnotations
+
+from bika.lims import api
+from bika.lims import logger
+from bika.lims.interfaces import IAnalysis
+from bika.lims.interfaces import IAnalysisRequest
+from bika.lims.interfaces import IDuplicateAnalysis
+from bika.lims.interfaces import IReferenceAnalysis
+from bika.lims.interfaces import IWorksheet
+
+"""Review state histogram of the analyses of an AR or Worksheet
+
+Escalating an analysis transition to the AR or Worksheet requires to know if
+any of the other analyses is still in a given review state. Instead of waking
+up and checking all analyses for every transition, ARs and Worksheets keep a
+persistent histogram of the review states of their analyses.
+
+The histogram is built on first access and maintained afterwards:
+
+- analysis transitions (bika.lims.workflow.AfterTransitionEventHandler) and
+  forced state changes (bika.lims.utils.changeWorkflowState) update the
+  state of the analysis in all histograms it is a member of
+- analyses added to an AR discard the histogram of the AR, removed analyses
+  are removed from it (bika.lims.subscribers.analysis)
+- Worksheet.setAnalyses updates the members of the Worksheet histogram
+
+`rebuild` recomputes the histogram from the current analyses, e.g. to repair
+an inconsistent histogram.
+"""
+
+STATE_HISTOGRAM_STORAGE = "bika.lims.statehistogram"
+
+MEMBERS = "members"
+COUNTS = "counts"
+
+# Analyses in these states prevent the escalation of the transition to the
+# AR or Worksheet
+SUBMIT_PENDING_STATES = (
+    "to_be_sampled", "to_be_preserved", "sample_due", "sample_received")
+ATTACH_PENDING_STATES = SUBMIT_PENDING_STATES + ("attachment_due", )
+VERIFY_PENDING_STATES = ATTACH_PENDING_STATES + ("to_be_verified", )
+PUBLISH_PENDING_STATES = VERIFY_PENDING_STATES + ("verified", )
+
+
+def get_state(obj):
+    """Returns the review state of the object
+    """
+    workflow = api.get_tool("portal_workflow")
+    return workflow.getInfoFor(obj, "review_state", "")
+
+
+def get_members(container):
+    """Returns the analyses of the AR or Worksheet, None for other objects
+    """
+    if IAnalysisRequest.providedBy(container):
+        return container.objectValues("Analysis")
+    if IWorksheet.providedBy(container):
+        return container.getAnalyses()
+    return None
+
+
+def get_annotation(container):
+    return IAnnotations(container)
+
+
+def get_storage(container, create=True):
+    """Returns the histogram of the container. The histogram is built if it
+    does not exist yet, unless create is False.
+    """
+    storage = get_annotation(container).get(STATE_HISTOGRAM_STORAGE)
+    if storage is None and create:
+        storage = rebuild(container)
+    return storage
+
+
+def flush(container):
+    """Discard the histogram of the container
+    """
+    annotation = get_annotation(container)
+    if annotation.get(STATE_HISTOGRAM_STORAGE) is not None:
+        del annotation[STATE_HISTOGRAM_STORAGE]
+
+
+def rebuild(container):
+    """Build the histogram of the container from its current analyses
+    """
+    members = get_members(container)
+    if members is None:
+        return None
+    storage = OOBTree()
+    storage[MEMBERS] = OOBTree()
+    storage[COUNTS] = OOBTree()
+    for member in members:
+        _set_state(storage, api.get_uid(member), get_state(member))
+    get_annotation(container)[STATE_HISTOGRAM_STORAGE] = storage
+    logger.debug("Built state histogram of {}: {}".format(
+        api.get_id(container), dict(storage[COUNTS].items())))
+    return storage
+
+
+def _set_state(storage, uid, state):
+    members = storage[MEMBERS]
+    counts = storage[COUNTS]
+    old_state = members.get(uid)
+    if old_state == state:
+        return
+    if old_state is not None:
+        count = counts.get(old_state, 0) - 1
+        if count > 0:
+            counts[old_state] = count
+        elif old_state in counts:
+            del counts[old_state]
+    if state is None:
+        del members[uid]
+    else:
+        members[uid] = state
+        counts[state] = counts.get(state, 0) + 1
+
+
+def remove_member(container, obj):
+    """Remove the analysis from the histogram of the container
+    """
+    storage = get_storage(container, create=False)
+    if storage is None:
+        return
+    uid = api.get_uid(obj)
+    if uid in storage[MEMBERS]:
+        _set_state(storage, uid, None)
+
+
+def set_members(container, uids):
+    """Update the histogram of the container to the analyses with the given
+    UIDs
+    """
+    storage = get_storage(container, create=False)
+    if storage is None:
+        return
+    uids = set(uids)
+    for uid in list(storage[MEMBERS].keys()):
+        if uid not in uids:
+            _set_state(storage, uid, None)
+    for uid in uids:
+        if uid not in storage[MEMBERS]:
+            member = api.get_object_by_uid(uid)
+            _set_state(storage, uid, get_state(member))
+
+
+def is_analysis(obj):
+    return IAnalysis.providedBy(obj) or \
+        IReferenceAnalysis.providedBy(obj) or \
+        IDuplicateAnalysis.providedBy(obj)
+
+
+def get_containers(obj):
+    """Returns the AR and Worksheets the analysis is a member of
+    """
+    containers = []
+    parent = api.get_parent(obj)
+    if IAnalysisRequest.providedBy(parent):
+        containers.append(parent)
+    containers.extend(obj.getBackReferences("WorksheetAnalysis"))
+    return containers
+
+
+def update_state(obj, state=None):
+    """Update the state of the analysis in the histograms of its AR and
+    Worksheets. The current review state is used if no state is given.
+    """
+    if not is_analysis(obj):
+        return
+    uid = api.get_uid(obj)
+    for container in get_containers(obj):
+        storage = get_storage(container, create=False)
+        if storage is None or uid not in storage[MEMBERS]:
+            continue
+        if state is None:
+            state = get_state(obj)
+        _set_state(storage, uid, state)
+
+
+def get_counts(container):
+    """Returns a dict of review state -> number of analyses
+    """
+    storage = get_storage(container)
+    if storage is None:
+        return {}
+    return dict(storage[COUNTS].items())
+
+
+def has_states(container, states):
+    """Checks if any of the analyses of the container is in one of the given
+    review states
+    """
+    counts = get_storage(container)[COUNTS]
+    for state in states:
+        if counts.get(state, 0) > 0:
+            return True
+    return False
+
+
+def is_empty(container):
+    """Checks if the container has no analyses
+    """
+    return len(get_storage(container)[MEMBERS]) == 0
+
+
+def rebuild_all():
+    """Rebuild all existing histograms. Returns the number of rebuilt
+    histograms.
+    """
+    query = {"portal_type": ["AnalysisRequest", "Worksheet"]}
+    brains = api.search(query, "bika_catalog")
+    count = 0
+    for brain in brains:
+        container = api.get_object(brain)
+        if get_storage(container, create=False) is not None:
+            rebuild(container)
+            count += 1
+    logger.info("Rebuilt {} state histograms".format(count))
+    return count
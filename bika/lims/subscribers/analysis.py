@@ -6,8 +6,10 @@
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
 from AccessControl import getSecurityManager
+from Acquisition import aq_base
 from Acquisition import aq_inner
 from bika.lims import logger
+from bika.lims import statehistogram
 from bika.lims.interfaces import IRoutineAnalysis
 from bika.lims.subscribers import doActionFor
 from bika.lims.subscribers import skip
@@ -66,36 +68,21 @@ def ObjectRemovedEventHandler(instance, event):
     # if all other analyses are at a higher state than this one was.
     workflow = getToolByName(instance, 'portal_workflow')
     ar = instance.aq_parent
-    can_submit = True
-    can_attach = True
-    can_verify = True
-    can_publish = True
+    statehistogram.remove_member(ar, instance)
 
     # We add this manually here, because during admin/ZMI removal,
     # it may possibly not be added by the workflow code.
     if not 'workflow_skiplist' in instance.REQUEST:
         instance.REQUEST['workflow_skiplist'] = []
 
-    for a in ar.getAnalyses():
-        a_state = a.review_state
-        if a_state in \
-           ('to_be_sampled', 'to_be_preserved',
-            'sample_due', 'sample_received',):
-            can_submit = False
-        if a_state in \
-           ('to_be_sampled', 'to_be_preserved',
-            'sample_due', 'sample_received', 'attachment_due',):
-            can_attach = False
-        if a_state in \
-           ('to_be_sampled', 'to_be_preserved',
-            'sample_due', 'sample_received',
-            'attachment_due', 'to_be_verified',):
-            can_verify = False
-        if a_state in \
-           ('to_be_sampled', 'to_be_preserved',
-            'sample_due', 'sample_received',
-            'attachment_due', 'to_be_verified', 'verified',):
-            can_publish = False
+    can_submit = not statehistogram.has_states(
+        ar, statehistogram.SUBMIT_PENDING_STATES)
+    can_attach = not statehistogram.has_states(
+        ar, statehistogram.ATTACH_PENDING_STATES)
+    can_verify = not statehistogram.has_states(
+        ar, statehistogram.VERIFY_PENDING_STATES)
+    can_publish = not statehistogram.has_states(
+        ar, statehistogram.PUBLISH_PENDING_STATES)
 
     # Note: AR adds itself to the skiplist so we have to take it off again
     #       to allow multiple promotions (maybe by more than one deleted instance).
@@ -137,3 +124,18 @@ def ObjectRemovedEventHandler(instance, event):
                 skip(ar, 'assign', unskip=True)
 
     return
+
+
+def ObjectMovedEventHandler(instance, event):
+    """Keep the state histogram of the AR in sync with its analyses
+    """
+    if event.oldParent is not None and event.newParent is not None and \
+            aq_base(event.oldParent) is aq_base(event.newParent):
+        # renamed only
+        return
+    if event.oldParent is not None:
+        statehistogram.remove_member(event.oldParent, instance)
+    if event.newParent is not None:
+        # the initial state of the new analysis is not set yet, the
+        # histogram is rebuilt on next access
+        statehistogram.flush(event.newParent)
@@ -9,6 +9,8 @@ from Products.CMFCore.utils import getToolByName
 from Products.CMFCore import permissions
 from bika.lims.permissions import ManageWorksheets
 from bika.lims.permissions import AddClient, EditClient, ManageClients
+from bika.lims.setupcache import invalidate_setup_cache
+from bika.lims.setupcache import is_setup_item
 
 def BikaSetupModifiedEventHandler(instance, event):
     """ Event fired when BikaSetup object gets modified.
@@ -46,3 +48,15 @@ def BikaSetupModifiedEventHandler(instance, event):
         mp(EditClient, roles, 0)
         mp(permissions.ModifyPortalContent, roles, 0)
         obj.reindexObject()
+
+
+def SetupItemModifiedEventHandler(obj, event):
+    """ Event fired when an object gets modified, added, moved or removed.
+        Invalidates the cached setup data if the object lives in bika_setup
+    """
+    parents = [obj, getattr(event, "oldParent", None),
+               getattr(event, "newParent", None)]
+    for parent in parents:
+        if is_setup_item(parent):
+            invalidate_setup_cache()
+            return
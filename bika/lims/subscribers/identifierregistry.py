@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from zope.component import getUtility
+
+from bika.lims import api
+from bika.lims.identifierregistry import is_registered_type
+from bika.lims.interfaces import IIdentifierRegistry
+
+"""Keep the identifier registry up to date
+"""
+
+
+def is_temporary(obj):
+    return "portal_factory" in obj.getPhysicalPath()
+
+
+def update(obj):
+    registry = getUtility(IIdentifierRegistry)
+    registry.update(obj)
+    # The Analysis Requests share the Client Sample ID of their Sample
+    if api.get_portal_type(obj) == "Sample":
+        for ar in obj.getAnalysisRequests():
+            registry.update(ar)
+
+
+def ObjectModifiedEventHandler(obj, event):
+    """Update the identifiers of the created or modified object
+    """
+    if not is_registered_type(obj) or is_temporary(obj):
+        return
+    update(obj)
+
+
+def ObjectMovedEventHandler(obj, event):
+    """Update the identifiers when an object is added, renamed or removed
+    """
+    if not is_registered_type(obj) or is_temporary(obj):
+        return
+    if event.newParent is None:
+        getUtility(IIdentifierRegistry).remove(obj)
+    else:
+        update(obj)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from bika.lims import api
+from bika.lims import instrumentvalidity
+from bika.lims.interfaces import IInstrument
+
+
+def InstrumentModifiedEventHandler(instrument, event):
+    """Recompute the validity status of a modified instrument
+    """
+    if instrument.checkCreationFlag():
+        return
+    instrumentvalidity.update(instrument)
+
+
+def InstrumentPeriodModifiedEventHandler(obj, event):
+    """Recompute the validity status of the instrument when one of its
+    certifications, validations or calibrations is modified or removed
+    """
+    instrument = getattr(event, "oldParent", None) or api.get_parent(obj)
+    if not IInstrument.providedBy(instrument):
+        return
+    instrumentvalidity.update(instrument)
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from bika.lims import qcstats
+
+"""Keep the QC statistics up to date
+"""
+
+
+def ReferenceAnalysisRemovedEventHandler(analysis, event):
+    """Remove the reference analysis from its QC series
+    """
+    qcstats.remove_analysis(analysis)
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from bika.lims.utils import HIDDEN_ATTRIBUTES_RECORD
+from bika.lims.utils import invalidate_hidden_attributes
+
+
+def RecordModifiedEventHandler(record, event):
+    """Increment the version of the hidden attributes when the record
+    changes, so they are compiled again
+    """
+    if record.__name__ == HIDDEN_ATTRIBUTES_RECORD:
+        invalidate_hidden_attributes()
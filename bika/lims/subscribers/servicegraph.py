@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from zope.component import getUtility
+
+from bika.lims.interfaces import IServiceDependencyGraph
+
+"""Keep the service dependency graph up to date
+"""
+
+
+def ServiceModifiedEventHandler(service, event):
+    """Update the dependencies of the modified service
+    """
+    if service.checkCreationFlag():
+        return
+    getUtility(IServiceDependencyGraph).update_service(service)
+
+
+def ServiceRemovedEventHandler(service, event):
+    """Remove the service from the dependency graph
+    """
+    getUtility(IServiceDependencyGraph).remove_service(service)
+
+
+def SourceModifiedEventHandler(obj, event):
+    """Update all services which get their calculation from the modified (or
+    removed) Calculation, Method or Instrument
+    """
+    getUtility(IServiceDependencyGraph).update_source(obj)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from zope.component import getUtility
+
+from bika.lims.interfaces import ISpecificationIndex
+
+"""Keep the specification index up to date
+"""
+
+
+def SpecModifiedEventHandler(spec, event):
+    """Update the results ranges of the modified specification
+    """
+    getUtility(ISpecificationIndex).update_spec(spec)
+
+
+def SpecMovedEventHandler(spec, event):
+    """Update the index when a specification is added, moved or removed
+    """
+    if event.newParent is None:
+        getUtility(ISpecificationIndex).remove_spec(spec)
+    else:
+        getUtility(ISpecificationIndex).update_spec(spec)
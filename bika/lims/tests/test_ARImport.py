@@ -6,15 +6,20 @@
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
 from Products.CMFPlone.utils import _createObjectByType
+from bika.lims import arimportjob
 from bika.lims import logger
+from bika.lims.content.arimport import ARImport
 # from bika.lims.content.analysis import Analysis
 from bika.lims.testing import BIKA_SIMPLE_FIXTURE
 from bika.lims.tests.base import BikaSimpleTestCase
 from bika.lims.utils import tmpID
+from bika.lims.utils.arimport import ImportLookups
+from bika.lims.utils.arimport import get_lookups
 from bika.lims.workflow import doActionFor
 from plone.app.testing import login, logout
 from plone.app.testing import TEST_USER_NAME
 from Products.CMFCore.utils import getToolByName
+from zope.globalrequest import setRequest
 
 import re
 import transaction
@@ -144,6 +149,10 @@ Total price excl Tax,,,,,,,,,,,,,,
                   for a in analyses]
         if states != ['sampled'] * 12:
             self.fail('Analysis states should all be sampled, but are not!')
+        # the import job recorded all the rows
+        progress = arimportjob.get_progress(arimport)
+        if progress['status'] != 'done' or progress['done'] != 4:
+            self.fail('Import job not done: %s' % progress)
 
     def test_LIMS_2080_correctly_interpret_false_and_blank_values(self):
         pc = getToolByName(self.portal, 'portal_catalog')
@@ -383,6 +392,195 @@ Total price excl Tax,,,,,,,,,,,,,,
         if samplers != [None] * 2:
             self.fail('Analysis samplers should all be None, but are not!')
 
+    def create_arimport(self, count):
+        """Create a valid AR Import with `count` sample rows
+        """
+        workflow = getToolByName(self.portal, 'portal_workflow')
+        arimport = self.addthing(self.client, 'ARImport')
+        arimport.unmarkCreationFlag()
+        arimport.setFilename("test1.csv")
+        row = '"Sample {0}", HHS{0:05d}, 3/9/2014, 3/9/2014,,Toilet, ' \
+              'Liquids, Water, Cup, 0, Normal, 1, 0, 1,0,0,0,0,0'
+        arimport.setOriginalFile("""
+Header,      File name,  Client name,  Client ID, Contact,     CC Names - Report, CC Emails - Report, CC Names - Invoice, CC Emails - Invoice, No of Samples, Client Order Number, Client Reference,,
+Header Data, test1.csv,  Happy Hills,  HH,        Rita Mohale,                  ,                   ,                    ,                    , %s,            HHPO-001,                            ,,
+Samples,    ClientSampleID,    SamplingDate,DateSampled,Sampler,SamplePoint,SampleMatrix,SampleType,ContainerType,ReportDryMatter,Priority,Total number of Analyses or Profiles,Price excl Tax,ECO,SAL,COL,TAS,MicroBio,Properties
+Analysis price,,,,,,,,,,,,,,
+"Total Analyses or Profiles",,,,,,,,,,,,,%s,,,
+Total price excl Tax,,,,,,,,,,,,,,
+%s
+        """ % (count, count,
+               "\n".join([row.format(i + 1) for i in range(count)])))
+        arimport.setErrors([])
+        arimport.save_header_data()
+        arimport.save_sample_data()
+        errors = arimport.getErrors()
+        if errors:
+            self.fail("Unexpected errors while saving data: " + str(errors))
+        # the workflow scripts use response.write(); silence them
+        arimport.REQUEST.response.write = lambda x: x
+        workflow.doActionFor(arimport, 'validate')
+        state = workflow.getInfoFor(arimport, 'review_state')
+        if state != 'valid':
+            self.fail('Validation failed!  %s.Errors: %s' % (
+                arimport.id, arimport.getErrors()))
+        return arimport
+
+    def fail_rows(self, *client_sample_ids):
+        """Make the import of the rows with the given ClientSampleIDs raise,
+        after their objects have been created
+        """
+        import_row = ARImport.__dict__['import_row']
+
+        def failing_import_row(arimport, row, lookups=None):
+            ar = import_row(arimport, row, lookups)
+            if row['ClientSampleID'] in client_sample_ids:
+                raise ValueError("Cannot import %s" % row['ClientSampleID'])
+            return ar
+
+        ARImport.import_row = failing_import_row
+        self.addCleanup(setattr, ARImport, 'import_row', import_row)
+
+    def count_ars(self):
+        bc = getToolByName(self.portal, 'bika_catalog')
+        return len(bc(portal_type='AnalysisRequest'))
+
+    def test_import_in_chunks(self):
+        count = arimportjob.CHUNK_SIZE + 5
+        arimport = self.create_arimport(count)
+        workflow = getToolByName(self.portal, 'portal_workflow')
+        workflow.doActionFor(arimport, 'import')
+        # too many rows to be imported by the transition
+        progress = arimportjob.get_progress(arimport)
+        self.assertEqual(progress['status'], arimportjob.QUEUED)
+        self.assertEqual(progress['done'], 0)
+        self.assertEqual(progress['total'], count)
+        self.assertEqual(self.count_ars(), 0)
+
+        progress = arimportjob.process(arimport, arimportjob.CHUNK_SIZE)
+        self.assertEqual(progress['status'], arimportjob.RUNNING)
+        self.assertEqual(progress['done'], arimportjob.CHUNK_SIZE)
+        self.assertEqual(self.count_ars(), arimportjob.CHUNK_SIZE)
+
+        progress = arimportjob.process(arimport, arimportjob.CHUNK_SIZE)
+        self.assertEqual(progress['status'], arimportjob.DONE)
+        self.assertEqual(progress['done'], count)
+        self.assertEqual(progress['percent'], 100)
+        self.assertEqual(self.count_ars(), count)
+
+        # a done job does nothing
+        arimportjob.start(arimport)
+        progress = arimportjob.process(arimport, arimportjob.CHUNK_SIZE)
+        self.assertEqual(progress['status'], arimportjob.DONE)
+        self.assertEqual(self.count_ars(), count)
+
+    def test_failed_row_is_rolled_back(self):
+        arimport = self.create_arimport(3)
+        self.fail_rows('HHS00002')
+        arimportjob.start(arimport)
+        progress = arimportjob.process(arimport)
+        self.assertEqual(progress['status'], arimportjob.FAILED)
+        self.assertEqual(progress['done'], 1)
+        self.assertTrue(progress['error'].startswith('Row 2: '))
+        self.assertIn('Cannot import HHS00002', progress['error'])
+        # the objects created by the failing row are gone
+        self.assertEqual(len(self.client.objectValues('AnalysisRequest')), 1)
+        self.assertEqual(len(self.client.objectValues('Sample')), 1)
+        self.assertEqual(self.count_ars(), 1)
+        job = arimportjob.get_job(arimport)
+        self.assertEqual(list(job[arimportjob.ROWS].keys()), [0])
+
+    def test_resume_failed_job(self):
+        arimport = self.create_arimport(3)
+        self.fail_rows('HHS00002')
+        arimportjob.start(arimport)
+        arimportjob.process(arimport)
+        job = arimportjob.get_job(arimport)
+        first_uid = job[arimportjob.ROWS][0]
+
+        # the row does not fail anymore, e.g. after fixing the setup
+        self.doCleanups()
+        progress = arimportjob.run(arimport)
+        self.assertEqual(progress['status'], arimportjob.DONE)
+        self.assertEqual(progress['done'], 3)
+        self.assertEqual(progress['error'], '')
+        # the rows imported before the failure are not imported again
+        self.assertEqual(job[arimportjob.ROWS][0], first_uid)
+        self.assertEqual(self.count_ars(), 3)
+        self.assertEqual(len(self.client.objectValues('Sample')), 3)
+
+    def test_resume_partially_processed_job(self):
+        count = arimportjob.CHUNK_SIZE + 5
+        arimport = self.create_arimport(count)
+        arimportjob.start(arimport)
+        arimportjob.process(arimport, arimportjob.CHUNK_SIZE)
+        self.assertEqual(arimportjob.get_pending_count(arimport), 5)
+
+        # e.g. the polling page was closed and the import is started again
+        arimportjob.start(arimport)
+        self.assertEqual(arimportjob.get_progress(arimport)['done'],
+                         arimportjob.CHUNK_SIZE)
+        progress = arimportjob.process(arimport, arimportjob.CHUNK_SIZE)
+        self.assertEqual(progress['status'], arimportjob.DONE)
+        self.assertEqual(progress['done'], count)
+        self.assertEqual(self.count_ars(), count)
+
+    def get_uid(self, portal_type, **kwargs):
+        bsc = getToolByName(self.portal, 'bika_setup_catalog')
+        return bsc(portal_type=portal_type, **kwargs)[0].UID
+
+    def test_lookups_services(self):
+        ecoli = self.get_uid('AnalysisService', getKeyword='ECO')
+        salmonella = self.get_uid('AnalysisService', getKeyword='SAL')
+        # a service titled like the keyword of another one
+        self.addthing(self.portal.bika_setup.bika_analysisservices,
+                      'AnalysisService', title='SAL', Keyword="SAL2")
+        lookups = ImportLookups(self.client)
+        self.assertEqual(lookups.get_service_uid('ECO'), ecoli)
+        self.assertEqual(lookups.get_service_uid('Ecoli'), ecoli)
+        self.assertEqual(lookups.get_service_uid(ecoli), ecoli)
+        # keywords take precedence over titles
+        self.assertEqual(lookups.get_service_uid('SAL'), salmonella)
+        self.assertIsNone(lookups.get_service_uid('Unknown'))
+        self.assertTrue(lookups.is_keyword('ECO'))
+        self.assertFalse(lookups.is_keyword('Ecoli'))
+
+    def test_lookups_profiles(self):
+        ecoli = self.get_uid('AnalysisService', getKeyword='ECO')
+        salmonella = self.get_uid('AnalysisService', getKeyword='SAL')
+        profile = self.get_uid('AnalysisProfile', title='MicroBio')
+        lookups = ImportLookups(self.client)
+        self.assertTrue(lookups.is_profile('MicroBio'))
+        self.assertFalse(lookups.is_profile('ECO'))
+        self.assertEqual(lookups.get_profile_uid('MicroBio'), profile)
+        self.assertEqual(lookups.get_profile_uid(profile), profile)
+        self.assertEqual(sorted(lookups.get_profile_services('MicroBio')),
+                         sorted([ecoli, salmonella]))
+        self.assertIsNone(lookups.get_profile_uid('Unknown'))
+        self.assertIsNone(lookups.get_profile_services('Unknown'))
+
+    def test_lookups_containers_and_samplers(self):
+        cup = self.get_uid('ContainerType', title='Cup')
+        lookups = ImportLookups(self.client)
+        self.assertEqual(lookups.get_container(cup).UID(), cup)
+        self.assertIsNone(lookups.get_container('Unknown'))
+        self.assertEqual(lookups.get_sampler_id('test_sampler'),
+                         'test_sampler')
+        self.assertEqual(lookups.get_sampler_id('Unknown'), '')
+
+    def test_lookups_shared_by_request(self):
+        arimport = self.addthing(self.client, 'ARImport')
+        setRequest(self.request)
+        self.addCleanup(setRequest, None)
+        lookups = get_lookups(arimport)
+        self.assertIs(get_lookups(arimport), lookups)
+        # without request, the lookups are built for each call
+        setRequest(None)
+        self.assertIsNot(get_lookups(arimport), lookups)
+        self.assertIsNot(get_lookups(arimport), get_lookups(arimport))
+        self.assertEqual(get_lookups(arimport).services, lookups.services)
+
+
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestARImports))
@@ -16,6 +16,8 @@ from plone.app.testing import login, logout
 from plone.app.testing import TEST_USER_NAME
 from datetime import date
 from bika.lims.utils.analysisrequest import create_analysisrequest
+from bika.lims.utils.retest import retest_batch
+from bika.lims.workflow import doActionFor
 import unittest
 
 try:
@@ -74,6 +76,44 @@ class TestAnalysisRequestRetract(BikaFunctionalTestCase):
         self.assertEquals(ar.portal_workflow.getInfoFor(ar, 'review_state'),
                                                         'sample_received')
 
+    def test_retract_analyses_of_a_worksheet(self):
+        catalog = getToolByName(self.portal, 'portal_catalog')
+        client = self.portal.clients['client-1']
+        sampletype = self.portal.bika_setup.bika_sampletypes['sampletype-1']
+        values = {'Client': client.UID(),
+                  'Contact': client.getContacts()[0].UID(),
+                  'SamplingDate': '2015-01-01',
+                  'SampleType': sampletype.UID()}
+        services = catalog(portal_type='AnalysisService',
+                           inactive_state='active')[:3]
+        service_uids = [service.getObject().UID() for service in services]
+        ar = create_analysisrequest(client, {}, values, service_uids)
+        wf = getToolByName(ar, 'portal_workflow')
+        wf.doActionFor(ar, 'receive')
+        ws = _createObjectByType("Worksheet", self.portal.worksheets, tmpID())
+        self.request['context_uid'] = ws.UID()
+        analyses = ar.getAnalyses(full_objects=True)
+        for analysis in analyses:
+            ws.addAnalysis(analysis)
+            analysis.setResult('12')
+            wf.doActionFor(analysis, 'submit')
+
+        # The retests are added to the worksheet in one go
+        with retest_batch():
+            for analysis in analyses:
+                # dependents might have been retracted already
+                doActionFor(analysis, 'retract')
+        layout = ws.getLayout()
+        self.assertEquals(len(ws.getRawAnalyses()), 2 * len(analyses))
+        self.assertEquals(len(layout), 2 * len(analyses))
+        positions = dict([(slot['analysis_uid'], slot['position'])
+                          for slot in layout])
+        for analysis in analyses:
+            retest = ar[analysis.getKeyword()]
+            self.assertTrue(retest.getRetested())
+            self.assertEquals(positions[retest.UID()],
+                              positions[analysis.UID()])
+
     def tearDown(self):
         logout()
         super(TestAnalysisRequestRetract, self).tearDown()
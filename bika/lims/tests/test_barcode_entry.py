@@ -13,6 +13,7 @@ from plone.app.testing import login
 from plone.app.testing import TEST_USER_NAME
 from Products.CMFCore.utils import getToolByName
 from bika.lims.barcode import barcode_entry
+from bika.lims.utils.receive import receive_samples
 from DateTime import DateTime
 
 import json
@@ -49,7 +50,7 @@ class TestBarcodeEntry(BikaFunctionalTestCase):
         service = self.addthing(bs.bika_analysisservices, 'AnalysisService', title='Ecoli', Keyword="ECO")
         batch = self.addthing(self.portal.batches, 'Batch', title='B1')
         # Create Sample with single partition
-        self.sample1 = self.addthing(self.client, 'Sample', SampleType=sampletype)
+        self.sample1 = self.addthing(self.client, 'Sample', SampleType=sampletype, ClientSampleID='HHS14001')
         self.sample2 = self.addthing(self.client, 'Sample', SampleType=sampletype)
         self.addthing(self.sample1, 'SamplePartition', Container=container)
         self.addthing(self.sample2, 'SamplePartition', Container=container)
@@ -125,6 +126,33 @@ class TestBarcodeEntry(BikaFunctionalTestCase):
                          "sample1 redirect should be self:%s but it's %s" % (
                              expected, value['url']))
 
+    def test_client_sample_id_resolves_to_sample(self):
+        self.portal.REQUEST['entry'] = 'HHS14001'
+        self.portal.REQUEST['_authenticator'] = self.getAuthenticator()
+        value = json.loads(barcode_entry(self.portal, self.portal.REQUEST)())
+        expected = self.sample1.absolute_url()
+        self.assertEqual(value['url'], expected,
+                         "HHS14001 redirect should be sample1:%s but it's %s" % (
+                             expected, value['url']))
+
+    def test_receive_samples(self):
+        wf = getToolByName(self.portal, 'portal_workflow')
+        entries = ['HHS14001', self.ar3.id, 'HHS14001', 'unknown']
+        outcomes = receive_samples(entries)
+        self.assertTrue(outcomes['HHS14001']['received'])
+        self.assertEqual(outcomes['HHS14001']['uid'], self.sample1.UID())
+        self.assertTrue(outcomes[self.ar3.id]['received'])
+        self.assertEqual(outcomes[self.ar3.id]['uid'], self.sample2.UID())
+        self.assertFalse(outcomes['unknown']['received'])
+        for obj in self.sample1, self.ar1, self.ar2, self.sample2, self.ar3:
+            state = wf.getInfoFor(obj, 'review_state')
+            self.assertEqual(state, 'sample_received')
+        # scanning a received sample again does not receive it twice
+        outcomes = receive_samples([self.sample1.id])
+        self.assertFalse(outcomes[self.sample1.id]['received'])
+        self.assertEqual(outcomes[self.sample1.id]['review_state'],
+                         'sample_received')
+
 
 def test_sample_with_single_ar_redirects_to_AR(self):
     self.portal.REQUEST['entry'] = self.sample2.id
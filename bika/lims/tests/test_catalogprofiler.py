@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from Products.CMFPlone.utils import _createObjectByType
+from bika.lims import catalogprofiler
+from bika.lims.testing import BIKA_SIMPLE_FIXTURE
+from bika.lims.tests.base import BikaSimpleTestCase
+from bika.lims.utils import tmpID
+from plone.app.testing import login
+from plone.app.testing import TEST_USER_NAME
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class TestCatalogProfiler(BikaSimpleTestCase):
+
+    def setUp(self):
+        super(TestCatalogProfiler, self).setUp()
+        login(self.portal, TEST_USER_NAME)
+        folder = self.portal.bika_setup.bika_analysisservices
+        self.services = []
+        for title, keyword in (("Ecoli", "ECO"), ("Salmonella", "SAL")):
+            service = _createObjectByType("AnalysisService", folder, tmpID())
+            service.unmarkCreationFlag()
+            service.edit(title=title, Keyword=keyword)
+            self.services.append(service)
+        catalogprofiler.reset()
+
+    def tearDown(self):
+        catalogprofiler.disable()
+        catalogprofiler.reset()
+        super(TestCatalogProfiler, self).tearDown()
+
+    def test_query_shape(self):
+        query = {"portal_type": ["Sample", "AnalysisRequest"],
+                 "getDateReceived": {"query": 0, "range": "min"},
+                 "review_state": "sample_due",
+                 "sort_on": "created"}
+        self.assertEqual(
+            catalogprofiler.get_query_shape(query),
+            "getDateReceived:query,range portal_type:list "
+            "review_state:value sort_on=created")
+
+    def test_disabled_profiler_records_nothing(self):
+        bsc = self.portal.bika_setup_catalog
+        bsc(portal_type="AnalysisService")
+        self.assertEqual(catalogprofiler.get_query_stats(), [])
+
+    def test_profiler_records_queries(self):
+        catalogprofiler.enable()
+        bsc = self.portal.bika_setup_catalog
+        brains = bsc(portal_type="AnalysisService", sort_on="sortable_title")
+        bsc(portal_type="SampleType", sort_on="sortable_title")
+        self.assertTrue(set([service.UID() for service in self.services])
+                        <= set([brain.UID for brain in brains]))
+        for brain in brains:
+            brain.Title
+        stats = catalogprofiler.get_query_stats("bika_setup_catalog")
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]["calls"], 2)
+        self.assertTrue(stats[0]["results"] >= len(self.services))
+        self.assertEqual(stats[0]["shape"],
+                         "portal_type:value sort_on=sortable_title")
+        hits = dict(catalogprofiler.get_index_hits(bsc))
+        self.assertEqual(hits["portal_type"], 2)
+        self.assertEqual(hits["sortable_title"], 2)
+        reads = dict(catalogprofiler.get_column_reads(bsc))
+        self.assertEqual(reads["Title"], len(brains))
+        unused = catalogprofiler.get_unused_columns(bsc)
+        self.assertNotIn("Title", unused)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestCatalogProfiler))
+    suite.layer = BIKA_SIMPLE_FIXTURE
+    return suite
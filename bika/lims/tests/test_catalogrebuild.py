@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from bika.lims import api
+from bika.lims import catalogrebuild
+from bika.lims.testing import BIKA_SIMPLE_FIXTURE
+from bika.lims.tests.base import BikaSimpleTestCase
+from plone.app.testing import login
+from plone.app.testing import setRoles
+from plone.app.testing import TEST_USER_ID
+from plone.app.testing import TEST_USER_NAME
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class TestCatalogRebuild(BikaSimpleTestCase):
+
+    def setUp(self):
+        super(TestCatalogRebuild, self).setUp()
+        setRoles(self.portal, TEST_USER_ID, ['Manager'])
+        login(self.portal, TEST_USER_NAME)
+        folder = self.portal.bika_setup.bika_sampletypes
+        self.sampletypes = [
+            api.create(folder, "SampleType", title="Sample Type %s" % i)
+            for i in range(7)]
+        self.catalog = self.portal.bika_setup_catalog
+
+    def tearDown(self):
+        catalogrebuild.cancel(self.catalog)
+        super(TestCatalogRebuild, self).tearDown()
+
+    def get_shadow_paths(self):
+        shadow = catalogrebuild.get_shadow(self.catalog)
+        return sorted(shadow.uids.keys())
+
+    def get_indexed_sampletypes(self):
+        return [brain.UID for brain in self.catalog(portal_type="SampleType")]
+
+    def test_chunks(self):
+        catalogrebuild.start(self.catalog)
+        uids, objects = catalogrebuild.get_chunk(self.catalog, 0, 3)
+        self.assertEqual(len(uids), 3)
+        self.assertEqual(uids, sorted(uids))
+        catalogrebuild.index_chunk(self.catalog, 0, uids, objects, 3)
+        record = catalogrebuild.get_job(self.catalog)["workers"][0]
+        self.assertEqual(record["cursor"], uids[-1])
+        self.assertFalse(record["done"])
+
+        # the next chunk starts after the cursor
+        next_uids, objects = catalogrebuild.get_chunk(self.catalog, 0, 3)
+        self.assertTrue(next_uids[0] > uids[-1])
+        self.assertEqual(next_uids, sorted(next_uids))
+
+        # the objects of other types are skipped
+        while not record["done"]:
+            catalogrebuild.process(self.catalog, 0, 3)
+        indexed = self.get_shadow_paths()
+        for sampletype in self.sampletypes:
+            self.assertIn("/".join(sampletype.getPhysicalPath()), indexed)
+        portal_types = catalogrebuild.get_portal_types(self.catalog)
+        for path in indexed:
+            obj = self.portal.unrestrictedTraverse(path)
+            self.assertIn(obj.portal_type, portal_types)
+
+    def test_workers_split_uids(self):
+        catalogrebuild.start(self.catalog, workers=3)
+        chunks = []
+        for worker in range(3):
+            lower, upper = catalogrebuild.get_uid_range(worker, 3)
+            uids, objects = catalogrebuild.get_chunk(self.catalog, worker,
+                                                     1000)
+            for uid in uids:
+                self.assertTrue(lower is None or uid >= lower)
+                self.assertTrue(upper is None or uid < upper)
+            chunks.extend(uids)
+        self.assertEqual(len(chunks), len(set(chunks)))
+        for sampletype in self.sampletypes:
+            self.assertIn(api.get_uid(sampletype), chunks)
+
+    def test_resume_from_cursor(self):
+        catalogrebuild.start(self.catalog)
+        catalogrebuild.process(self.catalog, 0, 2)
+        record = catalogrebuild.get_job(self.catalog)["workers"][0]
+        cursor = record["cursor"]
+        count = record["count"]
+
+        # an interrupted worker starts again: the job is resumed as is
+        catalogrebuild.start(self.catalog)
+        record = catalogrebuild.get_job(self.catalog)["workers"][0]
+        self.assertEqual(record["cursor"], cursor)
+        uids, objects = catalogrebuild.get_chunk(self.catalog, 0, 2)
+        for uid in uids:
+            self.assertTrue(uid > cursor)
+        while not record["done"]:
+            catalogrebuild.process(self.catalog, 0, 2)
+        self.assertTrue(record["count"] >= count + len(self.sampletypes) - 2)
+
+    def test_swap(self):
+        before = sorted(self.get_indexed_sampletypes())
+        catalogrebuild.start(self.catalog, workers=2)
+        catalogrebuild.process(self.catalog, 0, 1000)
+        # not all the workers are done
+        self.assertFalse(catalogrebuild.finish(self.catalog))
+
+        # changes of the catalog during the rebuild are replayed
+        removed = self.sampletypes[0]
+        self.portal.bika_setup.bika_sampletypes.manage_delObjects(
+            [removed.getId()])
+        added = api.create(self.portal.bika_setup.bika_sampletypes,
+                           "SampleType", title="Sample Type added")
+
+        catalogrebuild.process(self.catalog, 1, 1000)
+        self.assertTrue(catalogrebuild.finish(self.catalog))
+        self.assertEqual(catalogrebuild.get_job(self.catalog), None)
+
+        after = self.get_indexed_sampletypes()
+        self.assertNotIn(api.get_uid(removed), after)
+        self.assertIn(api.get_uid(added), after)
+        expected = [uid for uid in before if uid != api.get_uid(removed)]
+        self.assertEqual(sorted(after), sorted(expected + [api.get_uid(added)]))
+        self.assertEqual(catalogrebuild.get_progress(self.catalog)["rebuilding"],
+                         False)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestCatalogRebuild))
+    suite.layer = BIKA_SIMPLE_FIXTURE
+    return suite
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from plone.registry.interfaces import IRegistry
+from zope.annotation.interfaces import IAnnotations
+from zope.component import getUtility
+
+from bika.lims.testing import BIKA_SIMPLE_FIXTURE
+from bika.lims.tests.base import BikaSimpleTestCase
+from bika.lims.utils import HIDDEN_ATTRIBUTES_RECORD
+from bika.lims.utils import HIDDEN_ATTRIBUTES_VERSION_STORAGE
+from bika.lims.utils import _hidden_attributes_cache
+from bika.lims.utils import get_hidden_attributes_version
+from bika.lims.utils import isAttributeHidden
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class TestHiddenAttributes(BikaSimpleTestCase):
+
+    def setUp(self):
+        super(TestHiddenAttributes, self).setUp()
+        self.registry = getUtility(IRegistry)
+        self.registry[HIDDEN_ATTRIBUTES_RECORD] = [
+            [u"AnalysisRequest", u"EnvironmentalConditions"]]
+
+    def test_record_modified(self):
+        self.assertTrue(
+            isAttributeHidden("AnalysisRequest", "EnvironmentalConditions"))
+        self.assertFalse(isAttributeHidden("AnalysisRequest", "Remarks"))
+        version = get_hidden_attributes_version(self.portal)
+        self.registry[HIDDEN_ATTRIBUTES_RECORD] = [
+            [u"AnalysisRequest", u"Remarks"]]
+        self.assertEqual(
+            get_hidden_attributes_version(self.portal), version + 1)
+        self.assertFalse(
+            isAttributeHidden("AnalysisRequest", "EnvironmentalConditions"))
+        self.assertTrue(isAttributeHidden("AnalysisRequest", "Remarks"))
+
+    def test_cache_keyed_by_site(self):
+        isAttributeHidden("AnalysisRequest", "Remarks")
+        key = self.portal.getPhysicalPath()
+        self.assertIn(key, _hidden_attributes_cache)
+        version, mapping = _hidden_attributes_cache[key]
+        self.assertEqual(version, get_hidden_attributes_version(self.portal))
+        # A mapping compiled for another site is never returned
+        _hidden_attributes_cache[("", "other")] = (version, {})
+        self.assertTrue(
+            isAttributeHidden("AnalysisRequest", "EnvironmentalConditions"))
+
+    def test_version_bumped_by_other_client(self):
+        isAttributeHidden("AnalysisRequest", "Remarks")
+        key = self.portal.getPhysicalPath()
+        version = _hidden_attributes_cache[key][0]
+        # Another ZEO client commits a new version of the hidden attributes
+        annotation = IAnnotations(self.portal)
+        annotation[HIDDEN_ATTRIBUTES_VERSION_STORAGE] = version + 1
+        isAttributeHidden("AnalysisRequest", "Remarks")
+        self.assertEqual(_hidden_attributes_cache[key][0], version + 1)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestHiddenAttributes))
+    suite.layer = BIKA_SIMPLE_FIXTURE
+    return suite
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from ZODB.POSException import ConflictError
+from bika.lims.testing import BIKA_SIMPLE_FIXTURE
+from bika.lims.tests.base import BikaSimpleTestCase
+from bika.lims.utils.indexing import deferred_indexing
+from bika.lims.utils.indexing import get_queue
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class DummyCatalog(object):
+
+    def getId(self):
+        return "bika_catalog"
+
+
+class DummyObject(object):
+    """Object which records its reindex calls
+    """
+
+    def __init__(self, id, fail=False):
+        self.id = id
+        self.fail = fail
+        self.reindexed = []
+
+    def getPhysicalPath(self):
+        return ("", "plone", self.id)
+
+    def getCatalogs(self):
+        return [DummyCatalog()]
+
+    def _old_reindexObject(self, idxs=[]):
+        if self.fail:
+            raise ConflictError()
+        self.reindexed.append(idxs)
+
+
+class TestDeferredIndexing(BikaSimpleTestCase):
+
+    def test_coalesced(self):
+        obj = DummyObject("obj")
+        with deferred_indexing() as queue:
+            queue.add(obj, ["review_state"])
+            with deferred_indexing():
+                queue.add(obj, ["getLate"])
+            self.assertEqual(obj.reindexed, [])
+        self.assertEqual(len(obj.reindexed), 1)
+        self.assertEqual(sorted(obj.reindexed[0]),
+                         ["getLate", "review_state"])
+        self.assertEqual(get_queue().depth, 0)
+
+    def test_catalog_updates_coalesced(self):
+        obj = DummyObject("obj")
+        queue = get_queue()
+        queue.depth += 1
+        try:
+            queue.add_catalog_update(obj, "bika_catalog", ["getLate"])
+            queue.add_catalog_update(obj, "bika_catalog", ["review_state"])
+            self.assertEqual(queue.get_catalog_keys_for("bika_catalog"),
+                             [("/plone/obj", "bika_catalog")])
+            self.assertEqual(queue.get_catalog_keys_for("portal_catalog"), [])
+            obj, idxs = queue.catalog_pending[("/plone/obj", "bika_catalog")]
+            self.assertEqual(sorted(idxs), ["getLate", "review_state"])
+        finally:
+            queue.depth -= 1
+            queue.clear()
+
+    def test_error_in_block(self):
+        obj = DummyObject("obj")
+        with self.assertRaises(ValueError):
+            with deferred_indexing() as queue:
+                queue.add(obj)
+                raise ValueError()
+        self.assertEqual(obj.reindexed, [])
+        queue = get_queue()
+        self.assertEqual(queue.depth, 0)
+        self.assertEqual(len(queue.pending), 0)
+
+    def test_error_in_process(self):
+        # the reindex of the first object conflicts while the queue is
+        # processed, the second object is still pending
+        failing = DummyObject("failing", fail=True)
+        other = DummyObject("other")
+        with self.assertRaises(ConflictError):
+            with deferred_indexing() as queue:
+                queue.add(failing)
+                queue.add(other)
+        queue = get_queue()
+        self.assertEqual(queue.depth, 0)
+        self.assertFalse(queue.processing)
+        self.assertEqual(len(queue.pending), 0)
+
+        # the next block starts with an empty queue
+        obj = DummyObject("obj")
+        with deferred_indexing() as queue:
+            self.assertEqual(queue.pending.keys(), [])
+            queue.add(obj)
+        self.assertEqual(other.reindexed, [])
+        self.assertEqual(obj.reindexed, [[]])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestDeferredIndexing))
+    suite.layer = BIKA_SIMPLE_FIXTURE
+    return suite
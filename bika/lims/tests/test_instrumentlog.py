@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from DateTime import DateTime
+from Products.CMFPlone.utils import _createObjectByType
+from plone.app.testing import TEST_USER_NAME
+from plone.app.testing import login
+
+from bika.lims import instrumentlog
+from bika.lims.testing import BIKA_FUNCTIONAL_TESTING
+from bika.lims.tests.base import BikaFunctionalTestCase
+from bika.lims.utils import tmpID
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class TestInstrumentLog(BikaFunctionalTestCase):
+
+    def setUp(self):
+        super(TestInstrumentLog, self).setUp()
+        login(self.portal, TEST_USER_NAME)
+        setup = self.portal.bika_setup
+        self.service = setup.bika_analysisservices['analysisservice-3']
+        self.instrument = _createObjectByType(
+            "Instrument", setup.bika_instruments, tmpID())
+        self.instrument.edit(title="QC instrument")
+        self.instrument.unmarkCreationFlag()
+        self.supplier = _createObjectByType(
+            "Supplier", setup.bika_suppliers, tmpID())
+        self.supplier.edit(Name="QC supplier")
+        self.supplier.unmarkCreationFlag()
+
+    def create_reference(self, blank=False):
+        reference = _createObjectByType(
+            "ReferenceSample", self.supplier, tmpID())
+        reference.setBlank(blank)
+        reference.setReferenceResults([{'uid': self.service.UID(),
+                                        'result': '10', 'min': '9',
+                                        'max': '11', 'error': '0'}])
+        reference.unmarkCreationFlag()
+        return reference
+
+    def add_reference_analysis(self, reference, result, capture_date):
+        analyses = self.instrument.addReferences(
+            reference, [self.service.UID()])
+        self.assertEqual(len(analyses), 1)
+        analysis = analyses[0]
+        analysis.setResult(result)
+        analysis.setResultCaptureDate(capture_date)
+        return analysis
+
+    def get_latest_uids(self):
+        return sorted([analysis.UID() for analysis
+                       in self.instrument.getLatestReferenceAnalyses()])
+
+    def test_no_reference_analyses(self):
+        self.assertEqual(self.instrument.getLatestReferenceAnalyses(), [])
+        self.assertTrue(self.instrument.isQCValid())
+
+    def test_latest_by_reference_type(self):
+        control = self.create_reference()
+        passed = self.add_reference_analysis(control, '10', DateTime() - 2)
+        self.assertEqual(self.get_latest_uids(), [passed.UID()])
+        self.assertTrue(self.instrument.isQCValid())
+        failed = self.add_reference_analysis(control, '20', DateTime() - 1)
+        self.assertEqual(self.get_latest_uids(), [failed.UID()])
+        self.assertFalse(self.instrument.isQCValid())
+        # blanks and controls are kept separately
+        blank = self.add_reference_analysis(
+            self.create_reference(blank=True), '10', DateTime())
+        self.assertEqual(self.get_latest_uids(),
+                         sorted([failed.UID(), blank.UID()]))
+        self.assertFalse(self.instrument.isQCValid())
+        # all analyses are logged
+        self.assertEqual(
+            sorted(instrumentlog.get_analysis_uids(self.instrument)),
+            sorted([passed.UID(), failed.UID(), blank.UID()]))
+
+    def test_latest_by_capture_date(self):
+        control = self.create_reference()
+        passed = self.add_reference_analysis(control, '10', DateTime() - 1)
+        # results imported from a file might be captured earlier
+        failed = self.add_reference_analysis(control, '20', DateTime() - 2)
+        self.assertEqual(self.get_latest_uids(), [passed.UID()])
+        self.assertTrue(self.instrument.isQCValid())
+        failed.setResultCaptureDate(DateTime())
+        self.assertEqual(self.get_latest_uids(), [failed.UID()])
+        self.assertFalse(self.instrument.isQCValid())
+        failed.setResultCaptureDate(DateTime() - 2)
+        self.assertEqual(self.get_latest_uids(), [passed.UID()])
+        self.assertTrue(self.instrument.isQCValid())
+
+    def test_remove_analysis(self):
+        control = self.create_reference()
+        passed = self.add_reference_analysis(control, '10', DateTime() - 2)
+        failed = self.add_reference_analysis(control, '20', DateTime() - 1)
+        self.assertFalse(self.instrument.isQCValid())
+        self.instrument.removeAnalysis(failed)
+        self.assertEqual(self.get_latest_uids(), [passed.UID()])
+        self.assertTrue(self.instrument.isQCValid())
+        self.assertEqual(self.instrument.getRawAnalyses(), [passed.UID()])
+
+    def test_rebuild(self):
+        control = self.create_reference()
+        self.add_reference_analysis(control, '10', DateTime() - 2)
+        failed = self.add_reference_analysis(control, '20', DateTime() - 1)
+        instrumentlog.rebuild(self.instrument)
+        self.assertEqual(self.get_latest_uids(), [failed.UID()])
+        self.assertFalse(self.instrument.isQCValid())
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestInstrumentLog))
+    suite.layer = BIKA_FUNCTIONAL_TESTING
+    return suite
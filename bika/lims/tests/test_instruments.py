@@ -5,7 +5,11 @@
 # Copyright 2011-2017 by it's authors.
 # Some rights reserved. See LICENSE.txt, AUTHORS.txt.
 
+from DateTime import DateTime
 from Products.CMFPlone.utils import _createObjectByType
+from zope.annotation.interfaces import IAnnotations
+from bika.lims import api
+from bika.lims import instrumentvalidity
 from bika.lims.utils import tmpID
 from bika.lims.testing import BIKA_FUNCTIONAL_TESTING
 from bika.lims.tests.base import BikaFunctionalTestCase
@@ -114,8 +118,111 @@ class TestInstrumentAlerts(BikaFunctionalTestCase):
         super(TestInstrumentAlerts, self).tearDown()
 
 
+class TestInstrumentValidity(BikaFunctionalTestCase):
+    layer = BIKA_FUNCTIONAL_TESTING
+
+    def setUp(self):
+        super(TestInstrumentValidity, self).setUp()
+        login(self.portal, TEST_USER_NAME)
+        instruments = self.portal.bika_setup.bika_instruments
+        self.instrument = instruments['instrument-10']
+        self.certification = self.instrument.getCertifications()[0]
+        self.certification.setValidTo('3000-01-01')
+
+    def tearDown(self):
+        self.instrument.setDisposeUntilNextCalibrationTest(False)
+        logout()
+        super(TestInstrumentValidity, self).tearDown()
+
+    def get_stored_status(self):
+        annotation = IAnnotations(self.instrument)
+        return annotation[instrumentvalidity.INSTRUMENT_VALIDITY_STORAGE]
+
+    def get_brain_status(self):
+        brains = api.search({"UID": api.get_uid(self.instrument)},
+                            "bika_setup_catalog")
+        return instrumentvalidity.get_brain_status(brains[0])
+
+    def test_dispose_setter(self):
+        self.instrument.setDisposeUntilNextCalibrationTest(True)
+        self.assertTrue(self.get_stored_status()["disposed"])
+        self.assertFalse(self.instrument.isValid())
+        self.assertFalse(self.get_brain_status()["valid"])
+        self.instrument.setDisposeUntilNextCalibrationTest(False)
+        self.assertFalse(self.get_stored_status()["disposed"])
+        self.assertEqual(self.instrument.isValid(),
+                         instrumentvalidity.compute(self.instrument)["valid"])
+
+    def test_dispose_flag_read_live(self):
+        self.instrument.setDisposeUntilNextCalibrationTest(False)
+        # the flag is set without the setter, e.g. by addReferences
+        field = self.instrument.getField('DisposeUntilNextCalibrationTest')
+        field.set(self.instrument, True)
+        self.assertFalse(self.get_stored_status()["disposed"])
+        self.assertFalse(self.instrument.isValid())
+        field.set(self.instrument, False)
+        self.assertEqual(self.instrument.isValid(),
+                         instrumentvalidity.compute(self.instrument)["valid"])
+
+    def test_certification_setters(self):
+        self.assertFalse(self.get_stored_status()["out_of_date"])
+        self.certification.setValidTo('2000-01-01')
+        self.assertTrue(self.get_stored_status()["out_of_date"])
+        self.assertTrue(self.instrument.getValidityStatus()["out_of_date"])
+        self.assertFalse(self.instrument.isValid())
+        self.assertFalse(self.get_brain_status()["valid"])
+        self.certification.setValidTo('3000-01-01')
+        self.assertFalse(self.get_stored_status()["out_of_date"])
+
+    def test_calibration_setters(self):
+        today = date.today()
+        calibration = _createObjectByType(
+            "InstrumentCalibration", self.instrument, tmpID())
+        calibration.unmarkCreationFlag()
+        calibration.setDownFrom(today.strftime("%Y/%m/%d"))
+        calibration.setDownTo((today + timedelta(1)).strftime("%Y/%m/%d"))
+        self.assertTrue(self.get_stored_status()["in_calibration"])
+        self.assertFalse(self.instrument.isValid())
+        calibration.setDownTo('2014/11/27')
+        calibration.setDownFrom('2014/11/27')
+        self.assertFalse(self.get_stored_status()["in_calibration"])
+
+    def test_expired_status(self):
+        status = instrumentvalidity.compute(self.instrument)
+        # the status expires at the latest after STATUS_MAX_AGE days
+        self.assertTrue(
+            status["expires"] <= DateTime() + instrumentvalidity.STATUS_MAX_AGE)
+        annotation = IAnnotations(self.instrument)
+        key = instrumentvalidity.INSTRUMENT_VALIDITY_STORAGE
+        # a wrong, expired status is not used
+        stale = dict(status, valid=not status["valid"],
+                     expires=DateTime() - 1)
+        annotation[key] = stale
+        self.assertEqual(self.instrument.isValid(), status["valid"])
+        # nor a status without expiry date
+        annotation[key] = dict(stale, expires=None)
+        self.assertEqual(self.instrument.isValid(), status["valid"])
+
+    def test_sweep(self):
+        annotation = IAnnotations(self.instrument)
+        key = instrumentvalidity.INSTRUMENT_VALIDITY_STORAGE
+        status = instrumentvalidity.compute(self.instrument)
+        annotation[key] = dict(status, valid=not status["valid"],
+                               expires=DateTime() - 1)
+        self.assertTrue(instrumentvalidity.sweep() >= 1)
+        stored = self.get_stored_status()
+        self.assertEqual(stored["valid"], status["valid"])
+        self.assertTrue(stored["expires"] > DateTime())
+        self.assertEqual(self.get_brain_status()["valid"], status["valid"])
+        # an unchanged, expired status is stored with a new expiry date
+        annotation[key] = dict(stored, expires=DateTime() - 1)
+        instrumentvalidity.sweep()
+        self.assertTrue(self.get_stored_status()["expires"] > DateTime())
+
+
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestInstrumentAlerts))
+    suite.addTest(unittest.makeSuite(TestInstrumentValidity))
     suite.layer = BIKA_FUNCTIONAL_TESTING
     return suite
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from DateTime import DateTime
+from Products.CMFCore.utils import getToolByName
+from plone.app.testing import TEST_USER_NAME
+from plone.app.testing import login
+
+from bika.lims import lateness
+from bika.lims.testing import BIKA_FUNCTIONAL_TESTING
+from bika.lims.tests.base import BikaFunctionalTestCase
+from bika.lims.utils.analysisrequest import create_analysisrequest
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class TestLateness(BikaFunctionalTestCase):
+
+    def setUp(self):
+        super(TestLateness, self).setUp()
+        login(self.portal, TEST_USER_NAME)
+        client = self.portal.clients['client-1']
+        sampletype = self.portal.bika_setup.bika_sampletypes['sampletype-1']
+        values = {'Client': client.UID(),
+                  'Contact': client.getContacts()[0].UID(),
+                  'SamplingDate': '2015-01-01',
+                  'SampleType': sampletype.UID()}
+        service = self.portal.bika_setup.bika_analysisservices[
+            'analysisservice-3']
+        self.ar = create_analysisrequest(client, {}, values, [service.UID()])
+        self.wf = getToolByName(self.portal, 'portal_workflow')
+
+    def receive(self, due_date):
+        self.wf.doActionFor(self.ar, 'receive')
+        for analysis in self.ar.getAnalyses(full_objects=True):
+            analysis.setDueDate(due_date)
+            analysis.reindexObject(idxs=['getDueDate'])
+
+    def test_not_received(self):
+        due_date = DateTime() + 1
+        self.assertFalse(lateness.is_ar_late(self.ar, now=due_date + 1))
+
+    def test_not_late(self):
+        self.receive(DateTime() + 1)
+        self.assertFalse(lateness.is_ar_late(self.ar))
+        self.assertFalse(self.ar.getLate())
+
+    def test_late_before_sweep(self):
+        due_date = DateTime() + 1
+        self.receive(due_date)
+        # the due date passes: the analysis is not flagged in the catalog
+        # until the next sweep, but the AR is late already
+        for brain in self.ar.getAnalyses():
+            self.assertFalse(brain.getLate)
+        self.assertTrue(lateness.is_ar_late(self.ar, now=due_date + 1))
+
+    def test_late_flag(self):
+        self.receive(DateTime() - 1)
+        for brain in self.ar.getAnalyses():
+            self.assertTrue(brain.getLate)
+        self.assertTrue(lateness.is_ar_late(self.ar))
+        self.assertTrue(self.ar.getLate())
+
+    def test_result_in_time(self):
+        due_date = DateTime() + 1
+        self.receive(due_date)
+        for analysis in self.ar.getAnalyses(full_objects=True):
+            analysis.setResult('12')
+            self.wf.doActionFor(analysis, 'submit')
+        # the analyses are not waiting for a result anymore
+        self.assertFalse(lateness.is_ar_late(self.ar, now=due_date + 1))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestLateness))
+    suite.layer = BIKA_FUNCTIONAL_TESTING
+    return suite
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from Products.Archetypes.CatalogMultiplex import CatalogMultiplex
+from Products.CMFCore.utils import getToolByName
+from Products.CMFPlone.utils import _createObjectByType
+
+from bika.lims.exportimport.load_setup_data import LoadSetupData
+from bika.lims.exportimport.setupdata import WorksheetImporter
+from bika.lims.testing import BIKA_SIMPLE_FIXTURE
+from bika.lims.tests.base import BikaSimpleTestCase
+from bika.lims.utils import tmpID
+from bika.lims.utils.indexing import deferred_indexing
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class RecordingCatalog(object):
+    """Catalog which records the queries of the importer
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.queries = []
+
+    def __call__(self, *args, **kwargs):
+        self.queries.append((args, kwargs))
+        return self.catalog(*args, **kwargs)
+
+
+class TestSetupDataRegistry(BikaSimpleTestCase):
+
+    def setUp(self):
+        super(TestSetupDataRegistry, self).setUp()
+        self.lsd = LoadSetupData(self.portal, self.request)
+        self.registry = self.lsd.registry
+        self.importer = WorksheetImporter(self.portal)
+        self.importer.lsd = self.lsd
+        self.importer.context = self.portal
+        self.bsc = RecordingCatalog(
+            getToolByName(self.portal, "bika_setup_catalog"))
+        # record the index operations of the content
+        self.indexed = []
+        reindex = CatalogMultiplex._old_reindexObject
+
+        def _old_reindexObject(obj, idxs=[]):
+            self.indexed.append("/".join(obj.getPhysicalPath()))
+            return reindex(obj, idxs=idxs)
+
+        CatalogMultiplex._old_reindexObject = _old_reindexObject
+        self.addCleanup(
+            setattr, CatalogMultiplex, "_old_reindexObject", reindex)
+
+    def create_department(self, title, create=None):
+        folder = self.portal.bika_setup.bika_departments
+        if create is None:
+            obj = self.importer.create_object("Department", folder)
+        else:
+            obj = create("Department", folder, tmpID())
+        obj.edit(title=title)
+        obj.unmarkCreationFlag()
+        return obj
+
+    def test_registered_on_creation(self):
+        with deferred_indexing() as queue:
+            department = self.create_department("Microbiology")
+            path = "/".join(department.getPhysicalPath())
+            found = self.importer.get_object(
+                self.bsc, "Department", "Microbiology")
+            self.assertEqual(found, department)
+            # the lookup neither queried the catalog nor indexed the object
+            self.assertEqual(self.bsc.queries, [])
+            self.assertIn(path, queue.pending)
+            self.assertEqual(self.indexed, [])
+        self.assertEqual(self.registry.hits, 1)
+        self.assertEqual(self.registry.misses, 0)
+        # the object is indexed once, when the block exits
+        self.assertEqual(self.indexed.count(path), 1)
+
+    def test_title_set_after_creation(self):
+        with deferred_indexing():
+            folder = self.portal.bika_setup.bika_departments
+            department = self.importer.create_object("Department", folder)
+            self.assertEqual(self.registry.get("Department", "Chemistry"), [])
+            department.edit(title="Chemistry")
+            self.assertEqual(self.registry.get("Department", "Chemistry"),
+                             [department])
+
+    def test_catalog_fallback(self):
+        # Objects which were not created by the importers are queried once
+        department = self.create_department(
+            "Virology", create=_createObjectByType)
+        found = self.importer.get_object(self.bsc, "Department", "Virology")
+        self.assertEqual(found, department)
+        self.assertEqual(len(self.bsc.queries), 1)
+        self.assertEqual(self.registry.misses, 1)
+        found = self.importer.get_object(self.bsc, "Department", "Virology")
+        self.assertEqual(found, department)
+        self.assertEqual(len(self.bsc.queries), 1)
+        self.assertEqual(self.registry.hits, 1)
+
+    def test_duplicate_titles(self):
+        with deferred_indexing():
+            self.create_department("Histology")
+            self.create_department("Histology")
+            found = self.importer.get_object(
+                self.bsc, "Department", "Histology")
+        self.assertIsNone(found)
+        self.assertEqual(self.bsc.queries, [])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestSetupDataRegistry))
+    suite.layer = BIKA_SIMPLE_FIXTURE
+    return suite
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from Products.CMFCore.utils import getToolByName
+from plone.app.testing import TEST_USER_NAME
+from plone.app.testing import login
+
+from bika.lims.testing import BIKA_FUNCTIONAL_TESTING
+from bika.lims.tests.base import BikaFunctionalTestCase
+from bika.lims.utils import outofrange
+from bika.lims.utils.analysisrequest import create_analysisrequest
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class TestOutOfRange(BikaFunctionalTestCase):
+
+    def setUp(self):
+        super(TestOutOfRange, self).setUp()
+        login(self.portal, TEST_USER_NAME)
+        client = self.portal.clients['client-1']
+        sampletype = self.portal.bika_setup.bika_sampletypes['sampletype-1']
+        values = {'Client': client.UID(),
+                  'Contact': client.getContacts()[0].UID(),
+                  'SamplingDate': '2015-01-01',
+                  'SampleType': sampletype.UID()}
+        service = self.portal.bika_setup.bika_analysisservices[
+            'analysisservice-3']
+        ar = create_analysisrequest(client, {}, values, [service.UID()])
+        self.wf = getToolByName(self.portal, 'portal_workflow')
+        self.wf.doActionFor(ar, 'receive')
+        self.analysis = ar.getAnalyses(full_objects=True)[0]
+        self.ranges = {self.analysis.UID(): {'min': '0', 'max': '10',
+                                             'error': '0'}}
+
+    def evaluate(self):
+        flags = outofrange.evaluate_analyses([self.analysis], self.ranges)
+        return flags[self.analysis.UID()]
+
+    def test_out_of_range(self):
+        self.analysis.setResult('5')
+        self.assertFalse(self.evaluate()['out_of_range'])
+        self.analysis.setResult('100')
+        self.assertTrue(self.evaluate()['out_of_range'])
+
+    def test_retracted(self):
+        self.analysis.setResult('100')
+        self.wf.doActionFor(self.analysis, 'submit')
+        self.assertTrue(self.evaluate()['out_of_range'])
+        self.wf.doActionFor(self.analysis, 'retract')
+        self.assertEqual(
+            self.wf.getInfoFor(self.analysis, 'review_state'), 'retracted')
+        flags = self.evaluate()
+        self.assertFalse(flags['out_of_range'])
+        self.assertFalse(flags['acceptable'])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestOutOfRange))
+    suite.layer = BIKA_FUNCTIONAL_TESTING
+    return suite
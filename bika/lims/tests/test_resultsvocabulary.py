@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from Products.CMFPlone.utils import _createObjectByType
+from plone.app.testing import TEST_USER_NAME
+from plone.app.testing import login
+from plone.memoize.ram import global_cache
+from zope.event import notify
+from zope.globalrequest import setRequest
+from zope.lifecycleevent import ObjectModifiedEvent
+
+from bika.lims import api
+from bika.lims import resultsvocabulary
+from bika.lims.setupcache import get_setup_stamp
+from bika.lims.testing import BIKA_FUNCTIONAL_TESTING
+from bika.lims.tests.base import BikaFunctionalTestCase
+from bika.lims.utils import tmpID
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class DummyAnalysis(object):
+
+    def __init__(self, service):
+        self.service = service
+
+    def getServiceUID(self):
+        return self.service.UID()
+
+
+class TestResultsVocabulary(BikaFunctionalTestCase):
+
+    def setUp(self):
+        super(TestResultsVocabulary, self).setUp()
+        login(self.portal, TEST_USER_NAME)
+        setRequest(self.request)
+        self.addCleanup(setRequest, None)
+        global_cache.invalidateAll()
+        self.service = self.portal.bika_setup.bika_analysisservices[
+            'analysisservice-3']
+        self.method = self.create_method("Titration")
+        self.set_methods([self.method])
+        # record the services and methods woken up by the vocabularies
+        self.loaded = []
+        get_object_by_uid = api.get_object_by_uid
+
+        def load(uid, *args, **kwargs):
+            self.loaded.append(uid)
+            return get_object_by_uid(uid, *args, **kwargs)
+
+        api.get_object_by_uid = load
+        self.addCleanup(setattr, api, "get_object_by_uid", get_object_by_uid)
+
+    def create_method(self, title):
+        method = _createObjectByType("Method", self.portal.methods, tmpID())
+        method.edit(title=title)
+        method.unmarkCreationFlag()
+        return method
+
+    def set_methods(self, methods):
+        self.service.setMethods([method.UID() for method in methods])
+        notify(ObjectModifiedEvent(self.service))
+
+    def get_methods(self):
+        return resultsvocabulary.get_service_methods(self.service.UID())[1]
+
+    def test_cache_hit(self):
+        methods = self.get_methods()
+        self.assertIn((self.method.UID(), "Titration"), methods)
+        self.assertEqual(self.loaded, [self.service.UID()])
+        self.assertEqual(self.get_methods(), methods)
+        self.assertEqual(self.loaded, [self.service.UID()])
+
+    def test_request_cache(self):
+        analysis = DummyAnalysis(self.service)
+        vocabulary = resultsvocabulary.get_methods_vocabulary(analysis)
+        self.assertIn(self.method.UID(),
+                      [item['ResultValue'] for item in vocabulary])
+        # the vocabulary is computed once per request
+        global_cache.invalidateAll()
+        self.assertEqual(
+            resultsvocabulary.get_methods_vocabulary(analysis), vocabulary)
+        self.assertEqual(self.loaded, [self.service.UID()])
+
+    def test_invalidated_on_service_change(self):
+        self.get_methods()
+        stamp = get_setup_stamp()
+        other = self.create_method("Gravimetry")
+        self.set_methods([self.method, other])
+        self.assertTrue(get_setup_stamp() > stamp)
+        self.loaded = []
+        methods = self.get_methods()
+        self.assertIn((other.UID(), "Gravimetry"), methods)
+        self.assertEqual(self.loaded, [self.service.UID()])
+
+    def test_invalidated_on_method_change(self):
+        self.assertIn((self.method.UID(), "Titration"), self.get_methods())
+        self.method.setTitle("Volumetry")
+        notify(ObjectModifiedEvent(self.method))
+        methods = self.get_methods()
+        self.assertIn((self.method.UID(), "Volumetry"), methods)
+        self.assertNotIn((self.method.UID(), "Titration"), methods)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestResultsVocabulary))
+    suite.layer = BIKA_FUNCTIONAL_TESTING
+    return suite
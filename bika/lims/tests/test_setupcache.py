@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from Products.CMFPlone.utils import _createObjectByType
+from plone.app.testing import TEST_USER_NAME
+from plone.app.testing import login
+from zope.event import notify
+from zope.lifecycleevent import ObjectModifiedEvent
+
+from bika.lims.setupcache import get_setup_stamp
+from bika.lims.setupcache import invalidate_setup_cache
+from bika.lims.setupcache import is_setup_item
+from bika.lims.testing import BIKA_SIMPLE_FIXTURE
+from bika.lims.tests.base import BikaSimpleTestCase
+from bika.lims.utils import tmpID
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class TestSetupCache(BikaSimpleTestCase):
+
+    def setUp(self):
+        super(TestSetupCache, self).setUp()
+        login(self.portal, TEST_USER_NAME)
+        self.folder = self.portal.bika_setup.bika_departments
+
+    def create_department(self):
+        department = _createObjectByType("Department", self.folder, tmpID())
+        department.unmarkCreationFlag()
+        return department
+
+    def test_invalidate(self):
+        stamp = get_setup_stamp()
+        invalidate_setup_cache()
+        self.assertEqual(get_setup_stamp(), stamp + 1)
+
+    def test_is_setup_item(self):
+        self.assertTrue(is_setup_item(self.portal.bika_setup))
+        self.assertTrue(is_setup_item(self.folder))
+        self.assertTrue(is_setup_item(self.portal.methods))
+        self.assertFalse(is_setup_item(self.portal.clients))
+        self.assertFalse(is_setup_item(self.portal))
+        self.assertFalse(is_setup_item(None))
+
+    def test_setup_item_added(self):
+        stamp = get_setup_stamp()
+        self.create_department()
+        self.assertTrue(get_setup_stamp() > stamp)
+
+    def test_setup_item_modified(self):
+        department = self.create_department()
+        stamp = get_setup_stamp()
+        department.setTitle("Microbiology")
+        notify(ObjectModifiedEvent(department))
+        self.assertEqual(get_setup_stamp(), stamp + 1)
+
+    def test_setup_item_removed(self):
+        department = self.create_department()
+        stamp = get_setup_stamp()
+        self.folder.manage_delObjects([department.getId()])
+        self.assertTrue(get_setup_stamp() > stamp)
+
+    def test_method_modified(self):
+        method = _createObjectByType("Method", self.portal.methods, tmpID())
+        method.unmarkCreationFlag()
+        stamp = get_setup_stamp()
+        notify(ObjectModifiedEvent(method))
+        self.assertEqual(get_setup_stamp(), stamp + 1)
+
+    def test_other_item_modified(self):
+        stamp = get_setup_stamp()
+        notify(ObjectModifiedEvent(self.portal.clients))
+        self.assertEqual(get_setup_stamp(), stamp)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestSetupCache))
+    suite.layer = BIKA_SIMPLE_FIXTURE
+    return suite
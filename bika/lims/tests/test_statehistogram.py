@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from Products.CMFCore.utils import getToolByName
+from plone.app.testing import TEST_USER_NAME
+from plone.app.testing import login
+
+from bika.lims import statehistogram
+from bika.lims.testing import BIKA_FUNCTIONAL_TESTING
+from bika.lims.tests.base import BikaFunctionalTestCase
+from bika.lims.utils.analysisrequest import create_analysisrequest
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class TestStateHistogram(BikaFunctionalTestCase):
+
+    def setUp(self):
+        super(TestStateHistogram, self).setUp()
+        login(self.portal, TEST_USER_NAME)
+        self.portal.bika_setup.setSelfVerificationEnabled(True)
+        client = self.portal.clients['client-1']
+        sampletype = self.portal.bika_setup.bika_sampletypes['sampletype-1']
+        values = {'Client': client.UID(),
+                  'Contact': client.getContacts()[0].UID(),
+                  'SamplingDate': '2015-01-01',
+                  'SampleType': sampletype.UID()}
+        servs = self.portal.bika_setup.bika_analysisservices
+        services = [servs['analysisservice-3'], servs['analysisservice-6']]
+        self.ar = create_analysisrequest(
+            client, {}, values, [service.UID() for service in services])
+        self.wf = getToolByName(self.portal, 'portal_workflow')
+        self.wf.doActionFor(self.ar, 'receive')
+        self.analyses = sorted(self.ar.objectValues('Analysis'),
+                               key=lambda analysis: analysis.getId())
+
+    def get_state(self, obj):
+        return self.wf.getInfoFor(obj, 'review_state')
+
+    def submit(self, analysis):
+        analysis.setResult('12')
+        self.wf.doActionFor(analysis, 'submit')
+
+    def assertCounts(self, counts):
+        self.assertEqual(statehistogram.get_counts(self.ar), counts)
+        # the maintained histogram is the same as a rebuilt one
+        storage = statehistogram.get_storage(self.ar)
+        maintained = (dict(storage[statehistogram.MEMBERS].items()),
+                      dict(storage[statehistogram.COUNTS].items()))
+        storage = statehistogram.rebuild(self.ar)
+        rebuilt = (dict(storage[statehistogram.MEMBERS].items()),
+                   dict(storage[statehistogram.COUNTS].items()))
+        self.assertEqual(maintained, rebuilt)
+
+    def test_submit(self):
+        self.assertCounts({'sample_received': 2})
+        self.submit(self.analyses[0])
+        self.assertCounts({'sample_received': 1, 'to_be_verified': 1})
+        # an analysis is still waiting for a result
+        self.assertTrue(statehistogram.has_states(
+            self.ar, statehistogram.SUBMIT_PENDING_STATES))
+        self.assertEqual(self.get_state(self.ar), 'sample_received')
+        self.submit(self.analyses[1])
+        self.assertCounts({'to_be_verified': 2})
+        self.assertFalse(statehistogram.has_states(
+            self.ar, statehistogram.SUBMIT_PENDING_STATES))
+        self.assertEqual(self.get_state(self.ar), 'to_be_verified')
+
+    def test_retract(self):
+        for analysis in self.analyses:
+            self.submit(analysis)
+        self.assertEqual(self.get_state(self.ar), 'to_be_verified')
+        self.wf.doActionFor(self.analyses[0], 'retract')
+        # the retest of the retracted analysis is waiting for a result
+        self.assertCounts({'retracted': 1, 'sample_received': 1,
+                           'to_be_verified': 1})
+        self.assertTrue(statehistogram.has_states(
+            self.ar, statehistogram.SUBMIT_PENDING_STATES))
+        self.assertEqual(self.get_state(self.ar), 'sample_received')
+
+    def test_verify(self):
+        for analysis in self.analyses:
+            self.submit(analysis)
+        self.wf.doActionFor(self.analyses[0], 'verify')
+        self.assertCounts({'to_be_verified': 1, 'verified': 1})
+        self.assertEqual(self.get_state(self.ar), 'to_be_verified')
+        self.wf.doActionFor(self.analyses[1], 'verify')
+        self.assertCounts({'verified': 2})
+        self.assertFalse(statehistogram.has_states(
+            self.ar, statehistogram.VERIFY_PENDING_STATES))
+        self.assertEqual(self.get_state(self.ar), 'verified')
+
+    def test_remove(self):
+        self.submit(self.analyses[0])
+        self.assertEqual(self.get_state(self.ar), 'sample_received')
+        # removing the analysis without result promotes the AR
+        self.ar.manage_delObjects([self.analyses[1].getId()])
+        self.assertCounts({'to_be_verified': 1})
+        self.assertEqual(self.get_state(self.ar), 'to_be_verified')
+
+    def test_rebuild(self):
+        self.submit(self.analyses[0])
+        # repair an inconsistent histogram
+        storage = statehistogram.get_storage(self.ar)
+        storage[statehistogram.COUNTS]['verified'] = 5
+        self.assertTrue(statehistogram.has_states(self.ar, ('verified', )))
+        self.assertTrue(statehistogram.rebuild_all() >= 1)
+        self.assertEqual(statehistogram.get_counts(self.ar),
+                         {'sample_received': 1, 'to_be_verified': 1})
+        self.assertFalse(statehistogram.has_states(self.ar, ('verified', )))
+        # discarded histograms are built again on next access
+        statehistogram.flush(self.ar)
+        self.assertIsNone(statehistogram.get_storage(self.ar, create=False))
+        self.assertFalse(statehistogram.is_empty(self.ar))
+        self.assertEqual(statehistogram.get_counts(self.ar),
+                         {'sample_received': 1, 'to_be_verified': 1})
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestStateHistogram))
+    suite.layer = BIKA_FUNCTIONAL_TESTING
+    return suite
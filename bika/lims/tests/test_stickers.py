@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from Products.CMFPlone.utils import _createObjectByType
+from bika.lims import api
+from bika.lims.browser.stickers import Sticker
+from bika.lims.browser.stickers import StickerItem
+from bika.lims.browser.stickers import escape_zpl
+from bika.lims.browser.stickers import get_template
+from bika.lims.browser.stickers import render_zpl
+from bika.lims.testing import BIKA_SIMPLE_FIXTURE
+from bika.lims.tests.base import BikaSimpleTestCase
+from bika.lims.utils import tmpID
+from bika.lims.utils.analysisrequest import create_analysisrequest
+from plone.app.testing import login, logout
+from plone.app.testing import TEST_USER_NAME
+
+import os
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class TestStickers(BikaSimpleTestCase):
+
+    def setUp(self):
+        super(TestStickers, self).setUp()
+        login(self.portal, TEST_USER_NAME)
+
+    def tearDown(self):
+        logout()
+        super(TestStickers, self).tearDown()
+
+    def create_ars(self, count):
+        folder = self.portal.bika_setup.bika_analysisservices
+        service = _createObjectByType("AnalysisService", folder, tmpID())
+        service.processForm()
+        service.edit(title="Detect Dust", Keyword="DUST")
+        client = _createObjectByType("Client", self.portal.clients, tmpID())
+        client.processForm()
+        contact = _createObjectByType("Contact", client, tmpID())
+        contact.processForm()
+        contact.edit(Firstname="Bob", Surname="Dobbs")
+        folder = self.portal.bika_setup.bika_sampletypes
+        sampletype = _createObjectByType("SampleType", folder, tmpID())
+        sampletype.processForm()
+        sampletype.edit(title="Air", Prefix="AIR")
+        values = {'Client': client.UID(),
+                  'Contact': contact.UID(),
+                  'ClientSampleID': 'CSID',
+                  'SamplingDate': '2015-01-01',
+                  'SampleType': sampletype.UID()}
+        return [create_analysisrequest(client, {}, values, [service.UID()])
+                for i in range(count)]
+
+    def test_populate_items(self):
+        ars = self.create_ars(2)
+        ar_brains = api.search({"portal_type": "AnalysisRequest"},
+                               "bika_catalog")
+        self.assertEqual(len(ar_brains), 2)
+        view = Sticker(self.portal, self.request)
+        items = view._populateItems(ar_brains)
+        # one sticker per partition
+        self.assertEqual(len(items), 2)
+        ars = dict([(ar.UID(), ar) for ar in ars])
+        for item in items:
+            ar = ars[api.get_uid(item.brains[0])]
+            sample = ar.getSample()
+            part = sample.objectValues("SamplePartition")[0]
+            self.assertTrue(isinstance(item, StickerItem))
+            # the items are built from brains, no object is woken up
+            self.assertEqual(api.get_uid(item.brains[1]), sample.UID())
+            self.assertEqual(api.get_uid(item.brains[2]), part.UID())
+            self.assertEqual(item.getId(), part.getId())
+            data = item.getData()
+            self.assertEqual(item.objects, {})
+            self.assertEqual(data["ar_id"], ar.getId())
+            self.assertEqual(data["sample_id"], sample.getId())
+            self.assertEqual(data["client_sample_id"],
+                             sample.getClientSampleID())
+            self.assertEqual(data["sample_type"], "Air")
+            self.assertEqual(data["barcode"], sample.getId())
+            self.assertEqual(item.getData(show_partitions=True)["barcode"],
+                             part.getId())
+            # the templates get the objects
+            self.assertEqual(item[1].UID(), sample.UID())
+            self.assertEqual([obj.UID() for obj in item],
+                             [ar.UID(), sample.UID(), part.UID()])
+
+        # samples and partitions
+        sample = ars.values()[0].getSample()
+        part = sample.objectValues("SamplePartition")[0]
+        items = view._populateItems([sample, part])
+        self.assertEqual([item.getId() for item in items],
+                         [part.getId(), part.getId()])
+        self.assertEqual([item.brains[0] for item in items], [None, None])
+
+    def test_render_ars(self):
+        ars = self.create_ars(2)
+        self.request["items"] = ",".join([ar.getId() for ar in ars])
+        self.request["template"] = "Code_128_1x48mm.pt"
+        output = Sticker(self.portal, self.request)()
+        for ar in ars:
+            self.assertIn(ar.getSample().getId(), output)
+        self.request["format"] = "zpl"
+        output = Sticker(self.portal, self.request)()
+        self.assertEqual(output.count("^XA"), 2)
+
+    def test_template_compiled_once(self):
+        import bika.lims.browser
+        path = os.path.join(os.path.dirname(bika.lims.browser.__file__),
+                            "templates/stickers/Code_128_1x48mm.pt")
+        self.assertIs(get_template(path), get_template(path))
+
+    def test_zpl(self):
+        self.assertEqual(escape_zpl(u"W-0001^P~1"), "W-0001 P 1")
+        data = {"id": "W-0001-P01",
+                "barcode": "W-0001",
+                "sample_type": u"Water",
+                "sample_point": u"Lake",
+                "date_sampled": "2017/01/01",
+                "client_sample_id": ""}
+        label = render_zpl(data)
+        self.assertTrue(label.startswith("^XA"))
+        self.assertTrue(label.endswith("^XZ"))
+        self.assertIn("^BCN,60,N,N,N^FDW-0001^FS", label)
+        self.assertIn("^FDW-0001-P01^FS", label)
+        self.assertIn("^FDWater Lake^FS", label)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestStickers))
+    suite.layer = BIKA_SIMPLE_FIXTURE
+    return suite
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from Products.CMFCore.utils import getToolByName
+from Products.CMFPlone.utils import _createObjectByType
+from plone.app.testing import TEST_USER_NAME
+from plone.app.testing import login
+from zope.globalrequest import setRequest
+
+from bika.lims import api
+from bika.lims.content.analysis import Analysis
+from bika.lims.content.analysis import clear_worksheet_cache
+from bika.lims.testing import BIKA_FUNCTIONAL_TESTING
+from bika.lims.tests.base import BikaFunctionalTestCase
+from bika.lims.utils import tmpID
+from bika.lims.utils.analysisrequest import create_analysisrequest
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class TestWorksheetMetadata(BikaFunctionalTestCase):
+
+    def setUp(self):
+        super(TestWorksheetMetadata, self).setUp()
+        login(self.portal, TEST_USER_NAME)
+        setRequest(self.request)
+        self.addCleanup(setRequest, None)
+        client = self.portal.clients['client-1']
+        sampletype = self.portal.bika_setup.bika_sampletypes['sampletype-1']
+        values = {'Client': client.UID(),
+                  'Contact': client.getContacts()[0].UID(),
+                  'SamplingDate': '2015-01-01',
+                  'SampleType': sampletype.UID()}
+        service = self.portal.bika_setup.bika_analysisservices[
+            'analysisservice-3']
+        ar = create_analysisrequest(client, {}, values, [service.UID()])
+        getToolByName(ar, 'portal_workflow').doActionFor(ar, 'receive')
+        self.analysis = ar.getAnalyses(full_objects=True)[0]
+        self.worksheet = _createObjectByType(
+            "Worksheet", self.portal.worksheets, tmpID())
+        self.request['context_uid'] = self.worksheet.UID()
+        # record the worksheet lookups of the analyses
+        self.lookups = []
+        getBackReferences = Analysis.getBackReferences
+
+        def lookup(obj, relationship=None, *args, **kwargs):
+            if relationship == 'WorksheetAnalysis':
+                self.lookups.append(obj.UID())
+            return getBackReferences(obj, relationship, *args, **kwargs)
+
+        Analysis.getBackReferences = lookup
+        self.addCleanup(delattr, Analysis, "getBackReferences")
+
+    def get_brain(self):
+        query = {"UID": self.analysis.UID()}
+        return api.search(query, "bika_analysis_catalog")[0]
+
+    def test_metadata(self):
+        brain = self.get_brain()
+        self.assertEqual(brain.getWorksheetUID, '')
+        self.worksheet.addAnalysis(self.analysis)
+        brain = self.get_brain()
+        self.assertEqual(brain.getWorksheetUID, self.worksheet.UID())
+        self.assertEqual(brain.getWorksheetTitle, self.worksheet.Title())
+        self.assertEqual(brain.getWorksheetPath,
+                         '/'.join(self.worksheet.getPhysicalPath()))
+        self.worksheet.removeAnalysis(self.analysis)
+        brain = self.get_brain()
+        self.assertEqual(brain.getWorksheetUID, '')
+        self.assertEqual(brain.getWorksheetTitle, '')
+        self.assertEqual(brain.getWorksheetPath, '')
+
+    def test_single_lookup(self):
+        self.worksheet.addAnalysis(self.analysis)
+        clear_worksheet_cache()
+        self.lookups = []
+        self.analysis.reindexObject()
+        self.get_brain()
+        # the three worksheet columns are computed from one lookup
+        self.assertEqual(self.lookups, [self.analysis.UID()])
+        self.assertEqual(self.analysis.getWorksheetUID(),
+                         self.worksheet.UID())
+        self.assertEqual(self.lookups, [self.analysis.UID()])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestWorksheetMetadata))
+    suite.layer = BIKA_FUNCTIONAL_TESTING
+    return suite
@@ -7,9 +7,17 @@
 
 from Acquisition import aq_inner
 from Acquisition import aq_parent
+from bika.lims import instrumentlog
+from bika.lims import lateness
+from bika.lims import instrumentvalidity
 from bika.lims import logger
+from bika.lims import qcstats
 from bika.lims.idserver import generateUniqueId
+from bika.lims.interfaces import IIdentifierRegistry
+from bika.lims.interfaces import IServiceDependencyGraph
+from bika.lims.interfaces import ISpecificationIndex
 from bika.lims.numbergenerator import INumberGenerator
+from bika.lims.utils.indexing import deferred_indexing
 from DateTime import DateTime
 from Products.ATContentTypes.utils import DT2dt
 from Products.CMFPlone.utils import _createObjectByType
@@ -38,9 +46,103 @@ def upgrade(tool):
     # Sync the empty number generator with existing content
     prepare_number_generator(portal)
 
+    # Build the service dependency graph
+    getUtility(IServiceDependencyGraph).rebuild()
+
+    # Build the specification index
+    getUtility(ISpecificationIndex).rebuild()
+
+    # Move the analyses of the instruments to the instrument analysis logs
+    migrate_instrument_analyses(portal)
+
+    # Store the validity status of the instruments as catalog metadata
+    bsc = portal.bika_setup_catalog
+    if 'getValidityStatus' not in bsc.schema():
+        bsc.addColumn('getValidityStatus')
+    for brain in bsc(portal_type="Instrument"):
+        instrumentvalidity.update(brain.getObject())
+
+    # Build the QC statistics of the reference analyses
+    qcstats.rebuild()
+    add_qc_metadata(portal)
+
+    # Build the identifier registry
+    getUtility(IIdentifierRegistry).rebuild()
+
+    # Store the lateness of the analyses and ARs in the catalogs
+    add_lateness_metadata(portal)
+
+    # Store the department, service and worksheet of the analyses
+    add_aggregated_analyses_metadata(portal)
+
     return True
 
 
+def add_qc_metadata(portal):
+    """Add the analyst metadata of the analyses, used by the reference
+    analysis QC report, and reindex the verified reference analyses
+    """
+    bac = portal.bika_analysis_catalog
+    if 'getAnalyst' not in bac.schema():
+        bac.addColumn('getAnalyst')
+    with deferred_indexing():
+        for brain in bac(portal_type='ReferenceAnalysis',
+                         review_state=qcstats.QC_STATES):
+            brain.getObject().reindexObject(idxs=['getAnalyst'])
+
+
+def add_lateness_metadata(portal):
+    """Add the late flag, due date, AR, client and contact metadata of the
+    analyses, and reindex the analyses which are not published yet
+    """
+    bac = portal.bika_analysis_catalog
+    bc = portal.bika_catalog
+    if 'getLate' not in bac.indexes():
+        bac.addIndex('getLate', 'FieldIndex')
+    for column in ('getDueDate', 'getDateReceived', 'getLate',
+                   'getClientTitle', 'getClientPath', 'getRequestPath',
+                   'getContactTitle', 'getContactEmail'):
+        if column not in bac.schema():
+            bac.addColumn(column)
+    if 'getLate' not in bc.indexes():
+        bc.addIndex('getLate', 'FieldIndex')
+    if 'getLate' not in bc.schema():
+        bc.addColumn('getLate')
+    review_states = ('sample_received', 'assigned', 'attachment_due',
+                     'to_be_verified', 'verified')
+    with deferred_indexing():
+        for brain in bac(portal_type='Analysis', review_state=review_states):
+            lateness.update(brain.getObject())
+
+
+def add_aggregated_analyses_metadata(portal):
+    """Add the department, service and worksheet metadata of the analyses,
+    and reindex the analyses which are not verified yet
+    """
+    bac = portal.bika_analysis_catalog
+    for column in ('getDepartmentUID', 'getServiceTitle', 'getWorksheetUID',
+                   'getWorksheetTitle', 'getWorksheetPath'):
+        if column not in bac.schema():
+            bac.addColumn(column)
+    review_states = ('sample_due', 'sample_received', 'assigned',
+                     'attachment_due', 'to_be_verified')
+    with deferred_indexing():
+        for brain in bac(portal_type='Analysis', review_state=review_states):
+            brain.getObject().reindexObject(idxs=['getDepartmentUID'])
+
+
+def migrate_instrument_analyses(portal):
+    """Build the analysis log of each instrument from the "Analyses"
+    reference field and drop the references
+    """
+    bsc = portal.bika_setup_catalog
+    for brain in bsc(portal_type="Instrument"):
+        instrument = brain.getObject()
+        instrumentlog.rebuild(instrument)
+        instrument.getField("Analyses").set(instrument, [])
+        instrument.getField("_LatestReferenceAnalyses").set(instrument, [])
+
+
 def prepare_number_generator(portal):
     # Load IDServer defaults
 
@@ -23,6 +23,7 @@ from DateTime import DateTime
 from zope.i18n import translate
 from zope.i18n.locales import locales
 from zope.component import queryUtility
+from zope.annotation.interfaces import IAnnotations
 
 from plone.memoize import ram
 from plone.registry.interfaces import IRegistry
@@ -349,6 +350,11 @@ def changeWorkflowState(content, wf_id, state_id, acquire_permissions=False,
         # Setting new state permissions
         wf_def.updateRoleMappingsFor(content)
 
+    # Keep the state histograms of the AR and Worksheets in sync
+    if wf_def.state_var == 'review_state':
+        from bika.lims import statehistogram
+        statehistogram.update_state(content, state_id)
+
     # Map changes to the catalogs
     content.reindexObject(idxs=['allowedRolesAndUsers', 'review_state'])
     return
@@ -369,11 +375,21 @@ def isnumber(s):
 
 def bika_url_fetcher(url):
     """Basically the same as the default_url_fetcher from WeasyPrint,
-    but injects the __ac cookie to make an authenticated request to the resource.
+    but resolves resources of this site in-process (see
+    bika.lims.utils.resources). Other site URLs are fetched with the __ac
+    cookie injected to make an authenticated request to the resource.
     """
     from weasyprint import VERSION_STRING
     from weasyprint.compat import Request
     from weasyprint.compat import urlopen_contenttype
+    from bika.lims.utils.resources import resolve_url
+
+    resolved = resolve_url(url)
+    if resolved is not None:
+        data, mime_type = resolved
+        return dict(string=data,
+                    redirected_url=url,
+                    mime_type=mime_type)
 
     request = api.get_request()
     __ac = request.cookies.get("__ac", "")
@@ -402,10 +418,10 @@ def createPdf(htmlreport, outfile=None, css=None, images={}):
     css: remote URL of css file to download
     images: A dictionary containing possible URLs (keys) and local filenames
             (values) with which they may to be replaced during rendering.
-    # WeasyPrint will attempt to retrieve images directly from the URL
-    # referenced in the HTML report, which may refer back to a single-threaded
-    # (and currently occupied) zeoclient, hanging it.  All image source
-    # URL's referenced in htmlreport should be local files.
+    # WeasyPrint retrieves the images directly from the URL referenced in
+    # the HTML report. Resources of this site are resolved in-process by
+    # bika_url_fetcher, so they do not refer back to the (currently
+    # occupied) zeoclient.
     """
     # A list of files that should be removed after PDF is written
     cleanup = []
@@ -481,34 +497,73 @@ def currency_format(context, locale):
     return format
 
 
-def getHiddenAttributesForClass(classname):
+HIDDEN_ATTRIBUTES_RECORD = 'bika.lims.hiddenattributes'
+
+# Annotation key of the portal where the version of the hidden attributes is
+# stored. The version is incremented whenever the registry record changes
+# (see bika.lims.subscribers.registry). Because it is persistent, all ZEO
+# clients see the new version with their next transaction and compile the
+# record again.
+HIDDEN_ATTRIBUTES_VERSION_STORAGE = 'bika.lims.hiddenattributes.version'
+
+# site path -> (version, mapping)
+_hidden_attributes_cache = {}
+
+
+def get_hidden_attributes_version(portal):
+    """Returns the version of the hidden attributes of the given portal
+    """
+    return IAnnotations(portal).get(HIDDEN_ATTRIBUTES_VERSION_STORAGE, 0)
+
+
+def get_hidden_attributes():
+    """Returns a mapping of classname -> frozenset of hidden field names,
+    compiled from the registry record 'bika.lims.hiddenattributes'
+    """
     try:
-        registry = queryUtility(IRegistry)
-        hiddenattributes = registry.get('bika.lims.hiddenattributes', ())
-        if hiddenattributes is not None:
-            for alist in hiddenattributes:
-                if alist[0] == classname:
-                    return alist[1:]
+        portal = api.get_portal()
+        key = portal.getPhysicalPath()
+        version = get_hidden_attributes_version(portal)
     except:
         logger.warning(
             'Probem accessing optionally hidden attributes in registry')
-
-    return []
-
-
-def isAttributeHidden(classname, fieldname):
+        return {}
+    cached = _hidden_attributes_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    mapping = {}
     try:
         registry = queryUtility(IRegistry)
-        hiddenattributes = registry.get('bika.lims.hiddenattributes', ())
-        if hiddenattributes is not None:
-            for alist in hiddenattributes:
-                if alist[0] == classname:
-                    return fieldname in alist[1:]
+        hiddenattributes = registry.get(HIDDEN_ATTRIBUTES_RECORD, ())
+        for alist in hiddenattributes or ():
+            # only the first list of a classname is considered
+            if alist and alist[0] not in mapping:
+                mapping[alist[0]] = frozenset(alist[1:])
     except:
         logger.warning(
             'Probem accessing optionally hidden attributes in registry')
+        return {}
+    _hidden_attributes_cache[key] = (version, mapping)
+    return mapping
+
+
+def invalidate_hidden_attributes():
+    """Increments the version of the hidden attributes of the current portal,
+    so the record is compiled again by all ZEO clients
+    """
+    portal = api.get_portal()
+    annotation = IAnnotations(portal)
+    version = annotation.get(HIDDEN_ATTRIBUTES_VERSION_STORAGE, 0) + 1
+    annotation[HIDDEN_ATTRIBUTES_VERSION_STORAGE] = version
+    _hidden_attributes_cache.pop(portal.getPhysicalPath(), None)
+
+
+def getHiddenAttributesForClass(classname):
+    return get_hidden_attributes().get(classname, frozenset())
+
 
-    return False
+def isAttributeHidden(classname, fieldname):
+    return fieldname in getHiddenAttributesForClass(classname)
 
 
 def dicts_to_dict(dictionaries, key_subfieldname):
@@ -16,6 +16,7 @@ from bika.lims.utils import tmpID
 from bika.lims.utils import to_utf8
 from bika.lims.utils import encode_header
 from bika.lims.utils import createPdf
+from bika.lims.utils.indexing import deferred_indexing
 from bika.lims.utils import attachPdf
 from bika.lims.utils.sample import create_sample
 from bika.lims.utils.samplepartition import create_samplepartition
@@ -56,24 +57,74 @@ def create_analysisrequest(context, request, values, analyses=None,
         Allow different prices to be set for analyses.  If not set, prices
         are read from the associated analysis service.
     """
+    record = _prepare_record(context, values, analyses=analyses,
+                             partitions=partitions,
+                             specifications=specifications, prices=prices)
+    with deferred_indexing():
+        return _create_analysisrequest(request, **record)
+
+
+def create_analysisrequests(request, records):
+    """Create multiple ARs in one pass.
+
+    All records are validated before any object is created. Each created
+    object is indexed only once, after all ARs have been created.
+
+    :param request:
+        The current Request object.
+    :param records:
+        A list of dicts with the keys "context" and "values" and optionally
+        "analyses", "partitions", "specifications" and "prices". See
+        `create_analysisrequest` for the meaning of each key.
+    :returns: The list of created ARs, in the order of the records
+    """
+    records = [_prepare_record(**record) for record in records]
+    with deferred_indexing():
+        return [_create_analysisrequest(request, **record)
+                for record in records]
+
+
+def _prepare_record(context, values, analyses=None, partitions=None,
+                    specifications=None, prices=None):
+    """Validate the values for a new AR and resolve the services.
+    Raises a RuntimeError for invalid values.
+    """
+    if context is None:
+        raise RuntimeError("create_analysisrequest: no context provided")
 
-    # Gather neccesary tools
-    workflow = getToolByName(context, 'portal_workflow')
-    bc = getToolByName(context, 'bika_catalog')
-    # Analyses are analyses services
-    analyses_services = analyses
-    analyses = []
     # It's necessary to modify these and we don't want to pollute the
     # parent's data
     values = values.copy()
-    analyses_services = analyses_services if analyses_services else []
-    anv = values['Analyses'] if values.get('Analyses', None) else []
+    # Analyses are analyses services
+    analyses_services = analyses if analyses else []
+    anv = values.pop('Analyses', None) or []
     analyses_services = anv + analyses_services
 
     if not analyses_services:
         raise RuntimeError(
                 "create_analysisrequest: no analyses services provided")
 
+    # Locate the existing sample for secondary ARs
+    if values.get('Sample', False):
+        values['Sample'] = get_sample_from_values(context, values)
+
+    return {
+        'context': context,
+        'values': values,
+        'service_uids': _resolve_items_to_service_uids(analyses_services),
+        'partitions': partitions,
+        'specifications': specifications,
+        'prices': prices,
+    }
+
+
+def _create_analysisrequest(request, context, values, service_uids,
+                            partitions=None, specifications=None, prices=None):
+    """Create and initialise an AR from a prepared record
+    """
+    # Gather neccesary tools
+    workflow = getToolByName(context, 'portal_workflow')
+
     # Create new sample or locate the existing for secondary AR
     if not values.get('Sample', False):
         secondary = False
@@ -81,7 +132,7 @@ def create_analysisrequest(context, request, values, analyses=None,
         sample = create_sample(context, request, values)
     else:
         secondary = True
-        sample = get_sample_from_values(context, values)
+        sample = values['Sample']
         workflow_enabled = sample.getSamplingWorkflowEnabled()
 
     # Create the Analysis Request
@@ -90,22 +141,21 @@ def create_analysisrequest(context, request, values, analyses=None,
     # Set some required fields manually before processForm is called
     ar.setSample(sample)
     values['Sample'] = sample
+    # The analyses are not part of the values, so processForm doesn't create
+    # them. They are created below, together with the specs and prices.
     ar.processForm(REQUEST=request, values=values)
     # Object has been renamed
     ar.edit(RequestID=ar.getId())
 
+    # Set analysis request analyses
+    ar.setAnalyses(service_uids, prices=prices, specs=specifications)
+    # Gettin the ar objects
+    analyses = ar.objectValues('Analysis')
+
     # Set initial AR state
     action = '{0}sampling_workflow'.format('' if workflow_enabled else 'no_')
     workflow.doActionFor(ar, action)
 
-    # Set analysis request analyses
-    service_uids = _resolve_items_to_service_uids(analyses_services)
-    # processForm already has created the analyses, but here we create the
-    # analyses with specs and prices. This function, even it is called 'set',
-    # deletes the old analyses, so eventually we obtain the desired analyses.
-    ar.setAnalyses(service_uids, prices=prices, specs=specifications)
-    # Gettin the ar objects
-    analyses = ar.getAnalyses(full_objects=True)
     # Continue to set the state of the AR
     skip_receive = ['to_be_sampled', 'sample_due', 'sampled', 'to_be_preserved']
     if secondary:
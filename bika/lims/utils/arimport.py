@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from bika.lims import api
+from bika.lims.utils import getUsers
+
+"""Setup lookups of AR Imports
+
+The rows of an AR Import reference analysis services (by keyword, title or
+UID), analysis profiles (by profile key, title or UID), samplers (by user id
+or full name) and containers (by UID). Validation and import used to query the
+setup catalog (or wake up all the profiles, or list all the users) for each
+value of each row.
+
+`ImportLookups` reads the setup once and resolves the values of all the rows
+from in-memory tables. One instance is shared by the validation and the
+import of an AR Import within a request (see `get_lookups`).
+"""
+
+LOOKUPS_KEY = "arimport_lookups"
+
+
+class ImportLookups(object):
+    """Lookup tables of the setup objects referenced by AR Import rows
+    """
+
+    def __init__(self, context):
+        self.context = context
+        bsc = api.get_tool("bika_setup_catalog")
+
+        # keyword/title/UID -> service UID. Keywords take precedence over
+        # titles, and titles over UIDs
+        self.services = {}
+        brains = bsc(portal_type="AnalysisService")
+        for attr in ("UID", "Title", "getKeyword"):
+            for brain in brains:
+                value = getattr(brain, attr, None)
+                if value:
+                    self.services[value] = brain.UID
+        self.keywords = set([brain.getKeyword for brain in brains
+                             if brain.getKeyword])
+
+        # key/title/UID -> (profile UID, service UIDs)
+        self.profiles = {}
+        self.profile_names = set()
+        for brain in bsc(portal_type="AnalysisProfile"):
+            profile = api.get_object(brain)
+            record = (brain.UID, profile.getRawService() or [])
+            names = [profile.getProfileKey(), brain.UID, profile.Title()]
+            for name in names:
+                if name and name not in self.profiles:
+                    self.profiles[name] = record
+            self.profile_names.update([profile.Title(),
+                                       profile.getProfileKey()])
+
+        # UID -> brain, for both containers and container types
+        self.containers = {}
+        for brain in bsc(portal_type=["Container", "ContainerType"]):
+            self.containers[brain.UID] = brain
+
+        self._samplers = None
+
+    @property
+    def samplers(self):
+        """List of (user id, full name) of the lab managers and samplers
+        """
+        if self._samplers is None:
+            users = getUsers(self.context, ["LabManager", "Sampler"])
+            self._samplers = users.items()
+        return self._samplers
+
+    def is_keyword(self, value):
+        return value in self.keywords
+
+    def is_profile(self, value):
+        """True if the value is the title or the key of a profile
+        """
+        return value in self.profile_names
+
+    def get_service_uid(self, value):
+        """Returns the UID of the service with the keyword, title or UID
+        """
+        return self.services.get(value)
+
+    def get_profile_uid(self, value):
+        """Returns the UID of the profile with the key, title or UID
+        """
+        record = self.profiles.get(value)
+        return record and record[0] or None
+
+    def get_profile_services(self, value):
+        """Returns the service UIDs of the profile with the key, title or UID,
+        None if there is no such profile
+        """
+        record = self.profiles.get(value)
+        return list(record[1]) if record else None
+
+    def get_container(self, uid):
+        """Returns the container or container type with the UID
+        """
+        brain = self.containers.get(uid)
+        return brain and api.get_object(brain) or None
+
+    def get_sampler_id(self, value):
+        """Returns the id of the sampler with the user id or full name. An
+        empty string is returned if the sampler is not found or ambiguous.
+        """
+        user_ids = []
+        for sampler_id, sampler_name in self.samplers:
+            if value == sampler_id:
+                return sampler_id
+            if value == sampler_name:
+                user_ids.append(sampler_id)
+        if len(user_ids) == 1:
+            return user_ids[0]
+        return ""
+
+
+def get_lookups(context):
+    """Returns the lookups of the AR Import, built once per request
+    """
+    request = api.get_request()
+    if request is None:
+        return ImportLookups(context)
+    key = "{}_{}".format(LOOKUPS_KEY, api.get_uid(context))
+    lookups = request.get(key)
+    if lookups is None:
+        lookups = ImportLookups(context)
+        request[key] = lookups
+    return lookups
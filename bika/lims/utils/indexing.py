@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from Products.CMFCore.utils import getToolByName
+
+from bika.lims import logger
+
+"""Deferred (coalesced) catalog indexing
+
+Bulk operations like the creation of many ARs or the cascading of workflow
+transitions reindex the same objects many times. Within `deferred_indexing`,
+the (re)index requests of Archetypes objects are queued instead, and each
+object is reindexed only once when the outermost block exits.
+
+To keep catalog queries consistent, the queued objects of a catalog are
+processed before the catalog is searched (see `bika.lims.monkey.indexing`).
+Unindex requests are never deferred.
+
+Updates of some indexes of an object in a single catalog (see
+`catalog_object`) are queued as well, and processed after the reindex
+requests.
+"""
+
+# marker for a full reindex of all indexes
+ALL_INDEXES = None
+
+_local = threading.local()
+
+
+class IndexingQueue(object):
+    """Queue of pending (re)index operations, keyed by the physical path
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.processing = False
+        self.pending = OrderedDict()
+        # (path, catalog id) -> (object, indexes)
+        self.catalog_pending = OrderedDict()
+
+    @property
+    def active(self):
+        return self.depth > 0 and not self.processing
+
+    def get_key(self, obj):
+        return "/".join(obj.getPhysicalPath())
+
+    def add(self, obj, idxs=ALL_INDEXES):
+        """Queue a (re)index of the given object.
+        """
+        key = self.get_key(obj)
+        idxs = idxs and set(idxs) or ALL_INDEXES
+        if key in self.pending:
+            queued_idxs = self.pending[key][1]
+            if queued_idxs is ALL_INDEXES or idxs is ALL_INDEXES:
+                idxs = ALL_INDEXES
+            else:
+                idxs = queued_idxs.union(idxs)
+            catalogs = self.pending[key][2]
+        else:
+            catalogs = [catalog.getId() for catalog in obj.getCatalogs()]
+        self.pending[key] = (obj, idxs, catalogs)
+
+    def remove(self, obj):
+        """Discard a pending (re)index of the given object
+        """
+        self.pending.pop(self.get_key(obj), None)
+
+    def add_catalog_update(self, obj, catalog_id, idxs):
+        """Queue an update of the given indexes and of the metadata of the
+        object in a single catalog. Pending updates are processed after the
+        pending (re)index requests, so the indexes of the object can be
+        computed from up-to-date searches of other catalogs.
+        """
+        key = (self.get_key(obj), catalog_id)
+        if key in self.catalog_pending:
+            idxs = self.catalog_pending.pop(key)[1].union(idxs)
+        self.catalog_pending[key] = (obj, set(idxs))
+
+    def clear(self):
+        self.pending.clear()
+        self.catalog_pending.clear()
+
+    def get_keys_for(self, catalog_id=None):
+        if catalog_id is None:
+            return self.pending.keys()
+        return [key for key, (obj, idxs, catalogs) in self.pending.items()
+                if catalog_id in catalogs]
+
+    def get_catalog_keys_for(self, catalog_id=None):
+        return [key for key in self.catalog_pending.keys()
+                if catalog_id in (None, key[1])]
+
+    def process(self, catalog_id=None):
+        """Reindex all queued objects once. If a catalog id is given, only the
+        objects indexed in this catalog are processed.
+        """
+        if not (self.pending or self.catalog_pending) or self.processing:
+            return 0
+        self.processing = True
+        try:
+            count = 0
+            if self.get_catalog_keys_for(catalog_id):
+                # the updates might search any catalog, all the objects are
+                # reindexed first
+                catalog_id = None
+            keys = self.get_keys_for(catalog_id)
+            while keys:
+                for key in keys:
+                    if key not in self.pending:
+                        continue
+                    obj, idxs, catalogs = self.pending.pop(key)
+                    idxs = [] if idxs is ALL_INDEXES else list(idxs)
+                    obj._old_reindexObject(idxs=idxs)
+                    count += 1
+                # reindexing might have queued new operations
+                keys = self.get_keys_for(catalog_id)
+            for key in self.get_catalog_keys_for(catalog_id):
+                obj, idxs = self.catalog_pending.pop(key)
+                catalog_object(obj, key[1], idxs)
+                count += 1
+        finally:
+            self.processing = False
+        logger.debug("Processed {} deferred reindex operations".format(count))
+        return count
+
+
+def catalog_object(obj, catalog_id, idxs):
+    """Update the given indexes and the metadata of the object in a single
+    catalog. The indexes must exist in the catalog: the catalog reindexes all
+    its indexes otherwise.
+    """
+    catalog = getToolByName(obj, catalog_id)
+    catalog.catalog_object(obj, "/".join(obj.getPhysicalPath()),
+                           idxs=list(idxs), update_metadata=1)
+
+
+def update_catalog(obj, catalog_id, idxs):
+    """Update the given indexes and the metadata of the object in a single
+    catalog, deferred inside `deferred_indexing`. Unlike reindexObject, the
+    other catalogs of the object are left untouched.
+    """
+    queue = get_queue()
+    if queue.active:
+        return queue.add_catalog_update(obj, catalog_id, idxs)
+    return catalog_object(obj, catalog_id, idxs)
+
+
+def get_queue():
+    """Returns the indexing queue of the current thread
+    """
+    queue = getattr(_local, "queue", None)
+    if queue is None:
+        queue = _local.queue = IndexingQueue()
+    return queue
+
+
+def process_queue(catalog_id=None):
+    """Process the pending (re)index operations of the current thread
+    """
+    queue = getattr(_local, "queue", None)
+    if queue is None:
+        return 0
+    return queue.process(catalog_id)
+
+
+@contextmanager
+def deferred_indexing():
+    """Defer and coalesce all (re)index operations until the outermost block
+    exits. Pending operations are discarded if an error is raised, in the
+    block or while processing the queue, because the transaction is going to
+    be aborted anyway: the queue of the thread must not keep objects of the
+    aborted transaction for the next request.
+    """
+    queue = get_queue()
+    queue.depth += 1
+    try:
+        yield queue
+        if queue.depth == 1:
+            queue.process()
+    finally:
+        queue.depth -= 1
+        if queue.depth == 0:
+            queue.clear()
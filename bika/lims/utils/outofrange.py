@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from zope.component import getSiteManager
+from zope.component import getUtility
+from zope.interface import providedBy
+
+from bika.lims import api
+from bika.lims.interfaces import IResultOutOfRange
+from bika.lims.interfaces import ISpecificationIndex
+
+"""Batch evaluation of results against results ranges and detection limits
+
+Listings and reports flag out-of-range results, results in the shoulder range
+(out of range, but within the % error) and results below/above the detection
+limits. Instead of going through the `IResultOutOfRange` adapters and the
+detection limit methods of each analysis, the results of a whole page or
+report are evaluated in one pass:
+
+- the results ranges of all analyses are looked up at once in the
+  specification index (see `bika.lims.specindex`)
+- the min/max/error values of each distinct range are converted to floats
+  once, no matter how many analyses share the range
+- the detection limits are read once per service
+
+The rules are the same as in `bika.lims.browser.analysis.ResultOutOfRange`
+and `Analysis.isBelowLowerDetectionLimit`/`isAboveUpperDetectionLimit`.
+Analyses with other `IResultOutOfRange` adapters than this default one (e.g.
+the duplicate variation of duplicate analyses, the reference values of
+reference analyses, or the adapters of add-ons) are still checked by their
+adapters. The adapters are looked up once per set of provided interfaces.
+Like the adapters, the results of retracted analyses are never out of range.
+
+`bika/lims/scripts/benchmark_outofrange.py` compares the evaluator with the
+per-result arithmetic of the default adapter and, on the analyses of a site,
+with the per-analysis adapter calls the listings and reports used to make.
+"""
+
+
+def to_float(value, default=None):
+    """Converts the value to a float, returns the default if the value is
+    not floatable
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def compile_range(spec):
+    """Returns a tuple of (min, max, error) floats for the results range.
+    Unset min/max values are None, an unset error is 0.
+    """
+    return (to_float(spec.get('min')),
+            to_float(spec.get('max')),
+            to_float(spec.get('error'), 0))
+
+
+def check_range(result, spec_min, spec_max, error):
+    """Returns a tuple of (out of range, acceptable) for the float result.
+    A result is acceptable if it is out of range, but within the % error
+    (shoulder range).
+    """
+    error_amount = (result / 100) * error
+    if spec_min and result < spec_min and result + error_amount >= spec_min:
+        return True, True
+    if spec_max and result > spec_max and result - error_amount <= spec_max:
+        return True, True
+    if spec_min is not None and result < spec_min:
+        return True, False
+    if spec_max is not None and result > spec_max:
+        return True, False
+    return False, False
+
+
+def check_detection_limits(result, value, operand, ldl, udl):
+    """Returns a tuple of (below LDL, above UDL) for the result, its float
+    value (or None) and the detection limit operand
+    """
+    below = operand == '<'
+    above = operand == '>'
+    if not result:
+        return below, above
+    if value is None:
+        result = str(result).strip()
+        return below or result.startswith('<'), above or result.startswith('>')
+    return below or value < ldl, above or value > udl
+
+
+def evaluate(records):
+    """Evaluates a sequence of (result, results range, detection limit
+    operand, LDL, UDL) records. Returns a list of flag dicts with the keys
+    'out_of_range', 'acceptable', 'below_ldl', 'above_udl', 'is_ldl' and
+    'is_udl', in the same order as the records.
+    """
+    ranges = {}
+    flags = []
+    append = flags.append
+    for result, spec, operand, ldl, udl in records:
+        value = to_float(result)
+        out_of_range = acceptable = False
+        if spec and value is not None:
+            key = (spec.get('min'), spec.get('max'), spec.get('error'))
+            compiled = ranges.get(key)
+            if compiled is None:
+                compiled = ranges[key] = compile_range(spec)
+            out_of_range, acceptable = check_range(value, *compiled)
+        below, above = check_detection_limits(result, value, operand,
+                                              ldl, udl)
+        append({
+            'out_of_range': out_of_range,
+            'acceptable': acceptable,
+            'below_ldl': below,
+            'above_udl': above,
+            'is_ldl': below and operand == '<',
+            'is_udl': above and operand == '>',
+        })
+    return flags
+
+
+def get_adapter_factories(analysis, cache):
+    """Returns the factories of the IResultOutOfRange adapters of the
+    analysis, or None if the analysis only has the default adapter
+    """
+    from bika.lims.browser.analysis import ResultOutOfRange
+    provided = providedBy(analysis)
+    if provided not in cache:
+        factories = getSiteManager().adapters.lookupAll(
+            (provided, ), IResultOutOfRange)
+        factories = [factory for name, factory in factories]
+        if factories == [ResultOutOfRange]:
+            factories = None
+        cache[provided] = factories
+    return cache[provided]
+
+
+def check_adapters(analysis, factories, spec):
+    """Returns a tuple of (out of range, acceptable) for the analysis, from
+    its IResultOutOfRange adapters
+    """
+    for factory in factories:
+        adapter = factory(analysis)
+        if spec:
+            ret = adapter(specification=spec)
+        else:
+            ret = adapter()
+        if ret and ret.get('out_of_range'):
+            return True, ret.get('acceptable', False)
+    return False, False
+
+
+def evaluate_analyses(analyses, ranges=None):
+    """Evaluates the results of the given analyses. Returns a dict of
+    analysis UID -> flags (see `evaluate`).
+
+    `ranges` is a dict of analysis UID -> results range. The ranges are
+    looked up in the specification index if not given. Retracted analyses
+    are never out of range.
+    """
+    if ranges is None:
+        ranges = getUtility(ISpecificationIndex).get_ranges(analyses)
+    limits = {}
+    factories = {}
+    uids = []
+    records = []
+    custom = []
+    for analysis in analyses:
+        service_uid = analysis.getServiceUID()
+        if service_uid not in limits:
+            service = analysis.getService()
+            limits[service_uid] = (service.getLowerDetectionLimit(),
+                                   service.getUpperDetectionLimit())
+        ldl, udl = limits[service_uid]
+        operand = ''
+        if hasattr(analysis, 'getDetectionLimitOperand'):
+            operand = analysis.getDetectionLimitOperand()
+        uid = api.get_uid(analysis)
+        uids.append(uid)
+        # retracted results are not checked against the range
+        spec = None
+        retracted = api.get_workflow_status_of(analysis) == 'retracted'
+        if not retracted:
+            spec = ranges.get(uid)
+        records.append((analysis.getResult(), spec, operand, ldl, udl))
+        if retracted:
+            continue
+        analysis_factories = get_adapter_factories(analysis, factories)
+        if analysis_factories is not None:
+            custom.append((uid, analysis, analysis_factories))
+    flags = dict(zip(uids, evaluate(records)))
+    for uid, analysis, analysis_factories in custom:
+        out_of_range, acceptable = check_adapters(
+            analysis, analysis_factories, ranges.get(uid))
+        flags[uid]['out_of_range'] = out_of_range
+        flags[uid]['acceptable'] = acceptable
+    return flags
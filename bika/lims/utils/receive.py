@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from zope.component import getUtility
+
+from bika.lims import api
+from bika.lims import bikaMessageFactory as _
+from bika.lims.cascade import CascadePlan
+from bika.lims.cascade import get_key
+from bika.lims.identifierregistry import CLIENT_SAMPLE_ID
+from bika.lims.identifierregistry import ID
+from bika.lims.identifierregistry import SAMPLE_ID
+from bika.lims.identifierregistry import TITLE
+from bika.lims.identifierregistry import normalize
+from bika.lims.interfaces import IIdentifierRegistry
+from bika.lims.utils import t
+from bika.lims.utils.indexing import deferred_indexing
+
+"""Bulk reception of samples
+
+The receive station scans the barcodes of the arriving samples one after the
+other. Receiving them one by one (a request, a workflow transition and the
+reindexing of the sample, its partitions, ARs and analyses per scan) does not
+keep up with the scanner, so the scanned identifiers are queued by the
+browser and received in batches:
+
+1. the identifiers are resolved at once with the identifier registry
+2. the samples are received in one cascade plan. The transitions of the
+   partitions, ARs and analyses of each sample are cascaded by the workflow
+   scripts, and the reindexing of all the objects is deferred to the end of
+   the batch, so each object is reindexed once.
+
+`receive_samples` takes a list of scanned identifiers (ids, barcodes or
+Client Sample IDs of Samples and ARs) and returns a mapping of identifier ->
+outcome.
+"""
+
+RECEIVE_KINDS = (ID, TITLE, SAMPLE_ID, CLIENT_SAMPLE_ID)
+
+
+def get_objects(uids):
+    """Returns a dict of UID -> Sample or AR for the given UIDs
+    """
+    query = {"UID": list(uids), "portal_type": ["Sample", "AnalysisRequest"]}
+    brains = api.search(query, "bika_catalog")
+    return dict([(brain.UID, api.get_object(brain)) for brain in brains])
+
+
+def get_target(obj):
+    """Returns the object to receive for the scanned Sample or AR: the sample
+    of an AR, unless it was already received (secondary ARs)
+    """
+    if api.get_portal_type(obj) == "Sample":
+        return obj
+    sample = obj.getSample()
+    if sample is None or api.get_workflow_status_of(sample) != "sample_due":
+        return obj
+    return sample
+
+
+def receive_samples(identifiers):
+    """Receive the Samples and ARs with the given identifiers.
+
+    Returns a dict of identifier -> outcome, a dict with the keys:
+
+    - uid: the UID of the received object
+    - id: the id of the received object
+    - url: the url of the received object
+    - received: the object was received by this call
+    - review_state: the review state after the reception
+    - message: the reason why the object was not received
+    """
+    registry = getUtility(IIdentifierRegistry)
+    identifiers = [normalize(identifier) for identifier in identifiers]
+    identifiers = [identifier for identifier in identifiers if identifier]
+    uids = registry.resolve_many(identifiers, RECEIVE_KINDS)
+    objects = get_objects(filter(None, uids.values()))
+
+    outcomes = {}
+    targets = {}
+    plan = CascadePlan()
+    for identifier in identifiers:
+        outcome = outcomes[identifier] = {
+            "uid": None,
+            "id": None,
+            "url": None,
+            "received": False,
+            "review_state": None,
+            "message": "",
+        }
+        obj = objects.get(uids.get(identifier))
+        if obj is None:
+            outcome["message"] = t(_("No sample found"))
+            continue
+        target = get_target(obj)
+        outcome["uid"] = api.get_uid(target)
+        outcome["id"] = api.get_id(target)
+        outcome["url"] = api.get_url(target)
+        targets[identifier] = target
+        # a sample scanned twice is received once
+        plan.add(target, "receive")
+
+    with deferred_indexing():
+        plan.execute()
+
+    for identifier, target in targets.items():
+        outcome = outcomes[identifier]
+        key = get_key(target, "receive")
+        state = api.get_workflow_status_of(target)
+        outcome["review_state"] = state
+        if key in plan.errors:
+            outcome["message"] = plan.errors[key]
+        elif key not in plan.keys:
+            outcome["message"] = t(_("Cannot receive ${id} in state ${state}",
+                                     mapping={"id": outcome["id"],
+                                              "state": state}))
+        else:
+            outcome["received"] = state == "sample_received"
+    return outcomes
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import mimetypes
+import os
+import threading
+import urlparse
+from collections import OrderedDict
+
+from Acquisition import aq_base
+from Acquisition import aq_parent
+from OFS.Image import Pdata
+from Products.CMFCore.FSDTMLMethod import FSDTMLMethod
+from Products.CMFCore.FSFile import FSFile
+from Products.CMFCore.FSImage import FSImage
+
+from bika.lims import api
+from bika.lims import logger
+
+"""In-process resource resolver
+
+WeasyPrint fetches every image and stylesheet referenced in a report. For
+URLs pointing to this site, the resources are resolved by traversal instead of
+a loopback HTTP request, which is slow and can hang a single-threaded ZEO
+client that is busy rendering the report.
+
+Traversal is done with the permissions of the current user. Static files
+and images are read as they are, and their contents are kept in a LRU cache
+shared across renders, keyed by the file modification time or the ZODB
+modification time of the object. Anything else (DTML methods like the
+`*.css.dtml` skin files, page templates, scripts and views) is rendered by
+calling it in-process, and not cached.
+"""
+
+# maximum number of cached resources
+CACHE_MAX_ITEMS = 256
+# maximum total size of the cached resources in bytes
+CACHE_MAX_SIZE = 64 * 1024 * 1024
+# resources larger than this are not cached
+CACHE_MAX_ITEM_SIZE = 4 * 1024 * 1024
+
+
+class LRUCache(object):
+    """Thread-safe LRU cache limited by number of items and total size
+    """
+
+    def __init__(self, max_items=CACHE_MAX_ITEMS, max_size=CACHE_MAX_SIZE,
+                 max_item_size=CACHE_MAX_ITEM_SIZE):
+        self.max_items = max_items
+        self.max_size = max_size
+        self.max_item_size = max_item_size
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            value = self.items.pop(key, None)
+            if value is None:
+                return default
+            # move to the end (most recently used)
+            self.items[key] = value
+            return value
+
+    def set(self, key, data, mime_type):
+        if len(data) > self.max_item_size:
+            return
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self.items[key] = (data, mime_type)
+            self.size += len(data)
+            while self.items and (len(self.items) > self.max_items or
+                                  self.size > self.max_size):
+                _, (old_data, _) = self.items.popitem(last=False)
+                self.size -= len(old_data)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self.items)
+
+
+resource_cache = LRUCache()
+
+
+def get_file_path(obj):
+    """Returns the filesystem path of browser resources and static skin files
+    """
+    # ++resource++ files and files of resource directories
+    context = getattr(obj, "context", None)
+    path = getattr(context, "path", None)
+    if isinstance(path, basestring) and os.path.isfile(path):
+        return path
+    # CMF filesystem files and images. The sources of the other skin objects
+    # (DTML methods, page templates, scripts) must be rendered
+    if not isinstance(aq_base(obj), (FSFile, FSImage)):
+        return None
+    path = getattr(aq_base(obj), "_filepath", None)
+    if isinstance(path, basestring) and os.path.isfile(path):
+        return path
+    return None
+
+
+def get_data(obj):
+    """Returns the raw data of OFS files/images, blobs and image scales
+    """
+    data = getattr(aq_base(obj), "data", None)
+    if data is None:
+        return None
+    if isinstance(data, Pdata):
+        return str(data)
+    if isinstance(data, basestring):
+        return data
+    # blob wrappers and image scales wrap the actual file
+    return get_data(data)
+
+
+def render(obj, url):
+    """Render the object in-process. Returns a tuple of (data, mime type) or
+    None if the object can not be rendered
+    """
+    if not callable(obj):
+        return None
+    request = api.get_request()
+    response = request.RESPONSE
+    # the rendered object may set the headers of the response of the report
+    content_type = response.getHeader("Content-Type")
+    try:
+        if isinstance(aq_base(obj), FSDTMLMethod):
+            data = obj(aq_parent(obj), request)
+        else:
+            data = obj()
+        mime_type = response.getHeader("Content-Type")
+    except Exception as e:
+        logger.warn("Can not render {}: {}".format(url, e))
+        return None
+    finally:
+        if content_type:
+            response.setHeader("Content-Type", content_type)
+        else:
+            response.headers.pop("content-type", None)
+    if isinstance(data, unicode):
+        data = data.encode("utf-8")
+    if not isinstance(data, str):
+        return None
+    mime_type = mimetypes.guess_type(url)[0] or mime_type or "text/html"
+    return data, mime_type.split(";")[0]
+
+
+def get_mime_type(obj, url):
+    mime_type = getattr(aq_base(obj), "content_type", None)
+    if not mime_type:
+        context = getattr(obj, "context", None)
+        mime_type = getattr(context, "content_type", None)
+    if not mime_type and hasattr(aq_base(obj), "getContentType"):
+        mime_type = obj.getContentType()
+    if not mime_type:
+        mime_type = mimetypes.guess_type(url)[0]
+    return mime_type or "application/octet-stream"
+
+
+def traverse_url(url):
+    """Traverse to the object the URL points to. Returns None if the URL does
+    not belong to this site or if the object can not be traversed.
+    """
+    request = api.get_request()
+    if request is None:
+        return None
+    host = request.get_header("HOST")
+    parts = urlparse.urlsplit(url)
+    if not host or parts.netloc != host:
+        return None
+    try:
+        path = request.physicalPathFromURL(
+            urlparse.urlunsplit(parts[:3] + ("", "")))
+        return api.get_portal().restrictedTraverse("/".join(path))
+    except Exception as e:
+        logger.debug("Can not traverse to {}: {}".format(url, e))
+        return None
+
+
+def resolve_url(url):
+    """Resolve a site URL in-process. Returns a tuple of (data, mime type) or
+    None if the URL can not be resolved this way.
+    """
+    obj = traverse_url(url)
+    if obj is None:
+        return None
+
+    path = get_file_path(obj)
+    if path is not None:
+        key = ("file", path, os.path.getmtime(path))
+        cached = resource_cache.get(key)
+        if cached is not None:
+            return cached
+        with open(path, "rb") as f:
+            data = f.read()
+    else:
+        mtime = getattr(aq_base(obj), "_p_mtime", None)
+        key = mtime and ("zodb", "/".join(obj.getPhysicalPath()), mtime)
+        cached = key and resource_cache.get(key)
+        if cached:
+            return cached
+        data = get_data(obj)
+        if data is None:
+            return render(obj, url)
+
+    mime_type = get_mime_type(obj, url)
+    if key:
+        resource_cache.set(key, data, mime_type)
+    return data, mime_type
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from Products.CMFCore.utils import getToolByName
+from Products.CMFPlone.utils import _createObjectByType
+
+from bika.lims import api
+from bika.lims import logger
+from bika.lims.utils import changeWorkflowState
+from bika.lims.utils.indexing import deferred_indexing
+
+"""Retests of retracted analyses
+
+When an analysis is retracted, it is renamed and a copy of it (the retest) is
+created in the same Analysis Request. If the retracted analysis is assigned to
+a worksheet, the retest is added to the same worksheet, in the same slot.
+
+Mass retractions (e.g. all the analyses of a failed QC run) used to rewrite
+the Analyses references and the layout of the worksheet once per retest.
+Within `retest_batch`, the worksheet updates are queued instead and applied
+once per worksheet, when the outermost block exits. The analyses of the
+worksheet are never woken up for this.
+"""
+
+_local = threading.local()
+
+
+class WorksheetQueue(object):
+    """Queue of retests to add to the worksheets, keyed by worksheet path
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.pending = OrderedDict()
+
+    @property
+    def active(self):
+        return self.depth > 0
+
+    def add(self, worksheet, retracted_uid, retest):
+        key = api.get_path(worksheet)
+        if key not in self.pending:
+            self.pending[key] = (worksheet, [])
+        self.pending[key][1].append((retracted_uid, retest))
+
+    def clear(self):
+        self.pending.clear()
+
+    def process(self):
+        count = 0
+        while self.pending:
+            key, (worksheet, retests) = self.pending.popitem(last=False)
+            add_retests_to_worksheet(worksheet, retests)
+            count += len(retests)
+        return count
+
+
+def get_queue():
+    """Returns the worksheet queue of the current thread
+    """
+    queue = getattr(_local, "queue", None)
+    if queue is None:
+        queue = _local.queue = WorksheetQueue()
+    return queue
+
+
+@contextmanager
+def retest_batch():
+    """Add the retests created within the block to their worksheets when the
+    outermost block exits, with one update per worksheet
+    """
+    queue = get_queue()
+    queue.depth += 1
+    try:
+        with deferred_indexing():
+            yield queue
+            if queue.depth == 1:
+                queue.process()
+    except:
+        queue.depth -= 1
+        if queue.depth == 0:
+            queue.clear()
+        raise
+    queue.depth -= 1
+
+
+def get_worksheet(analysis):
+    """Returns the worksheet the analysis is assigned to, None otherwise
+    """
+    worksheets = analysis.getBackReferences("WorksheetAnalysis")
+    return worksheets and worksheets[0] or None
+
+
+def get_retest_id(analysis):
+    """Returns the id to rename the retracted analysis to. Multiple
+    retractions are supported by renaming to *-0, *-1, etc.
+    """
+    parent = api.get_parent(analysis)
+    prefix = api.get_id(analysis)
+    count = len([oid for oid in parent.objectIds("Analysis")
+                 if oid.startswith(prefix)])
+    return "{}-{}".format(analysis.getKeyword(), count)
+
+
+def create_retest(analysis):
+    """Rename the retracted analysis and create its retest in the same
+    container. Returns the retest.
+    """
+    parent = api.get_parent(analysis)
+    keyword = analysis.getKeyword()
+    # LIMS-1290 - Analyst must be able to retract, which creates a new
+    # Analysis. The permission check is cancelled with this.
+    parent._verifyObjectPaste = str
+    parent.manage_renameObject(keyword, get_retest_id(analysis))
+    delattr(parent, '_verifyObjectPaste')
+    # Create new analysis and copy values from retracted
+    retest = _createObjectByType("Analysis", parent, keyword)
+    retest.edit(
+        Service=analysis.getService(),
+        Calculation=analysis.getCalculation(),
+        InterimFields=analysis.getInterimFields(),
+        ResultDM=analysis.getResultDM(),
+        Retested=True,
+        MaxTimeAllowed=analysis.getMaxTimeAllowed(),
+        DueDate=analysis.getDueDate(),
+        Duration=analysis.getDuration(),
+        ReportDryMatter=analysis.getReportDryMatter(),
+        Analyst=analysis.getAnalyst(),
+        Instrument=analysis.getInstrument(),
+        SamplePartition=analysis.getSamplePartition())
+    retest.setDetectionLimitOperand(analysis.getDetectionLimitOperand())
+    retest.setResult(analysis.getResult())
+    # Required number of verifications
+    retest.setNumberOfRequiredVerifications(
+        analysis.getNumberOfRequiredVerifications())
+    retest.unmarkCreationFlag()
+    changeWorkflowState(retest, "bika_analysis_workflow", "sample_received")
+    retest.reindexObject()
+    return retest
+
+
+def add_retest_to_worksheet(worksheet, retracted_uid, retest):
+    """Add the retest to the slot of the retracted analysis in the worksheet.
+    The update is queued inside `retest_batch`.
+    """
+    queue = get_queue()
+    if queue.active:
+        queue.add(worksheet, retracted_uid, retest)
+    else:
+        add_retests_to_worksheet(worksheet, [(retracted_uid, retest)])
+
+
+def add_retests_to_worksheet(worksheet, retests):
+    """Add the retests to the worksheet with one update of its analyses and
+    layout. `retests` is a list of (retracted analysis UID, retest) tuples.
+    """
+    workflow = getToolByName(worksheet, "portal_workflow")
+    request = api.get_request()
+    analysis_uids = list(worksheet.getRawAnalyses())
+    layout = list(worksheet.getLayout())
+    positions = dict([(slot["analysis_uid"], slot["position"])
+                      for slot in layout])
+    container_positions = dict([(slot["container_uid"], slot["position"])
+                                for slot in layout])
+    instrument = worksheet.getInstrument()
+    methods = instrument and instrument.getMethods() or []
+
+    added = []
+    for retracted_uid, retest in retests:
+        uid = api.get_uid(retest)
+        if uid in positions:
+            continue
+        # If the ws has an instrument assigned for which the analysis is
+        # allowed, set it
+        if instrument and retest.isInstrumentAllowed(instrument):
+            if methods:
+                retest.setMethod(methods[0])
+            retest.setInstrument(instrument)
+        container_uid = api.get_uid(api.get_parent(retest))
+        position = positions.get(retracted_uid)
+        if position is None:
+            position = container_positions.get(container_uid)
+        if position is None:
+            used = [0] + [int(pos) for pos in positions.values()]
+            position = max(used) + 1
+        slot = {"position": position,
+                "type": "a",
+                "container_uid": container_uid,
+                "analysis_uid": uid}
+        layout.append(slot)
+        positions[uid] = position
+        analysis_uids.append(uid)
+        added.append(retest)
+
+    if not added:
+        return
+    worksheet.setAnalyses(analysis_uids)
+    worksheet.setLayout(layout)
+
+    # The assign script of the analyses looks up the worksheet by context_uid
+    context_uid = request.get("context_uid")
+    request["context_uid"] = api.get_uid(worksheet)
+    try:
+        for retest in added:
+            transitions = [t["id"] for t in workflow.getTransitionsFor(retest)]
+            if "assign" in transitions:
+                workflow.doActionFor(retest, "assign")
+    finally:
+        request["context_uid"] = context_uid
+    logger.debug("Added {} retests to {}".format(len(added),
+                                                 api.get_id(worksheet)))
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Bika LIMS
+#
+# Copyright 2011-2017 by it's authors.
+# Some rights reserved. See LICENSE.txt, AUTHORS.txt.
+
+from AccessControl import getSecurityManager
+from Products.CMFPlone.utils import safe_unicode
+from zope.component import getUtility
+
+from bika.lims import api
+from bika.lims import bikaMessageFactory as _
+from bika.lims.cascade import CascadePlan
+from bika.lims.cascade import get_key
+from bika.lims.interfaces import IAnalysisRequest
+from bika.lims.interfaces import IServiceDependencyGraph
+from bika.lims.permissions import EditFieldResults
+from bika.lims.permissions import EditResults
+from bika.lims.utils import isActive
+from bika.lims.utils import t
+from bika.lims.utils.indexing import deferred_indexing
+
+"""Bulk submission of results
+
+Results entry (Worksheet and AR manage results) submits the results of many
+analyses at once. The submission is done in three passes:
+
+1. the values (result, interim fields, method, instrument...) of all analyses
+   are applied
+2. the calculated results of the dependents of the changed analyses are
+   recalculated once, in dependency order
+3. the analyses are submitted in one batch, in dependency order. The workflow
+   scripts of the submitted analyses don't submit their dependents again
+   (see `bika.lims.cascade`) and each analysis is reindexed once.
+
+`submit_results` takes a mapping of analysis UID -> values, with the keys of
+`FIELDS`, and returns a mapping of analysis UID -> outcome.
+"""
+
+FIELDS = ("Result", "ResultDM", "InterimFields", "Method", "Instrument",
+          "Analyst", "Uncertainty", "DetectionLimit", "Remarks", "Retested")
+
+# states of the dependencies which prevent the submission of the dependents
+PRE_SUBMIT_STATES = ("to_be_sampled", "to_be_preserved", "sample_due",
+                     "sample_received")
+
+
+def get_analyses(uids):
+    """Returns a dict of UID -> analysis for the given UIDs
+    """
+    query = {"UID": list(uids)}
+    brains = api.search(query, "bika_analysis_catalog")
+    return dict([(brain.UID, api.get_object(brain)) for brain in brains])
+
+
+def can_edit_results(analysis):
+    """Returns True if the current user can enter results for the analysis
+    """
+    sm = getSecurityManager()
+    return sm.checkPermission(EditResults, analysis) or \
+        sm.checkPermission(EditFieldResults, analysis)
+
+
+def set_instrument(analysis, instrument_uid):
+    """Assign the instrument to the analysis if it is allowed. An empty UID
+    removes the instrument.
+    """
+    if instrument_uid and not analysis.isInstrumentAllowed(instrument_uid):
+        return
+    previous = analysis.getInstrument()
+    if previous:
+        previous.removeAnalysis(analysis)
+    if not instrument_uid:
+        analysis.setInstrument(None)
+        return
+    analysis.setInstrument(instrument_uid)
+    instrument = analysis.getInstrument()
+    instrument.addAnalysis(analysis)
+    if api.get_portal_type(analysis) == "ReferenceAnalysis":
+        instrument.setDisposeUntilNextCalibrationTest(False)
+
+
+def apply_values(analysis, values):
+    """Apply the values to the analysis. Returns a tuple of (saved, result
+    changed, message). Only changed values are written, so that the result
+    capture date is kept if the result did not change.
+    """
+    if not isActive(analysis):
+        return False, False, t(_("Analysis is inactive"))
+    editable = can_edit_results(analysis)
+
+    if "Instrument" in values:
+        set_instrument(analysis, values["Instrument"])
+    method_uid = values.get("Method")
+    if method_uid and analysis.isMethodAllowed(method_uid):
+        analysis.setMethod(method_uid)
+    if "Analyst" in values:
+        analysis.setAnalyst(values["Analyst"])
+    if "Uncertainty" in values:
+        analysis.setUncertainty(values["Uncertainty"])
+    if "DetectionLimit" in values:
+        analysis.setDetectionLimitOperand(values["DetectionLimit"])
+
+    if editable:
+        if "Retested" in values and \
+                analysis.getRetested() != values["Retested"]:
+            analysis.setRetested(values["Retested"])
+        if "Remarks" in values and analysis.getRemarks() != values["Remarks"]:
+            analysis.setRemarks(values["Remarks"])
+
+    result = values.get("Result")
+    if not result:
+        return True, False, ""
+    if not editable:
+        title = safe_unicode(api.get_title(analysis))
+        msgid = _('Result for ${analysis} could not be saved because '
+                  'it was already submitted by another user.',
+                  mapping={'analysis': title})
+        return False, False, t(msgid)
+
+    if "InterimFields" in values and \
+            analysis.getInterimFields() != values["InterimFields"]:
+        analysis.setInterimFields(values["InterimFields"])
+    # save results separately, otherwise capture date is rewritten
+    result_dm = values.get("ResultDM", analysis.getResultDM())
+    changed = analysis.getResult() != result or \
+        analysis.getResultDM() != result_dm
+    if changed:
+        analysis.setResultDM(result_dm)
+        analysis.setResult(result)
+    return True, changed, ""
+
+
+def get_dependency_order(analyses):
+    """Sorts the analyses so that each analysis comes after the analyses it
+    depends on. The closure of the dependencies of a dependent contains the
+    closure of its dependencies, so sorting by its size is a topological
+    order.
+    """
+    graph = getUtility(IServiceDependencyGraph)
+    sizes = {}
+
+    def get_size(analysis):
+        service_uid = analysis.getServiceUID()
+        if service_uid not in sizes:
+            sizes[service_uid] = len(graph.get_dependencies(service_uid))
+        return sizes[service_uid]
+
+    return sorted(analyses, key=get_size)
+
+
+def recalculate(analyses):
+    """Recalculate the results of the dependents of the given analyses, once
+    and in dependency order. Returns the recalculated analyses.
+    """
+    graph = getUtility(IServiceDependencyGraph)
+    # AR UID -> (AR, service UIDs of the dependents)
+    containers = {}
+    for analysis in analyses:
+        parent = api.get_parent(analysis)
+        if not IAnalysisRequest.providedBy(parent):
+            continue
+        dependants = graph.get_dependants(analysis.getServiceUID())
+        if not dependants:
+            continue
+        record = containers.setdefault(api.get_uid(parent), (parent, set()))
+        record[1].update(dependants)
+
+    recalculated = []
+    for parent, service_uids in containers.values():
+        dependents = parent.getAnalyses(full_objects=True,
+                                        getServiceUID=list(service_uids))
+        for dependent in get_dependency_order(dependents):
+            if not isActive(dependent) or not can_edit_results(dependent):
+                continue
+            if dependent.calculateResult(override=True):
+                recalculated.append(dependent)
+    return recalculated
+
+
+def can_submit(analysis, submitting=()):
+    """Returns True if the analysis has a result and none of its dependencies
+    is waiting for a result. The dependencies with the UIDs in `submitting`
+    are about to be submitted.
+    """
+    if not analysis.getResult():
+        return False
+    if not hasattr(analysis, "getDependencies"):
+        return True
+    for dependency in analysis.getDependencies():
+        if api.get_uid(dependency) in submitting:
+            continue
+        if api.get_workflow_status_of(dependency) in PRE_SUBMIT_STATES:
+            return False
+    return True
+
+
+def submit_results(records, submit=True):
+    """Apply the values of the analyses, recalculate their dependents and
+    submit them. `records` is a dict of analysis UID -> values (see `FIELDS`).
+
+    Returns a dict of analysis UID -> outcome, a dict with the keys:
+
+    - saved: the values were saved
+    - recalculated: the result was recalculated
+    - submitted: the analysis was submitted
+    - review_state: the review state after the submission
+    - message: the reason why the values were not saved or submitted
+    """
+    outcomes = {}
+    analyses = get_analyses(records.keys())
+    with deferred_indexing():
+        changed = []
+        saved = []
+        for uid, values in records.items():
+            outcome = outcomes[uid] = {
+                "saved": False,
+                "recalculated": False,
+                "submitted": False,
+                "review_state": None,
+                "message": "",
+            }
+            analysis = analyses.get(uid)
+            if analysis is None:
+                outcome["message"] = t(_("Analysis not found"))
+                continue
+            ok, result_changed, message = apply_values(analysis, values)
+            outcome["saved"] = ok
+            outcome["message"] = message
+            if ok and values.get("Result"):
+                saved.append(analysis)
+            if result_changed:
+                changed.append(analysis)
+
+        for analysis in recalculate(changed):
+            uid = api.get_uid(analysis)
+            if uid in outcomes:
+                outcomes[uid]["recalculated"] = True
+
+        if submit:
+            plan = CascadePlan()
+            submitting = set()
+            for analysis in get_dependency_order(saved):
+                if can_submit(analysis, submitting) and \
+                        plan.add(analysis, "submit"):
+                    submitting.add(api.get_uid(analysis))
+            plan.execute()
+            for analysis in saved:
+                key = get_key(analysis, "submit")
+                outcome = outcomes[api.get_uid(analysis)]
+                outcome["submitted"] = key in plan.keys and \
+                    key not in plan.errors
+                if key in plan.errors:
+                    outcome["message"] = plan.errors[key]
+
+    for uid, analysis in analyses.items():
+        outcomes[uid]["review_state"] = api.get_workflow_status_of(analysis)
+    return outcomes
@@ -15,9 +15,11 @@ from Products.CMFCore.utils import getToolByName
 from Products.validation import validation
 from Products.validation.interfaces.IValidator import IValidator
 
+from zope.component import getUtility
 from zope.interface import implements
 
 from bika.lims import api
+from bika.lims.interfaces import IIdentifierRegistry
 from bika.lims.utils import to_utf8
 from bika.lims import bikaMessageFactory as _
 
@@ -50,8 +52,8 @@ validation.register(IdentifierTypeAttributesValidator())
 
 
 class IdentifierValidator:
-    """some actual validation should go here.
-    I'm leaving this stub registered, but adding no extra validation.
+    """Verifies that the external identifiers are not used by other objects
+    (see `bika.lims.identifierregistry`)
     """
 
     implements(IValidator)
@@ -70,6 +72,19 @@ class IdentifierValidator:
             # no change.
             return True
 
+        translate = getToolByName(instance, 'translation_service').translate
+        registry = getUtility(IIdentifierRegistry)
+        records = value if isinstance(value, (list, tuple)) else [value]
+        for record in records:
+            identifier = record
+            if isinstance(record, dict):
+                identifier = record.get('Identifier')
+            if not identifier or not isinstance(identifier, basestring):
+                continue
+            if not registry.is_unique(identifier, api.get_uid(instance)):
+                msg = _("Identifier '${identifier}' is already in use",
+                        mapping={'identifier': safe_unicode(identifier)})
+                return to_utf8(translate(msg))
         return True
 
 
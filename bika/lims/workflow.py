@@ -14,6 +14,9 @@ from bika.lims.utils import changeWorkflowState
 from bika.lims.utils import t
 from bika.lims import logger
 from bika.lims import api
+from bika.lims import cascade
+from bika.lims import lateness
+from bika.lims import statehistogram
 from Products.CMFCore.interfaces import IContentish
 from Products.CMFCore.WorkflowCore import WorkflowException
 from Products.CMFPlone.interfaces import IWorkflowChain
@@ -53,6 +56,9 @@ def skip(instance, action, peek=False, unskip=False):
 def doActionFor(instance, action_id):
     actionperformed = False
     message = ''
+    # Planned transitions are performed by the cascade planner
+    if cascade.is_planned(instance, action_id):
+        return actionperformed, message
     if not skip(instance, action_id, peek=True):
         try:
             api.do_transition_for(instance, action_id)
@@ -84,10 +90,17 @@ def AfterTransitionEventHandler(instance, event):
     # creation doesn't have a 'transition'
     if not event.transition:
         return
+    # The state histograms of the AR and Worksheets must be up to date before
+    # the workflow script checks them for escalation
+    if event.workflow.state_var == "review_state":
+        statehistogram.update_state(instance, event.new_state.id)
     key = 'workflow_script_' + event.transition.id
     method = getattr(instance, key, False)
     if method:
         method()
+    # The workflow script may have changed the due date or the result
+    if event.workflow.state_var == "review_state":
+        lateness.update(instance)
 
 
 def get_workflow_actions(obj):